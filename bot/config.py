@@ -94,6 +94,7 @@ DEFAULT_GLOBAL_COOLDOWN = int(os.getenv("DEFAULT_GLOBAL_COOLDOWN", "1"))
 # Impostazioni di log
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_FILE = os.getenv("LOG_FILE", "logs/m4bot.log")
+LOG_DIR = os.path.dirname(LOG_FILE) or "logs"
 
 # Integrazione OBS
 OBS_WEBSOCKET_URL = os.getenv("OBS_WEBSOCKET_URL", "ws://localhost:4455")
@@ -116,6 +117,21 @@ SECURITY_SETTINGS = {
     "cors_allowed_origins": os.getenv("CORS_ALLOWED_ORIGINS", "*").split(",")
 }
 
+# Indirizzi autorizzati a leggere l'endpoint /metrics dell'API del bot con una
+# connessione diretta (le richieste inoltrate da nginx vengono rifiutate)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Token Bearer per /metrics: se impostato è richiesto a ogni richiesta, da qualunque indirizzo
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Indirizzi autorizzati a consultare e controllare il profiler dell'API del bot (il pannello web)
+# con una connessione diretta (le richieste inoltrate da nginx vengono rifiutate)
+PROFILER_ALLOWED_IPS = [ip.strip() for ip in os.getenv('PROFILER_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Segreto condiviso con il pannello web: se impostato è richiesto come token Bearer
+# a ogni richiesta al profiler, da qualunque indirizzo
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN', '')
+
 # Configurazione API Kick
 REDIRECT_URI = os.environ.get("REDIRECT_URI", "http://localhost:5000/auth/callback")
 SCOPE = "channels:read chat:connect chat:read chat:write user:read"
@@ -353,5 +369,7 @@ __all__ = [
     'TELEGRAM_BOT_TOKEN', 'TELEGRAM_CHAT_ID', 'DISCORD_WEBHOOK_URL',
     'EMAIL_SENDER', 'EMAIL_RECIPIENT', 'EMAIL_SMTP_SERVER',
     'EMAIL_SMTP_PORT', 'EMAIL_USERNAME', 'EMAIL_PASSWORD',
-    'REDIS_URL', 'ConfigValidator', 'load_config', 'config'
+    'REDIS_URL', 'ConfigValidator', 'load_config', 'config',
+    'DEFAULT_COMMAND_COOLDOWN', 'DEFAULT_USER_COOLDOWN', 'DEFAULT_GLOBAL_COOLDOWN', 'VERSION',
+    'METRICS_ALLOWED_IPS', 'METRICS_TOKEN', 'PROFILER_ALLOWED_IPS', 'PROFILER_TOKEN'
 ]
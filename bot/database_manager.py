@@ -6,9 +6,18 @@ import time
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Tuple, Union, Set
 
+from stability.monitoring.metrics_registry import get_registry
+
 # Configura il logging
 logger = logging.getLogger("DatabaseManager")
 
+# Metriche delle query nel registro unificato
+_registry = get_registry()
+QUERY_DURATION = _registry.histogram(
+    "m4bot_db_query_duration_seconds", "Durata delle query al database", ("operation",))
+QUERY_ERRORS = _registry.counter(
+    "m4bot_db_query_errors_total", "Query al database fallite", ("operation",))
+
 class DatabaseManager:
     """
     Gestisce la connessione e le operazioni del database PostgreSQL
@@ -116,12 +125,15 @@ class DatabaseManager:
                 result = await conn.execute(query, *args, timeout=timeout)
                 
                 execution_time = (time.time() - start_time) * 1000  # Converti in ms
+                QUERY_DURATION.labels("execute").observe(execution_time / 1000)
                 if execution_time > self.slow_query_threshold:
                     await self._log_slow_query(query, args, execution_time)
                 
                 return result
         except Exception as e:
             execution_time = (time.time() - start_time) * 1000
+            QUERY_DURATION.labels("execute").observe(execution_time / 1000)
+            QUERY_ERRORS.labels("execute").inc()
             await self._log_query_error(query, args, e, execution_time)
             raise DatabaseError(f"Errore nell'esecuzione della query: {e}")
     
@@ -147,12 +159,15 @@ class DatabaseManager:
                 result = await conn.fetch(query, *args, timeout=timeout)
                 
                 execution_time = (time.time() - start_time) * 1000
+                QUERY_DURATION.labels("fetch").observe(execution_time / 1000)
                 if execution_time > self.slow_query_threshold:
                     await self._log_slow_query(query, args, execution_time)
                 
                 return result
         except Exception as e:
             execution_time = (time.time() - start_time) * 1000
+            QUERY_DURATION.labels("fetch").observe(execution_time / 1000)
+            QUERY_ERRORS.labels("fetch").inc()
             await self._log_query_error(query, args, e, execution_time)
             raise DatabaseError(f"Errore nell'esecuzione della query: {e}")
     
@@ -178,12 +193,15 @@ class DatabaseManager:
                 result = await conn.fetchrow(query, *args, timeout=timeout)
                 
                 execution_time = (time.time() - start_time) * 1000
+                QUERY_DURATION.labels("fetchrow").observe(execution_time / 1000)
                 if execution_time > self.slow_query_threshold:
                     await self._log_slow_query(query, args, execution_time)
                 
                 return result
         except Exception as e:
             execution_time = (time.time() - start_time) * 1000
+            QUERY_DURATION.labels("fetchrow").observe(execution_time / 1000)
+            QUERY_ERRORS.labels("fetchrow").inc()
             await self._log_query_error(query, args, e, execution_time)
             raise DatabaseError(f"Errore nell'esecuzione della query: {e}")
     
@@ -209,12 +227,15 @@ class DatabaseManager:
                 result = await conn.fetchval(query, *args, timeout=timeout)
                 
                 execution_time = (time.time() - start_time) * 1000
+                QUERY_DURATION.labels("fetchval").observe(execution_time / 1000)
                 if execution_time > self.slow_query_threshold:
                     await self._log_slow_query(query, args, execution_time)
                 
                 return result
         except Exception as e:
             execution_time = (time.time() - start_time) * 1000
+            QUERY_DURATION.labels("fetchval").observe(execution_time / 1000)
+            QUERY_ERRORS.labels("fetchval").inc()
             await self._log_query_error(query, args, e, execution_time)
             raise DatabaseError(f"Errore nell'esecuzione della query: {e}")
     
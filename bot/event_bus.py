@@ -0,0 +1,498 @@
+#!/usr/bin/env python3
+"""
+Bus degli eventi di chat di M4Bot.
+Ogni messaggio ricevuto viene normalizzato una sola volta in un ChatMessage e
+distribuito a tutti i consumatori (punti, giochi, comandi, plugin) in ordine di
+priorità, eseguendo in parallelo i consumatori con la stessa priorità.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional, Any, Callable
+
+from stability.monitoring.metrics_registry import get_registry
+
+# Configura il logger
+logger = logging.getLogger('EventBus')
+
+# Priorità predefinita dei consumatori (valori più bassi vengono eseguiti prima)
+DEFAULT_PRIORITY = 100
+
+# Peso del campione più recente nella media mobile esponenziale delle latenze
+LATENCY_EWMA_ALPHA = 0.1
+
+# Metriche del percorso della chat nel registro unificato
+_registry = get_registry()
+MESSAGES_PUBLISHED = _registry.counter(
+    "m4bot_chat_messages_published_total", "Messaggi di chat pubblicati sul bus", ("platform",))
+MESSAGES_DROPPED = _registry.counter(
+    "m4bot_chat_messages_dropped_total", "Messaggi scartati per coda piena", ("queue",))
+QUEUE_DEPTH = _registry.gauge(
+    "m4bot_chat_queue_depth", "Messaggi in attesa nelle code delle partizioni del bus")
+QUEUE_DELAY = _registry.histogram(
+    "m4bot_chat_queue_delay_seconds", "Tempo tra la ricezione del messaggio e l'inizio della distribuzione")
+HANDLER_DURATION = _registry.histogram(
+    "m4bot_chat_handler_duration_seconds", "Durata dei consumatori dei messaggi di chat", ("handler",))
+HANDLER_ERRORS = _registry.counter(
+    "m4bot_chat_handler_errors_total", "Errori dei consumatori dei messaggi di chat", ("handler",))
+_PARTITION_DROPPED = MESSAGES_DROPPED.labels("bus")
+
+
+class ChatMessage:
+    """Messaggio di chat normalizzato, condiviso da tutti i consumatori del bus."""
+
+    __slots__ = (
+        "platform", "channel_id", "channel_name", "message_id",
+        "user_id", "username", "display_name", "content",
+        "is_moderator", "is_subscriber", "is_vip", "is_follower",
+        "received_at", "_plugin_dict"
+    )
+
+    def __init__(self, platform: str, channel_id: Any, channel_name: str, user_id: Any,
+                 username: str, content: str, message_id: Optional[str] = None,
+                 display_name: Optional[str] = None, is_moderator: bool = False,
+                 is_subscriber: bool = False, is_vip: bool = False,
+                 is_follower: bool = False, received_at: Optional[float] = None):
+        self.platform = platform
+        self.channel_id = channel_id
+        self.channel_name = channel_name
+        self.message_id = message_id
+        self.user_id = user_id
+        self.username = username
+        self.display_name = display_name or username
+        self.content = content
+        self.is_moderator = is_moderator
+        self.is_subscriber = is_subscriber
+        self.is_vip = is_vip
+        self.is_follower = is_follower
+        self.received_at = received_at if received_at is not None else time.monotonic()
+        self._plugin_dict = None
+
+    @classmethod
+    def from_kick(cls, channel_id: int, channel_name: str, data: Dict) -> "ChatMessage":
+        """
+        Crea un messaggio a partire dal payload di un ChatMessageSentEvent di Kick.
+
+        Args:
+            channel_id: ID del canale nel database
+            channel_name: Nome del canale
+            data: Dati dell'evento ricevuti dal WebSocket
+
+        Returns:
+            Il messaggio normalizzato
+        """
+        sender = data.get("sender") or {}
+        return cls(
+            platform="kick",
+            channel_id=channel_id,
+            channel_name=channel_name,
+            message_id=data.get("id"),
+            user_id=sender.get("id"),
+            username=sender.get("username"),
+            content=data.get("content", ""),
+            is_moderator=sender.get("is_moderator", False),
+            is_subscriber=sender.get("is_subscriber", False),
+            is_vip="VIP" in sender.get("follower_badges", []),
+            is_follower=sender.get("is_follower", False)
+        )
+
+    @property
+    def is_command(self) -> bool:
+        """Indica se il messaggio è un comando (inizia con !)."""
+        return self.content.startswith("!")
+
+    @property
+    def command(self) -> Optional[str]:
+        """Nome del comando in minuscolo senza il !, o None se non è un comando."""
+        if not self.is_command:
+            return None
+        return self.content.split(" ", 1)[0][1:].lower()
+
+    def user_dict(self) -> Dict[str, Any]:
+        """Restituisce l'utente nel formato usato da giochi e gestore comandi."""
+        return {
+            "id": self.user_id,
+            "username": self.username,
+            "is_moderator": self.is_moderator,
+            "is_subscriber": self.is_subscriber,
+            "is_vip": self.is_vip
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Restituisce il messaggio nel formato dei plugin (polls, loyalty, moderazione).
+
+        Il dizionario viene costruito una sola volta e condiviso tra i plugin,
+        che devono trattarlo in sola lettura.
+        """
+        if self._plugin_dict is None:
+            self._plugin_dict = {
+                "id": self.message_id,
+                "platform": self.platform,
+                "channel_id": self.channel_id,
+                "channel_name": self.channel_name,
+                "content": self.content,
+                "author": {
+                    "id": self.user_id,
+                    "username": self.username,
+                    "display_name": self.display_name,
+                    "is_moderator": self.is_moderator,
+                    "is_subscriber": self.is_subscriber,
+                    "is_vip": self.is_vip,
+                    "is_follower": self.is_follower
+                }
+            }
+        return self._plugin_dict
+
+
+def put_dropping_oldest(queue: asyncio.Queue, item) -> bool:
+    """Accoda senza bloccare; se la coda è piena scarta l'elemento più vecchio."""
+    dropped = False
+    if queue.full():
+        try:
+            queue.get_nowait()
+            queue.task_done()
+            dropped = True
+        except asyncio.QueueEmpty:
+            pass
+    queue.put_nowait(item)
+    return dropped
+
+
+class Broadcaster:
+    """Distribuisce gli stessi messaggi a più client, ognuno con la propria coda limitata."""
+
+    def __init__(self, queue_size: int = 100):
+        """
+        Args:
+            queue_size: Numero massimo di messaggi in attesa per ogni client
+        """
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    def __len__(self) -> int:
+        return len(self.subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        """
+        Registra un client.
+
+        Returns:
+            Coda su cui arrivano i messaggi pubblicati
+        """
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        """Rimuove un client registrato con subscribe()."""
+        self.subscribers.discard(queue)
+
+    def publish(self, message) -> int:
+        """
+        Invia un messaggio a tutti i client senza mai bloccare: a un client lento
+        viene scartato il messaggio più vecchio.
+
+        Args:
+            message: Messaggio da distribuire
+
+        Returns:
+            Numero di messaggi scartati
+        """
+        dropped = 0
+        for queue in list(self.subscribers):
+            dropped += put_dropping_oldest(queue, message)
+        return dropped
+
+
+class _Subscriber:
+    """Consumatore registrato sul bus con le sue statistiche di latenza."""
+
+    __slots__ = (
+        "name", "handler", "priority", "detached", "queue", "task",
+        "calls", "errors", "dropped", "total_time", "max_time", "ewma_time",
+        "duration_metric", "error_metric", "dropped_metric"
+    )
+
+    def __init__(self, name: str, handler: Callable, priority: int, detached: bool, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.priority = priority
+        self.detached = detached
+        self.queue = asyncio.Queue(maxsize=queue_size) if detached else None
+        self.task = None
+        self.calls = 0
+        self.errors = 0
+        self.dropped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.ewma_time = 0.0
+        self.duration_metric = HANDLER_DURATION.labels(name)
+        self.error_metric = HANDLER_ERRORS.labels(name)
+        self.dropped_metric = MESSAGES_DROPPED.labels(name)
+
+    def record(self, elapsed: float, failed: bool):
+        """Aggiorna le statistiche dopo un'invocazione."""
+        self.calls += 1
+        self.duration_metric.observe(elapsed)
+        if failed:
+            self.errors += 1
+            self.error_metric.inc()
+        self.total_time += elapsed
+        if elapsed > self.max_time:
+            self.max_time = elapsed
+        if self.calls == 1:
+            self.ewma_time = elapsed
+        else:
+            self.ewma_time += LATENCY_EWMA_ALPHA * (elapsed - self.ewma_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """Restituisce le statistiche del consumatore (tempi in millisecondi)."""
+        return {
+            "priority": self.priority,
+            "detached": self.detached,
+            "calls": self.calls,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "avg_ms": (self.total_time / self.calls * 1000) if self.calls else 0.0,
+            "ewma_ms": self.ewma_time * 1000,
+            "max_ms": self.max_time * 1000
+        }
+
+
+class ChatEventBus:
+    """
+    Bus in-process che distribuisce i messaggi di chat a tutti i consumatori.
+
+    publish() non blocca mai: i messaggi finiscono in code limitate partizionate
+    per canale (l'ordine all'interno di un canale è preservato). Ogni worker esegue
+    i consumatori per gruppi di priorità crescente; i consumatori con la stessa
+    priorità vengono eseguiti in parallelo e se uno di essi restituisce True il
+    messaggio non viene passato ai gruppi successivi. I consumatori "detached"
+    hanno una coda e un worker propri, così un plugin lento non rallenta gli altri.
+    """
+
+    def __init__(self, context: Any = None, workers: int = 4, queue_size: int = 1000):
+        """
+        Args:
+            context: Oggetto passato come secondo argomento ai gestori dei plugin (l'app)
+            workers: Numero di partizioni/worker che consumano i messaggi
+            queue_size: Dimensione massima di ogni coda
+        """
+        self.context = context
+        self.worker_count = max(1, workers)
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, _Subscriber] = {}
+        self._groups: List[List[_Subscriber]] = []
+        self._queues: List[asyncio.Queue] = []
+        self._workers: List[asyncio.Task] = []
+        self.published = 0
+        self.dropped = 0
+        self.max_queue_delay = 0.0
+
+    def subscribe(self, name: str, handler: Callable, priority: int = DEFAULT_PRIORITY,
+                  detached: bool = False, queue_size: Optional[int] = None):
+        """
+        Registra un consumatore.
+
+        Args:
+            name: Nome univoco del consumatore (usato nelle statistiche)
+            handler: Coroutine chiamata con il ChatMessage; restituendo True ferma la propagazione
+            priority: Priorità (valori più bassi vengono eseguiti prima)
+            detached: Se True il consumatore ha una coda e un worker propri e non può fermare la propagazione
+            queue_size: Dimensione della coda del consumatore detached
+        """
+        if name in self.subscribers:
+            self.unsubscribe(name)
+
+        subscriber = _Subscriber(name, handler, priority, detached, queue_size or self.queue_size)
+        self.subscribers[name] = subscriber
+        if detached and self._workers:
+            subscriber.task = asyncio.create_task(self._detached_worker(subscriber))
+        self._rebuild_groups()
+        logger.debug(f"Consumatore registrato: {name} (priorità {priority})")
+
+    def register_handler(self, handler: Callable, priority: int = DEFAULT_PRIORITY, detached: bool = False,
+                         context: Any = None):
+        """
+        Registra un gestore dei plugin, con firma handler(message: dict, app) -> bool.
+
+        Args:
+            handler: Gestore del plugin
+            priority: Priorità (valori più bassi vengono eseguiti prima)
+            detached: Se True il gestore viene eseguito su una coda propria
+            context: Oggetto passato come secondo argomento al gestore (predefinito: quello del bus)
+        """
+        if context is None:
+            context = self.context
+
+        async def plugin_handler(message: ChatMessage):
+            return await handler(message.to_dict(), context)
+
+        self.subscribe(f"plugin:{handler.__module__}.{handler.__name__}", plugin_handler, priority, detached)
+
+    def unsubscribe(self, name: str):
+        """Rimuove un consumatore."""
+        subscriber = self.subscribers.pop(name, None)
+        if subscriber:
+            if subscriber.task and not subscriber.task.done():
+                subscriber.task.cancel()
+            self._rebuild_groups()
+
+    def _rebuild_groups(self):
+        """Raggruppa i consumatori per priorità crescente."""
+        groups: Dict[int, List[_Subscriber]] = {}
+        for subscriber in self.subscribers.values():
+            groups.setdefault(subscriber.priority, []).append(subscriber)
+        self._groups = [groups[priority] for priority in sorted(groups)]
+
+    def start(self):
+        """Avvia i worker del bus; deve essere chiamato con un loop in esecuzione."""
+        if self._workers:
+            return
+        self._queues = [asyncio.Queue(maxsize=self.queue_size) for _ in range(self.worker_count)]
+        self._workers = [asyncio.create_task(self._partition_worker(queue)) for queue in self._queues]
+        QUEUE_DEPTH.set_function(lambda: sum(queue.qsize() for queue in self._queues))
+        for subscriber in self.subscribers.values():
+            if subscriber.detached and subscriber.task is None:
+                subscriber.task = asyncio.create_task(self._detached_worker(subscriber))
+
+    async def close(self):
+        """Ferma tutti i worker del bus."""
+        tasks = list(self._workers)
+        tasks.extend(s.task for s in self.subscribers.values() if s.task)
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._workers = []
+        self._queues = []
+        for subscriber in self.subscribers.values():
+            subscriber.task = None
+
+    def publish(self, message: ChatMessage) -> bool:
+        """
+        Pubblica un messaggio senza bloccare il chiamante.
+
+        Args:
+            message: Il messaggio normalizzato
+
+        Returns:
+            True se il messaggio è stato accodato senza scartarne altri
+        """
+        self.start()
+        self.published += 1
+        MESSAGES_PUBLISHED.labels(message.platform).inc()
+
+        # Stessa partizione per lo stesso canale: l'ordine dei messaggi è preservato
+        queue = self._queues[hash(message.channel_name) % len(self._queues)]
+        if put_dropping_oldest(queue, message):
+            self.dropped += 1
+            _PARTITION_DROPPED.inc()
+            if self.dropped % 100 == 1:
+                logger.warning(f"Coda del bus piena: scartati {self.dropped} messaggi finora")
+            return False
+        return True
+
+    async def dispatch(self, message: ChatMessage) -> bool:
+        """
+        Esegue la catena dei consumatori per un messaggio.
+
+        Args:
+            message: Il messaggio normalizzato
+
+        Returns:
+            True se un consumatore ha fermato la propagazione
+        """
+        for group in self._groups:
+            inline = []
+            for subscriber in group:
+                if subscriber.detached:
+                    if subscriber.queue is not None and put_dropping_oldest(subscriber.queue, message):
+                        subscriber.dropped += 1
+                        subscriber.dropped_metric.inc()
+                else:
+                    inline.append(subscriber)
+
+            if not inline:
+                continue
+            if len(inline) == 1:
+                stop = await self._invoke(inline[0], message)
+            else:
+                results = await asyncio.gather(*(self._invoke(s, message) for s in inline))
+                stop = any(results)
+            if stop:
+                return True
+        return False
+
+    async def _invoke(self, subscriber: _Subscriber, message: ChatMessage) -> bool:
+        """Chiama un consumatore misurandone la latenza; gli errori non interrompono la catena."""
+        start = time.perf_counter()
+        failed = False
+        try:
+            return await subscriber.handler(message) is True
+        except Exception as e:
+            failed = True
+            logger.error(f"Errore nel consumatore {subscriber.name}: {e}")
+            return False
+        finally:
+            subscriber.record(time.perf_counter() - start, failed)
+
+    async def _partition_worker(self, queue: asyncio.Queue):
+        """Consuma i messaggi di una partizione eseguendo la catena dei consumatori."""
+        while True:
+            message = await queue.get()
+            try:
+                delay = time.monotonic() - message.received_at
+                QUEUE_DELAY.observe(delay)
+                if delay > self.max_queue_delay:
+                    self.max_queue_delay = delay
+                await self.dispatch(message)
+            except Exception as e:
+                logger.error(f"Errore nella distribuzione del messaggio: {e}")
+            finally:
+                queue.task_done()
+
+    async def _detached_worker(self, subscriber: _Subscriber):
+        """Consuma la coda di un consumatore detached."""
+        while True:
+            message = await subscriber.queue.get()
+            try:
+                await self._invoke(subscriber, message)
+            finally:
+                subscriber.queue.task_done()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Restituisce le statistiche del bus e dei singoli consumatori.
+
+        Returns:
+            Dizionario con contatori globali e latenze per consumatore
+        """
+        return {
+            "published": self.published,
+            "dropped": self.dropped,
+            "queued": sum(queue.qsize() for queue in self._queues),
+            "max_queue_delay_ms": self.max_queue_delay * 1000,
+            "subscribers": {name: s.stats() for name, s in self.subscribers.items()}
+        }
+
+
+class PluginHandlers:
+    """Registra i gestori dei plugin di un'app sul bus del bot, passando loro l'app."""
+
+    def __init__(self, bus: ChatEventBus, app: Any):
+        """
+        Args:
+            bus: Bus dei messaggi di chat del bot
+            app: App dei plugin, passata come secondo argomento ai gestori
+        """
+        self.bus = bus
+        self.app = app
+
+    def register_handler(self, handler: Callable, priority: int = DEFAULT_PRIORITY, detached: bool = False):
+        """Registra un gestore dei plugin sul bus (vedi ChatEventBus.register_handler)."""
+        self.bus.register_handler(handler, priority, detached, context=self.app)
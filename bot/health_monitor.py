@@ -11,6 +11,8 @@ from email.message import EmailMessage
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 
+from stability.monitoring.loop_lag import LoopLagMonitor
+
 # Configurazione logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,6 +37,8 @@ class HealthMonitor:
         """
         self.config = config
         self.process = psutil.Process(os.getpid())
+        # Prima lettura di riferimento: le successive non bloccano il loop
+        self.process.cpu_percent(interval=None)
         self.start_time = datetime.now()
         self.last_heartbeat = datetime.now()
         self.status = {
@@ -56,7 +60,8 @@ class HealthMonitor:
                 "database": 0,
                 "api": 0,
                 "websocket": 0
-            }
+            },
+            "event_loop": {}
         }
         
         # Stato di notifica per evitare notifiche ripetute
@@ -64,9 +69,18 @@ class HealthMonitor:
             "database": True,
             "api": True,
             "websocket": True,
-            "redis": True
+            "redis": True,
+            "event_loop": True
         }
         
+        # Latenza del loop asyncio e cattura delle chiamate bloccanti
+        self.loop_lag = LoopLagMonitor(
+            interval=config.get("loop_lag_interval", 0.1),
+            block_threshold=config.get("loop_block_threshold_ms", 100) / 1000
+        )
+        self.loop_lag_critical_ms = config.get("loop_lag_critical_ms", 250)
+        self.last_block_check = time.time()
+        
         # Contatori di errori
         self.error_counters = {
             "database": 0,
@@ -85,6 +99,7 @@ class HealthMonitor:
     
     async def start_monitoring(self):
         """Avvia il task di monitoraggio"""
+        self.loop_lag.start()
         self.monitor_task = asyncio.create_task(self._monitor_loop())
         logger.info("Monitoraggio avviato")
     
@@ -98,6 +113,7 @@ class HealthMonitor:
                 pass
             self.monitor_task = None
             logger.info("Monitoraggio fermato")
+        await self.loop_lag.stop()
     
     def _get_system_info(self) -> Dict[str, str]:
         """Raccoglie informazioni sul sistema"""
@@ -151,8 +167,8 @@ class HealthMonitor:
             uptime = datetime.now() - self.start_time
             uptime_seconds = int(uptime.total_seconds())
             
-            # Ottieni utilizzo CPU
-            cpu_percent = self.process.cpu_percent(interval=1.0)
+            # Ottieni utilizzo CPU (dall'ultima lettura, senza attese sul loop)
+            cpu_percent = self.process.cpu_percent(interval=None)
             
             # Ottieni utilizzo memoria
             mem_info = self.process.memory_info()
@@ -168,6 +184,7 @@ class HealthMonitor:
                 "cpu_usage": cpu_percent,
                 "memory_usage": mem_usage_mb,
                 "disk_usage": disk_percent,
+                "event_loop": self.loop_lag.get_stats(),
                 "last_check": datetime.now().isoformat()
             })
             
@@ -357,6 +374,27 @@ class HealthMonitor:
         if self.status["disk_usage"] > 95:
             critical_issues.append(f"Spazio su disco critico: {self.status['disk_usage']:.1f}%")
         
+        # Controllo latenza del loop asyncio
+        lag = self.loop_lag.get_percentiles()
+        if lag["p99_ms"] > self.loop_lag_critical_ms and self.notification_state["event_loop"]:
+            critical_issues.append(
+                f"Latenza del loop critica: p50={lag['p50_ms']:.1f}ms p99={lag['p99_ms']:.1f}ms max={lag['max_ms']:.1f}ms"
+            )
+            self.notification_state["event_loop"] = False
+        elif lag["p99_ms"] <= self.loop_lag_critical_ms and not self.notification_state["event_loop"]:
+            self.notification_state["event_loop"] = True
+            await self._send_notification(f"Latenza del loop rientrata: p99={lag['p99_ms']:.1f}ms", "info")
+        
+        # Blocchi del loop dall'ultimo controllo, con il punto in cui si è fermato il più lungo
+        blocks = self.loop_lag.get_blocks(since=self.last_block_check)
+        self.last_block_check = time.time()
+        critical_blocks = [block for block in blocks if block["blocked_ms"] > self.loop_lag_critical_ms]
+        if critical_blocks:
+            longest = max(critical_blocks, key=lambda block: block["blocked_ms"])
+            critical_issues.append(
+                f"Loop bloccato {len(critical_blocks)} volte (massimo {longest['blocked_ms']:.0f}ms in {longest['location']})"
+            )
+        
         # Se ci sono problemi critici, invia notifica
         if critical_issues:
             message = "PROBLEMI CRITICI RILEVATI:\n" + "\n".join(critical_issues)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Codec JSON condiviso da WebSocket, webhook e Redis.
+Usa orjson quando è installato e ripiega sul modulo json della libreria standard,
+mantenendo la stessa interfaccia e gli stessi risultati.
+"""
+
+import json
+import logging
+from typing import Any, Union
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# Configura il logger
+logger = logging.getLogger('JSONCodec')
+
+# Backend in uso, utile per log e diagnostica
+BACKEND = "orjson" if ORJSON_AVAILABLE else "json"
+
+# Eccezioni sollevate da loads() per input non validi (orjson.JSONDecodeError deriva da ValueError)
+JSONDecodeError = ValueError
+
+
+def loads(data: Union[str, bytes, bytearray, memoryview]) -> Any:
+    """
+    Decodifica un documento JSON.
+
+    Args:
+        data: Documento JSON come stringa o bytes
+
+    Returns:
+        L'oggetto decodificato
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    Codifica un oggetto in JSON compatto (UTF-8).
+
+    Gli oggetti che orjson non supporta (chiavi non serializzabili, interi oltre
+    64 bit) vengono codificati con la libreria standard.
+
+    Args:
+        obj: Oggetto da codificare
+
+    Returns:
+        Il documento JSON in bytes
+    """
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def dumps(obj: Any) -> str:
+    """
+    Codifica un oggetto in JSON compatto.
+
+    Args:
+        obj: Oggetto da codificare
+
+    Returns:
+        Il documento JSON come stringa
+    """
+    if ORJSON_AVAILABLE:
+        return dumps_bytes(obj).decode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False)
@@ -17,6 +17,7 @@ import string
 import hashlib
 import base64
 import secrets
+import heapq
 from typing import Dict, List, Optional, Any, Union, Callable
 
 import aiohttp
@@ -31,7 +32,10 @@ from bot.config import *
 
 # Importazione dei moduli
 from bot.kick_channel_points import KickChannelPoints
+from bot.event_bus import ChatEventBus, ChatMessage, Broadcaster
 from stability.monitoring.integrated_monitor import IntegratedMonitor
+from stability.monitoring.metrics_registry import get_registry, internal_access_allowed, CONTENT_TYPE
+from stability.monitoring.profiler import get_profiler, profiler_enabled
 
 # Assicurati che tutte le directory necessarie esistano
 directories_to_check = [
@@ -59,6 +63,23 @@ logging.basicConfig(
 )
 logger = logging.getLogger('M4Bot')
 
+# Metriche di comandi e API di Kick nel registro unificato
+metrics_registry = get_registry()
+COMMAND_DURATION = metrics_registry.histogram(
+    "m4bot_command_duration_seconds", "Durata dell'esecuzione dei comandi di chat", ("command",),
+    max_series=200)
+KICK_API_DURATION = metrics_registry.histogram(
+    "m4bot_kick_api_request_duration_seconds", "Durata delle richieste all'API di Kick", ("method", "status"))
+
+# Numero massimo di eventi in attesa per ogni client overlay
+OVERLAY_QUEUE_SIZE = 100
+
+# Comandi del sistema punti canale, gestiti dal bot anche durante i giochi
+POINTS_BALANCE_COMMANDS = ("punti", "points")
+POINTS_LEADERBOARD_COMMANDS = ("classifica", "leaderboard", "top")
+POINTS_REWARDS_COMMANDS = ("premi", "rewards")
+POINTS_COMMANDS = POINTS_BALANCE_COMMANDS + POINTS_LEADERBOARD_COMMANDS + POINTS_REWARDS_COMMANDS
+
 class Database:
     """Gestisce la connessione e le operazioni del database."""
     
@@ -371,9 +392,12 @@ class KickApi:
                 return None
             headers["Authorization"] = f"Bearer {token}"
             
+        status = "error"
+        start_time = time.perf_counter()
         try:
             if method.upper() == "GET":
                 async with self.session.get(url, params=params, headers=headers) as response:
+                    status = response.status
                     if response.status != 200:
                         error_text = await response.text()
                         logger.error(f"Errore nella richiesta API GET {url}: {error_text}")
@@ -381,6 +405,7 @@ class KickApi:
                     return await response.json()
             elif method.upper() == "POST":
                 async with self.session.post(url, json=data, headers=headers) as response:
+                    status = response.status
                     if response.status != 200 and response.status != 201:
                         error_text = await response.text()
                         logger.error(f"Errore nella richiesta API POST {url}: {error_text}")
@@ -388,6 +413,7 @@ class KickApi:
                     return await response.json()
             elif method.upper() == "PUT":
                 async with self.session.put(url, json=data, headers=headers) as response:
+                    status = response.status
                     if response.status != 200:
                         error_text = await response.text()
                         logger.error(f"Errore nella richiesta API PUT {url}: {error_text}")
@@ -395,6 +421,7 @@ class KickApi:
                     return await response.json()
             elif method.upper() == "DELETE":
                 async with self.session.delete(url, params=params, headers=headers) as response:
+                    status = response.status
                     if response.status != 200 and response.status != 204:
                         error_text = await response.text()
                         logger.error(f"Errore nella richiesta API DELETE {url}: {error_text}")
@@ -405,6 +432,8 @@ class KickApi:
         except Exception as e:
             logger.error(f"Eccezione nella richiesta API {url}: {e}")
             return None
+        finally:
+            KICK_API_DURATION.labels(method.upper(), status).observe(time.perf_counter() - start_time)
             
     async def send_chat_message(self, channel_id: int, channel_name: str, message: str):
         """Invia un messaggio in chat."""
@@ -696,16 +725,17 @@ class CommandHandler:
         self.cooldowns[cooldown_key] = current_time
         self.cooldowns[user_cooldown_key] = current_time
         
-        # Invia la risposta in chat
-        await self.bot.api.send_chat_message(channel_id, channel_name, response)
-        
-        # Aggiorna il contatore di utilizzo
-        async with self.bot.db.pool.acquire() as conn:
-            await conn.execute('''
-                UPDATE commands
-                SET usage_count = usage_count + 1
-                WHERE id = $1
-            ''', cmd_info["id"])
+        with COMMAND_DURATION.labels(command_name).time():
+            # Invia la risposta in chat
+            await self.bot.api.send_chat_message(channel_id, channel_name, response)
+            
+            # Aggiorna il contatore di utilizzo
+            async with self.bot.db.pool.acquire() as conn:
+                await conn.execute('''
+                    UPDATE commands
+                    SET usage_count = usage_count + 1
+                    WHERE id = $1
+                ''', cmd_info["id"])
 
 class ChatGame:
     """Classe base per i giochi in chat."""
@@ -809,6 +839,11 @@ class DiceGame(ChatGame):
 class MarbleGame(ChatGame):
     """Implementazione di un gioco marble in chat."""
     
+    # Moltiplicatori delle scommesse per posizione d'arrivo
+    BET_MULTIPLIERS = (2.5, 1.5, 1.2)
+    # Punti assegnati ai primi tre classificati
+    PODIUM_PRIZES = (100, 50, 25)
+    
     def __init__(self, bot, channel_id: int, channel_name: str):
         super().__init__(bot, channel_id, channel_name)
         self.track_length = 10  # Lunghezza del percorso
@@ -819,6 +854,13 @@ class MarbleGame(ChatGame):
         self.betting_phase = False  # Indica se le scommesse sono aperte
         self.betting_duration = 30  # Durata in secondi della fase di scommesse
         self.bets = {}  # Scommesse degli utenti {better_id: {"target_id": id, "amount": punti}}
+        self.status_top_n = 5  # Numero di biglie mostrate nei riepiloghi compatti
+        self.participant_order = []  # Ordine di iscrizione, usato per !bet [numero]
+        # Stato vettoriale della gara: liste parallele di id e posizioni
+        self._racer_ids = []
+        self._positions = []
+        self._running = []  # Indici delle biglie ancora in gara
+        self._bet_winners = []  # (nome, vincita) calcolati al momento del pagamento
         
     async def start(self):
         """Avvia il gioco marble."""
@@ -855,11 +897,23 @@ class MarbleGame(ChatGame):
         """Apre la fase di scommesse."""
         self.betting_phase = True
         
-        # Crea una lista di partecipanti per scommettere
+        # In chat solo i primi partecipanti, l'elenco completo va all'overlay
+        shown = self.participant_order[:self.status_top_n]
         participants_list = "\n".join([
-            f"{i+1}. {info['username']}" 
-            for i, (_, info) in enumerate(self.participants.items())
+            f"{i+1}. {self.participants[user_id]['username']}" 
+            for i, user_id in enumerate(shown)
         ])
+        hidden = len(self.participant_order) - len(shown)
+        if hidden > 0:
+            participants_list += f"\n... e altri {hidden} partecipanti"
+            
+        self.bot.publish_overlay(self.channel_id, "marble_betting", {
+            "participants": [
+                {"number": i + 1, "username": self.participants[user_id]["username"]}
+                for i, user_id in enumerate(self.participant_order)
+            ],
+            "duration": self.betting_duration
+        })
         
         # Annuncia l'apertura delle scommesse
         await self.bot.api.send_chat_message(
@@ -888,9 +942,11 @@ class MarbleGame(ChatGame):
         """Inizia la gara delle biglie."""
         self.race_active = True
         
-        # Inizializza le posizioni
-        for user_id in self.participants:
-            self.marble_positions[user_id] = 0
+        # Inizializza lo stato vettoriale della gara
+        self._racer_ids = list(self.participant_order)
+        self._positions = [0] * len(self._racer_ids)
+        self._running = list(range(len(self._racer_ids)))
+        self.marble_positions = dict.fromkeys(self._racer_ids, 0)
             
         # Annuncia l'inizio della gara
         participants_count = len(self.participants)
@@ -911,15 +967,18 @@ class MarbleGame(ChatGame):
             await self.update_race()
             
             # Mostra lo stato della gara
-            await self.show_race_status()
+            await self.show_race_status(round_count)
             
             # Verifica se la gara è finita
-            if len(self.finished_marbles) >= len(self.participants) or round_count >= max_rounds:
+            if not self._running or round_count >= max_rounds:
                 self.race_active = False
             else:
                 # Piccola pausa tra i round
                 await asyncio.sleep(2)
         
+        # Sincronizza le posizioni finali per i risultati
+        self.marble_positions = dict(zip(self._racer_ids, self._positions))
+        
         # Annuncia i risultati finali
         await self.announce_results()
         
@@ -931,49 +990,92 @@ class MarbleGame(ChatGame):
         
     async def update_race(self):
         """Aggiorna le posizioni delle biglie nella gara."""
-        # Per ogni biglia ancora in gara
-        for user_id, position in list(self.marble_positions.items()):
-            if user_id in self.marble_positions and position < self.track_length:
-                # Calcola un movimento casuale per la biglia (1-3 spazi)
-                move = random.randint(1, 3)
-                new_position = position + move
+        running = self._running
+        if not running:
+            return
+            
+        # Estrae tutti i movimenti del round in una sola chiamata (1-3 spazi)
+        moves = random.choices((1, 2, 3), k=len(running))
+        positions = self._positions
+        track_length = self.track_length
+        still_running = []
+        
+        for index, move in zip(running, moves):
+            new_position = positions[index] + move
+            if new_position >= track_length:
+                # La biglia ha raggiunto il traguardo
+                positions[index] = track_length
+                self.finished_marbles.append(self._racer_ids[index])
+            else:
+                positions[index] = new_position
+                still_running.append(index)
                 
-                # Aggiorna la posizione
-                if new_position >= self.track_length:
-                    # La biglia ha raggiunto il traguardo
-                    self.marble_positions[user_id] = self.track_length
-                    self.finished_marbles.append(user_id)
-                else:
-                    self.marble_positions[user_id] = new_position
+        self._running = still_running
     
-    async def show_race_status(self):
-        """Mostra lo stato attuale della gara."""
-        # Crea una rappresentazione visiva della gara
-        status_lines = []
+    def _leaderboard(self, limit: Optional[int] = None) -> List[tuple]:
+        """
+        Restituisce la classifica corrente della gara.
         
-        for user_id, position in sorted(self.marble_positions.items(), 
-                                       key=lambda x: x[1], 
-                                       reverse=True):
-            username = self.participants[user_id]["username"]
-            progress = position / self.track_length * 100
+        Args:
+            limit: Numero massimo di biglie da restituire (None per tutte)
             
-            if user_id in self.finished_marbles:
+        Returns:
+            Lista di tuple (user_id, posizione): prima gli arrivati in ordine
+            d'arrivo, poi le biglie ancora in gara per posizione decrescente
+        """
+        finished = self.finished_marbles if limit is None else self.finished_marbles[:limit]
+        ranking = [(user_id, self.track_length) for user_id in finished]
+        if limit is not None and len(ranking) >= limit:
+            return ranking
+            
+        key = self._positions.__getitem__
+        if limit is None:
+            remaining = sorted(self._running, key=key, reverse=True)
+        else:
+            remaining = heapq.nlargest(limit - len(ranking), self._running, key=key)
+        ranking.extend((self._racer_ids[index], self._positions[index]) for index in remaining)
+        return ranking
+    
+    async def show_race_status(self, round_count: int = 0):
+        """
+        Mostra lo stato attuale della gara.
+        
+        Il frame completo viene inviato all'overlay; in chat arriva solo un
+        riepilogo dei primi classificati, e solo se nessun overlay è collegato.
+        
+        Args:
+            round_count: Numero del round appena simulato
+        """
+        if self.bot.has_overlay_subscribers(self.channel_id):
+            self.bot.publish_overlay(self.channel_id, "marble_frame", {
+                "round": round_count,
+                "track_length": self.track_length,
+                "positions": dict(zip(self._racer_ids, self._positions)),
+                "finished": list(self.finished_marbles)
+            })
+            return
+            
+        status_lines = []
+        finished = len(self.finished_marbles)
+        for rank, (user_id, position) in enumerate(self._leaderboard(self.status_top_n), start=1):
+            username = self.participants[user_id]["username"]
+            if rank <= finished:
                 # Biglia che ha completato il percorso
-                status = f"{username}: 🏁 ARRIVATO! ({progress:.0f}%)"
+                status_lines.append(f"{rank}. {username}: 🏁")
             else:
-                # Biglia ancora in gara
-                track = "▒" * position + "░" * (self.track_length - position)
-                marble = "🔮"
-                status = f"{username}: {marble}{track} ({progress:.0f}%)"
+                progress = position / self.track_length * 100
+                status_lines.append(f"{rank}. {username}: 🔮 {progress:.0f}%")
                 
-            status_lines.append(status)
+        hidden = len(self._racer_ids) - len(status_lines)
+        if hidden > 0:
+            status_lines.append(f"... e altre {hidden} biglie ({finished} arrivate)")
             
-        # Invia l'aggiornamento in chat
+        # Invia il riepilogo compatto in chat
         status_message = "\n".join(status_lines)
         await self.bot.api.send_chat_message(
             self.channel_id,
             self.channel_name,
-            f"Stato della gara di biglie:\n{status_message}"
+            f"Stato della gara di biglie (round {round_count}):\n{status_message}"
         )
         
     async def announce_results(self):
@@ -986,25 +1088,23 @@ class MarbleGame(ChatGame):
             )
             return
             
-        # Prepara i risultati
-        results = []
-        position = 1
-        
-        # Prima i giocatori che hanno completato il percorso
-        for user_id in self.finished_marbles:
-            username = self.participants[user_id]["username"]
-            results.append(f"{position}° posto: {username}")
-            position += 1
-            
-        # Poi i giocatori ancora in gara, ordinati per posizione
-        remaining = [(user_id, pos) for user_id, pos in self.marble_positions.items() 
-                    if user_id not in self.finished_marbles]
-        remaining.sort(key=lambda x: x[1], reverse=True)
-        
-        for user_id, _ in remaining:
-            username = self.participants[user_id]["username"]
-            results.append(f"{position}° posto: {username}")
-            position += 1
+        # Classifica completa per l'overlay, riepilogo compatto per la chat
+        ranking = [user_id for user_id, _ in self._leaderboard()]
+        self.bot.publish_overlay(self.channel_id, "marble_results", {
+            "ranking": [
+                {"position": i + 1, "user_id": user_id,
+                 "username": self.participants[user_id]["username"]}
+                for i, user_id in enumerate(ranking)
+            ]
+        })
+        
+        results = [
+            f"{position}° posto: {self.participants[user_id]['username']}"
+            for position, user_id in enumerate(ranking[:self.status_top_n], start=1)
+        ]
+        hidden = len(ranking) - len(results)
+        if hidden > 0:
+            results.append(f"... e altri {hidden} partecipanti")
             
         # Invia i risultati in chat
         results_message = "\n".join(results)
@@ -1013,108 +1113,73 @@ class MarbleGame(ChatGame):
             self.channel_name,
             f"🏆 Risultati finali della gara di biglie:\n{results_message}"
         )
+    
+    def _settlement_deltas(self) -> Dict[int, int]:
+        """
+        Calcola in un solo passaggio i punti da accreditare a fine gara.
+        
+        Returns:
+            Dizionario {user_id: punti} con premi del podio e vincite delle scommesse
+        """
+        deltas: Dict[int, int] = {}
+        podium = self.finished_marbles[:len(self.PODIUM_PRIZES)]
         
-        # Assegna punti ai vincitori
-        if self.finished_marbles:
-            winner_id = self.finished_marbles[0]
-            winner_name = self.participants[winner_id]["username"]
+        for user_id, prize in zip(podium, self.PODIUM_PRIZES):
+            deltas[user_id] = deltas.get(user_id, 0) + prize
             
-            # Assegna punti al vincitore
-            await self.bot.update_user_points(
-                self.channel_id,
-                winner_id,
-                100  # Punti da assegnare al vincitore
-            )
+        # Moltiplicatore per ogni biglia sul podio
+        multipliers = dict(zip(podium, self.BET_MULTIPLIERS))
+        self._bet_winners = []
+        for better_id, bet_info in self.bets.items():
+            multiplier = multipliers.get(bet_info["target_id"])
+            if multiplier is None:
+                continue
+            winnings = int(bet_info["amount"] * multiplier)
+            deltas[better_id] = deltas.get(better_id, 0) + winnings
+            self._bet_winners.append((bet_info.get("better_name", "Scommettitore"), winnings))
+            
+        return deltas
+    
+    async def payout_bets(self):
+        """
+        Paga premi del podio e scommesse vincenti.
+        
+        Tutti gli accrediti vengono applicati con una sola transazione
+        set-based tramite PointSystem.update_points_batch.
+        """
+        if not self.finished_marbles:
+            return
             
+        deltas = self._settlement_deltas()
+        if deltas and not await self.bot.point_system.update_points_batch(self.channel_id, deltas):
             await self.bot.api.send_chat_message(
                 self.channel_id,
                 self.channel_name,
-                f"Congratulazioni {winner_name}! Hai vinto 100 punti come vincitore della gara di biglie! 🎉"
+                "⚠️ Errore durante l'assegnazione dei punti della gara. Contatta un moderatore."
             )
-            
-            # Assegna punti anche al secondo e terzo posto, se presenti
-            if len(self.finished_marbles) > 1:
-                second_id = self.finished_marbles[1]
-                second_name = self.participants[second_id]["username"]
-                await self.bot.update_user_points(
-                    self.channel_id,
-                    second_id,
-                    50  # Punti da assegnare al secondo posto
-                )
-                await self.bot.api.send_chat_message(
-                    self.channel_id,
-                    self.channel_name,
-                    f"Complimenti a {second_name}! Hai guadagnato 50 punti per il secondo posto! 🥈"
-                )
-                
-            if len(self.finished_marbles) > 2:
-                third_id = self.finished_marbles[2]
-                third_name = self.participants[third_id]["username"]
-                await self.bot.update_user_points(
-                    self.channel_id,
-                    third_id,
-                    25  # Punti da assegnare al terzo posto
-                )
-                await self.bot.api.send_chat_message(
-                    self.channel_id,
-                    self.channel_name,
-                    f"Complimenti a {third_name}! Hai guadagnato 25 punti per il terzo posto! 🥉"
-                )
-    
-    async def payout_bets(self):
-        """Paga le scommesse vincenti."""
-        if not self.bets or not self.finished_marbles:
             return
             
-        # Crea una lista dei vincitori delle scommesse
-        bet_winners = []
-        
-        # Per ogni scommessa
-        for better_id, bet_info in self.bets.items():
-            target_id = bet_info["target_id"]
-            amount = bet_info["amount"]
-            
-            # Verifica se il bersaglio della scommessa è arrivato primo
-            if target_id in self.finished_marbles and self.finished_marbles[0] == target_id:
-                # Calcola la vincita (2.5x la scommessa)
-                winnings = int(amount * 2.5)
-                
-                # Assegna i punti
-                await self.bot.update_user_points(
-                    self.channel_id,
-                    better_id,
-                    winnings
-                )
-                
-                # Aggiungi alla lista dei vincitori
-                better_name = bet_info.get("better_name", "Scommettitore")
-                bet_winners.append(f"{better_name} (+{winnings} punti)")
-            
-            # Se il bersaglio è arrivato secondo (1.5x)
-            elif len(self.finished_marbles) > 1 and target_id in self.finished_marbles and self.finished_marbles[1] == target_id:
-                winnings = int(amount * 1.5)
-                await self.bot.update_user_points(
-                    self.channel_id,
-                    better_id,
-                    winnings
-                )
-                better_name = bet_info.get("better_name", "Scommettitore")
-                bet_winners.append(f"{better_name} (+{winnings} punti)")
-                
-            # Se il bersaglio è arrivato terzo (1.2x)
-            elif len(self.finished_marbles) > 2 and target_id in self.finished_marbles and self.finished_marbles[2] == target_id:
-                winnings = int(amount * 1.2)
-                await self.bot.update_user_points(
-                    self.channel_id,
-                    better_id,
-                    winnings
-                )
-                better_name = bet_info.get("better_name", "Scommettitore")
-                bet_winners.append(f"{better_name} (+{winnings} punti)")
+        # Annuncia il podio
+        medals = ("🎉", "🥈", "🥉")
+        podium_lines = [
+            f"{medal} {self.participants[user_id]['username']} +{prize} punti"
+            for user_id, prize, medal in zip(self.finished_marbles, self.PODIUM_PRIZES, medals)
+        ]
+        await self.bot.api.send_chat_message(
+            self.channel_id,
+            self.channel_name,
+            "Premi della gara di biglie: " + " | ".join(podium_lines)
+        )
                 
         # Annuncia i vincitori delle scommesse, se ce ne sono
-        if bet_winners:
-            winners_message = "\n".join(bet_winners)
+        if self._bet_winners:
+            top_winners = heapq.nlargest(self.status_top_n, self._bet_winners, key=lambda w: w[1])
+            winners_message = "\n".join(
+                f"{name} (+{winnings} punti)" for name, winnings in top_winners
+            )
+            hidden = len(self._bet_winners) - len(top_winners)
+            if hidden > 0:
+                winners_message += f"\n... e altri {hidden} vincitori"
             await self.bot.api.send_chat_message(
                 self.channel_id,
                 self.channel_name,
@@ -1140,6 +1205,7 @@ class MarbleGame(ChatGame):
                     "id": user["id"],
                     "username": user["username"]
                 }
+                self.participant_order.append(user["id"])
                 
                 await self.bot.api.send_chat_message(
                     self.channel_id,
@@ -1183,7 +1249,7 @@ class MarbleGame(ChatGame):
                     return
                 
                 # Ottieni l'ID del partecipante selezionato
-                participant_id = list(self.participants.keys())[participant_num - 1]
+                participant_id = self.participant_order[participant_num - 1]
                 participant_name = self.participants[participant_id]["username"]
                 
                 # Rimuovi i punti scommessi
@@ -1227,6 +1293,38 @@ class PointSystem:
                               last_updated = NOW()
             ''', channel_id, user_id, points)
             
+    async def update_points_batch(self, channel_id: int, deltas: Dict[int, int]) -> bool:
+        """
+        Aggiorna i punti di più utenti con una sola istruzione set-based.
+        
+        Args:
+            channel_id: ID del canale
+            deltas: Dizionario {user_id: punti da aggiungere}
+            
+        Returns:
+            True se la transazione è andata a buon fine, False altrimenti
+        """
+        if not deltas:
+            return True
+            
+        user_ids = list(deltas.keys())
+        amounts = [deltas[user_id] for user_id in user_ids]
+        try:
+            async with self.bot.db.pool.acquire() as conn:
+                async with conn.transaction():
+                    await conn.execute('''
+                        INSERT INTO channel_points (channel_id, user_id, points)
+                        SELECT $1, d.user_id, d.points
+                        FROM unnest($2::int[], $3::int[]) AS d(user_id, points)
+                        ON CONFLICT (channel_id, user_id)
+                        DO UPDATE SET points = channel_points.points + EXCLUDED.points,
+                                      last_updated = NOW()
+                    ''', channel_id, user_ids, amounts)
+            return True
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento batch dei punti per il canale {channel_id}: {e}")
+            return False
+            
     async def get_user_points(self, channel_id: int, user_id: int):
         """Ottiene i punti di un utente."""
         async with self.bot.db.pool.acquire() as conn:
@@ -1277,6 +1375,8 @@ class M4Bot:
         self.start_time = time.time()
         self.channels = {}  # Dizionario per tracciare i canali connessi
         self.monitor = None  # Sistema di monitoraggio integrato
+        self.overlay_subscribers = {}  # channel_id -> Broadcaster degli overlay collegati
+        self.event_bus = ChatEventBus(self)  # Distribuzione dei messaggi di chat ai consumatori
         
     async def initialize(self):
         """Inizializza il bot e si connette alle risorse necessarie."""
@@ -1298,6 +1398,10 @@ class M4Bot:
             self.kick_channel_points = KickChannelPoints(self)
             await self.kick_channel_points.setup_database()
             
+            # Registra i consumatori dei messaggi di chat sul bus degli eventi
+            self._register_chat_consumers()
+            self.event_bus.start()
+            
             # Inizializzazione del sistema di monitoraggio integrato
             config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 
                                      "config", "monitoring.json")
@@ -1316,6 +1420,8 @@ class M4Bot:
             
     async def shutdown(self):
         """Chiude tutte le connessioni e risorse."""
+        await self.event_bus.close()
+        
         if self.api:
             await self.api.close_session()
             
@@ -1363,6 +1469,48 @@ class M4Bot:
         """Aggiorna i punti di un utente."""
         await self.point_system.update_points(channel_id, user_id, points)
         
+    def subscribe_overlay(self, channel_id: int) -> asyncio.Queue:
+        """
+        Registra un client overlay per gli eventi di un canale.
+        
+        Args:
+            channel_id: ID del canale
+            
+        Returns:
+            Coda su cui arrivano gli eventi destinati all'overlay
+        """
+        broadcaster = self.overlay_subscribers.get(channel_id)
+        if broadcaster is None:
+            broadcaster = self.overlay_subscribers[channel_id] = Broadcaster(OVERLAY_QUEUE_SIZE)
+        return broadcaster.subscribe()
+        
+    def unsubscribe_overlay(self, channel_id: int, queue: asyncio.Queue):
+        """Rimuove un client overlay registrato con subscribe_overlay."""
+        broadcaster = self.overlay_subscribers.get(channel_id)
+        if broadcaster is not None:
+            broadcaster.unsubscribe(queue)
+            if not broadcaster:
+                del self.overlay_subscribers[channel_id]
+                
+    def has_overlay_subscribers(self, channel_id: int) -> bool:
+        """Indica se almeno un overlay è collegato al canale."""
+        return bool(self.overlay_subscribers.get(channel_id))
+        
+    def publish_overlay(self, channel_id: int, event: str, data: dict):
+        """
+        Invia un evento a tutti gli overlay collegati al canale.
+        
+        Non blocca mai: se un client è lento viene scartato il suo evento più vecchio.
+        
+        Args:
+            channel_id: ID del canale
+            event: Tipo di evento
+            data: Dati dell'evento
+        """
+        broadcaster = self.overlay_subscribers.get(channel_id)
+        if broadcaster:
+            broadcaster.publish({"event": event, "channel_id": channel_id, "data": data})
+        
     async def start_game(self, game_type: str, channel_id: int, channel_name: str):
         """Avvia un gioco in chat."""
         # Ferma eventuali giochi attivi
@@ -1507,6 +1655,116 @@ class M4Bot:
         
         return status
 
+    def _register_chat_consumers(self):
+        """
+        Registra sul bus i consumatori principali dei messaggi di chat.
+        
+        Il log su database gira su una coda propria. I punti canale vengono
+        aggiornati per primi, così !punti e la classifica li includono; i giochi
+        vengono eseguiti prima dei comandi e possono fermarli, tranne quelli del
+        sistema punti.
+        """
+        bus = self.event_bus
+        bus.subscribe("chat_log", self._log_chat_message, priority=0, detached=True)
+        bus.subscribe("channel_points", self._award_chat_points, priority=30)
+        bus.subscribe("games", self._handle_game_message, priority=40)
+        bus.subscribe("commands", self._handle_chat_command, priority=50)
+        
+    async def _log_chat_message(self, message: ChatMessage):
+        """Registra il messaggio di chat nel database."""
+        async with self.db.pool.acquire() as conn:
+            await conn.execute('''
+                INSERT INTO chat_messages 
+                (channel_id, user_id, username, content, is_command, created_at)
+                VALUES ($1, $2, $3, $4, $5, NOW())
+            ''', message.channel_id, message.user_id, message.username, message.content, message.is_command)
+            
+    async def _award_chat_points(self, message: ChatMessage):
+        """Assegna i punti canale per il messaggio e segna l'utente come attivo."""
+        if self.kick_channel_points:
+            await self.kick_channel_points.handle_chat_message(
+                message.channel_id,
+                int(message.user_id),
+                message.username,
+                message.is_subscriber,
+                message.is_moderator,
+                message.is_vip
+            )
+            
+    async def _handle_game_message(self, message: ChatMessage) -> bool:
+        """
+        Passa il messaggio al gioco attivo nel canale.
+        
+        Returns:
+            True se il messaggio è un comando consumato dal gioco (mai per i comandi
+            del sistema punti, che restano disponibili durante i giochi)
+        """
+        game = self.active_games.get(message.channel_id)
+        if not game or not game.active:
+            return False
+            
+        await game.handle_message(message.user_dict(), message.content)
+        
+        if message.command == "bet" and isinstance(game, MarbleGame):
+            logger.info(f"Scommessa ricevuta da {message.username} nel canale {message.channel_name}")
+            
+        # Durante un gioco i comandi non vengono elaborati di nuovo
+        return message.is_command and message.command not in POINTS_COMMANDS
+        
+    async def _handle_chat_command(self, message: ChatMessage):
+        """Gestisce i comandi del sistema punti e inoltra gli altri al gestore comandi."""
+        command = message.command
+        if command is None:
+            return
+            
+        channel_id = message.channel_id
+        channel_name = message.channel_name
+        
+        if command in POINTS_BALANCE_COMMANDS:
+            with COMMAND_DURATION.labels("points").time():
+                # Ottieni i punti dell'utente
+                points = await self.point_system.get_user_points(channel_id, int(message.user_id))
+                points_name = self.kick_channel_points.config.points_name
+                
+                # Invia un messaggio con i punti dell'utente
+                await self.api.send_chat_message(channel_id, channel_name, f"{message.username}, hai {points} {points_name}!")
+            return
+            
+        if command in POINTS_LEADERBOARD_COMMANDS:
+            with COMMAND_DURATION.labels("leaderboard").time():
+                # Ottieni la classifica dei punti
+                top_users = await self.point_system.get_top_points(channel_id, 5)
+                points_name = self.kick_channel_points.config.points_name
+                
+                # Formatta la classifica
+                text = f"Classifica {points_name}:\n"
+                for i, user_data in enumerate(top_users):
+                    text += f"{i+1}. {user_data['username']}: {user_data['points']} {points_name}\n"
+                
+                await self.api.send_chat_message(channel_id, channel_name, text)
+            return
+            
+        if command in POINTS_REWARDS_COMMANDS:
+            with COMMAND_DURATION.labels("rewards").time():
+                # Ottieni la lista dei premi disponibili
+                rewards = await self.kick_channel_points.get_rewards(channel_id)
+                
+                if not rewards:
+                    await self.api.send_chat_message(channel_id, channel_name, "Nessun premio disponibile al momento.")
+                    return
+                
+                # Formatta la lista dei premi
+                text = "Premi disponibili:\n"
+                for reward in rewards:
+                    if reward.get("enabled", True):
+                        text += f"{reward.get('title')}: {reward.get('cost')} punti - {reward.get('description')}\n"
+                
+                await self.api.send_chat_message(channel_id, channel_name, text)
+            return
+        
+        # Gestisci altri comandi standard
+        await self.command_handler.handle_command(channel_id, channel_name, message.user_dict(), message.content)
+
     async def handle_message(self, channel_id: int, channel_name: str, user: dict, message: str):
         """Gestisce un messaggio ricevuto."""
         # Controlla se c'è un gioco attivo in questo canale
@@ -1533,16 +1791,82 @@ async def main():
     bot = M4Bot()
     await bot.initialize()
     
+    # Profiler a campionamento, attivo dall'avvio se richiesto (M4BOT_PROFILER=1)
+    profiler = get_profiler()
+    if profiler_enabled():
+        profiler.start()
+    
     # Crea un'app Quart per le API
     from quart import Quart, request, jsonify
     app = Quart(__name__)
     
+    # Plugin: i gestori dei messaggi di chat si registrano sul bus del bot
+    try:
+        from plugins import setup_plugins
+        setup_plugins(app, bot.event_bus)
+    except Exception as e:
+        logger.error(f"Errore nel caricamento dei plugin: {e}")
+    
     @app.route('/api/system/status', methods=['GET'])
     async def api_system_status():
         """Endpoint per ottenere lo stato del sistema."""
         status = await bot.check_system_status()
         return jsonify(status)
     
+    @app.route('/metrics', methods=['GET'])
+    async def metrics_endpoint():
+        """Endpoint di esposizione delle metriche in formato Prometheus."""
+        if not internal_access_allowed(request.remote_addr, request.headers, METRICS_ALLOWED_IPS, METRICS_TOKEN):
+            return "Forbidden", 403
+        return metrics_registry.render(), 200, {"Content-Type": CONTENT_TYPE}
+    
+    @app.route('/api/overlay/<int:channel_id>/stream', methods=['GET'])
+    async def api_overlay_stream(channel_id):
+        """Canale push (Server-Sent Events) degli eventi dei giochi per gli overlay OBS."""
+        async def event_stream():
+            queue = bot.subscribe_overlay(channel_id)
+            try:
+                while True:
+                    message = await queue.get()
+                    yield f"data: {json.dumps(message)}\n\n"
+            finally:
+                bot.unsubscribe_overlay(channel_id, queue)
+        
+        return app.response_class(event_stream(), mimetype='text/event-stream')
+    
+    def profiler_access_allowed():
+        """Gli endpoint del profiler sono riservati al pannello web (PROFILER_TOKEN o PROFILER_ALLOWED_IPS)."""
+        return internal_access_allowed(request.remote_addr, request.headers, PROFILER_ALLOWED_IPS, PROFILER_TOKEN)
+    
+    @app.route('/api/system/profiler', methods=['GET'])
+    async def api_profiler_stats():
+        """Endpoint per il riepilogo del profiler."""
+        if not profiler_access_allowed():
+            return jsonify({"error": "Accesso negato"}), 403
+        return jsonify(profiler.get_stats(top=request.args.get('top', 30, type=int)))
+    
+    @app.route('/api/system/profiler/flamegraph', methods=['GET'])
+    async def api_profiler_flamegraph():
+        """Endpoint per gli stack campionati in formato folded."""
+        if not profiler_access_allowed():
+            return jsonify({"error": "Accesso negato"}), 403
+        return jsonify({"folded": profiler.export_folded()})
+    
+    @app.route('/api/system/profiler/<action>', methods=['POST'])
+    async def api_profiler_control(action):
+        """Endpoint per avviare, fermare o azzerare il profiler."""
+        if not profiler_access_allowed():
+            return jsonify({"error": "Accesso negato"}), 403
+        if action == 'start':
+            profiler.start()
+        elif action == 'stop':
+            profiler.stop()
+        elif action == 'reset':
+            profiler.reset()
+        else:
+            return jsonify({"error": f"Azione non valida: {action}"}), 400
+        return jsonify({"success": True, "running": profiler.running})
+    
     # Altri endpoint API...
     
     # Avvia il server API
@@ -1565,6 +1889,7 @@ async def main():
         logger.info("Interruzione del bot rilevata")
     finally:
         # Chiudi le connessioni
+        profiler.stop()
         await bot.shutdown()
         logger.info("Bot terminato con successo")
 
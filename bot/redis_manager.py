@@ -4,15 +4,21 @@ import asyncio
 import redis.asyncio as redis
 from typing import Any, Dict, List, Optional, Tuple, Union, Set
 from datetime import datetime, timedelta
-import json
 import socket
 import hashlib
 import secrets
 import time
 
+from bot import json_codec
+from stability.monitoring.metrics_registry import get_registry
+
 # Configurazione logging
 logger = logging.getLogger("RedisManager")
 
+# Durata dei comandi Redis nel registro unificato delle metriche
+COMMAND_DURATION = get_registry().histogram(
+    "m4bot_redis_command_duration_seconds", "Durata dei comandi Redis", ("command",))
+
 class RedisManager:
     """
     Gestisce le connessioni a Redis con funzionalità avanzate come:
@@ -210,18 +216,21 @@ class RedisManager:
         formatted_key = self._format_key(key)
         
         try:
-            # Serializza oggetti complessi
-            if not isinstance(value, (str, bytes, int, float)):
-                serialized_value = json.dumps(value)
+            # Serializza oggetti complessi (direttamente in bytes UTF-8)
+            is_json = not isinstance(value, (str, bytes, int, float))
+            if is_json:
+                serialized_value = json_codec.dumps_bytes(value)
                 # Flag per indicare che il valore è serializzato
                 formatted_key = f"{formatted_key}:json"
             else:
                 serialized_value = value
             
             # Comprimi valori grandi se necessario
-            if isinstance(serialized_value, str) and len(serialized_value) > self.compression_threshold:
+            if (is_json or isinstance(serialized_value, str)) and len(serialized_value) > self.compression_threshold:
                 import zlib
-                serialized_value = zlib.compress(serialized_value.encode('utf-8'))
+                if isinstance(serialized_value, str):
+                    serialized_value = serialized_value.encode('utf-8')
+                serialized_value = zlib.compress(serialized_value)
                 formatted_key = f"{formatted_key}:compressed"
             
             async with await self._get_redis() as r:
@@ -281,10 +290,9 @@ class RedisManager:
                 if result is not None:
                     if formatted_key.endswith(":json:compressed") or formatted_key.endswith(":compressed:json"):
                         import zlib
-                        decompressed = zlib.decompress(result)
-                        result = json.loads(decompressed.decode('utf-8'))
+                        result = json_codec.loads(zlib.decompress(result))
                     elif formatted_key.endswith(":json"):
-                        result = json.loads(result)
+                        result = json_codec.loads(result)
                     elif formatted_key.endswith(":compressed"):
                         import zlib
                         result = zlib.decompress(result).decode('utf-8')
@@ -732,6 +740,8 @@ class RedisManager:
                 "avg_time": 0
             }
         
+        COMMAND_DURATION.labels(command).observe(execution_time / 1000)
+        
         stats = self.command_stats[command]
         stats["count"] += 1
         stats["total_time"] += execution_time
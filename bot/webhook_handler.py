@@ -10,8 +10,12 @@ import time
 import jwt
 import re
 import ipaddress
+import bisect
+from collections import deque
 from datetime import datetime
-from typing import Dict, List, Optional, Any, Callable
+from typing import Dict, List, Optional, Any, Callable, Iterable
+
+from bot import json_codec
 
 # Configurazione logging
 logging.basicConfig(
@@ -25,6 +29,207 @@ logging.basicConfig(
 
 logger = logging.getLogger("WebhookHandler")
 
+class IPMatcher:
+    """
+    Indice precompilato per liste di IP e blocchi CIDR.
+    
+    Le voci vengono convertite una sola volta in intervalli interi ordinati
+    e fusi (uno per famiglia IPv4/IPv6), così la verifica di un IP è una
+    ricerca binaria invece di un ciclo che ri-analizza ogni CIDR.
+    """
+    
+    def __init__(self, entries: Iterable[str]):
+        """
+        Costruisce l'indice
+        
+        Args:
+            entries: IP esatti o blocchi CIDR
+        """
+        self.entries = list(entries)
+        # Voci non interpretabili come IP, confrontate come stringhe esatte
+        self._literals = set()
+        intervals = {4: [], 6: []}
+        
+        for entry in self.entries:
+            try:
+                if '/' in entry:
+                    network = ipaddress.ip_network(entry, strict=False)
+                    start = int(network.network_address)
+                    end = int(network.broadcast_address)
+                    version = network.version
+                else:
+                    address = ipaddress.ip_address(entry)
+                    start = end = int(address)
+                    version = address.version
+            except ValueError:
+                self._literals.add(entry)
+                continue
+            intervals[version].append((start, end))
+        
+        self._starts = {}
+        self._ends = {}
+        for version, ranges in intervals.items():
+            merged = []
+            for start, end in sorted(ranges):
+                if merged and start <= merged[-1][1] + 1:
+                    if end > merged[-1][1]:
+                        merged[-1] = (merged[-1][0], end)
+                else:
+                    merged.append((start, end))
+            self._starts[version] = [r[0] for r in merged]
+            self._ends[version] = [r[1] for r in merged]
+    
+    def __bool__(self) -> bool:
+        return bool(self.entries)
+    
+    def __len__(self) -> int:
+        return len(self.entries)
+    
+    def matches(self, ip: str) -> bool:
+        """
+        Verifica se un IP appartiene alla lista
+        
+        Args:
+            ip: Indirizzo IP da verificare
+            
+        Returns:
+            bool: True se l'IP è nella lista
+            
+        Raises:
+            ValueError: Se l'IP non è valido
+        """
+        if ip in self._literals:
+            return True
+        
+        address = ipaddress.ip_address(ip)
+        value = int(address)
+        starts = self._starts[address.version]
+        index = bisect.bisect_right(starts, value) - 1
+        return index >= 0 and value <= self._ends[address.version][index]
+
+
+class _RateLimitState:
+    """Contatore a finestra scorrevole per un singolo IP"""
+    
+    __slots__ = ("window_start", "current", "previous", "blocked_until")
+    
+    def __init__(self, window_start: float):
+        self.window_start = window_start
+        self.current = 0
+        self.previous = 0
+        self.blocked_until = 0.0
+
+
+class ReplayNonceCache:
+    """
+    Insieme di nonce anti-replay con scadenza a bucket temporali.
+    
+    Ogni nonce viene registrato in un dizionario (lookup O(1)) e nel bucket
+    del proprio intervallo; alla scadenza si eliminano interi bucket dalla
+    testa della coda, senza mai scorrere tutta la cache.
+    """
+    
+    def __init__(self, ttl: int = 3600, bucket_size: int = 60):
+        """
+        Inizializza la cache
+        
+        Args:
+            ttl: Durata di validità di un nonce in secondi
+            bucket_size: Ampiezza di ciascun bucket in secondi
+        """
+        self.ttl = ttl
+        self.bucket_size = bucket_size
+        self._seen: Dict[str, float] = {}
+        self._buckets: deque = deque()
+    
+    def __contains__(self, key: str) -> bool:
+        return key in self._seen
+    
+    def __len__(self) -> int:
+        return len(self._seen)
+    
+    def add(self, key: str, now: float) -> bool:
+        """
+        Registra un nonce
+        
+        Args:
+            key: Identificativo univoco della richiesta
+            now: Timestamp corrente
+            
+        Returns:
+            bool: False se il nonce era già presente (replay), True altrimenti
+        """
+        self.expire(now)
+        
+        if key in self._seen:
+            return False
+        
+        bucket_id = int(now // self.bucket_size)
+        if not self._buckets or self._buckets[-1][0] != bucket_id:
+            self._buckets.append((bucket_id, []))
+        self._buckets[-1][1].append(key)
+        self._seen[key] = now
+        return True
+    
+    def expire(self, now: float):
+        """
+        Elimina i bucket scaduti
+        
+        Args:
+            now: Timestamp corrente
+        """
+        oldest_valid = int((now - self.ttl) // self.bucket_size)
+        while self._buckets and self._buckets[0][0] < oldest_valid:
+            _, keys = self._buckets.popleft()
+            for key in keys:
+                self._seen.pop(key, None)
+
+
+# Variabili nei template nel formato {{percorso.della.variabile}}
+TEMPLATE_VARIABLE_PATTERN = re.compile(r'\{\{([^}]+)\}\}')
+
+def compile_template_string(text: str) -> tuple:
+    """
+    Compila una stringa di template in una sequenza piatta di segmenti
+    
+    Args:
+        text: Testo con variabili
+        
+    Returns:
+        tuple: Segmenti letterali (str) e percorsi delle variabili (tuple)
+    """
+    segments = []
+    position = 0
+    for match in TEMPLATE_VARIABLE_PATTERN.finditer(text):
+        if match.start() > position:
+            segments.append(text[position:match.start()])
+        segments.append(tuple(match.group(1).strip().split('.')))
+        position = match.end()
+    if position < len(text):
+        segments.append(text[position:])
+    return tuple(segments)
+
+def compile_template(template: Any) -> tuple:
+    """
+    Compila un template una sola volta in un albero di nodi pronto per il rendering
+    
+    Args:
+        template: Template del webhook (dict, list, str o valore costante)
+        
+    Returns:
+        tuple: Nodo compilato (tipo, contenuto)
+    """
+    if isinstance(template, dict):
+        return ("dict", [(compile_template_string(key) if isinstance(key, str) else (key,),
+                          compile_template(value))
+                         for key, value in template.items()])
+    elif isinstance(template, list):
+        return ("list", [compile_template(item) for item in template])
+    elif isinstance(template, str):
+        return ("str", compile_template_string(template))
+    else:
+        return ("const", template)
+
 class WebhookHandler:
     """Gestore di webhook personalizzati per M4Bot"""
     
@@ -46,9 +251,9 @@ class WebhookHandler:
         self.security_config = config.get("security", {})
         
         # Whitelist IP (se vuoto, accetta tutte le IP)
-        self.ip_whitelist = self.security_config.get("ip_whitelist", [])
+        self.ip_whitelist = IPMatcher(self.security_config.get("ip_whitelist", []))
         # Blacklist IP
-        self.ip_blacklist = self.security_config.get("ip_blacklist", [])
+        self.ip_blacklist = IPMatcher(self.security_config.get("ip_blacklist", []))
         # Limite di richieste
         self.rate_limit = self.security_config.get("rate_limit", {
             "enabled": True,
@@ -57,12 +262,20 @@ class WebhookHandler:
             "block_duration": 300     # Durata del blocco in secondi
         })
         
-        # Cache per rate limiting
-        self.rate_limit_cache = {}
+        # Cache per rate limiting (contatori a finestra scorrevole per IP)
+        self.rate_limit_cache: Dict[str, _RateLimitState] = {}
+        self._rate_limit_last_sweep = time.time()
         # Cache dei webhook con errori
         self.error_cache = {}
         # Cache per verifica delle firme (anti-replay)
-        self.signature_cache = {}
+        self.signature_cache = ReplayNonceCache(
+            ttl=self.security_config.get("replay_window", 3600)
+        )
+        
+        # Template compilati per ID webhook: (template originale, template compilato)
+        self.template_cache: Dict[str, tuple] = {}
+        for webhook in self.webhooks:
+            self._compile_webhook_template(webhook)
         
         # Crea le directory necessarie
         os.makedirs("logs/webhooks", exist_ok=True)
@@ -207,23 +420,7 @@ class WebhookHandler:
             bool: True se l'IP è nella blacklist, False altrimenti
         """
         try:
-            client_ip = ipaddress.ip_address(ip)
-            
-            # Controlla IP esatti
-            if ip in self.ip_blacklist:
-                return True
-            
-            # Controlla subnet CIDR
-            for block in self.ip_blacklist:
-                if '/' in block:  # È un blocco CIDR
-                    try:
-                        network = ipaddress.ip_network(block, strict=False)
-                        if client_ip in network:
-                            return True
-                    except ValueError:
-                        continue
-            
-            return False
+            return self.ip_blacklist.matches(ip)
         except ValueError:
             logger.error(f"Formato IP non valido: {ip}")
             return True  # Per sicurezza, rifiuta IP non validi
@@ -243,27 +440,36 @@ class WebhookHandler:
             return True
         
         try:
-            client_ip = ipaddress.ip_address(ip)
-            
-            # Controlla IP esatti
-            if ip in self.ip_whitelist:
-                return True
-            
-            # Controlla subnet CIDR
-            for block in self.ip_whitelist:
-                if '/' in block:  # È un blocco CIDR
-                    try:
-                        network = ipaddress.ip_network(block, strict=False)
-                        if client_ip in network:
-                            return True
-                    except ValueError:
-                        continue
-            
-            return False
+            return self.ip_whitelist.matches(ip)
         except ValueError:
             logger.error(f"Formato IP non valido: {ip}")
             return False
     
+    def _get_rate_limit_state(self, ip: str, now: float) -> Optional[_RateLimitState]:
+        """
+        Restituisce lo stato di rate limiting di un IP facendo scorrere la finestra
+        
+        Args:
+            ip: Indirizzo IP
+            now: Timestamp corrente
+            
+        Returns:
+            Optional[_RateLimitState]: Stato dell'IP o None se non tracciato
+        """
+        state = self.rate_limit_cache.get(ip)
+        if state is None:
+            return None
+        
+        time_window = self.rate_limit["time_window"]
+        elapsed_windows = int((now - state.window_start) // time_window)
+        if elapsed_windows > 0:
+            # Scadenza pigra: la finestra corrente diventa la precedente
+            state.previous = state.current if elapsed_windows == 1 else 0
+            state.current = 0
+            state.window_start += elapsed_windows * time_window
+        
+        return state
+    
     def _is_rate_limited(self, ip: str) -> bool:
         """
         Verifica se un IP ha superato il rate limit
@@ -276,29 +482,27 @@ class WebhookHandler:
         """
         now = time.time()
         
-        # Pulisci vecchie entry
+        # Pulisci vecchie entry (al massimo una volta per finestra temporale)
         self._clean_rate_limit_cache(now)
         
-        if ip not in self.rate_limit_cache:
+        state = self._get_rate_limit_state(ip, now)
+        if state is None:
             return False
         
-        ip_data = self.rate_limit_cache[ip]
-        
         # Se è bloccato, controlla se il blocco è scaduto
-        if ip_data.get("blocked_until", 0) > now:
+        if state.blocked_until > now:
             return True
         
-        # Controlla il numero di richieste nella finestra temporale
+        # Stima le richieste nella finestra scorrevole pesando la finestra precedente
         time_window = self.rate_limit["time_window"]
         max_requests = self.rate_limit["max_requests"]
+        overlap = 1.0 - (now - state.window_start) / time_window
+        estimated_requests = state.previous * overlap + state.current
         
-        # Conta solo le richieste all'interno della finestra temporale
-        recent_requests = [ts for ts in ip_data["requests"] if ts > (now - time_window)]
-        
-        if len(recent_requests) >= max_requests:
+        if estimated_requests >= max_requests:
             # Supera il limite, blocca l'IP
             block_duration = self.rate_limit["block_duration"]
-            self.rate_limit_cache[ip]["blocked_until"] = now + block_duration
+            state.blocked_until = now + block_duration
             logger.warning(f"IP {ip} bloccato per {block_duration} secondi per rate limit")
             return True
         
@@ -313,33 +517,34 @@ class WebhookHandler:
         """
         now = time.time()
         
-        if ip not in self.rate_limit_cache:
-            self.rate_limit_cache[ip] = {
-                "requests": [now],
-                "blocked_until": 0
-            }
-        else:
-            self.rate_limit_cache[ip]["requests"].append(now)
+        state = self._get_rate_limit_state(ip, now)
+        if state is None:
+            state = _RateLimitState(now)
+            self.rate_limit_cache[ip] = state
+        
+        state.current += 1
     
     def _clean_rate_limit_cache(self, now: float):
         """
         Pulisce la cache del rate limiting
         
+        La scansione completa avviene al massimo una volta per finestra
+        temporale, quindi il costo per richiesta resta costante.
+        
         Args:
             now: Timestamp corrente
         """
         time_window = self.rate_limit["time_window"]
+        if now - self._rate_limit_last_sweep < time_window:
+            return
+        self._rate_limit_last_sweep = now
+        
         cutoff = now - (2 * time_window)
         
-        # Rimuovi richieste vecchie e IP non più bloccati
+        # Rimuovi gli IP inattivi da più di due finestre e non più bloccati
         for ip in list(self.rate_limit_cache.keys()):
-            # Rimuovi richieste vecchie
-            self.rate_limit_cache[ip]["requests"] = [
-                ts for ts in self.rate_limit_cache[ip]["requests"] if ts > cutoff
-            ]
-            
-            # Se non ci sono più richieste e l'IP non è bloccato, rimuovilo dalla cache
-            if not self.rate_limit_cache[ip]["requests"] and self.rate_limit_cache[ip]["blocked_until"] <= now:
+            state = self.rate_limit_cache[ip]
+            if state.window_start <= cutoff and state.blocked_until <= now:
                 del self.rate_limit_cache[ip]
     
     def _verify_webhook_signature(self, webhook: Dict[str, Any], headers: Dict[str, str], 
@@ -449,26 +654,17 @@ class WebhookHandler:
             # Usa una combinazione di timestamp e hash dei dati
             timestamp = headers.get("X-Timestamp", str(int(time.time())))
             data_hash = hashlib.sha256(
-                json.dumps(data).encode() if isinstance(data, dict) else str(data).encode()
+                json_codec.dumps_bytes(data) if isinstance(data, dict) else str(data).encode()
             ).hexdigest()
             combined_id = f"{webhook_id}:{timestamp}:{data_hash}"
         else:
             combined_id = f"{webhook_id}:{nonce or request_id}"
         
-        # Verifica se questa richiesta è già stata vista
-        if combined_id in self.signature_cache:
+        # Salva l'ID nella cache; le entry scadute vengono eliminate per bucket
+        if not self.signature_cache.add(combined_id, time.time()):
             logger.warning(f"Richiesta duplicata rilevata: {combined_id}")
             return True
         
-        # Salva l'ID nella cache
-        now = time.time()
-        self.signature_cache[combined_id] = now
-        
-        # Pulisci vecchie entry dalla cache (più di 1 ora)
-        for key in list(self.signature_cache.keys()):
-            if now - self.signature_cache[key] > 3600:
-                del self.signature_cache[key]
-        
         return False
     
     def _validate_webhook_data(self, webhook: Dict[str, Any], data: Any) -> bool:
@@ -588,14 +784,14 @@ class WebhookHandler:
                 "source_ip": source_ip,
                 "headers": {k: v for k, v in headers.items() if k.lower() not in 
                             ["authorization", "cookie", "x-signature"]},
-                "request_size": len(json.dumps(request_data)) if request_data else 0,
+                "request_size": len(json_codec.dumps_bytes(request_data)) if request_data else 0,
                 "processed": True
             }
             
             # Registra su file in formato JSON
             log_file = f"logs/webhooks/audit_{datetime.now().strftime('%Y-%m-%d')}.log"
             with open(log_file, "a") as f:
-                f.write(json.dumps(log_data) + "\n")
+                f.write(json_codec.dumps(log_data) + "\n")
                 
         except Exception as e:
             logger.error(f"Errore nella registrazione dell'evento webhook: {e}")
@@ -693,8 +889,8 @@ class WebhookHandler:
         try:
             # Prepara i dati da inviare
             if template:
-                # Applica il template ai dati
-                data = self._apply_template(template, payload)
+                # Applica il template compilato ai dati
+                data = self._render_template(self._get_compiled_template(webhook), payload)
             else:
                 # Usa i dati grezzi
                 data = payload
@@ -703,6 +899,7 @@ class WebhookHandler:
             headers["Content-Type"] = content_type
             
             # Gestisci l'autenticazione
+            payload_str = None
             if auth_type == "basic":
                 username = auth_params.get("username", "")
                 password = auth_params.get("password", "")
@@ -721,8 +918,8 @@ class WebhookHandler:
                 algorithm = auth_params.get("algorithm", "sha256")
                 header_name = auth_params.get("header_name", "X-Signature")
                 
-                # Calcola la firma HMAC
-                payload_str = json.dumps(data)
+                # Calcola la firma HMAC sullo stesso corpo che verrà inviato
+                payload_str = json_codec.dumps(data)
                 signature = self._generate_hmac_signature(payload_str, secret, algorithm)
                 headers[header_name] = signature
                 auth = None
@@ -743,7 +940,7 @@ class WebhookHandler:
             if content_type == "application/x-www-form-urlencoded":
                 send_data = data
             else:
-                send_data = json.dumps(data) if content_type == "application/json" else data
+                send_data = (payload_str or json_codec.dumps(data)) if content_type == "application/json" else data
             
             # Invia la richiesta
             for retry in range(self.max_retries):
@@ -813,6 +1010,43 @@ class WebhookHandler:
             self._track_webhook_error(webhook_id)
             return False, str(e)
     
+    def _compile_webhook_template(self, webhook: Dict[str, Any]) -> Optional[tuple]:
+        """
+        Compila il template di un webhook e lo salva nella cache
+        
+        Args:
+            webhook: Configurazione del webhook
+            
+        Returns:
+            Optional[tuple]: Template compilato o None se il webhook non ha template
+        """
+        webhook_id = webhook.get("id")
+        template = webhook.get("template")
+        
+        if not template:
+            self.template_cache.pop(webhook_id, None)
+            return None
+        
+        compiled = compile_template(template)
+        self.template_cache[webhook_id] = (template, compiled)
+        return compiled
+    
+    def _get_compiled_template(self, webhook: Dict[str, Any]) -> Optional[tuple]:
+        """
+        Ottiene il template compilato di un webhook, ricompilandolo se è cambiato
+        
+        Args:
+            webhook: Configurazione del webhook
+            
+        Returns:
+            Optional[tuple]: Template compilato
+        """
+        cached = self.template_cache.get(webhook.get("id"))
+        if cached is not None and cached[0] is webhook.get("template"):
+            return cached[1]
+        
+        return self._compile_webhook_template(webhook)
+    
     def _apply_template(self, template: Dict[str, Any], payload: Dict[str, Any]) -> Dict[str, Any]:
         """
         Applica un template ai dati dell'evento
@@ -824,23 +1058,60 @@ class WebhookHandler:
         Returns:
             Dict: Dati formattati secondo il template
         """
-        # Funzione ricorsiva per applicare il template
-        def apply_recursive(template_part, payload):
-            if isinstance(template_part, dict):
-                result = {}
-                for key, value in template_part.items():
-                    # Sostituisci le variabili nei nomi delle chiavi
-                    key = self._replace_variables(key, payload)
-                    result[key] = apply_recursive(value, payload)
-                return result
-            elif isinstance(template_part, list):
-                return [apply_recursive(item, payload) for item in template_part]
-            elif isinstance(template_part, str):
-                return self._replace_variables(template_part, payload)
+        return self._render_template(compile_template(template), payload)
+    
+    def _render_template(self, node: tuple, payload: Dict[str, Any]) -> Any:
+        """
+        Genera i dati a partire da un template compilato
+        
+        Args:
+            node: Nodo del template compilato
+            payload: Dati dell'evento
+            
+        Returns:
+            Any: Dati formattati secondo il template
+        """
+        kind, content = node
+        if kind == "str":
+            return self._render_segments(content, payload)
+        elif kind == "dict":
+            return {self._render_segments(key, payload): self._render_template(value, payload)
+                    for key, value in content}
+        elif kind == "list":
+            return [self._render_template(item, payload) for item in content]
+        else:
+            return content
+    
+    def _render_segments(self, segments: tuple, payload: Dict[str, Any]) -> Any:
+        """
+        Concatena in un solo passaggio i segmenti di una stringa compilata
+        
+        Args:
+            segments: Segmenti letterali e percorsi delle variabili
+            payload: Dati dell'evento
+            
+        Returns:
+            Any: Testo con variabili sostituite
+        """
+        if len(segments) == 1 and not isinstance(segments[0], tuple):
+            return segments[0]
+        
+        parts = []
+        for segment in segments:
+            if isinstance(segment, tuple):
+                # Cerca il valore nei dati dell'evento
+                value = payload
+                for key in segment:
+                    if isinstance(value, dict) and key in value:
+                        value = value[key]
+                    else:
+                        value = ""
+                        break
+                parts.append(str(value))
             else:
-                return template_part
+                parts.append(segment)
         
-        return apply_recursive(template, payload)
+        return "".join(parts)
     
     def _replace_variables(self, text: str, payload: Dict[str, Any]) -> str:
         """
@@ -856,27 +1127,7 @@ class WebhookHandler:
         if not isinstance(text, str):
             return text
         
-        # Cerca le variabili nel formato {{var}}
-        import re
-        matches = re.findall(r'\{\{([^}]+)\}\}', text)
-        
-        for match in matches:
-            # Estrai il percorso della variabile
-            path = match.strip().split('.')
-            
-            # Cerca il valore nei dati dell'evento
-            value = payload
-            for key in path:
-                if isinstance(value, dict) and key in value:
-                    value = value[key]
-                else:
-                    value = ""
-                    break
-            
-            # Sostituisci la variabile con il valore
-            text = text.replace(f"{{{{{match}}}}}", str(value))
-        
-        return text
+        return self._render_segments(compile_template_string(text), payload)
     
     def _track_webhook_error(self, webhook_id: str):
         """
@@ -1016,6 +1267,7 @@ class WebhookHandler:
         
         # Aggiungi il webhook
         self.webhooks.append(webhook)
+        self._compile_webhook_template(webhook)
         logger.info(f"Webhook '{webhook['id']}' aggiunto con successo")
         return True
     
@@ -1034,6 +1286,7 @@ class WebhookHandler:
             if webhook.get("id") == webhook_id:
                 # Rimuovi il webhook
                 self.webhooks.pop(i)
+                self.template_cache.pop(webhook_id, None)
                 logger.info(f"Webhook '{webhook_id}' rimosso con successo")
                 return True
         
@@ -1067,6 +1320,7 @@ class WebhookHandler:
                 # Aggiorna il webhook
                 webhook["id"] = webhook_id  # Assicura che l'ID rimanga lo stesso
                 self.webhooks[i] = webhook
+                self._compile_webhook_template(webhook)
                 logger.info(f"Webhook '{webhook_id}' aggiornato con successo")
                 return True
         
@@ -4,39 +4,130 @@ Gestione delle connessioni WebSocket con Kick.com
 Consente di ricevere eventi in tempo reale dalla piattaforma.
 """
 
-import json
 import logging
 import asyncio
 import time
+import random
 from typing import Dict, List, Optional, Any, Callable
 
 import websockets
 import aiohttp
 
+from bot import json_codec
+from bot.event_bus import ChatMessage
+
 # Configura il logger
 logger = logging.getLogger('WebSocketClient')
 
+# Politiche applicate quando la coda dei frame di un canale è piena
+OVERFLOW_DROP_OLDEST = "drop_oldest"  # Scarta il frame più vecchio in coda
+OVERFLOW_SAMPLE = "sample"            # Accetta solo un frame ogni sample_every, scarta gli altri
+OVERFLOW_BLOCK = "block"              # Sospende la lettura del socket finché c'è spazio
+
+# Peso del campione più recente nella media mobile esponenziale del ritardo dei frame
+LAG_EWMA_ALPHA = 0.1
+
+
+class _ChannelPipeline:
+    """Coda limitata dei frame di un canale e worker che li elabora in ordine."""
+    
+    __slots__ = ("queue", "task", "received", "dropped", "processed", "overflow_count",
+                 "max_lag", "ewma_lag")
+    
+    def __init__(self, queue_size: int):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.overflow_count = 0
+        self.max_lag = 0.0
+        self.ewma_lag = 0.0
+        
+    def record_lag(self, lag: float):
+        """Aggiorna le statistiche del ritardo tra ricezione ed elaborazione di un frame."""
+        self.processed += 1
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if self.processed == 1:
+            self.ewma_lag = lag
+        else:
+            self.ewma_lag += LAG_EWMA_ALPHA * (lag - self.ewma_lag)
+            
+    def metrics(self) -> Dict[str, Any]:
+        """Restituisce le metriche della coda (ritardi in millisecondi)."""
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "queued": self.queue.qsize(),
+            "lag_ewma_ms": self.ewma_lag * 1000,
+            "lag_max_ms": self.max_lag * 1000
+        }
+
+
 class KickWebSocketClient:
     """Cliente WebSocket per connettersi agli endpoint di Kick.com."""
     
     # URL del WebSocket di Kick
     WEBSOCKET_URL = "wss://ws-us2.pusher.com/app/eb1d5f283081a78b932c"
     
-    def __init__(self, bot):
+    # Evento Pusher dei messaggi di chat
+    CHAT_EVENT = "App\\Events\\ChatMessageSentEvent"
+    
+    def __init__(self, bot, frame_queue_size: int = 1000, overflow_policy: str = OVERFLOW_DROP_OLDEST,
+                 sample_every: int = 10, shard_id: int = 0, websocket_url: Optional[str] = None,
+                 backoff_base: float = 1.0, backoff_max: float = 60.0):
+        """
+        Args:
+            bot: Istanza del bot
+            frame_queue_size: Numero massimo di frame in attesa per ogni canale
+            overflow_policy: Politica con coda piena (drop_oldest, sample, block)
+            sample_every: Con la politica sample, frame accettati uno ogni N a coda piena
+            shard_id: Indice della connessione quando gestita da KickConnectionManager
+            websocket_url: URL alternativo del server Pusher (es. un server locale di prova)
+            backoff_base: Attesa base in secondi tra i tentativi di riconnessione
+            backoff_max: Attesa massima in secondi tra i tentativi di riconnessione
+        """
+        if overflow_policy not in (OVERFLOW_DROP_OLDEST, OVERFLOW_SAMPLE, OVERFLOW_BLOCK):
+            raise ValueError(f"Politica di overflow non valida: {overflow_policy}")
+            
         self.bot = bot
+        self.frame_queue_size = frame_queue_size
+        self.overflow_policy = overflow_policy
+        self.sample_every = max(1, sample_every)
+        self.pipelines: Dict[str, _ChannelPipeline] = {}  # Canale Pusher -> coda e worker
+        self.shard_id = shard_id
+        self.websocket_url = websocket_url or self.WEBSOCKET_URL
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
         self.ws = None
         self.connected = False
+        self.closing = False
         self.channel_subscriptions = {}
         self.message_handlers = {}
+        self.channel_ids = {}  # Cache nome canale -> ID nel database
+        self.subscribed_events = {self.CHAT_EVENT}  # Eventi di canale inoltrati ai worker
+        self.listen_task = None
+        self.ping_task = None
         self.reconnect_task = None
         self.last_pong = 0
         self.socket_key = ""
         self.ping_interval = 30  # Secondi tra un ping e l'altro
         
+        # Stato di salute della connessione
+        self.connects = 0
+        self.reconnects = 0
+        self.consecutive_failures = 0
+        self.last_connected_at = None
+        self.last_disconnected_at = None
+        self.last_error = None
+        
     async def connect(self):
         """Stabilisce una connessione WebSocket con Kick."""
         try:
-            self.ws = await websockets.connect(self.WEBSOCKET_URL)
+            self.closing = False
+            self.ws = await websockets.connect(self.websocket_url)
             self.connected = True
             self.last_pong = time.time()
             
@@ -46,19 +137,44 @@ class KickWebSocketClient:
                 "data": {}
             })
             
-            # Avvia il ping periodico
-            asyncio.create_task(self._ping_loop())
-            
-            # Avvia il task di ascolto
-            self.reconnect_task = asyncio.create_task(self._listen())
+            # Avvia il ping periodico e il task di ascolto della nuova connessione
+            self._cancel_connection_tasks()
+            self.ping_task = asyncio.create_task(self._ping_loop())
+            self.listen_task = asyncio.create_task(self._listen())
             
-            logger.info("Connesso al WebSocket di Kick")
+            self.connects += 1
+            self.consecutive_failures = 0
+            self.last_connected_at = time.time()
+            logger.info(f"Connesso al WebSocket di Kick (shard {self.shard_id})")
             return True
         except Exception as e:
-            logger.error(f"Errore nella connessione al WebSocket: {e}")
+            logger.error(f"Errore nella connessione al WebSocket (shard {self.shard_id}): {e}")
             self.connected = False
+            self.last_error = str(e)
             return False
             
+    def _cancel_connection_tasks(self):
+        """Annulla ping e ascolto della connessione precedente."""
+        current = asyncio.current_task()
+        for task in (self.ping_task, self.listen_task):
+            if task and task is not current and not task.done():
+                task.cancel()
+                
+    def _connection_lost(self, reason: str):
+        """Registra la perdita della connessione e pianifica la riconnessione."""
+        if self.connected:
+            self.last_disconnected_at = time.time()
+        self.connected = False
+        self.last_error = reason
+        self._schedule_reconnect()
+        
+    def _schedule_reconnect(self):
+        """Avvia il task di riconnessione se non è già in corso."""
+        if self.closing:
+            return
+        if self.reconnect_task is None or self.reconnect_task.done():
+            self.reconnect_task = asyncio.create_task(self._reconnect())
+            
     async def _ping_loop(self):
         """Invia ping periodici per mantenere attiva la connessione."""
         try:
@@ -72,67 +188,109 @@ class KickWebSocketClient:
                         "data": {}
                     })
                     
-                    # Se non riceviamo un pong entro 30 secondi, riconnetti
+                    # Se non riceviamo un pong entro 60 secondi, riconnetti
                     if time.time() - self.last_pong > 60:
-                        logger.warning("Nessun pong ricevuto, riconnessione...")
-                        asyncio.create_task(self._reconnect())
+                        logger.warning(f"Nessun pong ricevuto (shard {self.shard_id}), riconnessione...")
+                        if self.ws:
+                            await self.ws.close()
+                        self._connection_lost("pong timeout")
+                        break
         except asyncio.CancelledError:
             pass
         except Exception as e:
             logger.error(f"Errore nel ping loop: {e}")
             
     async def _listen(self):
-        """Ascolta i messaggi in arrivo dal WebSocket."""
+        """
+        Ascolta i messaggi in arrivo dal WebSocket.
+        
+        Il task si limita a leggere e decodificare i frame: gli eventi di canale
+        vengono accodati e elaborati dai worker, così la lettura del socket (e la
+        ricezione dei pong) non dipende dalla latenza dell'elaborazione.
+        """
         try:
             while self.connected:
                 try:
                     message = await self.ws.recv()
-                    await self._handle_message(message)
+                    await self._route_frame(message, time.monotonic())
                 except websockets.exceptions.ConnectionClosed:
-                    logger.warning("Connessione WebSocket chiusa, riconnessione...")
-                    self.connected = False
-                    await self._reconnect()
+                    if self.closing:
+                        break
+                    logger.warning(f"Connessione WebSocket chiusa (shard {self.shard_id}), riconnessione...")
+                    self._connection_lost("connection closed")
                     break
         except asyncio.CancelledError:
             logger.info("Task di ascolto WebSocket cancellato")
         except Exception as e:
             logger.error(f"Errore nell'ascolto WebSocket: {e}")
-            self.connected = False
-            await self._reconnect()
+            self._connection_lost(str(e))
             
+    def _backoff_delay(self, attempt: int) -> float:
+        """
+        Calcola l'attesa prima di un tentativo di riconnessione.
+        
+        Backoff esponenziale con jitter completo: le connessioni cadute insieme
+        non si ripresentano al server nello stesso istante.
+        
+        Args:
+            attempt: Numero di tentativi falliti consecutivi
+            
+        Returns:
+            Secondi di attesa
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        
     async def _reconnect(self):
-        """Tenta di ristabilire la connessione WebSocket."""
-        # Evita riconnessioni multiple
-        if not self.connected:
-            logger.info("Tentativo di riconnessione al WebSocket...")
-            
-            # Attendi un po' prima di riconnetterti
-            await asyncio.sleep(5)
-            
-            # Riconnetti
-            success = await self.connect()
-            
-            if success:
-                # Rinnova tutte le sottoscrizioni ai canali
-                for channel_name, channel_id in self.channel_subscriptions.items():
-                    handler = self.message_handlers.get(channel_id)
-                    if handler:
-                        await self.subscribe_to_channel_chat(channel_name, handler)
-                        
-                logger.info("Riconnessione al WebSocket riuscita")
-            else:
-                logger.error("Riconnessione al WebSocket fallita, ritentativo tra 30 secondi")
-                await asyncio.sleep(30)
-                asyncio.create_task(self._reconnect())
+        """Tenta di ristabilire la connessione WebSocket finché non riesce."""
+        attempt = 0
+        while not self.closing and not self.connected:
+            await asyncio.sleep(self._backoff_delay(attempt))
+            if self.closing:
+                return
+                
+            logger.info(f"Tentativo di riconnessione al WebSocket (shard {self.shard_id}, tentativo {attempt + 1})...")
+            if await self.connect():
+                self.reconnects += 1
+                await self._resubscribe_all()
+                logger.info(f"Riconnessione al WebSocket riuscita (shard {self.shard_id})")
+                return
+                
+            attempt += 1
+            self.consecutive_failures = attempt
+            
+    async def _resubscribe_all(self):
+        """Rinnova in parallelo tutte le sottoscrizioni ai canali."""
+        channels = [
+            channel_id for channel_id in self.channel_subscriptions.values()
+            if channel_id in self.message_handlers
+        ]
+        if channels:
+            await asyncio.gather(*(self._send_subscribe(channel_id) for channel_id in channels))
+            logger.info(f"Rinnovate {len(channels)} sottoscrizioni (shard {self.shard_id})")
+            
+    async def _send_subscribe(self, channel_id: str) -> bool:
+        """Invia la richiesta di sottoscrizione a un canale Pusher."""
+        return await self._send_message({
+            "event": "pusher:subscribe",
+            "data": {
+                "auth": "",
+                "channel": channel_id
+            }
+        })
             
     async def disconnect(self):
         """Chiude la connessione WebSocket."""
+        self.closing = True
         if self.ws:
             await self.ws.close()
             self.ws = None
             
         if self.reconnect_task and not self.reconnect_task.done():
             self.reconnect_task.cancel()
+        self._cancel_connection_tasks()
+            
+        for channel in list(self.pipelines):
+            await self._stop_pipeline(channel)
             
         self.connected = False
         logger.info("Disconnesso dal WebSocket di Kick")
@@ -141,19 +299,12 @@ class KickWebSocketClient:
         """Sottoscrive agli eventi di chat di un canale specifico."""
         channel_id = f"channel.{channel_name}.chat"
         
-        # Registra il callback per questo canale
+        # Registra il callback per questo canale (rinnovato automaticamente alla riconnessione)
         self.message_handlers[channel_id] = callback
+        self.channel_subscriptions[channel_name] = channel_id
         
         # Invia la richiesta di sottoscrizione
-        await self._send_message({
-            "event": "pusher:subscribe",
-            "data": {
-                "auth": "",
-                "channel": channel_id
-            }
-        })
-        
-        self.channel_subscriptions[channel_name] = channel_id
+        await self._send_subscribe(channel_id)
         logger.info(f"Sottoscritto al canale chat: {channel_name}")
         
     async def unsubscribe_from_channel(self, channel_name: str):
@@ -161,9 +312,10 @@ class KickWebSocketClient:
         if channel_name in self.channel_subscriptions:
             channel_id = self.channel_subscriptions[channel_name]
             
-            # Rimuovi l'handler
+            # Rimuovi l'handler e ferma il worker del canale
             if channel_id in self.message_handlers:
                 del self.message_handlers[channel_id]
+            await self._stop_pipeline(channel_id)
                 
             # Invia la richiesta di cancellazione della sottoscrizione
             await self._send_message({
@@ -180,155 +332,209 @@ class KickWebSocketClient:
         """Invia un messaggio tramite la connessione WebSocket."""
         if self.ws and self.connected:
             try:
-                await self.ws.send(json.dumps(message))
+                await self.ws.send(json_codec.dumps(message))
                 return True
             except Exception as e:
                 logger.error(f"Errore nell'invio del messaggio WebSocket: {e}")
-                self.connected = False
-                await self._reconnect()
+                self._connection_lost(str(e))
                 return False
         else:
             logger.warning("Tentativo di invio di un messaggio senza una connessione WebSocket attiva")
             return False
             
-    async def _handle_message(self, message_str: str):
-        """Gestisce i messaggi ricevuti dal WebSocket."""
+    async def _route_frame(self, message_str: str, received_at: float):
+        """
+        Decodifica un frame: gestisce subito gli eventi di sistema e accoda quelli di canale.
+        
+        Args:
+            message_str: Frame ricevuto dal WebSocket
+            received_at: Istante di ricezione (time.monotonic)
+        """
+        try:
+            message = json_codec.loads(message_str)
+        except json_codec.JSONDecodeError:
+            logger.error(f"Errore nel parsing del messaggio JSON: {message_str}")
+            return
+            
+        event = message.get("event", "")
+        channel = message.get("channel", "")
+        
+        if not channel or event.startswith("pusher"):
+            await self._handle_message(message)
+        elif event in self.subscribed_events and channel in self.message_handlers:
+            # Il payload interno viene decodificato solo dal worker del canale
+            await self._enqueue_frame(channel, (received_at, event, message.get("data", "{}")))
+        else:
+            # Nessuno è interessato a questo evento: il payload non viene decodificato
+            logger.debug(f"Ricevuto evento: {event} dal canale: {channel}")
+            
+    async def _enqueue_frame(self, channel: str, frame: tuple):
+        """
+        Accoda un frame nella coda del canale applicando la politica di overflow.
+        
+        Args:
+            channel: Canale Pusher del frame
+            frame: Tupla (istante di ricezione, evento, dati non decodificati)
+        """
+        pipeline = self._get_pipeline(channel)
+        pipeline.received += 1
+        queue = pipeline.queue
+        
+        if not queue.full():
+            queue.put_nowait(frame)
+            return
+            
+        if self.overflow_policy == OVERFLOW_BLOCK:
+            await queue.put(frame)
+            return
+            
+        pipeline.overflow_count += 1
+        if self.overflow_policy == OVERFLOW_SAMPLE and pipeline.overflow_count % self.sample_every:
+            # A coda piena passa solo un frame ogni sample_every
+            pipeline.dropped += 1
+            return
+            
+        # Scarta il frame più vecchio per fare spazio a quello nuovo
+        try:
+            queue.get_nowait()
+            queue.task_done()
+            pipeline.dropped += 1
+        except asyncio.QueueEmpty:
+            pass
+        queue.put_nowait(frame)
+        
+        if pipeline.dropped % 100 == 1:
+            logger.warning(f"Coda dei frame del canale {channel} piena: scartati {pipeline.dropped} frame")
+            
+    def _get_pipeline(self, channel: str) -> _ChannelPipeline:
+        """Restituisce la coda del canale, avviandone il worker se necessario."""
+        pipeline = self.pipelines.get(channel)
+        if pipeline is None:
+            pipeline = _ChannelPipeline(self.frame_queue_size)
+            self.pipelines[channel] = pipeline
+        if pipeline.task is None or pipeline.task.done():
+            pipeline.task = asyncio.create_task(self._channel_worker(channel, pipeline))
+        return pipeline
+        
+    async def _channel_worker(self, channel: str, pipeline: _ChannelPipeline):
+        """Elabora in ordine i frame di un canale."""
+        queue = pipeline.queue
+        while True:
+            received_at, event, data = await queue.get()
+            try:
+                pipeline.record_lag(time.monotonic() - received_at)
+                
+                callback = self.message_handlers.get(channel)
+                if callback:
+                    await callback(channel, json_codec.loads(data) if isinstance(data, str) else data)
+            except Exception as e:
+                logger.error(f"Errore nell'elaborazione di un frame del canale {channel}: {e}")
+            finally:
+                queue.task_done()
+                
+    async def _stop_pipeline(self, channel: str):
+        """Ferma il worker di un canale e ne rimuove la coda."""
+        pipeline = self.pipelines.pop(channel, None)
+        if pipeline and pipeline.task and not pipeline.task.done():
+            pipeline.task.cancel()
+            try:
+                await pipeline.task
+            except asyncio.CancelledError:
+                pass
+                
+    def get_health(self) -> Dict[str, Any]:
+        """
+        Restituisce lo stato di salute della connessione.
+        
+        Returns:
+            Dizionario con stato, contatori di riconnessione ed età dell'ultimo pong
+        """
+        return {
+            "shard_id": self.shard_id,
+            "connected": self.connected,
+            "channels": len(self.channel_subscriptions),
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "consecutive_failures": self.consecutive_failures,
+            "reconnecting": bool(self.reconnect_task and not self.reconnect_task.done()),
+            "last_connected_at": self.last_connected_at,
+            "last_disconnected_at": self.last_disconnected_at,
+            "last_error": self.last_error,
+            "last_pong_age": time.time() - self.last_pong if self.last_pong else None,
+            "socket_id": self.socket_key
+        }
+        
+    def get_metrics(self) -> Dict[str, Any]:
+        """
+        Restituisce le metriche delle code dei frame.
+        
+        Returns:
+            Dizionario con politica di overflow, totali e metriche per canale
+        """
+        channels = {channel: pipeline.metrics() for channel, pipeline in self.pipelines.items()}
+        return {
+            "connected": self.connected,
+            "overflow_policy": self.overflow_policy,
+            "received": sum(m["received"] for m in channels.values()),
+            "dropped": sum(m["dropped"] for m in channels.values()),
+            "queued": sum(m["queued"] for m in channels.values()),
+            "lag_max_ms": max((m["lag_max_ms"] for m in channels.values()), default=0.0),
+            "channels": channels
+        }
+            
+    async def _handle_message(self, message: Dict):
+        """Gestisce i messaggi di sistema ricevuti dal WebSocket."""
         try:
-            message = json.loads(message_str)
             event = message.get("event", "")
             channel = message.get("channel", "")
             
             # Gestisce i messaggi di sistema
             if event == "pusher:connection_established":
                 # Salva la chiave del socket
-                data = json.loads(message.get("data", "{}"))
+                data = json_codec.loads(message.get("data", "{}"))
                 self.socket_key = data.get("socket_id", "")
                 logger.info(f"Connessione WebSocket stabilita, socket_id: {self.socket_key}")
                 
             elif event == "pusher:pong":
                 self.last_pong = time.time()
                 
-            # Gestisce eventi di chat
-            elif event == "App\\Events\\ChatMessageSentEvent" and channel in self.message_handlers:
-                callback = self.message_handlers[channel]
-                data = json.loads(message.get("data", "{}"))
-                await callback(channel, data)
-                
             # Gestisce eventi di sottoscrizione
             elif event == "pusher_internal:subscription_succeeded":
                 logger.info(f"Sottoscrizione al canale {channel} riuscita")
                 
             # Altri tipi di eventi
-            elif event and event != "pusher:pong":
+            elif event:
                 logger.debug(f"Ricevuto evento: {event} dal canale: {channel}")
                 
-        except json.JSONDecodeError:
-            logger.error(f"Errore nel parsing del messaggio JSON: {message_str}")
         except Exception as e:
             logger.error(f"Errore nella gestione del messaggio: {e}")
             
-    async def handle_chat_message(self, channel_name: str, message_data: Dict):
-        """Gestisce un messaggio di chat ricevuto dal WebSocket."""
-        # Ottieni le informazioni dell'utente e del messaggio
-        try:
-            user = {
-                "id": message_data.get("sender", {}).get("id"),
-                "username": message_data.get("sender", {}).get("username"),
-                "is_moderator": message_data.get("sender", {}).get("is_moderator", False),
-                "is_subscriber": message_data.get("sender", {}).get("is_subscriber", False),
-                "is_vip": "VIP" in message_data.get("sender", {}).get("follower_badges", [])
-            }
-            
-            content = message_data.get("content", "")
-            
-            # Trova il canale nel database
+    async def _resolve_channel_id(self, channel_name: str) -> Optional[int]:
+        """Restituisce l'ID del canale nel database, con cache in memoria."""
+        channel_id = self.channel_ids.get(channel_name)
+        if channel_id is None:
             async with self.bot.db.pool.acquire() as conn:
-                channel = await conn.fetchrow('''
+                channel_id = await conn.fetchval('''
                     SELECT id FROM channels WHERE name = $1
                 ''', channel_name)
+            if channel_id is not None:
+                self.channel_ids[channel_name] = channel_id
+        return channel_id
+        
+    async def handle_chat_message(self, channel_name: str, message_data: Dict):
+        """
+        Gestisce un messaggio di chat ricevuto dal WebSocket.
+        
+        Il messaggio viene normalizzato una sola volta e pubblicato sul bus degli
+        eventi del bot, che lo distribuisce a log, punti canale, giochi, comandi e plugin.
+        """
+        try:
+            channel_id = await self._resolve_channel_id(channel_name)
+            if channel_id is None:
+                logger.warning(f"Ricevuto messaggio per canale non registrato: {channel_name}")
+                return
                 
-                if not channel:
-                    logger.warning(f"Ricevuto messaggio per canale non registrato: {channel_name}")
-                    return
-                    
-                channel_id = channel["id"]
-                
-                # Logga il messaggio nel database
-                await conn.execute('''
-                    INSERT INTO chat_messages 
-                    (channel_id, user_id, username, content, is_command, created_at)
-                    VALUES ($1, $2, $3, $4, $5, NOW())
-                ''', channel_id, user["id"], user["username"], content, content.startswith("!"))
-                
-            # Gestisci i punti canale per l'utente
-            if hasattr(self.bot, "kick_channel_points") and self.bot.kick_channel_points:
-                await self.bot.kick_channel_points.handle_chat_message(
-                    channel_id, 
-                    int(user["id"]), 
-                    user["username"],
-                    user["is_subscriber"],
-                    user["is_moderator"],
-                    user["is_vip"]
-                )
-                
-            # Passa il messaggio al metodo handle_message di M4Bot per i giochi
-            await self.bot.handle_message(channel_id, channel_name, user, content)
-                
-            # Se è un comando, passalo al gestore comandi
-            if content.startswith("!"):
-                command_parts = content.split(" ", 1)
-                command = command_parts[0][1:].lower()  # Rimuovi il ! e converti in minuscolo
-                
-                # Gestisci i comandi del sistema di punti canale
-                if command in ["punti", "points"]:
-                    # Ottieni i punti dell'utente
-                    points = await self.bot.point_system.get_user_points(channel_id, int(user["id"]))
-                    points_name = self.bot.kick_channel_points.config.points_name
-                    
-                    # Invia un messaggio con i punti dell'utente
-                    message = f"{user['username']}, hai {points} {points_name}!"
-                    await self.bot.api.send_chat_message(channel_id, channel_name, message)
-                    return
-                    
-                elif command in ["classifica", "leaderboard", "top"]:
-                    # Ottieni la classifica dei punti
-                    top_users = await self.bot.point_system.get_top_points(channel_id, 5)
-                    points_name = self.bot.kick_channel_points.config.points_name
-                    
-                    # Formatta la classifica
-                    message = f"Classifica {points_name}:\n"
-                    for i, user_data in enumerate(top_users):
-                        message += f"{i+1}. {user_data['username']}: {user_data['points']} {points_name}\n"
-                    
-                    # Invia la classifica in chat
-                    await self.bot.api.send_chat_message(channel_id, channel_name, message)
-                    return
-                    
-                elif command in ["premi", "rewards"]:
-                    # Ottieni la lista dei premi disponibili
-                    rewards = await self.bot.kick_channel_points.get_rewards(channel_id)
-                    
-                    if not rewards:
-                        await self.bot.api.send_chat_message(channel_id, channel_name, "Nessun premio disponibile al momento.")
-                        return
-                    
-                    # Formatta la lista dei premi
-                    message = "Premi disponibili:\n"
-                    for reward in rewards:
-                        if reward.get("enabled", True):
-                            message += f"{reward.get('title')}: {reward.get('cost')} punti - {reward.get('description')}\n"
-                    
-                    # Invia la lista in chat
-                    await self.bot.api.send_chat_message(channel_id, channel_name, message)
-                    return
-                
-                # Gestisci altri comandi standard
-                await self.bot.command_handler.handle_command(
-                    channel_id, 
-                    channel_name, 
-                    user, 
-                    content
-                )
+            self.bot.event_bus.publish(ChatMessage.from_kick(channel_id, channel_name, message_data))
         except Exception as e:
             logger.error(f"Errore nella gestione del messaggio di chat: {e}")
             
@@ -397,3 +603,93 @@ class KickWebSocketClient:
             
         except Exception as e:
             logger.error(f"Errore nella gestione dell'evento di follow: {e}")
+
+
+class KickConnectionManager:
+    """
+    Distribuisce le sottoscrizioni ai canali su più connessioni WebSocket (shard).
+    
+    Ogni shard è un KickWebSocketClient indipendente con riconnessione e rinnovo
+    delle sottoscrizioni propri: la caduta di una connessione interrompe solo i
+    canali assegnati a quello shard.
+    """
+    
+    def __init__(self, bot, shards: int = 4, **client_options):
+        """
+        Args:
+            bot: Istanza del bot
+            shards: Numero di connessioni WebSocket
+            **client_options: Opzioni passate a ogni KickWebSocketClient
+        """
+        self.bot = bot
+        self.clients = [
+            KickWebSocketClient(bot, shard_id=shard_id, **client_options)
+            for shard_id in range(max(1, shards))
+        ]
+        self.assignments: Dict[str, int] = {}  # Nome canale -> indice dello shard
+        
+    async def connect(self) -> int:
+        """
+        Connette tutti gli shard in parallelo; quelli non raggiungibili ritentano in background.
+        
+        Returns:
+            Numero di shard connessi
+        """
+        results = await asyncio.gather(*(client.connect() for client in self.clients))
+        for client, connected in zip(self.clients, results):
+            if not connected:
+                client._schedule_reconnect()
+        connected = sum(1 for result in results if result)
+        logger.info(f"Connessi {connected}/{len(self.clients)} shard WebSocket")
+        return connected
+        
+    async def disconnect(self):
+        """Chiude tutte le connessioni."""
+        await asyncio.gather(*(client.disconnect() for client in self.clients))
+        
+    def shard_for(self, channel_name: str) -> KickWebSocketClient:
+        """
+        Restituisce lo shard di un canale, assegnando i nuovi canali allo shard meno carico.
+        
+        Args:
+            channel_name: Nome del canale
+        """
+        shard_id = self.assignments.get(channel_name)
+        if shard_id is None:
+            shard_id = min(range(len(self.clients)), key=lambda i: len(self.clients[i].channel_subscriptions))
+            self.assignments[channel_name] = shard_id
+        return self.clients[shard_id]
+        
+    async def subscribe_to_channel_chat(self, channel_name: str, callback: Callable):
+        """Sottoscrive agli eventi di chat di un canale sullo shard assegnato."""
+        await self.shard_for(channel_name).subscribe_to_channel_chat(channel_name, callback)
+        
+    async def subscribe_many(self, channel_names: List[str], callback: Callable):
+        """Sottoscrive in parallelo agli eventi di chat di più canali."""
+        await asyncio.gather(*(self.subscribe_to_channel_chat(name, callback) for name in channel_names))
+        
+    async def unsubscribe_from_channel(self, channel_name: str):
+        """Annulla la sottoscrizione da un canale."""
+        shard_id = self.assignments.pop(channel_name, None)
+        if shard_id is not None:
+            await self.clients[shard_id].unsubscribe_from_channel(channel_name)
+            
+    def get_health(self) -> Dict[str, Any]:
+        """
+        Restituisce lo stato di salute di tutti gli shard.
+        
+        Returns:
+            Dizionario con riepilogo e dettaglio per shard
+        """
+        shards = [client.get_health() for client in self.clients]
+        return {
+            "shards": len(shards),
+            "connected": sum(1 for shard in shards if shard["connected"]),
+            "channels": sum(shard["channels"] for shard in shards),
+            "unavailable_channels": sum(shard["channels"] for shard in shards if not shard["connected"]),
+            "details": shards
+        }
+        
+    def get_metrics(self) -> Dict[str, Any]:
+        """Restituisce le metriche delle code dei frame di ogni shard."""
+        return {client.shard_id: client.get_metrics() for client in self.clients}
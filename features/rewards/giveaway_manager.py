@@ -12,12 +12,17 @@ import json
 import asyncio
 import logging
 import time
+import math
+import heapq
 import random
+import secrets
 import uuid
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Optional, Set, Union, Tuple
+from typing import Dict, List, Any, Optional, Set, Union, Tuple, AsyncIterator, Iterable
 from dataclasses import asdict
 
+import asyncpg
+
 # Importa i moduli locali
 from .models import Giveaway, Prize, Entry, Winner, GiveawayStatus
 from .validators import ParticipationValidator
@@ -26,6 +31,16 @@ from .prize_system import PrizeSystem
 # Configura il logger
 logger = logging.getLogger('m4bot.rewards.giveaway')
 
+# Errori dovuti al contenuto di una singola partecipazione (duplicato, giveaway inesistente,
+# valore non valido): la riga viene scartata invece di bloccare le scritture successive
+ENTRY_DATA_ERRORS = (asyncpg.IntegrityConstraintViolationError, asyncpg.DataError)
+
+ENTRY_INSERT_QUERY = """
+    INSERT INTO giveaway_entries
+    (id, giveaway_id, user_id, username, entry_time)
+    VALUES ($1, $2, $3, $4, $5)
+"""
+
 class GiveawayManager:
     """
     Classe principale che gestisce il sistema di giveaway.
@@ -61,10 +76,38 @@ class GiveawayManager:
         # Intervallo di controllo per giveaway temporizzati (secondi)
         self.check_interval = self.config.get('giveaway_check_interval', 15)
         
+        # Partecipanti di ogni giveaway attivo, per scartare i duplicati in O(1)
+        # giveaway_id -> set di user_id
+        self.entrants: Dict[str, Set[str]] = {}
+        
+        # Giveaway in chiusura: non accettano più partecipazioni mentre
+        # vengono scritte le ultime e si estraggono i vincitori
+        self.closing_giveaways: Set[str] = set()
+        
+        # Partecipazioni accettate in attesa di essere inserite nel database
+        # Tuple (id, giveaway_id, user_id, username, entry_time)
+        self.pending_entries: List[Tuple[str, str, str, str, float]] = []
+        
+        # Intervallo di scrittura delle partecipazioni (secondi) e dimensione massima del lotto
+        self.entry_flush_interval = self.config.get('giveaway_entry_flush_interval', 1.0)
+        self.entry_batch_size = self.config.get('giveaway_entry_batch_size', 1000)
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        
+        # Pesi dei biglietti per l'estrazione (vuoto = un biglietto per partecipante)
+        # Chiavi supportate: 'subscriber' (moltiplicatore per gli iscritti),
+        # 'points_per_ticket' e 'max_bonus_tickets' (biglietti extra in base ai punti)
+        self.ticket_weights: Dict[str, Any] = self.config.get('giveaway_ticket_weights', {})
+        
+        # Righe lette per ogni giro del cursore durante l'estrazione
+        self.selection_prefetch = self.config.get('giveaway_selection_prefetch', 5000)
+        
         logger.info("Gestore giveaway inizializzato")
     
     async def initialize(self):
         """Inizializza il gestore di giveaway."""
+        await self._ensure_schema()
+        
         # Carica i giveaway attivi dal database
         await self._load_active_giveaways()
         
@@ -74,19 +117,42 @@ class GiveawayManager:
         self.background_tasks.add(task)
         task.add_done_callback(self.background_tasks.discard)
         
+        # Avvia il task di scrittura a lotti delle partecipazioni
+        task = asyncio.create_task(self._entry_flush_loop())
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        
         logger.info(f"Gestore giveaway avviato con {len(self.active_giveaways)} giveaway attivi")
     
     async def shutdown(self):
         """Spegni il gestore di giveaway in modo sicuro."""
         self.running = False
+        self._flush_requested.set()
         
         # Attendi che tutti i task in background terminino
         if self.background_tasks:
             logger.info(f"In attesa che {len(self.background_tasks)} task terminino...")
             await asyncio.gather(*self.background_tasks, return_exceptions=True)
         
+        # Scrivi le partecipazioni ancora in memoria
+        await self.flush_entries()
+        
         logger.info("Gestore giveaway spento correttamente")
     
+    async def _ensure_schema(self):
+        """Aggiunge le colonne introdotte dopo la creazione delle tabelle dei giveaway."""
+        if not self.db_pool:
+            return
+        
+        try:
+            async with self.db_pool.acquire() as conn:
+                # Seme dell'estrazione, per verificare e ripetere la selezione dei vincitori
+                await conn.execute(
+                    "ALTER TABLE giveaways ADD COLUMN IF NOT EXISTS selection_seed BIGINT"
+                )
+        except Exception as e:
+            logger.error(f"Errore nell'aggiornamento dello schema dei giveaway: {e}")
+    
     async def _load_active_giveaways(self):
         """Carica i giveaway attivi dal database."""
         if not self.db_pool:
@@ -127,11 +193,19 @@ class GiveawayManager:
                         requirements=giveaway_data['requirements'],
                         created_by=giveaway_data['created_by'],
                         created_at=giveaway_data['created_at'],
-                        updated_at=giveaway_data['updated_at']
+                        updated_at=giveaway_data['updated_at'],
+                        selection_seed=giveaway_data.get('selection_seed')
                     )
                     
                     # Aggiungi alla lista di giveaway attivi
                     self.active_giveaways[giveaway.id] = giveaway
+                    
+                    # Carica i partecipanti già registrati
+                    entrant_rows = await conn.fetch(
+                        "SELECT user_id FROM giveaway_entries WHERE giveaway_id = $1",
+                        giveaway.id
+                    )
+                    self.entrants[giveaway.id] = {row['user_id'] for row in entrant_rows}
                 
                 logger.info(f"Caricati {len(self.active_giveaways)} giveaway attivi dal database")
         
@@ -268,6 +342,7 @@ class GiveawayManager:
             
             # Aggiungi ai giveaway attivi
             self.active_giveaways[giveaway.id] = giveaway
+            self.entrants[giveaway.id] = set()
             
             # Se lo stato è ACTIVE, annuncia il giveaway
             if giveaway.status == GiveawayStatus.ACTIVE:
@@ -348,20 +423,31 @@ class GiveawayManager:
             logger.warning(f"Impossibile terminare giveaway {giveaway_id}: stato non valido {giveaway.status.value}")
             return False
         
+        if giveaway_id in self.closing_giveaways:
+            logger.warning(f"Giveaway {giveaway_id} già in chiusura")
+            return False
+        
+        # Verifica se può essere terminato
+        current_time = time.time()
+        if not force and giveaway.end_time and giveaway.end_time > current_time:
+            logger.warning(f"Giveaway {giveaway_id} non può essere terminato: non è ancora scaduto")
+            return False
+        
+        # Da qui in poi le nuove partecipazioni vengono rifiutate, così quelle
+        # confermate sono tutte nel database prima dell'estrazione
+        self.closing_giveaways.add(giveaway_id)
         try:
-            # Verifica se può essere terminato
-            current_time = time.time()
-            if not force and giveaway.end_time and giveaway.end_time > current_time:
-                logger.warning(f"Giveaway {giveaway_id} non può essere terminato: non è ancora scaduto")
-                return False
+            # Scrivi le partecipazioni ancora in memoria prima della selezione: se la
+            # scrittura fallisce l'estrazione escluderebbe chi ha già ricevuto conferma,
+            # quindi la chiusura viene rimandata al prossimo controllo
+            while self._has_pending_entries(giveaway_id):
+                if not await self.flush_entries() and self._has_pending_entries(giveaway_id):
+                    logger.error(f"Chiusura del giveaway {giveaway_id} rimandata: "
+                                 f"partecipazioni non ancora scritte nel database")
+                    return False
             
-            # Ottieni le partecipazioni
-            entries = await self._get_entries(giveaway_id)
-            if not entries:
-                logger.warning(f"Nessuna partecipazione per il giveaway {giveaway_id}")
-            
-            # Seleziona i vincitori
-            winners = await self._select_winners(giveaway, entries)
+            # Seleziona i vincitori scorrendo le partecipazioni con un cursore
+            winners = await self._select_winners(giveaway, self._iter_entries(giveaway))
             if winners:
                 # Aggiorna lo stato del premio se presente
                 if giveaway.prize_id:
@@ -383,14 +469,14 @@ class GiveawayManager:
             if self.db_pool:
                 async with self.db_pool.acquire() as conn:
                     async with conn.transaction():
-                        # Aggiorna lo stato del giveaway
+                        # Aggiorna lo stato del giveaway con il seme dell'estrazione
                         await conn.execute(
                             """
                             UPDATE giveaways
-                            SET status = $1, updated_at = $2
-                            WHERE id = $3
+                            SET status = $1, updated_at = $2, selection_seed = $3
+                            WHERE id = $4
                             """,
-                            giveaway.status.value, giveaway.updated_at, giveaway.id
+                            giveaway.status.value, giveaway.updated_at, giveaway.selection_seed, giveaway.id
                         )
                         
                         # Registra i vincitori
@@ -406,6 +492,8 @@ class GiveawayManager:
             
             # Rimuovi dai giveaway attivi
             self.active_giveaways.pop(giveaway_id, None)
+            self.entrants.pop(giveaway_id, None)
+            self.validators.invalidate_cache(giveaway_id)
             
             logger.info(f"Giveaway '{giveaway.title}' ({giveaway.id}) terminato con {len(winners)} vincitori")
             return True
@@ -413,6 +501,10 @@ class GiveawayManager:
         except Exception as e:
             logger.error(f"Errore nella chiusura del giveaway {giveaway_id}: {e}")
             return False
+        
+        finally:
+            # Se la chiusura è stata rimandata il giveaway torna ad accettare partecipazioni
+            self.closing_giveaways.discard(giveaway_id)
     
     async def enter_giveaway(self, giveaway_id: str, user_id: str, username: str) -> Dict[str, Any]:
         """
@@ -434,104 +526,189 @@ class GiveawayManager:
         if giveaway.status != GiveawayStatus.ACTIVE:
             return {"success": False, "message": f"Il giveaway non è attivo (stato: {giveaway.status.value})"}
         
+        if giveaway_id in self.closing_giveaways:
+            return {"success": False, "message": "Il giveaway è in chiusura: partecipazioni terminate"}
+        
+        # Controlla se l'utente ha già partecipato (prenota subito il posto
+        # per evitare doppie partecipazioni durante la validazione)
+        entrants = self.entrants.setdefault(giveaway_id, set())
+        if user_id in entrants:
+            return {"success": False, "message": "Hai già partecipato a questo giveaway"}
+        entrants.add(user_id)
+        
         try:
-            # Controlla se l'utente ha già partecipato
-            already_entered = await self._check_user_entry(giveaway_id, user_id)
-            if already_entered:
-                return {"success": False, "message": "Hai già partecipato a questo giveaway"}
-            
             # Verifica i requisiti di partecipazione
             if giveaway.requirements:
                 validation = await self.validators.validate_requirements(
                     user_id=user_id,
                     channel_id=giveaway.channel_id,
-                    requirements=giveaway.requirements
+                    requirements=giveaway.requirements,
+                    giveaway_id=giveaway_id
                 )
                 
                 if not validation['valid']:
+                    entrants.discard(user_id)
                     return {
                         "success": False, 
                         "message": f"Non soddisfi i requisiti: {validation['reason']}"
                     }
             
-            # Registra la partecipazione
+            # La chiusura può essere iniziata durante la validazione
+            if giveaway_id in self.closing_giveaways:
+                entrants.discard(user_id)
+                return {"success": False, "message": "Il giveaway è in chiusura: partecipazioni terminate"}
+            
+            # Registra la partecipazione nel buffer, scritto a lotti nel database
             entry_id = str(uuid.uuid4())
             entry_time = time.time()
             
             if self.db_pool:
-                async with self.db_pool.acquire() as conn:
-                    await conn.execute(
-                        """
-                        INSERT INTO giveaway_entries
-                        (id, giveaway_id, user_id, username, entry_time)
-                        VALUES ($1, $2, $3, $4, $5)
-                        """,
-                        entry_id, giveaway_id, user_id, username, entry_time
-                    )
+                self.pending_entries.append((entry_id, giveaway_id, user_id, username, entry_time))
+                if len(self.pending_entries) >= self.entry_batch_size:
+                    self._flush_requested.set()
             
-            logger.info(f"Utente {username} ({user_id}) ha partecipato al giveaway {giveaway_id}")
+            logger.debug(f"Utente {username} ({user_id}) ha partecipato al giveaway {giveaway_id}")
             return {"success": True, "message": f"Hai partecipato al giveaway '{giveaway.title}'"}
         
         except Exception as e:
+            entrants.discard(user_id)
             logger.error(f"Errore nella registrazione della partecipazione al giveaway {giveaway_id}: {e}")
             return {"success": False, "message": "Si è verificato un errore durante la registrazione"}
     
-    async def _check_user_entry(self, giveaway_id: str, user_id: str) -> bool:
+    async def _entry_flush_loop(self):
+        """Task che scrive periodicamente le partecipazioni accumulate."""
+        while self.running:
+            try:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.entry_flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                
+                await self.flush_entries()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Errore nella scrittura periodica delle partecipazioni: {e}")
+    
+    async def flush_entries(self) -> int:
         """
-        Controlla se un utente ha già partecipato a un giveaway.
+        Inserisce nel database tutte le partecipazioni in attesa con un'unica operazione.
+        
+        Se il lotto fallisce, le righe vengono inserite una alla volta: quelle con
+        dati non validi vengono scartate, mentre in caso di errore di connessione
+        le righe non ancora scritte tornano in coda.
         
-        Args:
-            giveaway_id: ID del giveaway
-            user_id: ID dell'utente
-            
         Returns:
-            bool: True se l'utente ha già partecipato
+            int: Numero di partecipazioni scritte
         """
         if not self.db_pool:
-            return False
+            if self.pending_entries:
+                logger.error(f"{len(self.pending_entries)} partecipazioni in attesa: nessun pool di database fornito")
+            return 0
         
-        try:
-            async with self.db_pool.acquire() as conn:
-                entry = await conn.fetchrow(
-                    """
-                    SELECT id FROM giveaway_entries
-                    WHERE giveaway_id = $1 AND user_id = $2
-                    """,
-                    giveaway_id, user_id
-                )
+        async with self._flush_lock:
+            if not self.pending_entries:
+                return 0
+            
+            batch = self.pending_entries
+            self.pending_entries = []
+            
+            try:
+                async with self.db_pool.acquire() as conn:
+                    await conn.executemany(ENTRY_INSERT_QUERY, batch)
                 
-                return entry is not None
-        
-        except Exception as e:
-            logger.error(f"Errore nella verifica della partecipazione dell'utente {user_id}: {e}")
-            return False
+                logger.info(f"Registrate {len(batch)} partecipazioni ai giveaway")
+                return len(batch)
+            
+            except Exception as e:
+                logger.error(f"Errore nella scrittura di {len(batch)} partecipazioni, "
+                             f"nuovo tentativo riga per riga: {e}")
+            
+            return await self._insert_entries_one_by_one(batch)
     
-    async def _get_entries(self, giveaway_id: str) -> List[Entry]:
+    async def _insert_entries_one_by_one(self, batch: List[Tuple[str, str, str, str, float]]) -> int:
         """
-        Ottiene tutte le partecipazioni per un giveaway.
+        Inserisce le partecipazioni una alla volta, isolando le righe non valide.
         
         Args:
-            giveaway_id: ID del giveaway
+            batch: Partecipazioni da inserire
             
         Returns:
-            List[Entry]: Lista delle partecipazioni
+            int: Numero di partecipazioni scritte
         """
-        entries = []
+        written = 0
+        dropped = 0
         
+        for index, entry in enumerate(batch):
+            try:
+                async with self.db_pool.acquire() as conn:
+                    await conn.execute(ENTRY_INSERT_QUERY, *entry)
+                written += 1
+            except ENTRY_DATA_ERRORS as e:
+                dropped += 1
+                logger.error(f"Partecipazione {entry[0]} di {entry[3]} al giveaway {entry[1]} scartata: {e}")
+            except Exception as e:
+                # Problema del database, non della riga: riprova più tardi le righe rimaste
+                self.pending_entries[:0] = batch[index:]
+                logger.error(f"Errore nella scrittura delle partecipazioni, "
+                             f"{len(batch) - index} rimesse in coda: {e}")
+                break
+        
+        if written or dropped:
+            logger.info(f"Registrate {written} partecipazioni ai giveaway riga per riga ({dropped} scartate)")
+        return written
+    
+    def _has_pending_entries(self, giveaway_id: str) -> bool:
+        """Indica se un giveaway ha partecipazioni non ancora scritte nel database."""
+        return any(entry[1] == giveaway_id for entry in self.pending_entries)
+    
+    async def _iter_entries(self, giveaway: Giveaway) -> AsyncIterator[Tuple[Entry, float]]:
+        """
+        Scorre le partecipazioni di un giveaway con un cursore lato server.
+        
+        Le righe arrivano in ordine deterministico (entry_time, id), così
+        un'estrazione può essere ripetuta a partire dal suo seme.
+        
+        Args:
+            giveaway: Oggetto Giveaway
+            
+        Yields:
+            Tuple[Entry, float]: Partecipazione e peso del suo biglietto
+        """
         if not self.db_pool:
-            return entries
+            return
         
-        try:
-            async with self.db_pool.acquire() as conn:
-                rows = await conn.fetch(
-                    """
-                    SELECT * FROM giveaway_entries
-                    WHERE giveaway_id = $1
-                    """,
-                    giveaway_id
-                )
-                
-                for row in rows:
+        weighted = bool(self.ticket_weights)
+        if weighted:
+            query = """
+                SELECT e.id, e.giveaway_id, e.user_id, e.username, e.entry_time,
+                       EXISTS (
+                           SELECT 1 FROM subscriptions s
+                           WHERE s.channel_id = $2 AND s.user_id = e.user_id AND s.active = true
+                       ) AS is_subscriber,
+                       COALESCE((
+                           SELECT cp.points FROM channel_points cp
+                           WHERE cp.channel_id = $2 AND cp.user_id = e.user_id
+                       ), 0) AS points
+                FROM giveaway_entries e
+                WHERE e.giveaway_id = $1
+                ORDER BY e.entry_time, e.id
+            """
+            params = (giveaway.id, giveaway.channel_id)
+        else:
+            query = """
+                SELECT id, giveaway_id, user_id, username, entry_time
+                FROM giveaway_entries
+                WHERE giveaway_id = $1
+                ORDER BY entry_time, id
+            """
+            params = (giveaway.id,)
+        
+        async with self.db_pool.acquire() as conn:
+            # I cursori asyncpg richiedono una transazione
+            async with conn.transaction():
+                async for row in conn.cursor(query, *params, prefetch=self.selection_prefetch):
                     entry = Entry(
                         id=row['id'],
                         giveaway_id=row['giveaway_id'],
@@ -539,38 +716,101 @@ class GiveawayManager:
                         username=row['username'],
                         entry_time=row['entry_time']
                     )
-                    entries.append(entry)
-                
-                logger.debug(f"Recuperate {len(entries)} partecipazioni per il giveaway {giveaway_id}")
-                return entries
+                    yield entry, self._ticket_weight(row) if weighted else 1.0
+    
+    def _ticket_weight(self, row: Dict[str, Any]) -> float:
+        """
+        Calcola il peso del biglietto di una partecipazione.
         
-        except Exception as e:
-            logger.error(f"Errore nel recupero delle partecipazioni per il giveaway {giveaway_id}: {e}")
-            return entries
+        Args:
+            row: Riga con i campi is_subscriber e points
+            
+        Returns:
+            float: Peso del biglietto (1.0 = biglietto singolo)
+        """
+        weight = 1.0
+        
+        points_per_ticket = self.ticket_weights.get('points_per_ticket')
+        if points_per_ticket:
+            bonus = int(row['points'] or 0) // int(points_per_ticket)
+            max_bonus = self.ticket_weights.get('max_bonus_tickets')
+            if max_bonus is not None:
+                bonus = min(bonus, int(max_bonus))
+            weight += max(bonus, 0)
+        
+        if row['is_subscriber']:
+            weight *= float(self.ticket_weights.get('subscriber', 1.0))
+        
+        return weight
+    
+    @staticmethod
+    def _reservoir_push(reservoir: List[Tuple[float, int, Entry]], k: int,
+                        key: float, index: int, entry: Entry):
+        """Mantiene nel serbatoio le k partecipazioni con chiave più alta."""
+        if len(reservoir) < k:
+            heapq.heappush(reservoir, (key, index, entry))
+        elif key > reservoir[0][0]:
+            heapq.heapreplace(reservoir, (key, index, entry))
     
-    async def _select_winners(self, giveaway: Giveaway, entries: List[Entry]) -> List[Winner]:
+    async def _select_winners(self, giveaway: Giveaway,
+                              entries: Union[Iterable, AsyncIterator],
+                              seed: Optional[int] = None) -> List[Winner]:
         """
         Seleziona casualmente i vincitori tra le partecipazioni.
         
+        Usa un campionamento a serbatoio pesato (Efraimidis-Spirakis): ogni
+        partecipazione riceve la chiave log(u)/peso e vincono le k chiavi più
+        alte. La memoria resta O(k) qualunque sia il numero di partecipanti e,
+        a parità di seme e ordine delle partecipazioni, l'estrazione è
+        riproducibile.
+        
         Args:
             giveaway: Oggetto Giveaway
-            entries: Lista delle partecipazioni
+            entries: Partecipazioni (Entry o coppie (Entry, peso)), anche asincrone
+            seed: Seme dell'estrazione (generato se non specificato)
             
         Returns:
             List[Winner]: Lista dei vincitori
+            
+        Raises:
+            Exception: Se la lettura delle partecipazioni si interrompe
         """
         winners = []
         
-        if not entries:
-            logger.warning(f"Nessuna partecipazione per selezionare vincitori del giveaway {giveaway.id}")
-            return winners
+        if seed is None:
+            # 63 bit: il seme viene salvato in una colonna BIGINT
+            seed = secrets.randbits(63)
+        giveaway.selection_seed = seed
+        rng = random.Random(seed)
+        
+        k = max(int(giveaway.max_winners), 0)
+        reservoir: List[Tuple[float, int, Entry]] = []
+        count = 0
         
         try:
-            # Numero di vincitori da selezionare
-            num_winners = min(giveaway.max_winners, len(entries))
+            async def _as_async(items):
+                for item in items:
+                    yield item
+            
+            stream = entries if hasattr(entries, '__aiter__') else _as_async(entries)
             
-            # Selezione casuale
-            selected_entries = random.sample(entries, num_winners)
+            async for item in stream:
+                entry, weight = item if isinstance(item, tuple) else (item, 1.0)
+                count += 1
+                
+                if weight <= 0 or k == 0:
+                    continue
+                
+                # 1 - random() è in (0, 1], quindi il logaritmo è sempre definito
+                key = math.log(1.0 - rng.random()) / weight
+                self._reservoir_push(reservoir, k, key, count, entry)
+            
+            if not count:
+                logger.warning(f"Nessuna partecipazione per selezionare vincitori del giveaway {giveaway.id}")
+                return winners
+            
+            # Ordina i vincitori dalla chiave più alta
+            selected_entries = [entry for _, _, entry in sorted(reservoir, reverse=True)]
             
             # Crea gli oggetti vincitore
             current_time = time.time()
@@ -584,12 +824,15 @@ class GiveawayManager:
                 )
                 winners.append(winner)
             
-            logger.info(f"Selezionati {len(winners)} vincitori per il giveaway {giveaway.id}")
+            logger.info(f"Selezionati {len(winners)} vincitori su {count} partecipazioni per il giveaway "
+                        f"{giveaway.id} (seme estrazione: {seed})")
             return winners
         
         except Exception as e:
+            # Un serbatoio parziale non è un'estrazione valida: l'errore risale a
+            # end_giveaway, che lascia il giveaway attivo per un nuovo tentativo
             logger.error(f"Errore nella selezione dei vincitori per il giveaway {giveaway.id}: {e}")
-            return winners
+            raise
     
     async def _announce_giveaway(self, giveaway: Giveaway):
         """
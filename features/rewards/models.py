@@ -42,6 +42,7 @@ class Giveaway:
     prize_id: Optional[str] = None        # ID del premio (se presente)
     max_winners: int = 1                  # Numero massimo di vincitori
     requirements: List[Dict[str, Any]] = field(default_factory=list)  # Requisiti partecipazione
+    selection_seed: Optional[int] = None  # Seme dell'estrazione dei vincitori (per audit)
 
 @dataclass
 class Prize:
@@ -7,12 +7,41 @@ per partecipare a un giveaway, come essere seguaci, iscritti, o avere un certo
 numero di punti o tempo di visione.
 """
 
+import time
 import logging
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Dict, List, Any, Optional, Tuple, Iterable
+
+from stability.monitoring.metrics_registry import get_registry
 
 # Logger
 logger = logging.getLogger('m4bot.rewards.validators')
 
+# Caricamenti dei profili per la validazione: 'batch' se la query unica è
+# riuscita, 'fallback' se si è tornati alle query dei singoli validatori
+PROFILE_LOADS = get_registry().counter(
+    "m4bot_giveaway_profile_loads_total", "Caricamenti dei profili per i requisiti dei giveaway", ("path",))
+
+# Query unica che raccoglie tutti i dati necessari ai requisiti standard
+# (follower, iscrizione, punti, tempo di visione) per uno o più utenti.
+# Gli ID sono interi come le colonne di channel_points
+USER_PROFILE_QUERY = """
+    SELECT u.user_id,
+           EXISTS (
+               SELECT 1 FROM followers f
+               WHERE f.channel_id = $1::int AND f.user_id = u.user_id
+           ) AS is_follower,
+           (
+               SELECT s.tier FROM subscriptions s
+               WHERE s.channel_id = $1 AND s.user_id = u.user_id AND s.active = true
+               LIMIT 1
+           ) AS subscriber_tier,
+           cp.points,
+           cp.watch_time
+    FROM unnest($2::int[]) AS u(user_id)
+    LEFT JOIN channel_points cp
+        ON cp.channel_id = $1 AND cp.user_id = u.user_id
+"""
+
 class RequirementValidator:
     """Classe di base per la validazione di un singolo requisito."""
     
@@ -25,6 +54,22 @@ class RequirementValidator:
         """
         self.db_pool = db_pool
     
+    # True se il requisito può essere valutato sul profilo di USER_PROFILE_QUERY
+    batchable = False
+    
+    def evaluate(self, profile: Dict[str, Any], requirement: Dict[str, Any]) -> Tuple[bool, str]:
+        """
+        Valuta un requisito sul profilo già caricato di un utente.
+        
+        Args:
+            profile: Riga di USER_PROFILE_QUERY per l'utente
+            requirement: Dettagli del requisito
+            
+        Returns:
+            Tuple[bool, str]: (valido, motivo)
+        """
+        return False, "Validatore non implementato"
+    
     async def validate(self, user_id: str, channel_id: str, requirement: Dict[str, Any]) -> Tuple[bool, str]:
         """
         Valida se un utente soddisfa un requisito specifico.
@@ -43,6 +88,14 @@ class RequirementValidator:
 class FollowerValidator(RequirementValidator):
     """Validatore per verificare se un utente è un follower del canale."""
     
+    batchable = True
+    
+    def evaluate(self, profile: Dict[str, Any], requirement: Dict[str, Any]) -> Tuple[bool, str]:
+        """Verifica se l'utente è un follower sul profilo caricato."""
+        if profile.get('is_follower'):
+            return True, ""
+        return False, "Devi essere un follower del canale per partecipare"
+    
     async def validate(self, user_id: str, channel_id: str, requirement: Dict[str, Any]) -> Tuple[bool, str]:
         """Verifica se l'utente è un follower."""
         if not self.db_pool:
@@ -71,6 +124,20 @@ class FollowerValidator(RequirementValidator):
 class SubscriberValidator(RequirementValidator):
     """Validatore per verificare se un utente è iscritto al canale."""
     
+    batchable = True
+    
+    def evaluate(self, profile: Dict[str, Any], requirement: Dict[str, Any]) -> Tuple[bool, str]:
+        """Verifica se l'utente è iscritto sul profilo caricato."""
+        tier = profile.get('subscriber_tier')
+        if tier is None:
+            return False, "Devi essere iscritto al canale per partecipare"
+        
+        # Se richiesto un tier specifico
+        required_tier = requirement.get('tier')
+        if required_tier and int(tier) < int(required_tier):
+            return False, f"Devi essere iscritto al tier {required_tier} o superiore"
+        return True, ""
+    
     async def validate(self, user_id: str, channel_id: str, requirement: Dict[str, Any]) -> Tuple[bool, str]:
         """Verifica se l'utente è iscritto."""
         if not self.db_pool:
@@ -103,6 +170,23 @@ class SubscriberValidator(RequirementValidator):
 class PointsValidator(RequirementValidator):
     """Validatore per verificare se un utente ha un certo numero di punti canale."""
     
+    batchable = True
+    
+    def evaluate(self, profile: Dict[str, Any], requirement: Dict[str, Any]) -> Tuple[bool, str]:
+        """Verifica i punti dell'utente sul profilo caricato."""
+        min_points = requirement.get('value')
+        if not min_points or not min_points.isdigit():
+            return False, "Requisito punti non valido"
+        
+        min_points = int(min_points)
+        user_points = profile.get('points')
+        
+        if user_points is None:
+            return False, f"Devi avere almeno {min_points} punti (non hai punti)"
+        if user_points >= min_points:
+            return True, ""
+        return False, f"Devi avere almeno {min_points} punti (hai {user_points})"
+    
     async def validate(self, user_id: str, channel_id: str, requirement: Dict[str, Any]) -> Tuple[bool, str]:
         """Verifica se l'utente ha i punti richiesti."""
         if not self.db_pool:
@@ -142,6 +226,27 @@ class PointsValidator(RequirementValidator):
 class WatchTimeValidator(RequirementValidator):
     """Validatore per verificare se un utente ha visto il canale per un certo tempo."""
     
+    batchable = True
+    
+    def evaluate(self, profile: Dict[str, Any], requirement: Dict[str, Any]) -> Tuple[bool, str]:
+        """Verifica il tempo di visione dell'utente sul profilo caricato."""
+        min_seconds = requirement.get('value')
+        if not min_seconds or not min_seconds.isdigit():
+            return False, "Requisito tempo di visione non valido"
+        
+        min_seconds = int(min_seconds)
+        min_hours = min_seconds / 3600
+        user_watch_time = profile.get('watch_time')
+        
+        if user_watch_time is None:
+            return False, f"Devi aver guardato il canale per almeno {min_hours:.1f} ore"
+        if user_watch_time >= min_seconds:
+            return True, ""
+        
+        # Converti in ore per un messaggio più leggibile
+        user_hours = user_watch_time / 3600
+        return False, f"Devi aver guardato il canale per almeno {min_hours:.1f} ore (hai {user_hours:.1f} ore)"
+    
     async def validate(self, user_id: str, channel_id: str, requirement: Dict[str, Any]) -> Tuple[bool, str]:
         """Verifica se l'utente ha il tempo di visione richiesto."""
         if not self.db_pool:
@@ -244,25 +349,96 @@ class ParticipationValidator:
             'custom': CustomValidator(db_pool)
         }
         
+        # Cache dell'idoneità: (chiave, user_id) -> (scadenza, risultato)
+        # La chiave è l'ID del giveaway se disponibile, altrimenti il canale
+        self.eligibility_cache: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+        self.cache_ttl = self.config.get('eligibility_cache_ttl', 15)
+        
         logger.info("Validatore di partecipazione inizializzato")
     
-    async def validate_requirements(self, user_id: str, channel_id: str, 
-                                  requirements: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _get_cached(self, key: Tuple[str, str], now: float) -> Optional[Dict[str, Any]]:
         """
-        Verifica se un utente soddisfa tutti i requisiti specificati.
+        Restituisce un risultato di idoneità ancora valido dalla cache.
+        
+        Args:
+            key: Chiave (giveaway o canale, utente)
+            now: Timestamp corrente
+            
+        Returns:
+            Dict: Risultato in cache o None
+        """
+        cached = self.eligibility_cache.get(key)
+        if cached is None:
+            return None
+        if cached[0] <= now:
+            del self.eligibility_cache[key]
+            return None
+        return cached[1]
+    
+    def _store_cached(self, key: Tuple[str, str], result: Dict[str, Any], now: float):
+        """
+        Salva un risultato di idoneità nella cache, eliminando le voci scadute se cresce troppo.
+        
+        Args:
+            key: Chiave (giveaway o canale, utente)
+            result: Risultato della validazione
+            now: Timestamp corrente
+        """
+        if self.cache_ttl <= 0:
+            return
+        
+        if len(self.eligibility_cache) >= self.config.get('eligibility_cache_size', 100000):
+            self.eligibility_cache = {k: v for k, v in self.eligibility_cache.items() if v[0] > now}
+        
+        self.eligibility_cache[key] = (now + self.cache_ttl, result)
+    
+    def invalidate_cache(self, giveaway_id: Optional[str] = None):
+        """
+        Svuota la cache di idoneità, per un singolo giveaway o per intero.
+        
+        Args:
+            giveaway_id: ID del giveaway (opzionale)
+        """
+        if giveaway_id is None:
+            self.eligibility_cache.clear()
+        else:
+            self.eligibility_cache = {k: v for k, v in self.eligibility_cache.items() if k[0] != giveaway_id}
+    
+    async def _fetch_profiles(self, channel_id: str, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Carica con un'unica query i dati dei requisiti standard per più utenti.
+        
+        Args:
+            channel_id: ID del canale
+            user_ids: Lista degli ID utente
+            
+        Returns:
+            Dict: user_id -> profilo
+            
+        Raises:
+            ValueError: Se un ID non è numerico
+        """
+        async with self.db_pool.acquire() as conn:
+            rows = await conn.fetch(USER_PROFILE_QUERY, int(channel_id),
+                                    [int(user_id) for user_id in user_ids])
+        # Le chiavi tornano stringhe come gli ID ricevuti dal chiamante
+        return {str(row['user_id']): dict(row) for row in rows}
+    
+    async def _evaluate_requirements(self, user_id: str, channel_id: str,
+                                     requirements: List[Dict[str, Any]],
+                                     profile: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Valuta tutti i requisiti per un utente usando il profilo già caricato.
         
         Args:
             user_id: ID dell'utente
             channel_id: ID del canale
             requirements: Lista dei requisiti da verificare
+            profile: Profilo dell'utente (None se non è stato possibile caricarlo)
             
         Returns:
             Dict: Risultato della validazione con stato e dettagli
         """
-        if not requirements:
-            # Se non ci sono requisiti, l'utente è idoneo
-            return {'valid': True, 'details': {}}
-        
         results = {}
         details = {}
         
@@ -277,7 +453,10 @@ class ParticipationValidator:
                 details[req_type] = f"Tipo di requisito non supportato: {req_type}"
                 continue
             
-            valid, message = await validator.validate(user_id, channel_id, req)
+            if validator.batchable and profile is not None:
+                valid, message = validator.evaluate(profile, req)
+            else:
+                valid, message = await validator.validate(user_id, channel_id, req)
             results[req_type] = valid
             
             if not valid:
@@ -299,4 +478,93 @@ class ParticipationValidator:
                                 "Non soddisfi tutti i requisiti")
             response['reason'] = first_failure
         
-        return response 
\ No newline at end of file
+        return response
+    
+    def _needs_profile(self, requirements: List[Dict[str, Any]]) -> bool:
+        """Verifica se almeno un requisito si basa sul profilo utente."""
+        for req in requirements:
+            validator = self.validators.get(req.get('type'))
+            if validator and validator.batchable:
+                return True
+        return False
+    
+    async def validate_requirements(self, user_id: str, channel_id: str, 
+                                  requirements: List[Dict[str, Any]],
+                                  giveaway_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Verifica se un utente soddisfa tutti i requisiti specificati.
+        
+        I requisiti standard vengono valutati con un'unica query; il risultato
+        resta in cache per pochi secondi per coppia (giveaway, utente).
+        
+        Args:
+            user_id: ID dell'utente
+            channel_id: ID del canale
+            requirements: Lista dei requisiti da verificare
+            giveaway_id: ID del giveaway, usato come chiave della cache (opzionale)
+            
+        Returns:
+            Dict: Risultato della validazione con stato e dettagli
+        """
+        if not requirements:
+            # Se non ci sono requisiti, l'utente è idoneo
+            return {'valid': True, 'details': {}}
+        
+        results = await self.validate_batch([user_id], channel_id, requirements, giveaway_id)
+        return results[user_id]
+    
+    async def validate_batch(self, user_ids: Iterable[str], channel_id: str,
+                             requirements: List[Dict[str, Any]],
+                             giveaway_id: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Verifica i requisiti per un gruppo di utenti con un'unica query.
+        
+        Args:
+            user_ids: ID degli utenti
+            channel_id: ID del canale
+            requirements: Lista dei requisiti da verificare
+            giveaway_id: ID del giveaway, usato come chiave della cache (opzionale)
+            
+        Returns:
+            Dict: user_id -> risultato della validazione
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not requirements:
+            return {user_id: {'valid': True, 'details': {}} for user_id in user_ids}
+        
+        now = time.time()
+        cache_scope = giveaway_id or channel_id
+        results = {}
+        to_validate = []
+        
+        # Usa i risultati ancora validi in cache
+        for user_id in user_ids:
+            cached = self._get_cached((cache_scope, user_id), now)
+            if cached is not None:
+                results[user_id] = cached
+            else:
+                to_validate.append(user_id)
+        
+        if not to_validate:
+            return results
+        
+        # Carica i profili di tutti gli utenti da validare in un'unica query
+        profiles = {}
+        profiles_loaded = False
+        if self.db_pool and self._needs_profile(requirements):
+            try:
+                profiles = await self._fetch_profiles(channel_id, to_validate)
+                profiles_loaded = True
+                PROFILE_LOADS.labels("batch").inc()
+            except Exception as e:
+                PROFILE_LOADS.labels("fallback").inc()
+                logger.error(f"Errore nel caricamento dei profili per la validazione, "
+                             f"uso delle query singole: {e}")
+        
+        for user_id in to_validate:
+            profile = profiles.get(user_id, {}) if profiles_loaded else None
+            result = await self._evaluate_requirements(user_id, channel_id, requirements, profile)
+            results[user_id] = result
+            self._store_cached((cache_scope, user_id), result, now)
+        
+        return results
@@ -13,6 +13,8 @@ import asyncio
 import logging
 import time
 import uuid
+import heapq
+import itertools
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional, Set, Union, Tuple
 from dataclasses import asdict
@@ -23,6 +25,98 @@ from .models import ScheduledEvent, EventType, EventStatus, RecurrencePattern, E
 # Logger
 logger = logging.getLogger('m4bot.scheduler')
 
+# Tipi di scadenza gestiti dalla coda
+DEADLINE_START = "start"
+DEADLINE_END = "end"
+DEADLINE_REMINDER = "reminder"
+DEADLINE_RECURRENCE = "recurrence"
+
+# Anticipo con cui vengono generate le istanze degli eventi ricorrenti (secondi)
+RECURRENCE_HORIZON = 86400 * 7
+
+# Nuovi tentativi delle scadenze fallite: attesa iniziale, attesa massima (secondi) e tentativi
+DEADLINE_RETRY_DELAY = 30
+DEADLINE_RETRY_MAX_DELAY = 900
+DEADLINE_MAX_ATTEMPTS = 6
+
+class DeadlineQueue:
+    """
+    Coda di priorità delle scadenze dello scheduler.
+    
+    Ogni scadenza è identificata da una chiave (tipo, id). Ripianificare una
+    chiave inserisce una nuova voce e invalida quella precedente tramite un
+    numero di versione, quindi inserimento, ripianificazione e cancellazione
+    costano O(log n) e le voci obsolete vengono scartate quando emergono in cima.
+    """
+    
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Tuple[str, Any]]] = []
+        self._versions: Dict[Tuple[str, Any], int] = {}
+        self._counter = itertools.count()
+    
+    def __len__(self) -> int:
+        return len(self._versions)
+    
+    def schedule(self, key: Tuple[str, Any], due_time: float):
+        """
+        Pianifica (o ripianifica) una scadenza.
+        
+        Args:
+            key: Chiave della scadenza (tipo, id)
+            due_time: Timestamp della scadenza
+        """
+        version = next(self._counter)
+        self._versions[key] = version
+        heapq.heappush(self._heap, (due_time, version, key))
+        
+        # Ricostruisci lo heap se contiene troppe voci obsolete
+        if len(self._heap) > 2 * len(self._versions) + 1024:
+            self._heap = [entry for entry in self._heap if self._versions.get(entry[2]) == entry[1]]
+            heapq.heapify(self._heap)
+    
+    def cancel(self, key: Tuple[str, Any]):
+        """
+        Annulla una scadenza.
+        
+        Args:
+            key: Chiave della scadenza
+        """
+        self._versions.pop(key, None)
+    
+    def _discard_stale(self):
+        """Rimuove dalla cima dello heap le voci invalidate."""
+        while self._heap and self._versions.get(self._heap[0][2]) != self._heap[0][1]:
+            heapq.heappop(self._heap)
+    
+    def next_due_time(self) -> Optional[float]:
+        """
+        Restituisce il timestamp della prossima scadenza.
+        
+        Returns:
+            float: Timestamp della prossima scadenza o None se la coda è vuota
+        """
+        self._discard_stale()
+        return self._heap[0][0] if self._heap else None
+    
+    def pop_due(self, now: float) -> List[Tuple[str, Any]]:
+        """
+        Estrae tutte le scadenze già raggiunte.
+        
+        Args:
+            now: Timestamp corrente
+            
+        Returns:
+            List: Chiavi delle scadenze raggiunte, in ordine di scadenza
+        """
+        due = []
+        self._discard_stale()
+        while self._heap and self._heap[0][0] <= now:
+            _, version, key = heapq.heappop(self._heap)
+            del self._versions[key]
+            due.append(key)
+            self._discard_stale()
+        return due
+
 class ContentScheduler:
     """
     Classe principale che gestisce il sistema di pianificazione.
@@ -53,11 +147,29 @@ class ContentScheduler:
         # (event_id, reminder_id) -> EventReminder
         self.pending_reminders: Dict[Tuple[str, str], EventReminder] = {}
         
+        # Indice dei promemoria pendenti per evento
+        # event_id -> set di reminder_id
+        self.event_reminders: Dict[str, Set[str]] = {}
+        
+        # Scadenze di inizio, fine, promemoria e ricorrenza
+        self.deadlines = DeadlineQueue()
+        
+        # Tentativi falliti consecutivi per scadenza
+        # (tipo, chiave) -> numero di tentativi
+        self.deadline_failures: Dict[Tuple[str, Any], int] = {}
+        
+        # Inizio dell'ultima istanza generata per ogni evento ricorrente
+        # event_id -> timestamp
+        self.last_generated_instance: Dict[str, float] = {}
+        
+        # Segnale per risvegliare il task di controllo prima della scadenza
+        self._wakeup = asyncio.Event()
+        
         # Task in background per il monitoraggio degli eventi
         self.background_tasks = set()
         self.running = False
         
-        # Intervallo di controllo per gli eventi (secondi)
+        # Attesa dopo un errore nel ciclo di controllo (secondi)
         self.check_interval = self.config.get('scheduler_check_interval', 15)
         
         # Callback per tipi di eventi specifici
@@ -83,6 +195,7 @@ class ContentScheduler:
     async def shutdown(self):
         """Spegni lo scheduler in modo sicuro."""
         self.running = False
+        self._wakeup.set()
         
         # Attendi che tutti i task in background terminino
         if self.background_tasks:
@@ -164,6 +277,8 @@ class ContentScheduler:
                         self.pending_events[event.id] = event
                     elif event.status == EventStatus.ACTIVE:
                         self.active_events[event.id] = event
+                    
+                    self._schedule_event(event)
                 
                 logger.info(f"Caricati {len(self.pending_events)} eventi pendenti e {len(self.active_events)} eventi attivi")
         
@@ -209,33 +324,126 @@ class ContentScheduler:
                     )
                     
                     # Aggiungi alla lista dei promemoria pendenti
-                    self.pending_reminders[(reminder.event_id, reminder.id)] = reminder
+                    self._add_pending_reminder(reminder)
                 
                 logger.info(f"Caricati {len(self.pending_reminders)} promemoria pendenti")
         
         except Exception as e:
             logger.error(f"Errore nel caricamento dei promemoria pendenti: {e}")
     
+    def _schedule_event(self, event: ScheduledEvent):
+        """
+        Pianifica le scadenze di un evento in base al suo stato corrente.
+        
+        Args:
+            event: Evento da pianificare
+        """
+        if event.status == EventStatus.PENDING and event.id in self.pending_events:
+            self.deadlines.schedule((DEADLINE_START, event.id), event.start_time)
+            self.deadlines.cancel((DEADLINE_END, event.id))
+            
+            if event.is_recurring():
+                after_time = max(time.time(), self.last_generated_instance.get(event.id, 0))
+                next_start = self._calculate_next_instance(event, after_time)
+                if next_start:
+                    self.deadlines.schedule((DEADLINE_RECURRENCE, event.id),
+                                            next_start - RECURRENCE_HORIZON)
+            else:
+                self.deadlines.cancel((DEADLINE_RECURRENCE, event.id))
+        elif event.status == EventStatus.ACTIVE and event.id in self.active_events:
+            self.deadlines.cancel((DEADLINE_START, event.id))
+            self.deadlines.cancel((DEADLINE_RECURRENCE, event.id))
+            if event.end_time:
+                self.deadlines.schedule((DEADLINE_END, event.id), event.end_time)
+            else:
+                self.deadlines.cancel((DEADLINE_END, event.id))
+        else:
+            self._unschedule_event(event.id)
+            return
+        
+        # I promemoria dipendono dall'ora di inizio dell'evento
+        for reminder_id in self.event_reminders.get(event.id, ()):
+            self._schedule_reminder(event, self.pending_reminders[(event.id, reminder_id)])
+        
+        self._wakeup.set()
+    
+    def _schedule_reminder(self, event: ScheduledEvent, reminder: EventReminder):
+        """
+        Pianifica l'invio di un promemoria.
+        
+        Args:
+            event: Evento associato al promemoria
+            reminder: Promemoria da pianificare
+        """
+        self.deadlines.schedule((DEADLINE_REMINDER, (event.id, reminder.id)),
+                                event.start_time - reminder.time_before)
+        self._wakeup.set()
+    
+    def _unschedule_event(self, event_id: str):
+        """
+        Annulla tutte le scadenze di un evento.
+        
+        Args:
+            event_id: ID dell'evento
+        """
+        for kind in (DEADLINE_START, DEADLINE_END, DEADLINE_RECURRENCE):
+            self.deadlines.cancel((kind, event_id))
+        for reminder_id in self.event_reminders.get(event_id, ()):
+            self.deadlines.cancel((DEADLINE_REMINDER, (event_id, reminder_id)))
+    
+    def _add_pending_reminder(self, reminder: EventReminder):
+        """
+        Aggiunge un promemoria a quelli pendenti e lo pianifica.
+        
+        Args:
+            reminder: Promemoria da aggiungere
+        """
+        self.pending_reminders[(reminder.event_id, reminder.id)] = reminder
+        self.event_reminders.setdefault(reminder.event_id, set()).add(reminder.id)
+        
+        event = self.pending_events.get(reminder.event_id) or self.active_events.get(reminder.event_id)
+        if event:
+            self._schedule_reminder(event, reminder)
+        else:
+            # L'evento potrebbe non essere ancora caricato: controlla subito
+            self.deadlines.schedule((DEADLINE_REMINDER, (reminder.event_id, reminder.id)), 0)
+    
+    def _remove_pending_reminder(self, event_id: str, reminder_id: str):
+        """
+        Rimuove un promemoria da quelli pendenti.
+        
+        Args:
+            event_id: ID dell'evento
+            reminder_id: ID del promemoria
+        """
+        self.pending_reminders.pop((event_id, reminder_id), None)
+        self.deadlines.cancel((DEADLINE_REMINDER, (event_id, reminder_id)))
+        
+        reminder_ids = self.event_reminders.get(event_id)
+        if reminder_ids is not None:
+            reminder_ids.discard(reminder_id)
+            if not reminder_ids:
+                del self.event_reminders[event_id]
+    
     async def _periodic_check(self):
-        """Task periodico per controllare gli eventi pianificati."""
+        """Task che attende la prossima scadenza ed esegue quelle raggiunte."""
         logger.info("Avviato task periodico per controllo eventi")
         
         while self.running:
             try:
-                # Verifica eventi da avviare
-                await self._check_events_to_start()
+                self._wakeup.clear()
                 
-                # Verifica eventi da completare
-                await self._check_events_to_complete()
+                # Esegui le scadenze raggiunte
+                await self._process_due_deadlines()
                 
-                # Verifica promemoria da inviare
-                await self._check_reminders_to_send()
+                # Dormi fino alla prossima scadenza o a una modifica degli eventi
+                next_due = self.deadlines.next_due_time()
+                timeout = None if next_due is None else max(0.0, next_due - time.time())
                 
-                # Genera eventi ricorrenti se necessario
-                await self._generate_recurring_events()
-                
-                # Attendi il prossimo ciclo
-                await asyncio.sleep(self.check_interval)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
             
             except asyncio.CancelledError:
                 break
@@ -243,115 +451,183 @@ class ContentScheduler:
                 logger.error(f"Errore nel controllo periodico degli eventi: {e}")
                 await asyncio.sleep(self.check_interval)
     
-    async def _check_events_to_start(self):
-        """Controlla se ci sono eventi da avviare."""
-        current_time = time.time()
-        events_to_start = []
+    async def _process_due_deadlines(self):
+        """Esegue le azioni per tutte le scadenze raggiunte, ripianificando quelle fallite."""
+        for kind, key in self.deadlines.pop_due(time.time()):
+            try:
+                success = await self._run_deadline(kind, key)
+            except Exception as e:
+                logger.error(f"Errore nell'esecuzione della scadenza {kind} {key}: {e}")
+                success = False
+            
+            if success:
+                self.deadline_failures.pop((kind, key), None)
+            else:
+                self._retry_deadline(kind, key)
+    
+    async def _run_deadline(self, kind: str, key: Any) -> bool:
+        """
+        Esegue l'azione associata a una scadenza.
+        
+        Args:
+            kind: Tipo di scadenza
+            key: ID dell'evento, o (ID evento, ID promemoria) per i promemoria
+            
+        Returns:
+            bool: False se l'azione è fallita e va ritentata
+        """
+        if kind == DEADLINE_START:
+            # Avvia l'evento
+            if key in self.pending_events:
+                return await self.start_event(key)
+        
+        elif kind == DEADLINE_END:
+            # Completa l'evento
+            if key in self.active_events:
+                return await self.complete_event(key)
+        
+        elif kind == DEADLINE_REMINDER:
+            return await self._check_reminder(*key)
         
-        # Cerca eventi da avviare
-        for event_id, event in list(self.pending_events.items()):
-            if event.start_time <= current_time:
-                events_to_start.append(event)
+        elif kind == DEADLINE_RECURRENCE:
+            return await self._generate_recurring_event(key)
         
-        # Avvia gli eventi
-        for event in events_to_start:
-            await self.start_event(event.id)
+        return True
     
-    async def _check_events_to_complete(self):
-        """Controlla se ci sono eventi da completare."""
-        current_time = time.time()
-        events_to_complete = []
+    def _retry_deadline(self, kind: str, key: Any):
+        """
+        Ripianifica una scadenza fallita con attesa esponenziale.
         
-        # Cerca eventi da completare
-        for event_id, event in list(self.active_events.items()):
-            if event.end_time and event.end_time <= current_time:
-                events_to_complete.append(event)
+        Args:
+            kind: Tipo di scadenza
+            key: Chiave della scadenza
+        """
+        attempts = self.deadline_failures.get((kind, key), 0) + 1
+        if attempts >= DEADLINE_MAX_ATTEMPTS:
+            self.deadline_failures.pop((kind, key), None)
+            logger.error(f"Scadenza {kind} {key} abbandonata dopo {attempts} tentativi falliti")
+            return
         
-        # Completa gli eventi
-        for event in events_to_complete:
-            await self.complete_event(event.id)
+        self.deadline_failures[(kind, key)] = attempts
+        delay = min(DEADLINE_RETRY_MAX_DELAY, DEADLINE_RETRY_DELAY * 2 ** (attempts - 1))
+        self.deadlines.schedule((kind, key), time.time() + delay)
+        logger.warning(f"Scadenza {kind} {key} fallita, nuovo tentativo tra {delay} secondi")
     
-    async def _check_reminders_to_send(self):
-        """Controlla se ci sono promemoria da inviare."""
-        current_time = time.time()
-        reminders_to_send = []
+    async def _check_reminder(self, event_id: str, reminder_id: str) -> bool:
+        """
+        Invia un promemoria arrivato a scadenza.
         
-        # Cerca promemoria da inviare
-        for (event_id, reminder_id), reminder in list(self.pending_reminders.items()):
-            # Ottieni l'evento associato
-            event = self.pending_events.get(event_id) or self.active_events.get(event_id)
-            
-            if not event:
-                # Evento non trovato, rimuovi il promemoria
-                logger.warning(f"Promemoria {reminder_id} associato a un evento non trovato: {event_id}")
-                self.pending_reminders.pop((event_id, reminder_id), None)
-                continue
-            
-            # Calcola quando il promemoria deve essere inviato
-            reminder_time = event.start_time - reminder.time_before
+        Args:
+            event_id: ID dell'evento
+            reminder_id: ID del promemoria
             
-            if reminder_time <= current_time:
-                reminders_to_send.append((event, reminder))
+        Returns:
+            bool: False se l'invio è fallito
+        """
+        reminder = self.pending_reminders.get((event_id, reminder_id))
+        if not reminder:
+            return True
         
-        # Invia i promemoria
-        for event, reminder in reminders_to_send:
-            await self._send_reminder(event, reminder)
+        # Ottieni l'evento associato
+        event = self.pending_events.get(event_id) or self.active_events.get(event_id)
+        
+        if not event:
+            # Evento non trovato, rimuovi il promemoria
+            logger.warning(f"Promemoria {reminder_id} associato a un evento non trovato: {event_id}")
+            self._remove_pending_reminder(event_id, reminder_id)
+            return True
+        
+        # Calcola quando il promemoria deve essere inviato
+        reminder_time = event.start_time - reminder.time_before
+        
+        if reminder_time <= time.time():
+            return await self._send_reminder(event, reminder)
+        
+        self._schedule_reminder(event, reminder)
+        return True
     
-    async def _generate_recurring_events(self):
-        """Genera nuove istanze di eventi ricorrenti."""
-        current_time = time.time()
+    async def _generate_recurring_event(self, event_id: str) -> bool:
+        """
+        Genera la prossima istanza di un evento ricorrente e pianifica la successiva.
         
-        # Cerca eventi ricorrenti
-        for event_id, event in list(self.pending_events.items()):
-            if not event.is_recurring():
-                continue
-            
-            # Verifica se è necessario generare nuove istanze
-            recurrence = event.recurrence
-            if not recurrence:
-                continue
-            
-            # Ottieni il pattern di ricorrenza
-            pattern_type = recurrence.get('pattern')
-            if not pattern_type:
-                continue
-            
-            try:
-                pattern = RecurrencePattern(pattern_type)
-            except ValueError:
-                logger.warning(f"Pattern di ricorrenza non valido per evento {event_id}: {pattern_type}")
-                continue
-            
-            # Verifica se abbiamo già generato tutte le istanze necessarie
-            max_instances = recurrence.get('max_instances')
-            if max_instances:
-                # Conta le istanze già generate
-                if self.db_pool:
-                    async with self.db_pool.acquire() as conn:
-                        count = await conn.fetchval(
-                            """
-                            SELECT COUNT(*) FROM recurring_event_instances
-                            WHERE parent_event_id = $1
-                            """,
-                            event_id
-                        )
-                        
-                        if count >= max_instances:
-                            # Già generate tutte le istanze richieste
-                            continue
-            
-            # Controlla la data di fine della ricorrenza
-            until = recurrence.get('until')
-            if until and until < current_time:
-                # La ricorrenza è terminata
-                continue
+        Args:
+            event_id: ID dell'evento ricorrente
             
-            # Calcola quando dovrebbe avvenire la prossima istanza
-            next_start = self._calculate_next_instance(event, current_time)
+        Returns:
+            bool: False se la creazione dell'istanza è fallita e va ritentata
+        """
+        current_time = time.time()
+        
+        event = self.pending_events.get(event_id)
+        if not event or not event.is_recurring():
+            return True
+        
+        # Verifica se è necessario generare nuove istanze
+        recurrence = event.recurrence
+        if not recurrence:
+            return True
+        
+        # Ottieni il pattern di ricorrenza
+        pattern_type = recurrence.get('pattern')
+        if not pattern_type:
+            return True
+        
+        try:
+            pattern = RecurrencePattern(pattern_type)
+        except ValueError:
+            logger.warning(f"Pattern di ricorrenza non valido per evento {event_id}: {pattern_type}")
+            return True
+        
+        # Le istanze vengono registrate nel database: senza non c'è nulla da generare
+        if not self.db_pool:
+            logger.warning(f"Database non disponibile, istanze dell'evento ricorrente {event_id} non generate")
+            return True
+        
+        # Verifica se abbiamo già generato tutte le istanze necessarie
+        max_instances = recurrence.get('max_instances')
+        if max_instances:
+            # Conta le istanze già generate
+            async with self.db_pool.acquire() as conn:
+                count = await conn.fetchval(
+                    """
+                    SELECT COUNT(*) FROM recurring_event_instances
+                    WHERE parent_event_id = $1
+                    """,
+                    event_id
+                )
+                
+                if count >= max_instances:
+                    # Già generate tutte le istanze richieste
+                    return True
+        
+        # Controlla la data di fine della ricorrenza
+        until = recurrence.get('until')
+        if until and until < current_time:
+            # La ricorrenza è terminata
+            return True
+        
+        # Calcola quando dovrebbe avvenire la prossima istanza non ancora generata
+        after_time = max(current_time, self.last_generated_instance.get(event_id, 0))
+        next_start = self._calculate_next_instance(event, after_time)
+        if not next_start:
+            return True
+        
+        if next_start - current_time <= RECURRENCE_HORIZON:  # Genera istanze per la prossima settimana
+            # Genera una nuova istanza; in caso di errore l'occorrenza verrà ritentata
+            if not await self._create_recurring_instance(event, next_start):
+                return False
+            self.last_generated_instance[event_id] = next_start
             
-            if next_start and next_start - current_time <= 86400 * 7:  # Genera istanze per la prossima settimana
-                # Genera una nuova istanza
-                await self._create_recurring_instance(event, next_start)
+            # Pianifica la generazione dell'istanza successiva
+            following_start = self._calculate_next_instance(event, next_start)
+            if following_start:
+                self.deadlines.schedule((DEADLINE_RECURRENCE, event_id),
+                                        following_start - RECURRENCE_HORIZON)
+        else:
+            self.deadlines.schedule((DEADLINE_RECURRENCE, event_id),
+                                    next_start - RECURRENCE_HORIZON)
+        
+        return True
         
     def _calculate_next_instance(self, event: ScheduledEvent, after_time: float) -> Optional[float]:
         """
@@ -480,13 +756,16 @@ class ContentScheduler:
             logger.error(f"Errore nella creazione dell'istanza ricorrente: {e}")
             return None
     
-    async def _send_reminder(self, event: ScheduledEvent, reminder: EventReminder):
+    async def _send_reminder(self, event: ScheduledEvent, reminder: EventReminder) -> bool:
         """
         Invia un promemoria per un evento.
         
         Args:
             event: Evento associato al promemoria
             reminder: Promemoria da inviare
+            
+        Returns:
+            bool: False se l'invio è fallito e va ritentato
         """
         if not self.notification_service:
             logger.warning("Nessun servizio di notifica disponibile per inviare il promemoria")
@@ -494,7 +773,7 @@ class ContentScheduler:
             # Anche senza servizio di notifica, segna come inviato
             reminder.sent = True
             reminder.sent_at = time.time()
-            self.pending_reminders.pop((event.id, reminder.id), None)
+            self._remove_pending_reminder(event.id, reminder.id)
             
             # Aggiorna nel database
             if self.db_pool:
@@ -511,7 +790,7 @@ class ContentScheduler:
                 except Exception as e:
                     logger.error(f"Errore nell'aggiornamento dello stato del promemoria: {e}")
             
-            return
+            return True
         
         try:
             # Prepara il messaggio
@@ -553,7 +832,7 @@ class ContentScheduler:
             reminder.sent_at = time.time()
             
             # Rimuovi dai promemoria pendenti
-            self.pending_reminders.pop((event.id, reminder.id), None)
+            self._remove_pending_reminder(event.id, reminder.id)
             
             # Aggiorna nel database
             if self.db_pool:
@@ -568,9 +847,11 @@ class ContentScheduler:
                     )
             
             logger.info(f"Promemoria inviato per evento {event.id}: {event.title}")
+            return True
         
         except Exception as e:
             logger.error(f"Errore nell'invio del promemoria: {e}")
+            return False
     
     async def create_event(self, channel_id: str, data: Dict[str, Any]) -> Optional[str]:
         """
@@ -684,9 +965,11 @@ class ContentScheduler:
                         
                         # Aggiungi ai promemoria pendenti
                         self.pending_reminders[(event.id, reminder_id)] = reminder
+                        self.event_reminders.setdefault(event.id, set()).add(reminder_id)
             
-            # Aggiungi agli eventi pendenti
+            # Aggiungi agli eventi pendenti e pianifica le scadenze
             self.pending_events[event.id] = event
+            self._schedule_event(event)
             
             logger.info(f"Evento '{event.title}' creato con ID {event.id}")
             return event.id
@@ -821,6 +1104,9 @@ class ContentScheduler:
                     self.active_events.pop(event_id, None)
                     event.status = new_status
             
+            # Ripianifica le scadenze con i nuovi orari e stato
+            self._schedule_event(event)
+            
             logger.info(f"Evento {event_id} aggiornato con successo")
             return True
         
@@ -841,15 +1127,13 @@ class ContentScheduler:
         # Rimuovi l'evento dalle liste in memoria
         self.pending_events.pop(event_id, None)
         self.active_events.pop(event_id, None)
+        self.last_generated_instance.pop(event_id, None)
         
-        # Rimuovi i promemoria associati
-        reminders_to_remove = []
-        for (e_id, r_id) in self.pending_reminders.keys():
-            if e_id == event_id:
-                reminders_to_remove.append((e_id, r_id))
-        
-        for key in reminders_to_remove:
-            self.pending_reminders.pop(key, None)
+        # Annulla le scadenze e rimuovi i promemoria associati
+        self._unschedule_event(event_id)
+        for reminder_id in list(self.event_reminders.get(event_id, ())):
+            self._remove_pending_reminder(event_id, reminder_id)
+        self._wakeup.set()
         
         if not self.db_pool:
             return False
@@ -907,6 +1191,7 @@ class ContentScheduler:
             # Sposta l'evento nella lista degli attivi
             self.active_events[event_id] = event
             self.pending_events.pop(event_id)
+            self._schedule_event(event)
             
             # Aggiorna nel database
             if self.db_pool:
@@ -971,6 +1256,7 @@ class ContentScheduler:
             
             # Rimuovi l'evento dalla lista degli attivi
             self.active_events.pop(event_id)
+            self.deadlines.cancel((DEADLINE_END, event_id))
             
             # Aggiorna nel database
             if self.db_pool:
@@ -8,6 +8,7 @@ per raccogliere metriche sullo stato e le prestazioni di M4Bot.
 """
 
 import os
+import re
 import sys
 import time
 import json
@@ -47,6 +48,131 @@ M4BOT_DIR = os.environ.get("M4BOT_DIR", "/opt/m4bot")
 # Crea directory per log se non esiste
 os.makedirs("/var/log/m4bot", exist_ok=True)
 
+# Formato delle righe di accesso: [2023-05-21 10:15:30] 200 GET /api/status 0.123s
+ACCESS_LOG_PATTERN = re.compile(
+    rb'^\[(?P<timestamp>[^\]]+)\]\s+(?P<status>\d{3})\s+(?P<method>\S+)\s+(?P<endpoint>\S+)\s+(?P<duration>[\d.]+)s'
+)
+
+class LogTailer:
+    """
+    Lettore incrementale di un file di log.
+    
+    Mantiene offset e inode del file letto (salvati su disco tra un riavvio e l'altro),
+    così ogni riga viene restituita una sola volta; gestisce rotazione (nuovo inode)
+    e troncamento (dimensione inferiore all'offset).
+    """
+    
+    def __init__(self, path: str, state_file: Optional[str] = None, max_read_bytes: int = 4 * 1024 * 1024):
+        """
+        Inizializza il lettore
+        
+        Args:
+            path: Percorso del file di log
+            state_file: File in cui salvare inode e offset (opzionale)
+            max_read_bytes: Byte massimi letti per chiamata
+        """
+        self.path = path
+        self.state_file = state_file
+        self.max_read_bytes = max_read_bytes
+        
+        self.file = None
+        self.inode = None
+        self.offset = 0
+        self.partial = b""
+        
+        if state_file:
+            os.makedirs(os.path.dirname(state_file) or ".", exist_ok=True)
+        self._load_state()
+    
+    def _load_state(self):
+        """Carica inode e offset salvati; senza stato la lettura parte dalla fine del file."""
+        if self.state_file and os.path.exists(self.state_file):
+            try:
+                with open(self.state_file, 'r') as f:
+                    state = json.load(f)
+                self.inode = state.get("inode")
+                self.offset = state.get("offset", 0)
+                return
+            except Exception as e:
+                logger.warning(f"Stato del lettore di log non valido, ripartenza dalla fine del file: {e}")
+        
+        try:
+            stat = os.stat(self.path)
+            self.inode = stat.st_ino
+            self.offset = stat.st_size
+        except FileNotFoundError:
+            self.inode = None
+            self.offset = 0
+    
+    def _save_state(self):
+        """Salva atomicamente inode e offset correnti."""
+        if not self.state_file:
+            return
+        try:
+            tmp_file = f"{self.state_file}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump({"inode": self.inode, "offset": self.offset}, f)
+            os.replace(tmp_file, self.state_file)
+        except Exception as e:
+            logger.error(f"Errore nel salvataggio dello stato del lettore di log: {e}")
+    
+    def _open(self, inode: int, offset: int):
+        if self.file:
+            self.file.close()
+        self.file = open(self.path, 'rb')
+        self.file.seek(offset)
+        self.inode = inode
+        self.offset = offset
+        self.partial = b""
+    
+    def read_lines(self) -> List[bytes]:
+        """
+        Restituisce le righe complete aggiunte dall'ultima chiamata.
+        
+        Returns:
+            Lista di righe (bytes, senza terminatore)
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        
+        lines = []
+        if self.file is None:
+            # Prima apertura: riprende dall'offset salvato se il file è lo stesso
+            if stat.st_ino == self.inode and stat.st_size >= self.offset:
+                self._open(stat.st_ino, self.offset)
+            else:
+                self._open(stat.st_ino, 0)
+        elif stat.st_ino != self.inode:
+            # Rotazione: completa la lettura del vecchio file e passa al nuovo
+            lines.extend(line for line in (self.partial + self.file.read()).split(b"\n") if line)
+            self._open(stat.st_ino, 0)
+            logger.info(f"Rotazione rilevata per {self.path}")
+        elif stat.st_size < self.file.tell():
+            # Troncamento: riparte dall'inizio
+            self._open(stat.st_ino, 0)
+            logger.info(f"Troncamento rilevato per {self.path}")
+        
+        data = self.partial + self.file.read(self.max_read_bytes)
+        end = data.rfind(b"\n")
+        if end == -1:
+            self.partial = data
+        else:
+            lines.extend(line for line in data[:end].split(b"\n") if line)
+            self.partial = data[end + 1:]
+        
+        # L'offset salvato punta all'inizio dell'eventuale riga incompleta
+        self.offset = self.file.tell() - len(self.partial)
+        self._save_state()
+        return lines
+    
+    def close(self):
+        """Chiude il file di log."""
+        if self.file:
+            self.file.close()
+            self.file = None
+
 class M4BotExporter:
     """Esportatore di metriche per M4Bot"""
     
@@ -70,6 +196,12 @@ class M4BotExporter:
         self.services_status = {}
         self.running = False
         
+        # Lettura incrementale del log degli accessi
+        self.access_log = LogTailer(
+            os.path.join(M4BOT_DIR, "logs", "access.log"),
+            state_file=os.path.join(M4BOT_DIR, "data", "prometheus_access_log.state")
+        )
+        
         logger.info(f"M4Bot Prometheus Exporter inizializzato (porta: {port}, intervallo: {interval}s)")
     
     def _setup_metrics(self):
@@ -113,6 +245,11 @@ class M4BotExporter:
         self.update_last_check = Gauge('m4bot_update_last_check_timestamp', 'Timestamp dell\'ultimo controllo aggiornamenti', registry=self.registry)
         self.update_available = Gauge('m4bot_update_available', 'Se è disponibile un aggiornamento (1=sì, 0=no)', registry=self.registry)
         
+        # Metriche del loop asyncio del bot (dallo stato scritto da HealthMonitor)
+        self.event_loop_lag = Gauge('m4bot_event_loop_lag_window_seconds', 'Percentili della latenza del loop asyncio sull\'ultima finestra',
+                                    ['quantile'], registry=self.registry)
+        self.event_loop_blocked = Counter('m4bot_event_loop_blocks_total', 'Blocchi del loop asyncio rilevati dal thread di guardia', registry=self.registry)
+        
         # Info generali
         self.m4bot_info = Info('m4bot_info', 'Informazioni sulla versione di M4Bot', registry=self.registry)
     
@@ -174,40 +311,8 @@ class M4BotExporter:
     def collect_app_metrics(self):
         """Raccoglie metriche dell'applicazione dai log"""
         try:
-            # Parsiamo i log degli accessi se disponibili
-            log_file = os.path.join(M4BOT_DIR, "logs", "access.log")
-            if os.path.exists(log_file):
-                # Analisi del log per estrarre richieste ed errori
-                # Questo è un esempio semplificato
-                with open(log_file, 'r') as f:
-                    log_lines = f.readlines()
-                
-                # Analizziamo le ultime 100 righe
-                for line in log_lines[-100:]:
-                    # Solo le righe più recenti dall'ultimo aggiornamento
-                    try:
-                        # Esempio di formato log: [2023-05-21 10:15:30] 200 GET /api/status 0.123s
-                        parts = line.split()
-                        if len(parts) >= 5:
-                            timestamp_str = " ".join(parts[0:2]).strip("[]")
-                            timestamp = datetime.datetime.strptime(timestamp_str, "%Y-%m-%d %H:%M:%S")
-                            
-                            if timestamp > self.last_update:
-                                status_code = parts[2]
-                                method = parts[3]
-                                endpoint = parts[4]
-                                duration = float(parts[5].strip("s"))
-                                
-                                # Incrementa contatori
-                                self.app_requests_total.labels(endpoint=endpoint).inc()
-                                self.app_request_duration.labels(endpoint=endpoint).observe(duration)
-                                
-                                # Registra errori
-                                if status_code.startswith("5") or status_code.startswith("4"):
-                                    self.app_errors_total.labels(type=f"HTTP_{status_code}").inc()
-                    except Exception as e:
-                        logger.debug(f"Errore durante il parsing della riga di log: {e}")
-                        continue
+            # Righe del log degli accessi aggiunte dall'ultima raccolta
+            self._process_access_log(self.access_log.read_lines())
             
             # Statistiche di utilizzo
             stats_file = os.path.join(M4BOT_DIR, "data", "usage_stats.json")
@@ -236,6 +341,52 @@ class M4BotExporter:
         except Exception as e:
             logger.error(f"Errore durante la raccolta delle metriche dell'applicazione: {e}")
     
+    def _process_access_log(self, lines: List[bytes]):
+        """
+        Aggiorna contatori e istogrammi con un blocco di righe del log degli accessi.
+        
+        Args:
+            lines: Righe del log, ciascuna elaborata una sola volta
+        """
+        requests: Dict[str, List[float]] = {}
+        errors: Dict[str, int] = {}
+        invalid = 0
+        
+        for line in lines:
+            match = ACCESS_LOG_PATTERN.match(line)
+            if not match:
+                invalid += 1
+                continue
+            
+            try:
+                duration = float(match.group("duration"))
+            except ValueError:
+                # Durata malformata (es. "1.2.3"): la riga viene scartata
+                invalid += 1
+                continue
+            
+            endpoint = match.group("endpoint").decode("utf-8", "replace")
+            requests.setdefault(endpoint, []).append(duration)
+            
+            # Registra errori (4xx e 5xx)
+            status_code = match.group("status")
+            if status_code[0] in b"45":
+                error_type = f"HTTP_{status_code.decode()}"
+                errors[error_type] = errors.get(error_type, 0) + 1
+        
+        # Un aggiornamento per etichetta invece di uno per riga
+        for endpoint, durations in requests.items():
+            self.app_requests_total.labels(endpoint=endpoint).inc(len(durations))
+            histogram = self.app_request_duration.labels(endpoint=endpoint)
+            for duration in durations:
+                histogram.observe(duration)
+        
+        for error_type, count in errors.items():
+            self.app_errors_total.labels(type=error_type).inc(count)
+        
+        if invalid:
+            logger.debug(f"{invalid} righe del log degli accessi non riconosciute")
+    
     def collect_db_metrics(self):
         """Raccoglie metriche sul database"""
         try:
@@ -470,11 +621,34 @@ class M4BotExporter:
         except Exception as e:
             logger.error(f"Errore durante la raccolta delle informazioni sulla versione: {e}")
     
+    def collect_health_metrics(self):
+        """Raccoglie le metriche del loop asyncio dallo stato salvato da HealthMonitor"""
+        try:
+            status_file = os.path.join(M4BOT_DIR, "logs", "health_status.json")
+            # Uno stato vecchio vuol dire monitor fermo: meglio nessun valore che valori falsi
+            if not os.path.exists(status_file) or time.time() - os.path.getmtime(status_file) > 10 * self.interval:
+                return
+            
+            with open(status_file, 'r') as f:
+                event_loop = json.load(f).get("event_loop") or {}
+            
+            for quantile, key in (("0.5", "p50_ms"), ("0.9", "p90_ms"), ("0.99", "p99_ms"), ("1", "max_ms")):
+                if key in event_loop:
+                    self.event_loop_lag.labels(quantile=quantile).set(event_loop[key] / 1000)
+            if "blocked_count" in event_loop:
+                self.event_loop_blocked._value.set(event_loop["blocked_count"])
+            
+            logger.debug("Metriche del loop asyncio raccolte")
+            
+        except Exception as e:
+            logger.error(f"Errore durante la raccolta delle metriche del loop asyncio: {e}")
+    
     def collect_metrics(self):
         """Raccoglie tutte le metriche disponibili"""
         self.collect_system_metrics()
         self.collect_service_metrics()
         self.collect_app_metrics()
+        self.collect_health_metrics()
         self.collect_db_metrics()
         self.collect_backup_metrics()
         self.collect_update_metrics()
@@ -518,6 +692,7 @@ class M4BotExporter:
     def stop(self):
         """Ferma l'esportatore"""
         self.running = False
+        self.access_log.close()
         logger.info("Esportatore fermato")
 
 
@@ -9,6 +9,8 @@ from .ai_moderation import setup as setup_ai_moderation
 from .content_scheduler import setup as setup_content_scheduler
 from .loyalty_system import setup as setup_loyalty_system
 
+from bot.event_bus import PluginHandlers
+
 # Mappa dei plugin disponibili
 AVAILABLE_PLUGINS = {
     "polls": {
@@ -38,13 +40,20 @@ AVAILABLE_PLUGINS = {
     }
 }
 
-def setup_plugins(app):
+def setup_plugins(app, event_bus=None):
     """
     Configura tutti i plugin disponibili nell'applicazione
     
     Args:
         app: L'applicazione Flask/Quart
+        event_bus: Bus dei messaggi di chat del bot (ChatEventBus) su cui i plugin
+                   registrano i propri gestori
     """
+    if event_bus is not None:
+        app.message_handler = PluginHandlers(event_bus, app)
+    elif not hasattr(app, 'message_handler'):
+        app.logger.warning("Bus dei messaggi di chat non disponibile: i plugin non riceveranno i messaggi")
+    
     for plugin_id, plugin_info in AVAILABLE_PLUGINS.items():
         try:
             # Verifica se il plugin è abilitato nella configurazione
@@ -8,6 +8,7 @@ import logging
 import uuid
 import asyncio
 import time
+import heapq
 from datetime import datetime, timedelta
 from typing import Dict, List, Any, Optional
 from flask import Blueprint, jsonify, request, render_template, current_app
@@ -21,6 +22,9 @@ SCHEDULER_DIR = "data/scheduler"
 SCHEDULED_ITEMS_FILE = os.path.join(SCHEDULER_DIR, "scheduled_items.json")
 HISTORY_FILE = os.path.join(SCHEDULER_DIR, "history.json")
 
+# Ritardo con cui vengono accorpati i salvataggi su file (secondi)
+SAVE_DEBOUNCE_SECONDS = 2.0
+
 # Blueprint
 scheduler_blueprint = Blueprint('content_scheduler', __name__)
 
@@ -38,7 +42,16 @@ class ContentScheduler:
         self.scheduled_items = {}
         self.history = []
         self.scheduler_task = None
-        self.last_check = 0
+        self.save_task = None
+        
+        # Coda delle prossime esecuzioni: (next_run, item_id)
+        self.run_queue = []
+        # Segnale per risvegliare il loop quando cambia la programmazione
+        self.wakeup_event = asyncio.Event()
+        
+        # Elementi modificati e non ancora salvati su file
+        self.dirty_items = set()
+        self.history_dirty = False
         
         # Crea le directory necessarie
         os.makedirs(SCHEDULER_DIR, exist_ok=True)
@@ -47,6 +60,10 @@ class ContentScheduler:
         self._load_scheduled_items()
         self._load_history()
         
+        # Calcola la prossima esecuzione di ogni elemento programmato
+        for item_id in self.scheduled_items:
+            self._schedule_next_run(item_id)
+        
         # Avvia il task di scheduling
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
@@ -103,64 +120,142 @@ class ContentScheduler:
         except Exception as e:
             logger.error(f"Errore nel salvataggio della cronologia: {e}")
     
+    def _compute_next_run(self, item, after=None):
+        """
+        Calcola il timestamp della prossima esecuzione di un elemento
+        
+        Args:
+            item: L'elemento programmato
+            after: Timestamp dopo cui calcolare l'esecuzione (default: adesso)
+            
+        Returns:
+            float: Timestamp della prossima esecuzione, o None se non va eseguito
+        """
+        if item.get("status") != "scheduled":
+            return None
+        
+        if item.get("schedule_type") == "timestamp":
+            return item.get("scheduled_time", 0)
+        
+        if item.get("schedule_type") == "cron":
+            cron_expr = item.get("cron_expression", "")
+            if not cron_expr:
+                return None
+            
+            base = datetime.fromtimestamp(after if after is not None else datetime.now().timestamp())
+            try:
+                return croniter.croniter(cron_expr, base).get_next(datetime).timestamp()
+            except Exception as e:
+                logger.error(f"Errore nella valutazione dell'espressione cron '{cron_expr}': {e}")
+        
+        return None
+    
+    def _schedule_next_run(self, item_id, after=None):
+        """
+        Aggiorna next_run di un elemento e lo inserisce nella coda delle esecuzioni
+        
+        Args:
+            item_id: ID dell'elemento
+            after: Timestamp dopo cui calcolare l'esecuzione (default: adesso)
+        """
+        item = self.scheduled_items.get(item_id)
+        if not item:
+            return
+        
+        next_run = self._compute_next_run(item, after)
+        if next_run is None:
+            item.pop("next_run", None)
+            return
+        
+        item["next_run"] = next_run
+        heapq.heappush(self.run_queue, (next_run, item_id))
+        self.wakeup_event.set()
+    
+    def _mark_dirty(self, item_id=None, history=False):
+        """
+        Segna elementi o cronologia come modificati e pianifica un salvataggio
+        
+        Args:
+            item_id: ID dell'elemento modificato (opzionale)
+            history: True se è cambiata la cronologia
+        """
+        if item_id is not None:
+            self.dirty_items.add(item_id)
+        if history:
+            self.history_dirty = True
+        
+        # Accorpa i salvataggi ravvicinati in un'unica scrittura
+        if self.save_task is None or self.save_task.done():
+            try:
+                self.save_task = asyncio.get_running_loop().create_task(self._debounced_save())
+            except RuntimeError:
+                # Nessun loop attivo: salva subito
+                self._flush()
+    
+    async def _debounced_save(self):
+        """Attende il periodo di accorpamento e salva le modifiche pendenti"""
+        await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+        self._flush()
+    
+    def _flush(self):
+        """Scrive su file gli elementi e la cronologia modificati"""
+        if self.dirty_items:
+            logger.debug(f"Salvataggio di {len(self.dirty_items)} elementi programmati modificati")
+            self.dirty_items.clear()
+            self._save_scheduled_items()
+        
+        if self.history_dirty:
+            self.history_dirty = False
+            self._save_history()
+    
+    async def close(self):
+        """Arresta il loop di scheduling e salva le modifiche pendenti"""
+        for task in (self.scheduler_task, self.save_task):
+            if task and not task.done():
+                task.cancel()
+        
+        self._flush()
+    
     async def _scheduler_loop(self):
         """Loop di scheduling degli elementi programmati"""
         try:
             while True:
                 try:
-                    now = datetime.now()
-                    current_time = now.timestamp()
-                    
-                    # Verifica se è passato almeno 1 secondo dall'ultimo controllo
-                    if current_time - self.last_check < 1:
-                        await asyncio.sleep(0.1)
-                        continue
-                    
-                    self.last_check = current_time
+                    self.wakeup_event.clear()
+                    current_time = datetime.now().timestamp()
                     
-                    # Trova gli elementi da eseguire
+                    # Estrai gli elementi arrivati a scadenza
                     to_execute = []
-                    for item_id, item in self.scheduled_items.items():
-                        if item.get("status") == "scheduled":
-                            # Gestisce gli elementi con timestamp
-                            if item.get("schedule_type") == "timestamp":
-                                schedule_time = item.get("scheduled_time", 0)
-                                if schedule_time <= current_time:
-                                    to_execute.append(item_id)
-                            
-                            # Gestisce gli elementi con cron
-                            elif item.get("schedule_type") == "cron":
-                                cron_expr = item.get("cron_expression", "")
-                                if cron_expr:
-                                    try:
-                                        # Calcola la prossima esecuzione
-                                        cron = croniter.croniter(cron_expr, now - timedelta(minutes=1))
-                                        next_exec = cron.get_next(datetime)
-                                        
-                                        # Verifica se è il momento di eseguire
-                                        if next_exec <= now:
-                                            to_execute.append(item_id)
-                                            
-                                            # Aggiorna il prossimo orario di esecuzione
-                                            if item.get("repeat", False):
-                                                item["last_execution"] = current_time
-                                                # Salva immediatamente per evitare esecuzioni duplicate
-                                                self._save_scheduled_items()
-                                    except Exception as e:
-                                        logger.error(f"Errore nella valutazione dell'espressione cron '{cron_expr}': {e}")
+                    while self.run_queue and self.run_queue[0][0] <= current_time:
+                        next_run, item_id = heapq.heappop(self.run_queue)
+                        item = self.scheduled_items.get(item_id)
+                        
+                        # Ignora le voci obsolete (elemento eliminato o ripianificato)
+                        if not item or item.get("status") != "scheduled" or item.get("next_run") != next_run:
+                            continue
+                        
+                        to_execute.append(item_id)
                     
                     # Esegui gli elementi
                     for item_id in to_execute:
                         await self._execute_scheduled_item(item_id)
+                        
+                        # Ricalcola la prossima esecuzione solo dopo l'esecuzione
+                        self._schedule_next_run(item_id)
+                        self._mark_dirty(item_id, history=True)
                     
-                    # Se sono stati eseguiti elementi, salva
-                    if to_execute:
-                        self._save_scheduled_items()
-                        self._save_history()
+                    # Dormi fino alla prossima scadenza o a una modifica della programmazione
+                    timeout = None
+                    if self.run_queue:
+                        timeout = max(0.0, self.run_queue[0][0] - datetime.now().timestamp())
                     
-                    # Attendi 1 secondo prima del prossimo controllo
-                    await asyncio.sleep(1)
+                    try:
+                        await asyncio.wait_for(self.wakeup_event.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
                     
+                except asyncio.CancelledError:
+                    raise
                 except Exception as e:
                     logger.error(f"Errore nel loop di scheduling: {e}")
                     await asyncio.sleep(5)  # Attendi 5 secondi in caso di errore
@@ -526,11 +621,12 @@ class ContentScheduler:
             if "priority" in data:
                 item["priority"] = data["priority"]
             
-            # Registra l'elemento
+            # Registra l'elemento e pianifica la prima esecuzione
             self.scheduled_items[item_id] = item
+            self._schedule_next_run(item_id)
             
             # Salva gli elementi programmati
-            self._save_scheduled_items()
+            self._mark_dirty(item_id)
             
             return {"success": True, "item": item}
             
@@ -621,8 +717,11 @@ class ContentScheduler:
             # Aggiorna il timestamp di modifica
             item["updated_at"] = datetime.now().timestamp()
             
+            # Ricalcola la prossima esecuzione
+            self._schedule_next_run(item_id)
+            
             # Salva gli elementi programmati
-            self._save_scheduled_items()
+            self._mark_dirty(item_id)
             
             return {"success": True, "item": item}
             
@@ -645,11 +744,11 @@ class ContentScheduler:
             if item_id not in self.scheduled_items:
                 return {"success": False, "error": "Elemento non trovato"}
             
-            # Elimina l'elemento
+            # Elimina l'elemento (la voce in coda viene scartata all'estrazione)
             del self.scheduled_items[item_id]
             
             # Salva gli elementi programmati
-            self._save_scheduled_items()
+            self._mark_dirty(item_id)
             
             return {"success": True}
             
@@ -899,8 +998,9 @@ def setup(app):
         history = await scheduler.get_history(filters, limit)
         return jsonify(history)
     
-    @app.teardown_appcontext
-    async def shutdown_scheduler(exception=None):
-        """Chiude il gestore della programmazione alla chiusura dell'app"""
-        if hasattr(app, 'content_scheduler'):
-            await app.content_scheduler.close() 
\ No newline at end of file
+    if hasattr(app, 'after_serving'):
+        @app.after_serving
+        async def shutdown_scheduler():
+            """Chiude il gestore della programmazione alla chiusura dell'app"""
+            if hasattr(app, 'content_scheduler'):
+                await app.content_scheduler.close() 
\ No newline at end of file
@@ -7,16 +7,27 @@ import json
 import logging
 import asyncio
 import time
+import heapq
+import sqlite3
+from abc import ABC, abstractmethod
+from bisect import bisect_right
 from typing import Dict, List, Any, Optional, Callable
 from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request, render_template, current_app
 
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
 # Logger
 logger = logging.getLogger(__name__)
 
 # Path per i file del sistema di fedeltà
 LOYALTY_DIR = "data/loyalty"
 USERS_FILE = os.path.join(LOYALTY_DIR, "users.json")
+USERS_DB_FILE = os.path.join(LOYALTY_DIR, "users.db")
 LEVELS_FILE = os.path.join(LOYALTY_DIR, "levels.json")
 REWARDS_FILE = os.path.join(LOYALTY_DIR, "rewards.json")
 LOYALTY_CONFIG_FILE = os.path.join(LOYALTY_DIR, "config.json")
@@ -24,6 +35,287 @@ LOYALTY_CONFIG_FILE = os.path.join(LOYALTY_DIR, "config.json")
 # Blueprint
 loyalty_blueprint = Blueprint('loyalty_system', __name__)
 
+class LoyaltyUserStore(ABC):
+    """Interfaccia dei backend di persistenza degli utenti del sistema di fedeltà"""
+    
+    @abstractmethod
+    async def open(self):
+        """Apre il backend e crea tabelle e indici se mancanti"""
+    
+    @abstractmethod
+    async def load_all(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Carica tutti gli utenti
+        
+        Returns:
+            Dict[str, Dict[str, Any]]: Utenti indicizzati per ID
+        """
+    
+    @abstractmethod
+    async def save_batch(self, users: List[Dict[str, Any]]):
+        """
+        Inserisce o aggiorna un lotto di utenti in un'unica transazione
+        
+        Args:
+            users: Utenti da salvare
+        """
+    
+    @abstractmethod
+    async def delete_batch(self, user_ids: List[str]):
+        """
+        Elimina un lotto di utenti
+        
+        Args:
+            user_ids: ID degli utenti da eliminare
+        """
+    
+    @abstractmethod
+    async def top_users(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Restituisce gli utenti con più punti usando l'indice sui punti
+        
+        Args:
+            limit: Numero massimo di utenti
+            
+        Returns:
+            List[Dict[str, Any]]: Utenti ordinati per punti decrescenti
+        """
+    
+    async def close(self):
+        """Chiude il backend"""
+        pass
+    
+    @staticmethod
+    def _to_row(user: Dict[str, Any]) -> tuple:
+        """Converte un utente nella riga (id, platform, points, level, last_active, data)"""
+        return (
+            user["id"],
+            user.get("platform", ""),
+            float(user.get("points", 0)),
+            int(user.get("level", 1)),
+            float(user.get("last_active", 0)),
+            json.dumps(user)
+        )
+
+
+class SQLiteUserStore(LoyaltyUserStore):
+    """Backend SQLite: le query vengono eseguite in un thread per non bloccare il loop"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Percorso del database SQLite
+        """
+        self.path = path
+        self.conn = None
+    
+    def _run(self, func, *args):
+        """Esegue una funzione sincrona sul database in un thread"""
+        return asyncio.get_running_loop().run_in_executor(None, func, *args)
+    
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS loyalty_users (
+                id TEXT PRIMARY KEY,
+                platform TEXT NOT NULL,
+                points REAL NOT NULL DEFAULT 0,
+                level INTEGER NOT NULL DEFAULT 1,
+                last_active REAL NOT NULL DEFAULT 0,
+                data TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_loyalty_users_points ON loyalty_users (points DESC)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_loyalty_users_last_active ON loyalty_users (last_active)")
+        self.conn.commit()
+    
+    async def open(self):
+        await self._run(self._open)
+    
+    def _load_all(self):
+        rows = self.conn.execute("SELECT id, data FROM loyalty_users").fetchall()
+        return {user_id: json.loads(data) for user_id, data in rows}
+    
+    async def load_all(self) -> Dict[str, Dict[str, Any]]:
+        return await self._run(self._load_all)
+    
+    def _save_batch(self, rows):
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO loyalty_users (id, platform, points, level, last_active, data)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    platform = excluded.platform,
+                    points = excluded.points,
+                    level = excluded.level,
+                    last_active = excluded.last_active,
+                    data = excluded.data
+            """, rows)
+    
+    async def save_batch(self, users: List[Dict[str, Any]]):
+        if users:
+            await self._run(self._save_batch, [self._to_row(user) for user in users])
+    
+    def _delete_batch(self, user_ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM loyalty_users WHERE id = ?", [(user_id,) for user_id in user_ids])
+    
+    async def delete_batch(self, user_ids: List[str]):
+        if user_ids:
+            await self._run(self._delete_batch, list(user_ids))
+    
+    def _top_users(self, limit):
+        rows = self.conn.execute(
+            "SELECT data FROM loyalty_users ORDER BY points DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [json.loads(data) for (data,) in rows]
+    
+    async def top_users(self, limit: int) -> List[Dict[str, Any]]:
+        return await self._run(self._top_users, limit)
+    
+    async def close(self):
+        if self.conn:
+            await self._run(self.conn.close)
+            self.conn = None
+
+
+class PostgresUserStore(LoyaltyUserStore):
+    """Backend PostgreSQL basato su asyncpg"""
+    
+    def __init__(self, dsn: str):
+        """
+        Args:
+            dsn: Stringa di connessione PostgreSQL
+        """
+        self.dsn = dsn
+        self.pool = None
+    
+    async def open(self):
+        if not ASYNCPG_AVAILABLE:
+            raise RuntimeError("asyncpg non installato: impossibile usare il backend PostgreSQL")
+        
+        self.pool = await asyncpg.create_pool(dsn=self.dsn, min_size=1, max_size=5)
+        async with self.pool.acquire() as conn:
+            await conn.execute("""
+                CREATE TABLE IF NOT EXISTS loyalty_users (
+                    id TEXT PRIMARY KEY,
+                    platform TEXT NOT NULL,
+                    points DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    level INTEGER NOT NULL DEFAULT 1,
+                    last_active DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    data JSONB NOT NULL
+                )
+            """)
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_loyalty_users_points ON loyalty_users (points DESC)")
+            await conn.execute("CREATE INDEX IF NOT EXISTS idx_loyalty_users_last_active ON loyalty_users (last_active)")
+    
+    async def load_all(self) -> Dict[str, Dict[str, Any]]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch("SELECT id, data::text AS data FROM loyalty_users")
+        return {row["id"]: json.loads(row["data"]) for row in rows}
+    
+    async def save_batch(self, users: List[Dict[str, Any]]):
+        if not users:
+            return
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.executemany("""
+                    INSERT INTO loyalty_users (id, platform, points, level, last_active, data)
+                    VALUES ($1, $2, $3, $4, $5, $6::jsonb)
+                    ON CONFLICT (id) DO UPDATE SET
+                        platform = EXCLUDED.platform,
+                        points = EXCLUDED.points,
+                        level = EXCLUDED.level,
+                        last_active = EXCLUDED.last_active,
+                        data = EXCLUDED.data
+                """, [self._to_row(user) for user in users])
+    
+    async def delete_batch(self, user_ids: List[str]):
+        if not user_ids:
+            return
+        async with self.pool.acquire() as conn:
+            await conn.execute("DELETE FROM loyalty_users WHERE id = ANY($1::text[])", list(user_ids))
+    
+    async def top_users(self, limit: int) -> List[Dict[str, Any]]:
+        async with self.pool.acquire() as conn:
+            rows = await conn.fetch(
+                "SELECT data::text AS data FROM loyalty_users ORDER BY points DESC LIMIT $1", limit
+            )
+        return [json.loads(row["data"]) for row in rows]
+    
+    async def close(self):
+        if self.pool:
+            await self.pool.close()
+            self.pool = None
+
+
+class JSONFileUserStore(LoyaltyUserStore):
+    """Backend di riserva sul vecchio file users.json, riscritto per intero a ogni salvataggio"""
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Percorso del file JSON degli utenti
+        """
+        self.path = path
+        self.users = {}
+    
+    def _write(self, data: str):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+    
+    async def _save(self):
+        # Serializza nel loop, così il thread non legge gli utenti mentre vengono modificati
+        data = json.dumps(self.users, indent=2)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, data)
+    
+    async def open(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.users = json.load(f)
+    
+    async def load_all(self) -> Dict[str, Dict[str, Any]]:
+        return dict(self.users)
+    
+    async def save_batch(self, users: List[Dict[str, Any]]):
+        if users:
+            self.users.update((user["id"], user) for user in users)
+            await self._save()
+    
+    async def delete_batch(self, user_ids: List[str]):
+        if user_ids:
+            for user_id in user_ids:
+                self.users.pop(user_id, None)
+            await self._save()
+    
+    async def top_users(self, limit: int) -> List[Dict[str, Any]]:
+        return heapq.nlargest(limit, self.users.values(), key=lambda user: user.get("points", 0))
+
+
+def create_user_store(storage_config: Dict[str, Any]) -> LoyaltyUserStore:
+    """
+    Crea il backend di persistenza degli utenti indicato nella configurazione
+    
+    Args:
+        storage_config: Sezione "storage" della configurazione ({"backend", "path", "dsn"})
+        
+    Returns:
+        LoyaltyUserStore: Il backend richiesto (SQLite se non specificato)
+    """
+    backend = storage_config.get("backend", "sqlite")
+    if backend == "postgres":
+        dsn = storage_config.get("dsn") or os.environ.get("DATABASE_URL")
+        if not dsn:
+            raise ValueError("DSN PostgreSQL mancante per il backend del sistema di fedeltà")
+        return PostgresUserStore(dsn)
+    if backend != "sqlite":
+        raise ValueError(f"Backend di persistenza non supportato: {backend}")
+    return SQLiteUserStore(storage_config.get("path", USERS_DB_FILE))
+
+
 class LoyaltySystem:
     """Gestore del sistema di fedeltà"""
     
@@ -40,17 +332,32 @@ class LoyaltySystem:
         self.rewards = []
         self.config = {}
         self.update_task = None
+        self.flush_task = None
         self.last_housekeeping = 0
         
+        # Soglie dei livelli ordinate per la ricerca binaria: _calculate_level
+        self.level_thresholds = []
+        self.level_ids = []
+        
+        # Utenti modificati o eliminati in attesa di essere scritti nel backend
+        self.dirty_users = set()
+        self.deleted_users = set()
+        self.storage = None
+        self.users_loaded = asyncio.Event()
+        self._flush_requested = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        
         # Crea le directory necessarie
         os.makedirs(LOYALTY_DIR, exist_ok=True)
         
-        # Carica i dati salvati
-        self._load_users()
+        # Carica i dati salvati (gli utenti vengono caricati dal backend nel task di aggiornamento)
         self._load_levels()
         self._load_rewards()
         self._load_config()
         
+        self.flush_interval = self.config.get("users_flush_interval", 5)
+        self.flush_batch_size = self.config.get("users_flush_batch_size", 500)
+        
         # Avvia il task di aggiornamento
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
@@ -58,27 +365,129 @@ class LoyaltySystem:
         
         logger.info("Sistema di fedeltà inizializzato")
     
-    def _load_users(self):
-        """Carica gli utenti dal file"""
-        if os.path.exists(USERS_FILE):
+    async def _load_users(self):
+        """Apre il backend di persistenza e carica gli utenti, migrando il vecchio file JSON"""
+        try:
+            self.storage = create_user_store(self.config.get("storage", {}))
+            await self.storage.open()
+            self.users = await self.storage.load_all()
+            logger.info(f"Caricati {len(self.users)} utenti")
+            
+            if not self.users and os.path.exists(USERS_FILE):
+                await self._migrate_json_users()
+        except Exception as e:
+            logger.critical(f"Backend degli utenti non disponibile ({e}): uso il file {USERS_FILE}")
+            await self._open_file_store()
+        finally:
+            self.users_loaded.set()
+    
+    async def _open_file_store(self):
+        """Ripiega sulla persistenza nel file users.json; se anche questa fallisce solleva l'errore"""
+        if self.storage:
             try:
-                with open(USERS_FILE, 'r') as f:
-                    self.users = json.load(f)
-                logger.info(f"Caricati {len(self.users)} utenti")
+                await self.storage.close()
             except Exception as e:
-                logger.error(f"Errore nel caricamento degli utenti: {e}")
-                self.users = {}
-        else:
-            self.users = {}
-    
-    def _save_users(self):
-        """Salva gli utenti nel file"""
+                logger.error(f"Errore nella chiusura del backend degli utenti: {e}")
+        
+        self.storage = JSONFileUserStore(USERS_FILE)
         try:
-            with open(USERS_FILE, 'w') as f:
-                json.dump(self.users, f, indent=2)
-            logger.debug("Utenti salvati")
+            await self.storage.open()
+            self.users = await self.storage.load_all()
         except Exception as e:
-            logger.error(f"Errore nel salvataggio degli utenti: {e}")
+            self.storage = None
+            logger.critical(f"Impossibile caricare gli utenti da {USERS_FILE}: {e}")
+            raise
+        
+        logger.info(f"Caricati {len(self.users)} utenti da {USERS_FILE}")
+    
+    async def _migrate_json_users(self):
+        """Importa nel backend gli utenti del vecchio file users.json e lo rinomina"""
+        with open(USERS_FILE, 'r') as f:
+            users = json.load(f)
+        
+        user_list = list(users.values())
+        for start in range(0, len(user_list), self.flush_batch_size):
+            await self.storage.save_batch(user_list[start:start + self.flush_batch_size])
+        
+        self.users = users
+        os.replace(USERS_FILE, USERS_FILE + ".migrated")
+        logger.info(f"Migrati {len(users)} utenti da {USERS_FILE} al nuovo backend")
+    
+    def _mark_user_dirty(self, user_id: str):
+        """
+        Segna un utente come modificato; il salvataggio avviene nel prossimo lotto
+        
+        Args:
+            user_id: ID dell'utente
+        """
+        self.dirty_users.add(user_id)
+        if len(self.dirty_users) >= self.flush_batch_size:
+            self._flush_requested.set()
+    
+    async def _flush_loop(self):
+        """Task che scrive periodicamente nel backend gli utenti modificati"""
+        while True:
+            try:
+                try:
+                    await asyncio.wait_for(self._flush_requested.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_requested.clear()
+                
+                await self.flush_users()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Errore nel salvataggio periodico degli utenti: {e}")
+    
+    async def flush_users(self) -> int:
+        """
+        Scrive nel backend tutti gli utenti modificati ed elimina quelli rimossi
+        
+        Returns:
+            int: Numero di utenti scritti
+        """
+        if not self.storage:
+            return 0
+        
+        async with self._flush_lock:
+            dirty, self.dirty_users = self.dirty_users, set()
+            deleted, self.deleted_users = self.deleted_users, set()
+            batch = [self.users[user_id] for user_id in dirty if user_id in self.users]
+            
+            try:
+                await self.storage.delete_batch(list(deleted))
+                await self.storage.save_batch(batch)
+                if batch:
+                    logger.debug(f"Salvati {len(batch)} utenti")
+                return len(batch)
+            except Exception as e:
+                # Rimetti in coda le modifiche per il prossimo tentativo
+                self.dirty_users |= dirty
+                self.deleted_users |= deleted
+                logger.error(f"Errore nel salvataggio di {len(batch)} utenti: {e}")
+                return 0
+    
+    async def close(self):
+        """Ferma i task, salva le modifiche pendenti e chiude il backend"""
+        for task in (self.update_task, self.flush_task):
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        
+        await self.flush_users()
+        if self.storage:
+            await self.storage.close()
+            self.storage = None
+    
+    def _build_level_index(self):
+        """Ricostruisce le soglie ordinate dei livelli usate da _calculate_level"""
+        sorted_levels = sorted(self.levels, key=lambda x: x.get("points_required", 0))
+        self.level_thresholds = [level.get("points_required", 0) for level in sorted_levels]
+        self.level_ids = [level.get("id", 1) for level in sorted_levels]
     
     def _load_levels(self):
         """Carica i livelli dal file"""
@@ -86,6 +495,7 @@ class LoyaltySystem:
             try:
                 with open(LEVELS_FILE, 'r') as f:
                     self.levels = json.load(f)
+                self._build_level_index()
                 logger.info(f"Caricati {len(self.levels)} livelli")
             except Exception as e:
                 logger.error(f"Errore nel caricamento dei livelli: {e}")
@@ -132,6 +542,7 @@ class LoyaltySystem:
                 "benefits": ["chat_emotes", "priority_responses", "exclusive_content", "special_events"]
             }
         ]
+        self._build_level_index()
         self._save_levels()
     
     def _save_levels(self):
@@ -233,6 +644,13 @@ class LoyaltySystem:
                 "telegram": True,
                 "whatsapp": True
             },
+            "storage": {
+                "backend": "sqlite",  # sqlite o postgres
+                "path": USERS_DB_FILE,
+                "dsn": None  # Se assente viene usata la variabile DATABASE_URL
+            },
+            "users_flush_interval": 5,  # Secondi tra un salvataggio degli utenti e l'altro
+            "users_flush_batch_size": 500,
             "housekeeping_interval": 3600,  # 1 ora
             "inactive_user_days": 30,  # Giorni di inattività prima della pulizia
             "enable_level_roles": True,
@@ -253,6 +671,10 @@ class LoyaltySystem:
     async def _update_loop(self):
         """Loop di aggiornamento del sistema di fedeltà"""
         try:
+            # Carica gli utenti e avvia il salvataggio a lotti
+            await self._load_users()
+            self.flush_task = asyncio.create_task(self._flush_loop())
+            
             while True:
                 # Esegui housekeeping se necessario
                 now = time.time()
@@ -279,7 +701,7 @@ class LoyaltySystem:
             await self._check_expired_rewards()
             
             # Salva gli utenti
-            self._save_users()
+            await self.flush_users()
         except Exception as e:
             logger.error(f"Errore nell'housekeeping: {e}")
     
@@ -301,6 +723,8 @@ class LoyaltySystem:
             # Rimuovi gli utenti inattivi
             for user_id in inactive_users:
                 del self.users[user_id]
+                self.dirty_users.discard(user_id)
+                self.deleted_users.add(user_id)
             
             if inactive_users:
                 logger.info(f"Rimossi {len(inactive_users)} utenti inattivi")
@@ -326,6 +750,7 @@ class LoyaltySystem:
                 if expired_rewards:
                     user["active_rewards"] = [r for r in active_rewards if r not in expired_rewards]
                     user["expired_rewards"] = user.get("expired_rewards", []) + expired_rewards
+                    self._mark_user_dirty(user_id)
                     logger.debug(f"Rimosse {len(expired_rewards)} ricompense scadute per l'utente {user_id}")
         except Exception as e:
             logger.error(f"Errore nella verifica delle ricompense scadute: {e}")
@@ -341,6 +766,8 @@ class LoyaltySystem:
             bool: True se il messaggio è stato processato, False altrimenti
         """
         try:
+            await self.users_loaded.wait()
+            
             # Verifica se la piattaforma è abilitata
             platform = message.get("platform", "unknown")
             if not self.config.get("platforms", {}).get(platform, False):
@@ -411,6 +838,8 @@ class LoyaltySystem:
             Dict[str, Any]: Risultato dell'operazione
         """
         try:
+            await self.users_loaded.wait()
+            
             # Verifica che l'utente esista
             if user_id not in self.users:
                 return {"success": False, "error": "Utente non trovato"}
@@ -436,8 +865,8 @@ class LoyaltySystem:
                 if self.config.get("announce_level_ups", True):
                     await self._announce_level_up(user, old_level, new_level)
             
-            # Salva gli utenti
-            self._save_users()
+            # Pianifica il salvataggio dell'utente
+            self._mark_user_dirty(user_id)
             
             return {
                 "success": True,
@@ -463,13 +892,10 @@ class LoyaltySystem:
         Returns:
             int: Livello dell'utente
         """
-        # Ordina i livelli per punti richiesti (decrescente)
-        sorted_levels = sorted(self.levels, key=lambda x: x.get("points_required", 0), reverse=True)
-        
-        # Trova il primo livello che l'utente ha raggiunto
-        for level in sorted_levels:
-            if points >= level.get("points_required", 0):
-                return level.get("id", 1)
+        # Ricerca binaria dell'ultima soglia raggiunta
+        index = bisect_right(self.level_thresholds, points)
+        if index:
+            return self.level_ids[index - 1]
         
         # Livello predefinito (1)
         return 1
@@ -522,6 +948,8 @@ class LoyaltySystem:
             Dict[str, Any]: Risultato dell'operazione
         """
         try:
+            await self.users_loaded.wait()
+            
             # Verifica che l'utente esista
             if user_id not in self.users:
                 return {"success": False, "error": "Utente non trovato"}
@@ -566,8 +994,8 @@ class LoyaltySystem:
                 "redeemed_at": time.time()
             }]
             
-            # Salva gli utenti
-            self._save_users()
+            # Pianifica il salvataggio dell'utente
+            self._mark_user_dirty(user_id)
             
             # Annuncia la ricompensa se configurato
             if self.config.get("announce_rewards", True):
@@ -647,9 +1075,17 @@ def setup(app):
     
     @loyalty_blueprint.route('/api/users', methods=['GET'])
     async def get_users():
-        """API per ottenere tutti gli utenti"""
+        """API per ottenere tutti gli utenti, o la classifica dei primi N con ?limit=N"""
+        limit = request.args.get("limit", type=int)
+        loyalty_system = app.loyalty_system
+        if limit and loyalty_system.storage:
+            # Usa l'indice sui punti del backend dopo aver scritto le modifiche pendenti
+            await loyalty_system.flush_users()
+            users_list = await loyalty_system.storage.top_users(limit)
+            return jsonify({"success": True, "users": users_list})
+        
         # Converti gli utenti in una lista
-        users_list = list(app.loyalty_system.users.values())
+        users_list = list(loyalty_system.users.values())
         
         # Ordina gli utenti per punti
         users_list.sort(key=lambda x: x.get("points", 0), reverse=True)
@@ -718,15 +1154,11 @@ def setup(app):
     if hasattr(app, 'message_handler'):
         app.message_handler.register_handler(handle_loyalty_message)
     
-    # Aggiungi un gestore di chiusura per interrompere il task di aggiornamento
-    @app.teardown_appcontext
-    async def shutdown_loyalty(exception=None):
-        if hasattr(app, 'loyalty_system') and app.loyalty_system.update_task:
-            app.loyalty_system.update_task.cancel()
-            try:
-                await app.loyalty_system.update_task
-            except asyncio.CancelledError:
-                pass
+    # Ferma i task e salva gli utenti modificati alla chiusura del server
+    if hasattr(app, 'after_serving'):
+        @app.after_serving
+        async def shutdown_loyalty():
+            await app.loyalty_system.close()
     
     logger.info("Plugin del sistema di fedeltà configurato")
 
@@ -11,12 +11,26 @@ import time
 from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request, render_template, current_app
 
+from bot.event_bus import Broadcaster
+
 # Logger
 logger = logging.getLogger(__name__)
 
 # Path per i file dei sondaggi
 POLLS_DIR = "data/polls"
 POLLS_FILE = os.path.join(POLLS_DIR, "polls.json")
+# Write-ahead log dei voti registrati dopo l'ultimo snapshot
+POLLS_WAL_FILE = os.path.join(POLLS_DIR, "polls.wal")
+
+# Compattazione del log: al raggiungimento della soglia o dopo l'intervallo (secondi)
+WAL_COMPACT_THRESHOLD = 5000
+WAL_COMPACT_INTERVAL = 60
+
+# Frequenza fissa con cui i risultati aggiornati vengono inviati agli overlay (secondi)
+SNAPSHOT_INTERVAL = 1.0
+
+# Dimensione massima della coda di ogni client dell'overlay
+OVERLAY_QUEUE_SIZE = 100
 
 # Blueprint
 polls_blueprint = Blueprint('polls', __name__)
@@ -36,6 +50,18 @@ class PollManager:
         self.active_polls = {}
         self.update_task = None
         
+        # Indice dei votanti per sondaggio: poll_id -> {voter_key: option_id}
+        self.voter_index = {}
+        
+        # Write-ahead log: file aperto in append e voti scritti dall'ultimo snapshot
+        self.wal_file = None
+        self.wal_entries = 0
+        self.last_compaction = time.monotonic()
+        
+        # Sondaggi con risultati cambiati dall'ultimo invio agli overlay
+        self.changed_polls = set()
+        self.broadcaster = Broadcaster(OVERLAY_QUEUE_SIZE)
+        
         # Crea le directory necessarie
         os.makedirs(POLLS_DIR, exist_ok=True)
         
@@ -50,51 +76,190 @@ class PollManager:
         logger.info("Gestore dei sondaggi inizializzato")
     
     def _load_polls(self):
-        """Carica i sondaggi dal file"""
+        """Carica i sondaggi dallo snapshot e riapplica i voti del write-ahead log"""
         if os.path.exists(POLLS_FILE):
             try:
                 with open(POLLS_FILE, 'r') as f:
                     self.polls = json.load(f)
                 logger.info(f"Caricati {len(self.polls)} sondaggi dal file")
-                
-                # Riattiva i sondaggi attivi
-                now = datetime.now().timestamp()
-                for poll_id, poll in self.polls.items():
-                    if poll['status'] == 'active' and poll['end_time'] > now:
-                        self.active_polls[poll_id] = poll
             except Exception as e:
                 logger.error(f"Errore nel caricamento dei sondaggi: {e}")
                 self.polls = {}
         else:
             self.polls = {}
+        
+        # Costruisce l'indice dei votanti: le liste 'voters' restano solo nello snapshot
+        for poll_id, poll in self.polls.items():
+            index = {}
+            for option_id, option in poll['options'].items():
+                for voter_key in option.pop('voters', []):
+                    index[voter_key] = option_id
+            self.voter_index[poll_id] = index
+        
+        self._replay_wal()
+        
+        # Riattiva i sondaggi attivi
+        now = datetime.now().timestamp()
+        for poll_id, poll in self.polls.items():
+            if poll['status'] == 'active' and poll['end_time'] > now:
+                self.active_polls[poll_id] = poll
+    
+    def _replay_wal(self):
+        """
+        Riapplica i voti del write-ahead log sopra lo snapshot caricato
+        
+        L'applicazione di un voto è idempotente rispetto allo stato finale, quindi
+        un log sopravvissuto a una compattazione interrotta non altera i conteggi.
+        """
+        if not os.path.exists(POLLS_WAL_FILE):
+            return
+        
+        replayed = 0
+        try:
+            with open(POLLS_WAL_FILE, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Riga troncata da un'interruzione durante la scrittura
+                        continue
+                    poll = self.polls.get(entry.get('poll_id'))
+                    if poll and entry.get('option_id') in poll['options']:
+                        self._apply_vote(poll, entry['voter_key'], entry['option_id'])
+                        replayed += 1
+        except Exception as e:
+            logger.error(f"Errore nella lettura del log dei voti: {e}")
+        
+        self.wal_entries = replayed
+        if replayed:
+            logger.info(f"Riapplicati {replayed} voti dal log")
     
     def _save_polls(self):
-        """Salva i sondaggi nel file"""
+        """Salva uno snapshot completo dei sondaggi nel file, in modo atomico"""
         try:
-            with open(POLLS_FILE, 'w') as f:
-                json.dump(self.polls, f, indent=2)
+            snapshot = {}
+            for poll_id, poll in self.polls.items():
+                options = {option_id: dict(option, voters=[]) for option_id, option in poll['options'].items()}
+                for voter_key, option_id in self.voter_index.get(poll_id, {}).items():
+                    options[option_id]['voters'].append(voter_key)
+                snapshot[poll_id] = dict(poll, options=options)
+            
+            tmp_file = POLLS_FILE + ".tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(snapshot, f, separators=(',', ':'))
+            os.replace(tmp_file, POLLS_FILE)
             logger.debug("Sondaggi salvati nel file")
+            return True
         except Exception as e:
             logger.error(f"Errore nel salvataggio dei sondaggi: {e}")
+            return False
+    
+    def _append_wal(self, poll_id, voter_key, option_id):
+        """
+        Aggiunge un voto al write-ahead log
+        
+        Args:
+            poll_id: ID del sondaggio
+            voter_key: Chiave piattaforma_votante
+            option_id: ID dell'opzione votata
+        """
+        try:
+            if self.wal_file is None:
+                self.wal_file = open(POLLS_WAL_FILE, 'a')
+            self.wal_file.write(json.dumps({
+                'poll_id': poll_id,
+                'voter_key': voter_key,
+                'option_id': option_id
+            }) + "\n")
+            self.wal_file.flush()
+            self.wal_entries += 1
+        except Exception as e:
+            logger.error(f"Errore nella scrittura del log dei voti: {e}")
+            # Senza log il voto è salvato solo dal prossimo snapshot
+            self._compact()
+    
+    def _compact(self):
+        """Scrive uno snapshot completo e svuota il write-ahead log"""
+        if not self._save_polls():
+            return
+        
+        try:
+            if self.wal_file is not None:
+                self.wal_file.close()
+                self.wal_file = None
+            open(POLLS_WAL_FILE, 'w').close()
+        except Exception as e:
+            logger.error(f"Errore nella compattazione del log dei voti: {e}")
+        
+        self.wal_entries = 0
+        self.last_compaction = time.monotonic()
+    
+    def _apply_vote(self, poll, voter_key, option_id):
+        """
+        Applica un voto ai contatori e all'indice dei votanti in O(1)
+        
+        Args:
+            poll: Il sondaggio
+            voter_key: Chiave piattaforma_votante
+            option_id: ID dell'opzione votata
+        """
+        index = self.voter_index.setdefault(poll['id'], {})
+        previous = index.get(voter_key)
+        if previous == option_id:
+            return
+        
+        if previous is not None and previous in poll['options']:
+            poll['options'][previous]['votes'] -= 1
+        else:
+            poll['total_votes'] += 1
+        
+        poll['options'][option_id]['votes'] += 1
+        index[voter_key] = option_id
+    
+    def _notify(self, poll_id, event):
+        """
+        Invia agli overlay lo stato corrente di un sondaggio
+        
+        Args:
+            poll_id: ID del sondaggio
+            event: Tipo di evento (created, results, closed)
+        """
+        poll = self.polls.get(poll_id)
+        if not poll or not self.broadcaster:
+            return
+        
+        self.broadcaster.publish({'event': event, 'poll_id': poll_id, 'poll': poll})
+    
+    async def close(self):
+        """Ferma il loop di aggiornamento e compatta il log dei voti"""
+        if self.update_task and not self.update_task.done():
+            self.update_task.cancel()
+        
+        self._compact()
     
     async def _update_loop(self):
-        """Loop di aggiornamento dei sondaggi attivi"""
+        """Loop dei sondaggi: invio dei risultati, chiusura e compattazione del log"""
         try:
             while True:
-                to_close = []
-                now = datetime.now().timestamp()
+                await asyncio.sleep(SNAPSHOT_INTERVAL)
                 
-                # Verifica quali sondaggi sono terminati
-                for poll_id, poll in self.active_polls.items():
-                    if poll['end_time'] <= now:
-                        to_close.append(poll_id)
+                # Invia agli overlay solo i sondaggi cambiati, a frequenza fissa
+                changed, self.changed_polls = self.changed_polls, set()
+                for poll_id in changed:
+                    self._notify(poll_id, 'results')
                 
                 # Chiudi i sondaggi terminati
+                now = datetime.now().timestamp()
+                to_close = [poll_id for poll_id, poll in self.active_polls.items() if poll['end_time'] <= now]
                 for poll_id in to_close:
                     await self.close_poll(poll_id)
                 
-                # Attendi 5 secondi prima del prossimo controllo
-                await asyncio.sleep(5)
+                # Compatta il log se è cresciuto troppo o è passato l'intervallo
+                if self.wal_entries and (
+                    self.wal_entries >= WAL_COMPACT_THRESHOLD or
+                    time.monotonic() - self.last_compaction >= WAL_COMPACT_INTERVAL
+                ):
+                    self._compact()
         except asyncio.CancelledError:
             logger.info("Task di aggiornamento dei sondaggi interrotto")
         except Exception as e:
@@ -129,8 +294,7 @@ class PollManager:
             for i, option in enumerate(data['options']):
                 options[str(i)] = {
                     'text': option,
-                    'votes': 0,
-                    'voters': []
+                    'votes': 0
                 }
             
             # Crea il sondaggio
@@ -152,9 +316,11 @@ class PollManager:
             # Registra il sondaggio
             self.polls[poll_id] = poll
             self.active_polls[poll_id] = poll
+            self.voter_index[poll_id] = {}
             
             # Salva i sondaggi
-            self._save_polls()
+            self._compact()
+            self._notify(poll_id, 'created')
             
             # Pubblica il sondaggio sulle piattaforme selezionate
             await self._publish_poll(poll)
@@ -206,26 +372,16 @@ class PollManager:
             # Crea un ID univoco per il votante + piattaforma
             voter_key = f"{platform}_{voter_id}"
             
-            # Verifica se l'utente ha già votato
-            has_voted = False
-            for option in poll['options'].values():
-                if voter_key in option['voters']:
-                    has_voted = True
-                    # Se non sono permessi voti multipli, rifiuta il voto
-                    if not poll['allow_multiple_votes']:
-                        return {'success': False, 'error': 'Hai già votato per questo sondaggio'}
-                    # Altrimenti rimuovi il voto precedente
-                    option['voters'].remove(voter_key)
-                    option['votes'] -= 1
-                    poll['total_votes'] -= 1
-            
-            # Registra il voto
-            poll['options'][option_id]['voters'].append(voter_key)
-            poll['options'][option_id]['votes'] += 1
-            poll['total_votes'] += 1
+            # Verifica se l'utente ha già votato tramite l'indice dei votanti
+            previous = self.voter_index.get(poll_id, {}).get(voter_key)
+            if previous is not None and not poll['allow_multiple_votes']:
+                return {'success': False, 'error': 'Hai già votato per questo sondaggio'}
             
-            # Salva i sondaggi
-            self._save_polls()
+            # Registra il voto e lo accoda al log; lo snapshot viene scritto in compattazione
+            if previous != option_id:
+                self._apply_vote(poll, voter_key, option_id)
+                self._append_wal(poll_id, voter_key, option_id)
+                self.changed_polls.add(poll_id)
             
             return {'success': True, 'poll': poll}
         except Exception as e:
@@ -261,7 +417,9 @@ class PollManager:
                 del self.active_polls[poll_id]
             
             # Salva i sondaggi
-            self._save_polls()
+            self._compact()
+            self.changed_polls.discard(poll_id)
+            self._notify(poll_id, 'closed')
             
             # Pubblica i risultati del sondaggio
             await self._publish_results(poll)
@@ -407,6 +565,12 @@ def setup(app):
     # Registra il blueprint
     app.register_blueprint(polls_blueprint, url_prefix='/polls')
     
+    # Compatta il log dei voti alla chiusura del server
+    if hasattr(app, 'after_serving'):
+        @app.after_serving
+        async def shutdown_polls():
+            await app.poll_manager.close()
+    
     # Definisci le route
     @polls_blueprint.route('/', methods=['GET'])
     async def polls_page():
@@ -424,6 +588,31 @@ def setup(app):
         """API per ottenere i sondaggi attivi"""
         return jsonify(list(app.poll_manager.active_polls.values()))
     
+    @polls_blueprint.route('/api/polls/stream', methods=['GET'])
+    async def stream_polls():
+        """Canale push (Server-Sent Events) dei risultati in tempo reale per gli overlay"""
+        poll_id = request.args.get('poll_id')
+        manager = app.poll_manager
+        
+        async def event_stream():
+            queue = manager.broadcaster.subscribe()
+            try:
+                # Invia subito lo stato corrente
+                polls = [manager.polls[poll_id]] if poll_id in manager.polls else (
+                    [] if poll_id else list(manager.active_polls.values()))
+                for poll in polls:
+                    yield f"data: {json.dumps({'event': 'snapshot', 'poll_id': poll['id'], 'poll': poll})}\n\n"
+                
+                while True:
+                    message = await queue.get()
+                    if poll_id and message['poll_id'] != poll_id:
+                        continue
+                    yield f"data: {json.dumps(message)}\n\n"
+            finally:
+                manager.broadcaster.unsubscribe(queue)
+        
+        return current_app.response_class(event_stream(), mimetype='text/event-stream')
+    
     @polls_blueprint.route('/api/polls/<poll_id>', methods=['GET'])
     async def get_poll(poll_id):
         """API per ottenere un sondaggio specifico"""
@@ -11,6 +11,8 @@ import time
 from datetime import datetime, timedelta
 from flask import Blueprint, jsonify, request, render_template, current_app
 
+from bot.event_bus import Broadcaster
+
 # Logger
 logger = logging.getLogger(__name__)
 
@@ -18,6 +20,12 @@ logger = logging.getLogger(__name__)
 TIMERS_DIR = "data/timers"
 TIMERS_FILE = os.path.join(TIMERS_DIR, "timers.json")
 
+# Ritardo con cui vengono accorpati i salvataggi su file (secondi)
+SAVE_DEBOUNCE_SECONDS = 2.0
+
+# Dimensione massima della coda di ogni client dell'overlay
+OVERLAY_QUEUE_SIZE = 100
+
 # Blueprint
 timers_blueprint = Blueprint('timers', __name__)
 
@@ -35,6 +43,14 @@ class TimerManager:
         self.timers = {}
         self.active_timers = {}
         self.update_task = None
+        self.save_task = None
+        self.dirty = False
+        
+        # Completamenti pianificati dei countdown: timer_id -> TimerHandle
+        self.completion_handles = {}
+        
+        # Client connessi al canale push dell'overlay OBS
+        self.broadcaster = Broadcaster(OVERLAY_QUEUE_SIZE)
         
         # Crea le directory necessarie
         os.makedirs(TIMERS_DIR, exist_ok=True)
@@ -42,10 +58,10 @@ class TimerManager:
         # Carica i timer salvati
         self._load_timers()
         
-        # Avvia il task di aggiornamento dei timer
+        # Pianifica il completamento dei timer ripristinati
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
-        self.update_task = asyncio.create_task(self._update_loop())
+        self.update_task = asyncio.create_task(self._restore_active_timers())
         
         logger.info("Gestore dei timer inizializzato")
     
@@ -77,37 +93,133 @@ class TimerManager:
         except Exception as e:
             logger.error(f"Errore nel salvataggio dei timer: {e}")
     
-    async def _update_loop(self):
-        """Loop di aggiornamento dei timer attivi"""
-        try:
-            while True:
-                to_complete = []
-                now = datetime.now().timestamp()
-                
-                # Verifica quali timer sono terminati
-                for timer_id, timer in self.active_timers.items():
-                    if timer.get('timer_type') == 'countdown' and timer.get('end_time', 0) <= now:
-                        to_complete.append(timer_id)
-                    
-                    # Aggiorna il tempo trascorso per i cronometri
-                    if timer.get('timer_type') == 'stopwatch' and timer.get('status') == 'active':
-                        elapsed = now - timer.get('start_time', now)
-                        timer['elapsed_time'] = elapsed
-                        self.timers[timer_id] = timer
-                
-                # Completa i timer terminati
-                for timer_id in to_complete:
-                    await self.complete_timer(timer_id)
-                
-                # Salva lo stato dei timer
-                self._save_timers()
-                
-                # Attendi 0.5 secondi prima del prossimo controllo
-                await asyncio.sleep(0.5)
-        except asyncio.CancelledError:
-            logger.info("Task di aggiornamento dei timer interrotto")
-        except Exception as e:
-            logger.error(f"Errore nel loop di aggiornamento dei timer: {e}")
+    def _mark_dirty(self):
+        """Segna i timer come modificati e pianifica un salvataggio accorpato"""
+        self.dirty = True
+        
+        if self.save_task is None or self.save_task.done():
+            try:
+                self.save_task = asyncio.get_running_loop().create_task(self._debounced_save())
+            except RuntimeError:
+                # Nessun loop attivo: salva subito
+                self._flush()
+    
+    async def _debounced_save(self):
+        """Attende il periodo di accorpamento e salva i timer se modificati"""
+        await asyncio.sleep(SAVE_DEBOUNCE_SECONDS)
+        self._flush()
+    
+    def _flush(self):
+        """Salva i timer solo se ci sono modifiche pendenti"""
+        if self.dirty:
+            self.dirty = False
+            self._save_timers()
+    
+    async def close(self):
+        """Annulla i completamenti pianificati e salva le modifiche pendenti"""
+        for handle in self.completion_handles.values():
+            handle.cancel()
+        self.completion_handles.clear()
+        
+        for task in (self.update_task, self.save_task):
+            if task and not task.done():
+                task.cancel()
+        
+        self._flush()
+    
+    async def _restore_active_timers(self):
+        """Pianifica il completamento dei countdown attivi caricati dal file"""
+        for timer_id, timer in self.active_timers.items():
+            if timer.get('timer_type') == 'countdown':
+                self._schedule_completion(timer_id)
+    
+    def _schedule_completion(self, timer_id):
+        """
+        Pianifica il completamento di un countdown alla sua scadenza
+        
+        Args:
+            timer_id: ID del timer
+        """
+        self._cancel_completion(timer_id)
+        
+        timer = self.timers.get(timer_id)
+        if not timer or timer.get('timer_type') != 'countdown' or timer.get('status') != 'active':
+            return
+        
+        loop = asyncio.get_running_loop()
+        delay = max(0.0, timer.get('end_time', 0) - datetime.now().timestamp())
+        self.completion_handles[timer_id] = loop.call_at(
+            loop.time() + delay, self._on_countdown_expired, timer_id
+        )
+    
+    def _cancel_completion(self, timer_id):
+        """
+        Annulla il completamento pianificato di un countdown
+        
+        Args:
+            timer_id: ID del timer
+        """
+        handle = self.completion_handles.pop(timer_id, None)
+        if handle:
+            handle.cancel()
+    
+    def _on_countdown_expired(self, timer_id):
+        """
+        Callback del loop eseguita alla scadenza di un countdown
+        
+        Args:
+            timer_id: ID del timer
+        """
+        self.completion_handles.pop(timer_id, None)
+        asyncio.create_task(self.complete_timer(timer_id))
+    
+    def get_timer_state(self, timer):
+        """
+        Restituisce una copia del timer con i valori in tempo reale
+        
+        Il tempo trascorso dei cronometri e il tempo rimanente dei countdown
+        vengono calcolati alla lettura invece di essere aggiornati periodicamente.
+        
+        Args:
+            timer: Il timer
+            
+        Returns:
+            dict: Stato corrente del timer
+        """
+        state = dict(timer)
+        
+        if timer.get('status') == 'active':
+            now = datetime.now().timestamp()
+            
+            if timer.get('timer_type') == 'countdown':
+                remaining = timer.get('end_time', now) - now
+                state['remaining_time'] = max(0, remaining)
+                progress = (1 - (remaining / (timer.get('duration') or 1))) * 100
+                state['progress_percent'] = min(100, max(0, progress))
+            elif timer.get('timer_type') == 'stopwatch':
+                state['elapsed_time'] = now - timer.get('start_time', now)
+        
+        return state
+    
+    def _state_changed(self, timer_id, event):
+        """
+        Registra un cambio di stato: pianifica il salvataggio e notifica gli overlay
+        
+        Args:
+            timer_id: ID del timer
+            event: Tipo di cambiamento (created, started, paused, ...)
+        """
+        self._mark_dirty()
+        
+        if not self.broadcaster:
+            return
+        
+        timer = self.timers.get(timer_id)
+        self.broadcaster.publish({
+            'event': event,
+            'timer_id': timer_id,
+            'timer': self.get_timer_state(timer) if timer else None
+        })
     
     async def create_timer(self, data):
         """
@@ -175,7 +287,7 @@ class TimerManager:
             self.timers[timer_id] = timer
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'created')
             
             return {'success': True, 'timer': timer}
         except Exception as e:
@@ -224,9 +336,10 @@ class TimerManager:
             
             # Registra il timer come attivo
             self.active_timers[timer_id] = timer
+            self._schedule_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'started')
             
             # Esegui le azioni di avvio
             await self._execute_actions(timer, 'on_start')
@@ -274,9 +387,10 @@ class TimerManager:
             # Rimuovi il timer dai timer attivi
             if timer_id in self.active_timers:
                 del self.active_timers[timer_id]
+            self._cancel_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'paused')
             
             return {'success': True, 'timer': timer}
         except Exception as e:
@@ -316,9 +430,10 @@ class TimerManager:
             
             # Registra il timer come attivo
             self.active_timers[timer_id] = timer
+            self._schedule_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'resumed')
             
             return {'success': True, 'timer': timer}
         except Exception as e:
@@ -356,9 +471,10 @@ class TimerManager:
             # Rimuovi il timer dai timer attivi
             if timer_id in self.active_timers:
                 del self.active_timers[timer_id]
+            self._cancel_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'reset')
             
             return {'success': True, 'timer': timer}
         except Exception as e:
@@ -388,9 +504,10 @@ class TimerManager:
             # Rimuovi il timer dai timer attivi
             if timer_id in self.active_timers:
                 del self.active_timers[timer_id]
+            self._cancel_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'completed')
             
             # Esegui le azioni di completamento
             await self._execute_actions(timer, 'on_complete')
@@ -446,7 +563,7 @@ class TimerManager:
             timer['lap_times'].append(lap)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'lap')
             
             return {'success': True, 'timer': timer, 'lap': lap}
         except Exception as e:
@@ -474,9 +591,10 @@ class TimerManager:
             # Rimuovi il timer dai timer attivi
             if timer_id in self.active_timers:
                 del self.active_timers[timer_id]
+            self._cancel_completion(timer_id)
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'deleted')
             
             return {'success': True}
         except Exception as e:
@@ -521,7 +639,7 @@ class TimerManager:
                     timer['duration'] = data['duration']
             
             # Salva i timer
-            self._save_timers()
+            self._state_changed(timer_id, 'updated')
             
             return {'success': True, 'timer': timer}
         except Exception as e:
@@ -603,6 +721,12 @@ def setup(app):
     # Registra il blueprint
     app.register_blueprint(timers_blueprint, url_prefix='/timers')
     
+    # Salva le modifiche pendenti alla chiusura del server
+    if hasattr(app, 'after_serving'):
+        @app.after_serving
+        async def shutdown_timers():
+            await app.timer_manager.close()
+    
     # Definisci le route
     @timers_blueprint.route('/', methods=['GET'])
     async def timers_page():
@@ -639,31 +763,47 @@ def setup(app):
     @timers_blueprint.route('/api/timers', methods=['GET'])
     async def get_timers():
         """API per ottenere tutti i timer"""
-        return jsonify(list(app.timer_manager.timers.values()))
+        manager = app.timer_manager
+        return jsonify([manager.get_timer_state(timer) for timer in manager.timers.values()])
     
     @timers_blueprint.route('/api/timers/active', methods=['GET'])
     async def get_active_timers():
         """API per ottenere i timer attivi"""
-        return jsonify(list(app.timer_manager.active_timers.values()))
+        manager = app.timer_manager
+        return jsonify([manager.get_timer_state(timer) for timer in manager.active_timers.values()])
+    
+    @timers_blueprint.route('/api/timers/stream', methods=['GET'])
+    async def stream_timers():
+        """Canale push (Server-Sent Events) dei cambi di stato per gli overlay OBS"""
+        timer_id = request.args.get('timer_id')
+        manager = app.timer_manager
+        
+        async def event_stream():
+            queue = manager.broadcaster.subscribe()
+            try:
+                # Invia subito lo stato corrente
+                timers = [manager.timers[timer_id]] if timer_id in manager.timers else (
+                    [] if timer_id else list(manager.timers.values()))
+                for timer in timers:
+                    yield f"data: {json.dumps({'event': 'snapshot', 'timer_id': timer['id'], 'timer': manager.get_timer_state(timer)})}\n\n"
+                
+                while True:
+                    message = await queue.get()
+                    if timer_id and message['timer_id'] != timer_id:
+                        continue
+                    yield f"data: {json.dumps(message)}\n\n"
+            finally:
+                manager.broadcaster.unsubscribe(queue)
+        
+        return current_app.response_class(event_stream(), mimetype='text/event-stream')
     
     @timers_blueprint.route('/api/timers/<timer_id>', methods=['GET'])
     async def get_timer(timer_id):
         """API per ottenere un timer specifico"""
         timer = await app.timer_manager.get_timer(timer_id)
         if timer:
-            # Aggiorna le informazioni in tempo reale
-            if timer.get('status') == 'active':
-                now = datetime.now().timestamp()
-                
-                if timer.get('timer_type') == 'countdown':
-                    remaining = timer.get('end_time', now) - now
-                    timer['remaining_time'] = max(0, remaining)
-                    timer['progress_percent'] = (1 - (remaining / timer.get('duration', 1))) * 100
-                    timer['progress_percent'] = min(100, max(0, timer['progress_percent']))
-                elif timer.get('timer_type') == 'stopwatch':
-                    timer['elapsed_time'] = now - timer.get('start_time', now)
-            
-            return jsonify(timer)
+            # Calcola le informazioni in tempo reale senza modificare il timer
+            return jsonify(app.timer_manager.get_timer_state(timer))
         else:
             return jsonify({'error': 'Timer non trovato'}), 404
     
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark del costo per tick di AnomalyDetector.
+
+Ogni tick porta un valore per ciascuna metrica. Confronta l'implementazione
+precedente (una deque per metrica convertita in array NumPy a ogni campione)
+con MetricMatrix usata campione per campione (add_metric_value) e con la
+valutazione vettoriale di tutte le metriche del tick (process_tick).
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+from collections import deque
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stability.self_healing.anomaly_detection import AnomalyDetector
+
+
+class LegacyMetricSeries:
+    """Riproduzione della serie precedente, usata come riferimento."""
+
+    def __init__(self, capacity: int):
+        self.values = deque(maxlen=capacity)
+        self.timestamps = deque(maxlen=capacity)
+        self.mean = 0.0
+        self.std_dev = 0.0
+
+    def is_anomaly(self, value: float, z_threshold: float = 3.0) -> bool:
+        if len(self.values) < 10:
+            return False
+        return abs(value - self.mean) / max(self.std_dev, 0.0001) > z_threshold
+
+    def add_value(self, value: float, timestamp: float):
+        self.values.append(value)
+        self.timestamps.append(timestamp)
+        if len(self.values) > 1:
+            values_array = np.array(self.values)
+            self.mean = np.mean(values_array)
+            self.std_dev = np.std(values_array)
+
+
+def _per_tick(seconds: float, ticks: int) -> float:
+    return seconds / ticks * 1e6
+
+
+def run(metrics: int, ticks: int, capacity: int) -> None:
+    """
+    Esegue il benchmark e stampa i risultati.
+
+    Args:
+        metrics: Numero di metriche per tick
+        ticks: Numero di tick da elaborare
+        capacity: Dimensione della finestra di ciascuna metrica
+    """
+    names = [f"metric_{i}" for i in range(metrics)]
+    data = np.random.default_rng(42).normal(50.0, 10.0, (ticks, metrics))
+    samples = [dict(zip(names, row)) for row in data.tolist()]
+    timestamps = (np.arange(ticks, dtype=np.float64) * 60.0).tolist()
+
+    legacy = {name: LegacyMetricSeries(capacity) for name in names}
+    legacy_anomalies = 0
+    start = time.perf_counter()
+    for sample, timestamp in zip(samples, timestamps):
+        for name, value in sample.items():
+            series = legacy[name]
+            legacy_anomalies += series.is_anomaly(value)
+            series.add_value(value, timestamp)
+    legacy_time = time.perf_counter() - start
+
+    scalar = AnomalyDetector(history_size=capacity)
+    start = time.perf_counter()
+    for sample, timestamp in zip(samples, timestamps):
+        for name, value in sample.items():
+            scalar.add_metric_value(name, value, timestamp)
+    scalar_time = time.perf_counter() - start
+
+    vector = AnomalyDetector(history_size=capacity)
+    groups = 0
+    start = time.perf_counter()
+    for sample, timestamp in zip(samples, timestamps):
+        groups += len(vector.process_tick(sample, timestamp))
+    vector_time = time.perf_counter() - start
+
+    mean_error = max(abs(legacy[name].mean - vector.metrics[name].mean) for name in names)
+    std_error = max(abs(legacy[name].std_dev - vector.metrics[name].std_dev) for name in names)
+
+    print(f"{ticks} tick da {metrics} metriche, finestra di {capacity}\n")
+    print(f"{'implementazione':<34}{'µs/tick':>12}")
+    print(f"{'precedente (deque + np.array)':<34}{_per_tick(legacy_time, ticks):>12.1f}")
+    print(f"{'add_metric_value (per metrica)':<34}{_per_tick(scalar_time, ticks):>12.1f}")
+    print(f"{'process_tick (MetricMatrix)':<34}{_per_tick(vector_time, ticks):>12.1f}")
+    print(f"\nAnomalie: precedente {legacy_anomalies}, add_metric_value {len(scalar.anomalies)}, "
+          f"process_tick {groups} gruppi")
+    print(f"Differenza massima delle medie: {mean_error:.2e}, delle deviazioni standard: {std_error:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del rilevamento anomalie per tick")
+    parser.add_argument("-m", "--metrics", type=int, default=50, help="Metriche per tick")
+    parser.add_argument("-n", "--ticks", type=int, default=2000, help="Numero di tick")
+    parser.add_argument("-c", "--capacity", type=int, default=1000, help="Dimensione della finestra")
+    args = parser.parse_args()
+
+    # Le anomalie dei dati casuali non devono finire nell'output del benchmark
+    logging.getLogger('m4bot.stability.anomaly_detection').setLevel(logging.ERROR)
+    run(args.metrics, args.ticks, args.capacity)
+
+
+if __name__ == "__main__":
+    main()
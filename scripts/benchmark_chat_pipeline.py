@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark end-to-end della pipeline della chat di M4Bot.
+
+Un server Pusher finto riproduce messaggi di chat (sintetici o registrati) a
+frequenza configurabile e un'API REST di Kick finta risponde a messaggi, timeout
+e ban; entrambi girano in un thread con un loop proprio, così il loop del bot
+misura solo il lavoro del bot. I frame attraversano il percorso reale:
+KickWebSocketClient -> bus degli eventi -> moderazione, punti canale, comandi e
+log su database.
+
+Il database è un sostituto in memoria con latenza simulata per round-trip,
+oppure un PostgreSQL usa e getta indicato con --dsn (le tabelle vengono create
+e popolate con il canale e gli utenti del benchmark).
+
+Risultati: messaggi/sec, latenza p50/p99 dall'invio del frame al termine dei
+consumatori, round-trip al database per messaggio, chiamate all'API e RSS.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import datetime
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Iterator
+
+import psutil
+import websockets
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Chiave di cifratura dei token del canale di prova (evita la chiave temporanea e i suoi avvisi)
+if not os.environ.get("ENCRYPTION_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["ENCRYPTION_KEY"] = Fernet.generate_key().decode()
+
+from bot import json_codec
+from bot.m4bot import M4Bot, KickApi, CommandHandler, PointSystem
+from bot.event_bus import ChatEventBus
+from bot.kick_channel_points import KickChannelPoints
+from bot.websocket_client import KickWebSocketClient, OVERFLOW_DROP_OLDEST, OVERFLOW_SAMPLE, OVERFLOW_BLOCK
+
+# Canale e utenti del benchmark
+CHANNEL_ID = 90001
+CHANNEL_NAME = "m4bot-benchmark"
+FIRST_USER_ID = 900000
+CHAT_EVENT = KickWebSocketClient.CHAT_EVENT
+
+# Comandi personalizzati caricati nel canale
+CUSTOM_COMMANDS = {
+    "social": "Seguimi sui social, {user}!",
+    "discord": "Entra nel server Discord: https://discord.gg/m4bot",
+}
+
+# Contenuti dei messaggi sintetici
+PHRASES = [
+    "ciao a tutti!",
+    "che giocata incredibile [emote:37226:KEKW]",
+    "quando inizia la prossima partita?",
+    "gg",
+    "questo stream è fantastico, saluti da Milano",
+    "LUL LUL LUL",
+]
+COMMANDS = ["!punti", "!top", "!premi", "!social", "!discord", "!comando_inesistente"]
+BANNED_WORDS = {"spamlink", "insulto"}
+
+logger = logging.getLogger('benchmark')
+
+
+def synthetic_messages(count: int, users: int, command_ratio: float, moderation_ratio: float,
+                       seed: int) -> Iterator[Dict[str, Any]]:
+    """
+    Genera payload sintetici di ChatMessageSentEvent.
+
+    Args:
+        count: Numero di messaggi
+        users: Numero di utenti distinti
+        command_ratio: Frazione di messaggi che sono comandi
+        moderation_ratio: Frazione di messaggi con parole bandite
+        seed: Seme del generatore casuale
+    """
+    rng = random.Random(seed)
+    banned = sorted(BANNED_WORDS)
+    for n in range(count):
+        user_id = FIRST_USER_ID + rng.randrange(users)
+        r = rng.random()
+        if r < moderation_ratio:
+            content = f"visita {rng.choice(banned)} per follower gratis"
+        elif r < moderation_ratio + command_ratio:
+            content = rng.choice(COMMANDS)
+        else:
+            content = rng.choice(PHRASES)
+
+        yield {
+            "id": f"bench-{n}",
+            "chatroom_id": CHANNEL_ID,
+            "content": content,
+            "type": "message",
+            "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "sender": {
+                "id": user_id,
+                "username": f"utente_{user_id}",
+                "slug": f"utente-{user_id}",
+                "is_subscriber": rng.random() < 0.2,
+                "is_moderator": False,
+                "follower_badges": [],
+                "identity": {"color": "#FF9D00", "badges": []},
+            },
+        }
+
+
+def load_recorded(path: str) -> List[Dict[str, Any]]:
+    """
+    Carica una chat registrata in formato JSONL.
+
+    Ogni riga può essere un frame Pusher completo (vengono tenuti solo i
+    ChatMessageSentEvent) oppure direttamente il payload del messaggio.
+
+    Args:
+        path: File JSONL
+
+    Returns:
+        Lista dei payload dei messaggi
+    """
+    payloads = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            data = json.loads(line)
+            if "event" in data:
+                if data["event"] != CHAT_EVENT:
+                    continue
+                data = data.get("data", {})
+                if isinstance(data, str):
+                    data = json.loads(data)
+            payloads.append(data)
+    return payloads
+
+
+def recorded_messages(payloads: List[Dict[str, Any]], count: int) -> Iterator[Dict[str, Any]]:
+    """Ripete ciclicamente i messaggi registrati, con ID univoci per la misura della latenza."""
+    for n in range(count):
+        payload = dict(payloads[n % len(payloads)])
+        payload["id"] = f"bench-{n}"
+        yield payload
+
+
+class FakeKickServer:
+    """Server Pusher e API REST di Kick finti, eseguiti in un thread con un loop proprio."""
+
+    def __init__(self, messages: Iterator[Dict[str, Any]], rate: float, api_latency: float = 0.0,
+                 host: str = "127.0.0.1"):
+        """
+        Args:
+            messages: Payload dei messaggi da riprodurre dopo la sottoscrizione al canale
+            rate: Messaggi al secondo (0 = il più velocemente possibile)
+            api_latency: Latenza simulata dell'API REST in secondi
+            host: Indirizzo di ascolto
+        """
+        self.messages = messages
+        self.rate = rate
+        self.api_latency = api_latency
+        self.host = host
+        self.sent_at: Dict[str, float] = {}  # ID messaggio -> istante di invio (perf_counter)
+        self.sent = 0
+        self.api_calls: Counter = Counter()
+        self.finished = threading.Event()
+        self.ws_url = None
+        self.api_url = None
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._ws_server = None
+        self._api_runner = None
+        self._replay_task = None
+
+    def start(self):
+        """Avvia i server e attende che siano in ascolto."""
+        self._thread = threading.Thread(target=self._run, name="fake-kick", daemon=True)
+        self._thread.start()
+        if not self._ready.wait(10):
+            raise RuntimeError("Avvio dei server finti non riuscito")
+
+    def stop(self):
+        """Ferma i server e il thread."""
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._stop_servers(), self._loop).result(10)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(10)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_until_complete(self._start_servers())
+        self._ready.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    async def _start_servers(self):
+        self._ws_server = await websockets.serve(self._pusher_handler, self.host, 0)
+        self.ws_url = f"ws://{self.host}:{self._ws_server.sockets[0].getsockname()[1]}/app/benchmark"
+
+        app = web.Application()
+        app.router.add_route("*", "/api/v2/{path:.*}", self._api_handler)
+        self._api_runner = web.AppRunner(app, access_log=None)
+        await self._api_runner.setup()
+        site = web.TCPSite(self._api_runner, self.host, 0)
+        await site.start()
+        self.api_url = f"http://{self.host}:{self._api_runner.addresses[0][1]}/api/v2"
+
+    async def _stop_servers(self):
+        if self._replay_task and not self._replay_task.done():
+            self._replay_task.cancel()
+        self._ws_server.close()
+        await self._ws_server.wait_closed()
+        await self._api_runner.cleanup()
+
+    async def _pusher_handler(self, websocket, path=None):
+        """Simula il protocollo Pusher: connessione, ping/pong e sottoscrizioni."""
+        await websocket.send(json_codec.dumps({
+            "event": "pusher:connection_established",
+            "data": json_codec.dumps({"socket_id": "123456.654321", "activity_timeout": 120})
+        }))
+        async for raw in websocket:
+            message = json_codec.loads(raw)
+            event = message.get("event")
+            if event == "pusher:ping":
+                await websocket.send(json_codec.dumps({"event": "pusher:pong", "data": "{}"}))
+            elif event == "pusher:subscribe":
+                channel = message.get("data", {}).get("channel", "")
+                await websocket.send(json_codec.dumps({
+                    "event": "pusher_internal:subscription_succeeded", "channel": channel, "data": "{}"
+                }))
+                if self._replay_task is None:
+                    self._replay_task = asyncio.create_task(self._replay(websocket, channel))
+
+    async def _replay(self, websocket, channel: str):
+        """Invia i messaggi alla frequenza configurata registrando l'istante di invio."""
+        start = time.perf_counter()
+        try:
+            for payload in self.messages:
+                if self.rate > 0:
+                    delay = start + self.sent / self.rate - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                frame = json_codec.dumps({"event": CHAT_EVENT, "channel": channel,
+                                          "data": json_codec.dumps(payload)})
+                self.sent_at[payload["id"]] = time.perf_counter()
+                await websocket.send(frame)
+                self.sent += 1
+        except websockets.exceptions.ConnectionClosed:
+            logger.error("Connessione chiusa dal bot durante la riproduzione")
+        finally:
+            self.finished.set()
+
+    async def _api_handler(self, request: web.Request) -> web.Response:
+        """Risponde a tutte le richieste dell'API di Kick contando le chiamate per tipo."""
+        # channels/<nome>/chat -> channels/*/chat
+        path = re.sub(r'^(channels|users)/[^/]+', r'\1/*', request.match_info["path"])
+        self.api_calls[f"{request.method} {path}"] += 1
+        if self.api_latency > 0:
+            await asyncio.sleep(self.api_latency)
+        if request.method == "GET":
+            return web.json_response({"is_live": False})
+        return web.json_response({"success": True})
+
+
+class _StandInConnection:
+    """Connessione del database in memoria con l'interfaccia di asyncpg usata dal bot."""
+
+    def __init__(self, db: "StandInDatabase"):
+        self.db = db
+
+    async def execute(self, query: str, *args):
+        await self.db.round_trip()
+        self.db.apply(query, args)
+        return "INSERT 0 1"
+
+    async def executemany(self, query: str, args):
+        await self.db.round_trip()
+        for row in args:
+            self.db.apply(query, row)
+
+    async def fetch(self, query: str, *args):
+        await self.db.round_trip()
+        return self.db.answer(query, args, many=True) or []
+
+    async def fetchrow(self, query: str, *args):
+        await self.db.round_trip()
+        return self.db.answer(query, args)
+
+    async def fetchval(self, query: str, *args):
+        await self.db.round_trip()
+        row = self.db.answer(query, args)
+        if isinstance(row, dict):
+            return next(iter(row.values()))
+        return row
+
+    def transaction(self):
+        return _StandInTransaction(self.db)
+
+
+class _StandInTransaction:
+    def __init__(self, db: "StandInDatabase"):
+        self.db = db
+
+    async def __aenter__(self):
+        await self.db.round_trip()  # BEGIN
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.db.round_trip()  # COMMIT / ROLLBACK
+        return False
+
+
+class _StandInAcquire:
+    def __init__(self, db: "StandInDatabase"):
+        self.db = db
+
+    async def __aenter__(self):
+        return _StandInConnection(self.db)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+
+class StandInDatabase:
+    """
+    Sostituto in memoria del pool asyncpg per il benchmark.
+
+    Risponde alle query del percorso della chat (canale, token, comandi, punti)
+    e simula la latenza di rete di ogni round-trip.
+    """
+
+    def __init__(self, access_token: str, latency: float = 0.0):
+        """
+        Args:
+            access_token: Token cifrato restituito per il canale del benchmark
+            latency: Latenza simulata di ogni round-trip in secondi
+        """
+        self.access_token = access_token
+        self.latency = latency
+        self.points: Dict[int, int] = {}
+
+    def acquire(self):
+        return _StandInAcquire(self)
+
+    async def close(self):
+        pass
+
+    async def round_trip(self):
+        await asyncio.sleep(self.latency)
+
+    def apply(self, query: str, args: tuple):
+        """Applica le scritture che influenzano le letture successive (punti)."""
+        if "INSERT INTO channel_points" not in query:
+            return
+        if "unnest" in query:
+            for user_id, points in zip(args[1], args[2]):
+                self.points[user_id] = self.points.get(user_id, 0) + points
+        elif "watch_time" not in query:
+            self.points[args[1]] = self.points.get(args[1], 0) + args[2]
+
+    def answer(self, query: str, args: tuple, many: bool = False):
+        """Restituisce il risultato delle letture note; None per le altre."""
+        if "FROM channels WHERE name" in query:
+            return {"id": CHANNEL_ID}
+        if "FROM channels" in query:
+            return {
+                "id": CHANNEL_ID,
+                "name": CHANNEL_NAME,
+                "access_token": self.access_token,
+                "refresh_token": self.access_token,
+                "token_expires_at": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+            }
+        if "FROM commands" in query:
+            return [{"id": i, "name": name, "response": response, "cooldown": 0, "user_level": "everyone"}
+                    for i, (name, response) in enumerate(CUSTOM_COMMANDS.items(), 1)]
+        if "FROM channel_points cp" in query:
+            top = sorted(self.points.items(), key=lambda item: item[1], reverse=True)[:args[1]]
+            return [{"user_id": user_id, "username": f"utente_{user_id}", "points": points}
+                    for user_id, points in top]
+        if "FROM channel_points" in query:
+            return self.points.get(args[1], 0)
+        return [] if many else None
+
+
+class _CountingConnection:
+    """Inoltra le chiamate alla connessione reale contando i round-trip."""
+
+    def __init__(self, conn, counts: Counter):
+        self._conn = conn
+        self._counts = counts
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    async def execute(self, *args, **kwargs):
+        self._counts["execute"] += 1
+        return await self._conn.execute(*args, **kwargs)
+
+    async def executemany(self, *args, **kwargs):
+        self._counts["executemany"] += 1
+        return await self._conn.executemany(*args, **kwargs)
+
+    async def fetch(self, *args, **kwargs):
+        self._counts["fetch"] += 1
+        return await self._conn.fetch(*args, **kwargs)
+
+    async def fetchrow(self, *args, **kwargs):
+        self._counts["fetchrow"] += 1
+        return await self._conn.fetchrow(*args, **kwargs)
+
+    async def fetchval(self, *args, **kwargs):
+        self._counts["fetchval"] += 1
+        return await self._conn.fetchval(*args, **kwargs)
+
+    def transaction(self, *args, **kwargs):
+        self._counts["transaction"] += 2  # BEGIN e COMMIT
+        return self._conn.transaction(*args, **kwargs)
+
+
+class _CountingAcquire:
+    def __init__(self, context, counts: Counter):
+        self._context = context
+        self._counts = counts
+
+    async def __aenter__(self):
+        return _CountingConnection(await self._context.__aenter__(), self._counts)
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return await self._context.__aexit__(exc_type, exc, tb)
+
+
+class CountingPool:
+    """Pool (asyncpg o sostituto in memoria) che conta i round-trip per tipo di operazione."""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.counts: Counter = Counter()
+
+    def acquire(self):
+        return _CountingAcquire(self.pool.acquire(), self.counts)
+
+    async def close(self):
+        await self.pool.close()
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values())
+
+
+async def _prepare_postgres(bot: M4Bot, access_token: str, user_ids: List[int]):
+    """Crea canale, utenti e comandi del benchmark in un database PostgreSQL usa e getta."""
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=1)
+    async with bot.db.pool.acquire() as conn:
+        await conn.execute('''
+            INSERT INTO channels (id, kick_channel_id, name, access_token, refresh_token, token_expires_at)
+            VALUES ($1, $2, $3, $4, $4, $5)
+            ON CONFLICT (id) DO UPDATE SET name = $3, access_token = $4, refresh_token = $4, token_expires_at = $5
+        ''', CHANNEL_ID, str(CHANNEL_ID), CHANNEL_NAME, access_token, expires_at)
+        await conn.executemany('''
+            INSERT INTO users (id, kick_id, username) VALUES ($1, $2, $3)
+            ON CONFLICT DO NOTHING
+        ''', [(user_id, str(user_id), f"utente_{user_id}") for user_id in user_ids])
+        await conn.executemany('''
+            INSERT INTO commands (channel_id, name, response, cooldown) VALUES ($1, $2, $3, 0)
+            ON CONFLICT (channel_id, name) DO UPDATE SET response = $3, enabled = TRUE
+        ''', [(CHANNEL_ID, name, response) for name, response in CUSTOM_COMMANDS.items()])
+
+
+async def _setup_bot(args, api_url: str, user_ids: List[int]) -> M4Bot:
+    """Costruisce il bot con i componenti del percorso della chat, senza monitoraggio."""
+    bot = M4Bot()
+    bot.event_bus = ChatEventBus(bot, workers=args.workers, queue_size=args.queue_size)
+
+    bot.api = KickApi(bot.db)
+    bot.api.BASE_URL = api_url
+    await bot.api.create_session()
+    access_token = bot.api.encryption.encrypt("benchmark-token")
+
+    if args.dsn:
+        bot.db.connection_string = args.dsn
+        if not await bot.db.connect():
+            raise RuntimeError("Connessione al database PostgreSQL non riuscita")
+        await _prepare_postgres(bot, access_token, user_ids)
+    else:
+        bot.db.pool = StandInDatabase(access_token, args.db_latency / 1000)
+    bot.db.pool = CountingPool(bot.db.pool)
+
+    bot.command_handler = CommandHandler(bot)
+    bot.point_system = PointSystem(bot)
+    bot.kick_channel_points = KickChannelPoints(bot)
+    if args.dsn:
+        await bot.kick_channel_points.setup_database()
+
+    bot._register_chat_consumers()
+
+    async def moderate(message):
+        # Moderazione per parole bandite con timeout tramite l'API, come il plugin di moderazione
+        if BANNED_WORDS.intersection(message.content.lower().split()):
+            await bot.api.timeout_user(message.channel_id, message.channel_name, str(message.user_id),
+                                       60, "benchmark")
+            return True
+        return False
+
+    bot.event_bus.subscribe("moderation", moderate, priority=10)
+    bot.event_bus.start()
+
+    await bot.connect_to_channel(CHANNEL_ID, CHANNEL_NAME)
+    return bot
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(args) -> Dict[str, Any]:
+    """
+    Esegue il benchmark.
+
+    Args:
+        args: Argomenti della linea di comando
+
+    Returns:
+        Dizionario con i risultati
+    """
+    if args.replay:
+        payloads = load_recorded(args.replay)
+        if not payloads:
+            raise ValueError(f"Nessun messaggio di chat in {args.replay}")
+        messages = recorded_messages(payloads, args.messages)
+        user_ids = sorted({int(p["sender"]["id"]) for p in payloads if p.get("sender", {}).get("id")})
+    else:
+        messages = synthetic_messages(args.messages, args.users, args.command_ratio,
+                                      args.moderation_ratio, args.seed)
+        user_ids = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+
+    server = FakeKickServer(messages, args.rate, args.api_latency / 1000)
+    server.start()
+    bot = await _setup_bot(args, server.api_url, user_ids)
+    pool = bot.db.pool
+    bus = bot.event_bus
+
+    # Latenza dall'invio del frame al termine dei consumatori inline del bus
+    latencies: List[float] = []
+    dispatch = bus.dispatch
+
+    async def timed_dispatch(message):
+        try:
+            return await dispatch(message)
+        finally:
+            sent = server.sent_at.pop(message.message_id, None)
+            if sent is not None:
+                latencies.append(time.perf_counter() - sent)
+
+    bus.dispatch = timed_dispatch
+
+    client = KickWebSocketClient(bot, frame_queue_size=args.queue_size, overflow_policy=args.overflow,
+                                 websocket_url=server.ws_url)
+    if not await client.connect():
+        server.stop()
+        raise RuntimeError("Connessione al server Pusher finto non riuscita")
+
+    async def on_chat(channel: str, data: Dict):
+        await client.handle_chat_message(CHANNEL_NAME, data)
+
+    # Solo il carico del benchmark entra nei conteggi
+    pool.counts.clear()
+    server.api_calls.clear()
+
+    process = psutil.Process()
+    rss_start = process.memory_info().rss
+    rss_peak = rss_start
+    start = time.perf_counter()
+    await client.subscribe_to_channel_chat(CHANNEL_NAME, on_chat)
+
+    # Attende la fine della riproduzione e lo svuotamento delle code
+    processed_before = -1
+    idle_since = time.perf_counter()
+    while True:
+        await asyncio.sleep(0.1)
+        rss_peak = max(rss_peak, process.memory_info().rss)
+        dropped = client.get_metrics()["dropped"] + bus.dropped
+        if server.finished.is_set() and len(latencies) + dropped >= server.sent:
+            break
+        if len(latencies) != processed_before:
+            processed_before = len(latencies)
+            idle_since = time.perf_counter()
+        elif time.perf_counter() - idle_since > args.drain_timeout:
+            logger.warning("Timeout nello svuotamento delle code: risultati parziali")
+            break
+    elapsed = time.perf_counter() - start
+
+    # Il log su database ha una coda propria: i suoi round-trip contano nel totale
+    chat_log = bus.subscribers.get("chat_log")
+    deadline = time.perf_counter() + args.drain_timeout
+    while chat_log and chat_log.queue.qsize() and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    rss_end = process.memory_info().rss
+
+    metrics = client.get_metrics()
+    bus_stats = bus.get_stats()
+    await client.disconnect()
+    await bot.kick_channel_points.stop_points_tracker(CHANNEL_ID)
+    await bus.close()
+    await bot.api.close_session()
+    await pool.close()
+    server.stop()
+
+    latencies.sort()
+    processed = len(latencies)
+    return {
+        "messages_sent": server.sent,
+        "messages_processed": processed,
+        "frames_dropped": metrics["dropped"],
+        "bus_dropped": bus_stats["dropped"],
+        "elapsed_s": elapsed,
+        "messages_per_second": processed / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50) * 1000,
+            "p99": _percentile(latencies, 99) * 1000,
+            "max": latencies[-1] * 1000 if latencies else 0.0,
+        },
+        "db_round_trips": pool.total,
+        "db_round_trips_per_message": pool.total / processed if processed else 0.0,
+        "db_operations": dict(pool.counts),
+        "api_calls": dict(server.api_calls),
+        "rss_mb": {
+            "start": rss_start / 1024 ** 2,
+            "peak": rss_peak / 1024 ** 2,
+            "end": rss_end / 1024 ** 2,
+        },
+        "consumers": {name: {"calls": s["calls"], "avg_ms": s["avg_ms"], "max_ms": s["max_ms"]}
+                      for name, s in bus_stats["subscribers"].items()},
+    }
+
+
+def print_results(results: Dict[str, Any]):
+    """Stampa i risultati in forma tabellare."""
+    latency = results["latency_ms"]
+    rss = results["rss_mb"]
+    print(f"\nMessaggi inviati/elaborati: {results['messages_sent']} / {results['messages_processed']} "
+          f"(scartati: {results['frames_dropped']} frame, {results['bus_dropped']} sul bus)")
+    print(f"Throughput:                 {results['messages_per_second']:.1f} messaggi/sec "
+          f"in {results['elapsed_s']:.2f} s")
+    print(f"Latenza (ms):               p50 {latency['p50']:.2f}  p99 {latency['p99']:.2f}  max {latency['max']:.2f}")
+    print(f"Round-trip database:        {results['db_round_trips']} "
+          f"({results['db_round_trips_per_message']:.2f} per messaggio) {results['db_operations']}")
+    print(f"Chiamate API:               {results['api_calls']}")
+    print(f"RSS (MB):                   inizio {rss['start']:.1f}  picco {rss['peak']:.1f}  fine {rss['end']:.1f}")
+
+    print(f"\n{'consumatore':<16}{'chiamate':>10}{'medio (ms)':>12}{'max (ms)':>10}")
+    for name, stats in sorted(results["consumers"].items()):
+        print(f"{name:<16}{stats['calls']:>10}{stats['avg_ms']:>12.2f}{stats['max_ms']:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark end-to-end della pipeline della chat")
+    parser.add_argument("-n", "--messages", type=int, default=20000, help="Numero di messaggi da inviare")
+    parser.add_argument("--rate", type=float, default=300, help="Messaggi al secondo (0 = massima velocità)")
+    parser.add_argument("--users", type=int, default=500, help="Utenti distinti nei messaggi sintetici")
+    parser.add_argument("--command-ratio", type=float, default=0.05, help="Frazione di comandi")
+    parser.add_argument("--moderation-ratio", type=float, default=0.01, help="Frazione di messaggi da moderare")
+    parser.add_argument("--replay", help="Chat registrata (JSONL di frame Pusher o payload) da riprodurre")
+    parser.add_argument("--dsn", help="PostgreSQL usa e getta al posto del database in memoria")
+    parser.add_argument("--db-latency", type=float, default=0.5,
+                        help="Latenza simulata per round-trip del database in memoria (ms)")
+    parser.add_argument("--api-latency", type=float, default=20, help="Latenza dell'API di Kick finta (ms)")
+    parser.add_argument("--queue-size", type=int, default=1000, help="Dimensione delle code di frame e bus")
+    parser.add_argument("--overflow", choices=[OVERFLOW_DROP_OLDEST, OVERFLOW_SAMPLE, OVERFLOW_BLOCK],
+                        default=OVERFLOW_DROP_OLDEST, help="Politica delle code dei frame piene")
+    parser.add_argument("--workers", type=int, default=4, help="Worker del bus degli eventi")
+    parser.add_argument("--drain-timeout", type=float, default=30, help="Attesa massima senza progressi (s)")
+    parser.add_argument("--seed", type=int, default=42, help="Seme dei messaggi sintetici")
+    parser.add_argument("--json", help="Salva i risultati su file JSON")
+    parser.add_argument("--log-level", default="WARNING", help="Livello di log durante il benchmark")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nRisultati salvati su {args.json}")
+
+
+if __name__ == "__main__":
+    main()
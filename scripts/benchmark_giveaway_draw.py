@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark dell'estrazione dei vincitori dei giveaway.
+
+Esegue _select_winners di GiveawayManager su un flusso di partecipazioni
+generate al volo, come le righe lette dal cursore lato server, e misura
+tempo e memoria di picco dell'estrazione per diversi numeri di partecipanti.
+Ripete poi l'estrazione con lo stesso seme per verificarne la riproducibilità.
+
+Risultati: tempo per estrazione, partecipazioni al secondo, memoria di picco
+e confronto dei vincitori tra due estrazioni con lo stesso seme.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.rewards.giveaway_manager import GiveawayManager
+from features.rewards.models import Entry, Giveaway, GiveawayStatus
+
+
+async def _entry_stream(giveaway_id: str, count: int, weighted: bool, seed: int):
+    """Genera le partecipazioni una alla volta, con il peso del biglietto se richiesto."""
+    rng = random.Random(seed)
+    now = time.time()
+    for index in range(count):
+        entry = Entry(
+            id=index + 1,
+            giveaway_id=giveaway_id,
+            user_id=str(index),
+            username=f"utente_{index}",
+            entry_time=now
+        )
+        yield entry, float(rng.randint(1, 5)) if weighted else 1.0
+
+
+async def _draw(manager: GiveawayManager, giveaway: Giveaway, count: int, weighted: bool, seed: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    winners = await manager._select_winners(giveaway, _entry_stream(giveaway.id, count, weighted, seed), seed=seed)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return winners, elapsed, peak
+
+
+async def run(sizes, winners: int, weighted: bool, seed: int):
+    """
+    Esegue il benchmark e stampa i risultati.
+
+    Args:
+        sizes: Numeri di partecipazioni da provare
+        winners: Numero di vincitori per estrazione
+        weighted: Se True assegna ai biglietti pesi casuali da 1 a 5
+        seed: Seme delle estrazioni
+    """
+    manager = GiveawayManager(db_pool=None, config={})
+
+    now = time.time()
+    giveaway = Giveaway(
+        id="benchmark", channel_id="90001", title="Benchmark", description="",
+        status=GiveawayStatus.ACTIVE, created_by="benchmark", created_at=now, updated_at=now,
+        start_time=now, max_winners=winners
+    )
+
+    print(f"Vincitori per estrazione: {winners}, biglietti {'pesati' if weighted else 'singoli'}")
+    print(f"{'partecipazioni':>15} {'tempo (s)':>10} {'partecipazioni/s':>17} {'picco memoria':>14} {'riproducibile':>14}")
+    for count in sizes:
+        first, elapsed, peak = await _draw(manager, giveaway, count, weighted, seed)
+        second, _, _ = await _draw(manager, giveaway, count, weighted, seed)
+        same = [w.entry_id for w in first] == [w.entry_id for w in second]
+        print(f"{count:>15,} {elapsed:>10.3f} {count / elapsed:>17,.0f} {peak / 1024:>11,.0f} KB {'sì' if same else 'NO':>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dell'estrazione dei vincitori dei giveaway")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000, 200000],
+                        help="Numeri di partecipazioni da provare")
+    parser.add_argument("-k", "--winners", type=int, default=3, help="Vincitori per estrazione")
+    parser.add_argument("--weighted", action="store_true", help="Biglietti con pesi casuali da 1 a 5")
+    parser.add_argument("--seed", type=int, default=1, help="Seme delle estrazioni")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    asyncio.run(run(args.sizes, args.winners, args.weighted, args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark della registrazione delle partecipazioni ai giveaway.
+
+Simula una raffica di !enter concorrenti (con una quota di duplicati) su un
+giveaway attivo di GiveawayManager. Il database è un sostituto in memoria con
+latenza simulata per round-trip, così il risultato riflette il numero di
+round-trip e non la velocità di un PostgreSQL locale.
+
+Risultati: partecipazioni al secondo, latenza p50/p99 di enter_giveaway,
+round-trip al database e righe scritte per round-trip.
+
+Con --points il giveaway richiede un minimo di punti e il benchmark verifica
+che i requisiti siano valutati con la query unica dei profili: la connessione
+finta rifiuta parametri non interi come farebbe asyncpg con int/int[], e lo
+script termina con errore se la validazione è tornata alle query singole.
+"""
+
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from features.rewards.giveaway_manager import GiveawayManager
+from features.rewards.models import Giveaway, GiveawayStatus
+from features.rewards.validators import PROFILE_LOADS, USER_PROFILE_QUERY
+
+
+class _StandInConnection:
+    """Connessione in memoria: ogni operazione costa un round-trip."""
+
+    def __init__(self, database: "StandInDatabase"):
+        self.database = database
+
+    async def execute(self, query: str, *args):
+        await self.database.round_trip(1)
+
+    async def executemany(self, query: str, rows):
+        await self.database.round_trip(len(rows))
+
+    async def fetch(self, query: str, *args):
+        if query != USER_PROFILE_QUERY:
+            raise NotImplementedError("Query non prevista dal benchmark")
+        channel_id, user_ids = args
+        # asyncpg non converte le stringhe nei parametri int e int[]
+        if not isinstance(channel_id, int) or not all(isinstance(user_id, int) for user_id in user_ids):
+            raise TypeError("USER_PROFILE_QUERY richiede ID interi")
+        await self.database.round_trip(0)
+        return [{'user_id': user_id, 'is_follower': True, 'subscriber_tier': None,
+                 'points': user_id % 1000, 'watch_time': 0} for user_id in user_ids]
+
+
+class _StandInAcquire:
+    def __init__(self, database: "StandInDatabase"):
+        self.database = database
+
+    async def __aenter__(self):
+        return _StandInConnection(self.database)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class StandInDatabase:
+    """Pool di connessioni finto con latenza per round-trip."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.round_trips = 0
+        self.rows_written = 0
+
+    async def round_trip(self, rows: int):
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+        self.rows_written += rows
+
+    def acquire(self):
+        return _StandInAcquire(self)
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+
+async def run(entries: int, users: int, concurrency: int, latency: float, flush_interval: float,
+              batch_size: int, seed: int, min_points: int = 0) -> bool:
+    """
+    Esegue il benchmark e stampa i risultati.
+
+    Args:
+        entries: Numero di comandi !enter simulati
+        users: Utenti tra cui vengono estratti i mittenti (le ripetizioni sono duplicati)
+        concurrency: Comandi elaborati in parallelo
+        latency: Latenza simulata di un round-trip al database (secondi)
+        flush_interval: Intervallo di scrittura delle partecipazioni (secondi)
+        batch_size: Dimensione massima del lotto di scrittura
+        seed: Seed del generatore casuale
+        min_points: Punti richiesti per partecipare (0 = nessun requisito)
+
+    Returns:
+        bool: False se i requisiti non sono stati valutati con la query unica
+    """
+    rng = random.Random(seed)
+    database = StandInDatabase(latency)
+    manager = GiveawayManager(db_pool=database, config={
+        'giveaway_entry_flush_interval': flush_interval,
+        'giveaway_entry_batch_size': batch_size
+    })
+
+    now = time.time()
+    giveaway = Giveaway(
+        id="benchmark", channel_id="90001", title="Benchmark", description="",
+        status=GiveawayStatus.ACTIVE, created_by="benchmark", created_at=now, updated_at=now,
+        start_time=now,
+        requirements=[{'type': 'points', 'value': str(min_points)}] if min_points else []
+    )
+    manager.active_giveaways[giveaway.id] = giveaway
+    manager.entrants[giveaway.id] = set()
+
+    commands = [str(rng.randrange(users)) for _ in range(entries)]
+    latencies = []
+    accepted = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def enter(user_id: str):
+        nonlocal accepted
+        async with semaphore:
+            start = time.perf_counter()
+            result = await manager.enter_giveaway(giveaway.id, user_id, f"utente_{user_id}")
+            latencies.append(time.perf_counter() - start)
+            accepted += result["success"]
+
+    manager.running = True
+    flush_task = asyncio.create_task(manager._entry_flush_loop())
+
+    batch_loads = PROFILE_LOADS.labels("batch").get()
+    fallback_loads = PROFILE_LOADS.labels("fallback").get()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(enter(user_id) for user_id in commands))
+    accept_time = time.perf_counter() - start
+
+    # Attende che tutte le partecipazioni siano nel database
+    while manager.pending_entries:
+        await asyncio.sleep(flush_interval / 10)
+    total_time = time.perf_counter() - start
+
+    manager.running = False
+    manager._flush_requested.set()
+    await flush_task
+
+    latencies.sort()
+    print(f"Comandi !enter:            {entries} (su {users} utenti possibili)")
+    print(f"Partecipazioni accettate:  {accepted}")
+    print(f"Tempo di accettazione:     {accept_time:.3f} s ({entries / accept_time:,.0f} comandi/s)")
+    print(f"Tempo fino alla scrittura: {total_time:.3f} s")
+    print(f"Latenza enter p50/p99:     {_percentile(latencies, 50) * 1e6:.0f} / {_percentile(latencies, 99) * 1e6:.0f} µs")
+    print(f"Round-trip al database:    {database.round_trips} ({database.rows_written / max(database.round_trips, 1):.0f} righe ciascuno)")
+
+    if not min_points:
+        return True
+    batch_loads = PROFILE_LOADS.labels("batch").get() - batch_loads
+    fallback_loads = PROFILE_LOADS.labels("fallback").get() - fallback_loads
+    print(f"Profili (query unica/fallback): {batch_loads:.0f} / {fallback_loads:.0f}")
+    return batch_loads > 0 and fallback_loads == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark delle partecipazioni ai giveaway")
+    parser.add_argument("-n", "--entries", type=int, default=60000, help="Comandi !enter simulati")
+    parser.add_argument("--users", type=int, default=50000, help="Utenti tra cui vengono estratti i mittenti")
+    parser.add_argument("--concurrency", type=int, default=1000, help="Comandi elaborati in parallelo")
+    parser.add_argument("--db-latency", type=float, default=1.0, help="Latenza di un round-trip al database (ms)")
+    parser.add_argument("--flush-interval", type=float, default=1.0, help="Intervallo di scrittura (s)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Dimensione massima del lotto")
+    parser.add_argument("--seed", type=int, default=1, help="Seed del generatore casuale")
+    parser.add_argument("--points", type=int, default=0,
+                        help="Punti richiesti per partecipare (verifica la query unica dei profili)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    ok = asyncio.run(run(args.entries, args.users, args.concurrency, args.db_latency / 1000,
+                         args.flush_interval, args.batch_size, args.seed, args.points))
+    if not ok:
+        print("ERRORE: i requisiti non sono stati valutati con la query unica dei profili")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark del percorso di decodifica dei frame Pusher di Kick.
+
+Confronta il modulo json della libreria standard con il codec condiviso
+(bot/json_codec.py) sui frame tipici ricevuti dal WebSocket: messaggi di chat
+(doppia decodifica: frame esterno + payload interno), eventi non sottoscritti
+(solo frame esterno) ed eventi di sistema, oltre alla codifica dei ping.
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot import json_codec
+
+CHAT_EVENT = "App\\Events\\ChatMessageSentEvent"
+
+
+def _frame(event: str, channel: str, data: dict) -> str:
+    """Costruisce un frame Pusher con payload interno serializzato come stringa."""
+    return json.dumps({"event": event, "channel": channel, "data": json.dumps(data)})
+
+
+# Frame campione con la stessa struttura di quelli inviati da Kick
+CHAT_FRAME = _frame(CHAT_EVENT, "chatrooms.668.v2", {
+    "id": "3c5b7b0e-2a0a-4b7e-9d7a-1f6f0b9b6a11",
+    "chatroom_id": 668,
+    "content": "ciao a tutti! [emote:37226:KEKW] !punti",
+    "type": "message",
+    "created_at": "2024-05-12T18:04:11+00:00",
+    "sender": {
+        "id": 1234567,
+        "username": "Spettatore_123",
+        "slug": "spettatore-123",
+        "identity": {
+            "color": "#FF9D00",
+            "badges": [
+                {"type": "subscriber", "text": "Subscriber", "count": 3},
+                {"type": "moderator", "text": "Moderator"},
+            ],
+        },
+    },
+})
+
+UNSUBSCRIBED_FRAME = _frame("App\\Events\\UserBannedEvent", "chatrooms.668.v2", {
+    "id": "b8a2d3f4-0000-4c1e-8f00-5b5d0d6c1e22",
+    "user": {"id": 7654321, "username": "spammer", "slug": "spammer"},
+    "banned_by": {"id": 1234, "username": "M4Bot", "slug": "m4bot"},
+    "permanent": False,
+    "duration": 10,
+    "expires_at": "2024-05-12T18:14:11+00:00",
+})
+
+SYSTEM_FRAME = json.dumps({"event": "pusher:pong", "data": "{}"})
+
+PING_MESSAGE = {"event": "pusher:ping", "data": {}}
+
+
+def _decode_chat(loads, frame: str):
+    message = loads(frame)
+    return loads(message["data"])
+
+
+def _decode_outer(loads, frame: str):
+    return loads(frame)
+
+
+def run(number: int) -> None:
+    """
+    Esegue il benchmark e stampa i risultati.
+
+    Args:
+        number: Numero di iterazioni per ciascun caso
+    """
+    cases = [
+        ("chat (frame + payload)", lambda loads: _decode_chat(loads, CHAT_FRAME)),
+        ("evento non sottoscritto", lambda loads: _decode_outer(loads, UNSUBSCRIBED_FRAME)),
+        ("evento di sistema", lambda loads: _decode_outer(loads, SYSTEM_FRAME)),
+    ]
+
+    print(f"Backend codec: {json_codec.BACKEND} - {number} iterazioni per caso\n")
+    print(f"{'caso':<28}{'json (µs)':>12}{'codec (µs)':>12}{'speedup':>10}")
+
+    for name, case in cases:
+        baseline = timeit.timeit(lambda: case(json.loads), number=number)
+        codec = timeit.timeit(lambda: case(json_codec.loads), number=number)
+        print(f"{name:<28}{baseline / number * 1e6:>12.2f}{codec / number * 1e6:>12.2f}{baseline / codec:>9.1f}x")
+
+    baseline = timeit.timeit(lambda: json.dumps(PING_MESSAGE), number=number)
+    codec = timeit.timeit(lambda: json_codec.dumps(PING_MESSAGE), number=number)
+    print(f"{'codifica ping':<28}{baseline / number * 1e6:>12.2f}{codec / number * 1e6:>12.2f}{baseline / codec:>9.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della decodifica dei frame Pusher")
+    parser.add_argument("-n", "--number", type=int, default=100000, help="Iterazioni per ciascun caso")
+    args = parser.parse_args()
+    run(args.number)
+
+
+if __name__ == "__main__":
+    main()
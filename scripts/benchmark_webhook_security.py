@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Micro-benchmark dei controlli di sicurezza dei webhook in arrivo.
+
+Misura il costo per richiesta di blacklist/whitelist IP, rate limiting e
+controllo anti-replay di WebhookHandler al crescere delle liste di IP/CIDR e
+del numero di IP mittenti distinti: con gli indici precompilati e le finestre
+a scadenza pigra il costo deve restare piatto.
+"""
+
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import ipaddress
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+os.chdir(ROOT_DIR)
+
+# Il modulo configura un file di log in logs/webhooks all'importazione
+os.makedirs("logs/webhooks", exist_ok=True)
+
+from bot.webhook_handler import WebhookHandler
+
+
+def _cidr_list(count: int, rng: random.Random) -> list:
+    """Genera blocchi CIDR /24 casuali (più qualche IP singolo) in 10.0.0.0/8."""
+    entries = []
+    for index in range(count):
+        base = rng.randrange(1 << 24)
+        network = ipaddress.ip_network((int(ipaddress.ip_address("10.0.0.0")) + (base & ~0xFF), 24))
+        entries.append(str(network) if index % 4 else str(network.network_address + 7))
+    return entries
+
+
+def _handler(whitelist: list, blacklist: list) -> WebhookHandler:
+    return WebhookHandler({
+        "webhooks": [],
+        "security": {
+            "ip_whitelist": whitelist,
+            "ip_blacklist": blacklist,
+            # Limite alto: si misura il conteggio, non il ramo di blocco
+            "rate_limit": {"enabled": True, "max_requests": 10 ** 9, "time_window": 60, "block_duration": 300}
+        }
+    })
+
+
+def run_case(list_size: int, distinct_ips: int, requests: int, seed: int) -> float:
+    """
+    Esegue i controlli di sicurezza su un flusso di richieste.
+
+    Args:
+        list_size: Voci di whitelist e blacklist
+        distinct_ips: IP mittenti distinti
+        requests: Richieste simulate
+        seed: Seed del generatore casuale
+
+    Returns:
+        float: Tempo medio per richiesta in microsecondi
+    """
+    rng = random.Random(seed)
+    whitelist = _cidr_list(list_size, rng)
+    handler = _handler(whitelist, _cidr_list(list_size, rng))
+    # Mittenti presi dalla whitelist, così quasi tutte le richieste attraversano ogni controllo
+    networks = [ipaddress.ip_network(entry) for entry in whitelist]
+    ips = [str(network[rng.randrange(network.num_addresses)]) for network in
+           (rng.choice(networks) for _ in range(distinct_ips))]
+    stream = [(rng.choice(ips), {"X-Request-ID": f"req-{index}"}) for index in range(requests)]
+
+    start = time.perf_counter()
+    for ip, headers in stream:
+        if handler._is_ip_blacklisted(ip) or not handler._is_ip_whitelisted(ip):
+            continue
+        if handler._is_rate_limited(ip):
+            continue
+        handler._track_request(ip)
+        handler._is_replay_attack("bench", headers, None)
+    elapsed = time.perf_counter() - start
+
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark dei controlli di sicurezza dei webhook")
+    parser.add_argument("-n", "--requests", type=int, default=100000, help="Richieste per ciascun caso")
+    parser.add_argument("--list-sizes", type=int, nargs="+", default=[10, 1000, 10000],
+                        help="Dimensioni di whitelist e blacklist")
+    parser.add_argument("--ips", type=int, nargs="+", default=[100, 10000, 100000],
+                        help="Numero di IP mittenti distinti")
+    parser.add_argument("--seed", type=int, default=1, help="Seed del generatore casuale")
+    args = parser.parse_args()
+
+    logging.getLogger("WebhookHandler").setLevel(logging.ERROR)
+
+    print(f"{args.requests} richieste per caso\n")
+    print(f"{'voci lista':>12}{'IP distinti':>14}{'µs/richiesta':>16}")
+    for list_size in args.list_sizes:
+        for distinct_ips in args.ips:
+            per_request = run_case(list_size, distinct_ips, args.requests, args.seed)
+            print(f"{list_size:>12}{distinct_ips:>14}{per_request:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
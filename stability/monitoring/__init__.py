@@ -8,12 +8,28 @@ Componenti principali:
 - SystemMonitor: monitora risorse di sistema e performance
 - MetricsCollector: raccoglie e analizza metriche di applicazione
 - ServiceMonitor: verifica la disponibilità di servizi interni ed esterni
+- MetricsRegistry: registro unificato delle metriche esposto in formato Prometheus
+- ProbeScheduler: verifiche dei servizi in parallelo con timeout e intervalli per servizio
+- SamplingProfiler: profiler a campionamento del loop asyncio, attivabile in produzione
+- LoopLagMonitor: latenza del loop asyncio e cattura dello stack delle chiamate bloccanti
 """
 
 from .system_monitor import get_system_monitor, SystemMonitor, MetricType
+from .metrics_registry import get_registry, MetricsRegistry, start_http_server
+from .probe_scheduler import ProbeScheduler, ProbeResult
+from .profiler import SamplingProfiler, get_profiler
+from .loop_lag import LoopLagMonitor
 
 __all__ = [
     'get_system_monitor',
     'SystemMonitor',
-    'MetricType'
+    'MetricType',
+    'get_registry',
+    'MetricsRegistry',
+    'start_http_server',
+    'ProbeScheduler',
+    'ProbeResult',
+    'SamplingProfiler',
+    'get_profiler',
+    'LoopLagMonitor'
 ] 
\ No newline at end of file
@@ -30,6 +30,10 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any, Tuple, Set, Union
 
+from stability.monitoring.timeseries_store import TimeSeriesStore, flatten_metric_values, import_json_exports
+from stability.monitoring.metrics_registry import get_registry, start_http_server
+from stability.monitoring.probe_scheduler import ProbeScheduler, ProbeResult
+
 # Configurazione logging
 logging.basicConfig(
     level=logging.INFO,
@@ -224,8 +228,30 @@ class IntegratedMonitor:
         self.data_dir = Path(self.config.get('data_dir', './monitoring_data'))
         self.data_dir.mkdir(exist_ok=True, parents=True)
         
-        # Stato dei servizi
+        # Archivio dello storico delle metriche
+        self.history = TimeSeriesStore(
+            self.config.get('history_dir') or self.data_dir / 'timeseries',
+            segment_seconds=self.config.get('history_segment_seconds', 3600),
+            raw_retention_hours=self.config.get('history_raw_hours', 48),
+            retention_days=self.config.get('history_days', 7),
+            rollup_seconds=self.config.get('history_rollup_seconds', 300)
+        )
+        
+        # Importa eventuali esportazioni JSON prodotte dalle versioni precedenti
+        import_json_exports(self.history, self.data_dir)
+        
+        # Registro unificato del processo, esposto su /metrics se abilitato
+        self.registry = get_registry()
+        self.metrics_server = None
+        
+        # Stato dei servizi, aggiornato dalle verifiche eseguite in parallelo in background
         self.services_status = {}
+        self.probes = ProbeScheduler(
+            self.config.get('services', {}),
+            default_interval=self.config.get('service_check_interval', 60),
+            default_timeout=self.config.get('service_check_timeout', 5),
+            on_result=self._on_probe_result
+        )
         
         # Stato della configurazione
         self.config_status = {}
@@ -249,6 +275,9 @@ class IntegratedMonitor:
             'enable_export': True,
             'export_interval': 300,
             'history_days': 7,
+            'history_raw_hours': 48,
+            'history_segment_seconds': 3600,
+            'history_rollup_seconds': 300,
             'thresholds': {
                 'cpu_warning': 75,
                 'cpu_critical': 90,
@@ -334,6 +363,7 @@ class IntegratedMonitor:
         )
         
         self.metrics[name] = metric
+        self._mirror_metric(metric)
         logger.debug(f"Metrica registrata: {name}")
         return metric
     
@@ -349,7 +379,35 @@ class IntegratedMonitor:
             logger.warning(f"Tentativo di aggiornare metrica non registrata: {name}")
             return
         
-        self.metrics[name].update(value)
+        metric = self.metrics[name]
+        metric.update(value)
+        self._mirror_metric(metric)
+    
+    def _mirror_metric(self, metric: Metric):
+        """Riporta il valore della metrica nel registro unificato."""
+        try:
+            self.registry.set_value(metric.name, metric.value, metric.type.value,
+                                    metric.description, metric.labels)
+        except ValueError as e:
+            logger.warning(f"Impossibile esporre la metrica {metric.name}: {e}")
+    
+    def _start_metrics_server(self):
+        """Avvia l'endpoint /metrics del registro se abilitato nella configurazione."""
+        if not self.config.get('enable_prometheus', False) or self.metrics_server:
+            return
+        
+        port = self.config.get('prometheus_port', 9090)
+        try:
+            self.metrics_server = start_http_server(port, registry=self.registry)
+        except OSError as e:
+            logger.error(f"Impossibile avviare l'endpoint delle metriche sulla porta {port}: {e}")
+    
+    def _stop_metrics_server(self):
+        """Ferma l'endpoint /metrics."""
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
     
     async def start(self):
         """Avvia il sistema integrato."""
@@ -362,10 +420,12 @@ class IntegratedMonitor:
         
         # Inizializzazione delle metriche di sistema
         self._init_system_metrics()
+        self._start_metrics_server()
         
         # Avvia i task
         self.collection_task = asyncio.create_task(self._collection_loop())
         self.validation_task = asyncio.create_task(self._validation_loop())
+        self.probes.start()
     
     async def stop(self):
         """Ferma il sistema integrato."""
@@ -389,6 +449,11 @@ class IntegratedMonitor:
             
         self.collection_task = None
         self.validation_task = None
+        
+        await self.probes.stop()
+        
+        self._stop_metrics_server()
+        self.history.close()
     
     def _init_system_metrics(self):
         """Inizializza le metriche di sistema predefinite."""
@@ -479,7 +544,6 @@ class IntegratedMonitor:
         
         last_system_collection = 0
         last_app_collection = 0
-        last_service_check = 0
         last_export = 0
         
         while self.running:
@@ -496,11 +560,6 @@ class IntegratedMonitor:
                     await self._collect_app_metrics()
                     last_app_collection = current_time
                 
-                # Controllo servizi
-                if current_time - last_service_check >= self.config.get('service_check_interval', 60):
-                    await self._check_services()
-                    last_service_check = current_time
-                
                 # Esportazione dati
                 if (self.config.get('enable_export', True) and 
                     current_time - last_export >= self.config.get('export_interval', 300)):
@@ -600,101 +659,32 @@ class IntegratedMonitor:
                 logger.error(f"Errore nel caricamento delle metriche dell'app: {e}")
     
     async def _check_services(self):
-        """Verifica lo stato dei servizi."""
-        services = self.config.get('services', {})
-        if not services:
-            return
-            
-        available = 0
-        unavailable = 0
-        
-        for service_name, service_config in services.items():
-            try:
-                service_type = service_config.get('type', 'systemd')
-                
-                if service_type == 'systemd':
-                    # Verifica servizio systemd
-                    result = await self._check_systemd_service(service_config.get('unit', service_name))
-                elif service_type == 'http':
-                    # Verifica endpoint HTTP
-                    result = await self._check_http_service(service_config.get('url'), 
-                                                          service_config.get('expected_status', 200))
-                elif service_type == 'process':
-                    # Verifica processo
-                    result = self._check_process(service_config.get('process_name'))
-                else:
-                    logger.warning(f"Tipo di servizio sconosciuto: {service_type}")
-                    result = False
-                
-                # Aggiorna lo stato del servizio
-                self.services_status[service_name] = {
-                    'available': result,
-                    'last_check': datetime.now().isoformat()
-                }
-                
-                if result:
-                    available += 1
-                else:
-                    unavailable += 1
-                    # Genera un avviso per il servizio non disponibile
-                    logger.warning(f"Servizio non disponibile: {service_name}")
-                    await self._send_alert(f"Servizio {service_name} non disponibile", "warning")
-                
-            except Exception as e:
-                logger.error(f"Errore nella verifica del servizio {service_name}: {e}")
-                self.services_status[service_name] = {
-                    'available': False,
-                    'last_check': datetime.now().isoformat(),
-                    'error': str(e)
-                }
-                unavailable += 1
+        """Verifica subito tutti i servizi in parallelo, senza attendere i loro intervalli."""
+        await self.probes.run_due(force=True)
+    
+    async def _on_probe_result(self, result: ProbeResult):
+        """Aggiorna lo stato del servizio e le metriche con l'esito di una verifica."""
+        status = {
+            'available': result.ok,
+            'last_check': datetime.fromtimestamp(result.timestamp).isoformat(),
+            'latency_ms': round(result.latency_ms, 2)
+        }
+        if result.error:
+            status['error'] = result.error
+        self.services_status[result.name] = status
         
-        # Aggiorna le metriche dei servizi
+        available = sum(1 for s in self.services_status.values() if s['available'])
         self.update_metric("services.available", available)
-        self.update_metric("services.unavailable", unavailable)
+        self.update_metric("services.unavailable", len(self.services_status) - available)
         
-        logger.debug(f"Controllo servizi completato: {available} disponibili, {unavailable} non disponibili")
-    
-    async def _check_systemd_service(self, service_name: str) -> bool:
-        """Verifica lo stato di un servizio systemd."""
-        try:
-            process = await asyncio.create_subprocess_shell(
-                f"systemctl is-active {service_name}",
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            
-            # Se il processo è terminato con successo e l'output è "active"
-            return process.returncode == 0 and stdout.decode().strip() == "active"
-            
-        except Exception as e:
-            logger.error(f"Errore nella verifica del servizio systemd {service_name}: {e}")
-            return False
+        if not result.ok:
+            # Genera un avviso per il servizio non disponibile
+            logger.warning(f"Servizio non disponibile: {result.name} ({result.error})")
+            await self._send_alert(f"Servizio {result.name} non disponibile", "warning")
     
-    async def _check_http_service(self, url: str, expected_status: int = 200) -> bool:
-        """Verifica lo stato di un servizio HTTP."""
-        try:
-            import aiohttp
-            
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, timeout=5) as response:
-                    return response.status == expected_status
-                    
-        except Exception as e:
-            logger.error(f"Errore nella verifica del servizio HTTP {url}: {e}")
-            return False
-    
-    def _check_process(self, process_name: str) -> bool:
-        """Verifica se un processo è in esecuzione."""
-        try:
-            for proc in psutil.process_iter(['name']):
-                if proc.info['name'] == process_name:
-                    return True
-            return False
-        except Exception as e:
-            logger.error(f"Errore nella verifica del processo {process_name}: {e}")
-            return False
+    def get_probe_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Restituisce ultimo esito e statistiche di latenza delle verifiche dei servizi."""
+        return self.probes.get_stats()
     
     async def _validate_configurations(self):
         """Valida tutte le configurazioni nelle directory configurate."""
@@ -940,43 +930,53 @@ class IntegratedMonitor:
             logger.error(f"Errore nell'invio dell'avviso Discord: {e}")
     
     def _export_metrics(self):
-        """Esporta le metriche su file."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        export_file = self.data_dir / f"metrics_{timestamp}.json"
-        
+        """
+        Registra i valori correnti delle metriche nell'archivio dello storico e
+        aggiorna l'istantanea dello stato di servizi e configurazioni.
+        """
         try:
-            data = {
-                "timestamp": time.time(),
-                "system_info": self.system_info,
-                "metrics": {name: metric.to_dict() for name, metric in self.metrics.items()},
-                "services_status": self.services_status,
-                "config_status": self.config_status
-            }
+            timestamp = time.time()
+            points = flatten_metric_values({name: metric.value for name, metric in self.metrics.items()})
+            for service_name, status in self.services_status.items():
+                points[f"services.{service_name}.available"] = 1.0 if status.get('available') else 0.0
+            self.history.append_many(points, timestamp)
             
-            with open(export_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
-            logger.info(f"Metriche esportate in {export_file}")
+            # Sigillatura dei segmenti, rollup e retention
+            self.history.maintain(timestamp)
             
-            # Elimina file vecchi
-            self._cleanup_old_exports()
+            # Lo stato corrente (non una serie temporale) sovrascrive un unico file
+            status_file = self.data_dir / "status.json"
+            tmp_file = status_file.with_suffix(".tmp")
+            with open(tmp_file, 'w') as f:
+                json.dump({
+                    "timestamp": timestamp,
+                    "system_info": self.system_info,
+                    "services_status": self.services_status,
+                    "config_status": self.config_status
+                }, f, indent=2)
+            os.replace(tmp_file, status_file)
+            
+            logger.debug(f"Registrati {len(points)} punti nello storico delle metriche")
             
         except Exception as e:
             logger.error(f"Errore nell'esportazione delle metriche: {e}")
     
-    def _cleanup_old_exports(self):
-        """Elimina i file di esportazione più vecchi del periodo configurato."""
-        try:
-            history_days = self.config.get('history_days', 7)
-            cutoff_time = time.time() - (history_days * 86400)
+    def query_history(self, name: str, start: Optional[float] = None, end: Optional[float] = None,
+                      step: Optional[float] = None, aggregate: str = "avg") -> List[Tuple[float, float]]:
+        """
+        Restituisce lo storico di una metrica in un intervallo di tempo.
+        
+        Args:
+            name: Nome della serie (es. system.cpu.usage_percent)
+            start: Inizio dell'intervallo in secondi (default: un'ora fa)
+            end: Fine dell'intervallo in secondi (default: ora corrente)
+            step: Intervallo di aggregazione opzionale in secondi
+            aggregate: Aggregato da usare: avg, min o max
             
-            for file in self.data_dir.glob("metrics_*.json"):
-                if file.stat().st_mtime < cutoff_time:
-                    file.unlink()
-                    logger.debug(f"File eliminato: {file}")
-                    
-        except Exception as e:
-            logger.error(f"Errore nella pulizia dei file vecchi: {e}")
+        Returns:
+            Lista di tuple (timestamp, valore)
+        """
+        return self.history.query(name, start, end, step, aggregate)
     
     def get_all_metrics(self) -> Dict[str, Dict[str, Any]]:
         """Restituisce tutte le metriche come dizionario."""
@@ -988,6 +988,7 @@ class IntegratedMonitor:
             "timestamp": time.time(),
             "system_info": self.system_info,
             "services": self.services_status,
+            "probes": self.probes.get_stats(),
             "configs": self.config_status,
             "thresholds": self.config.get('thresholds', {})
         }
@@ -1005,35 +1006,8 @@ class IntegratedMonitor:
         return status
     
     def format_prometheus(self) -> str:
-        """Formatta le metriche in formato Prometheus."""
-        output = []
-        
-        for name, metric in self.metrics.items():
-            # Converti nome in formato Prometheus (punti in underscore)
-            prom_name = name.replace('.', '_')
-            
-            # Aggiungi commento con descrizione
-            output.append(f"# HELP {prom_name} {metric.description}")
-            output.append(f"# TYPE {prom_name} {metric.type.value}")
-            
-            # Formatta il valore
-            if isinstance(metric.value, (int, float)):
-                # Formatta le labels
-                labels_str = ""
-                if metric.labels:
-                    labels = []
-                    for k, v in metric.labels.items():
-                        labels.append(f'{k}="{v}"')
-                    labels_str = f'{{{",".join(labels)}}}'
-                
-                output.append(f"{prom_name}{labels_str} {metric.value}")
-            
-            elif isinstance(metric.value, dict) and metric.type in (MetricType.HISTOGRAM, MetricType.SUMMARY):
-                # Per istogrammi e sommari, formato speciale
-                for k, v in metric.value.items():
-                    output.append(f"{prom_name}_{k} {v}")
-        
-        return "\n".join(output)
+        """Formatta le metriche del processo (registro unificato) in formato Prometheus."""
+        return self.registry.render()
 
 # Funzione principale di avvio
 async def main():
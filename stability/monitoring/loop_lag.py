@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+M4Bot - Latenza del Loop Asyncio
+
+Questo modulo misura la latenza del loop asyncio e individua le chiamate che lo
+bloccano, così da distinguere un servizio esterno lento da un processo fermo su
+codice sincrono.
+
+Caratteristiche:
+- Campionatore della latenza: differenza tra risveglio previsto ed effettivo di
+  una coroutine che dorme a intervalli regolari
+- Percentili sulla finestra degli ultimi campioni e istogramma nel registro metriche
+- Thread di guardia che, se il loop resta fermo oltre la soglia, cattura lo stack
+  del codice che lo sta bloccando
+"""
+
+import sys
+import math
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+from stability.monitoring.metrics_registry import get_registry
+from stability.monitoring.profiler import frame_stack
+
+logger = logging.getLogger('m4bot.stability.loop_lag')
+
+# Intervallo tra i risvegli del campionatore (secondi)
+DEFAULT_INTERVAL = 0.1
+
+# Durata oltre la quale il loop è considerato bloccato (secondi)
+DEFAULT_BLOCK_THRESHOLD = 0.1
+
+# Numero di campioni su cui calcolare i percentili (1 minuto all'intervallo predefinito)
+DEFAULT_WINDOW = 600
+
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_perf_counter = time.perf_counter
+
+_registry = get_registry()
+LOOP_LAG = _registry.histogram(
+    "m4bot_event_loop_lag_seconds", "Ritardo dei risvegli del loop asyncio rispetto al previsto",
+    buckets=LAG_BUCKETS)
+LOOP_BLOCKED = _registry.counter(
+    "m4bot_event_loop_blocked_total", "Blocchi del loop asyncio oltre la soglia del thread di guardia")
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile (nearest-rank) di una lista già ordinata."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(q / 100 * len(sorted_values))
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+class LoopLagMonitor:
+    """Misura la latenza del loop asyncio e cattura lo stack delle chiamate bloccanti."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, block_threshold: float = DEFAULT_BLOCK_THRESHOLD,
+                 window: int = DEFAULT_WINDOW, block_history: int = 50):
+        """
+        Args:
+            interval: Intervallo tra i risvegli del campionatore (secondi)
+            block_threshold: Durata oltre la quale catturare lo stack del loop (secondi)
+            window: Numero di campioni usati per i percentili
+            block_history: Numero di blocchi recenti conservati
+        """
+        self.interval = interval
+        self.block_threshold = block_threshold
+        self.thread_id: Optional[int] = None
+        self._samples = deque(maxlen=window)
+        self._blocks = deque(maxlen=block_history)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._last_beat = 0.0
+        self._pending_block: Optional[Dict[str, Any]] = None
+        self.max_lag = 0.0
+        self.block_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        """Avvia campionatore e thread di guardia (da chiamare nel thread del loop)."""
+        if self.running:
+            return
+        self.thread_id = threading.get_ident()
+        self._last_beat = _perf_counter()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self._sample_loop(), name="m4bot-loop-lag")
+        self._watchdog = threading.Thread(target=self._watch, name="m4bot-loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Monitor della latenza del loop avviato (soglia blocchi {self.block_threshold * 1000:g} ms)")
+
+    async def stop(self):
+        """Ferma campionatore e thread di guardia."""
+        self._stop_event.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+            self._watchdog = None
+        logger.info("Monitor della latenza del loop fermato")
+
+    async def _sample_loop(self):
+        while True:
+            self._last_beat = expected = _perf_counter()
+            expected += self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, _perf_counter() - expected)
+
+            LOOP_LAG.observe(lag)
+            with self._lock:
+                self._samples.append(lag)
+                if lag > self.max_lag:
+                    self.max_lag = lag
+
+            # Il thread di guardia ha catturato questo blocco: ne registra la durata totale
+            block = self._pending_block
+            if block is not None:
+                self._pending_block = None
+                block["blocked_ms"] = lag * 1000
+                logger.warning(f"Loop bloccato per {lag * 1000:.0f} ms in {block['location']}")
+
+    def _watch(self):
+        captured_beat = None
+        check_interval = max(0.005, self.block_threshold / 2)
+        while not self._stop_event.wait(check_interval):
+            beat = self._last_beat
+            stalled = _perf_counter() - beat - self.interval
+            if stalled < self.block_threshold or beat == captured_beat:
+                continue
+
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = frame_stack(frame)
+            del frame
+
+            captured_beat = beat
+            block = {
+                "timestamp": time.time(),
+                "blocked_ms": stalled * 1000,
+                "location": stack[-1] if stack else "?",
+                "stack": stack
+            }
+            with self._lock:
+                self._blocks.append(block)
+                self.block_count += 1
+            LOOP_BLOCKED.inc()
+            self._pending_block = block
+
+    def get_percentiles(self) -> Dict[str, float]:
+        """
+        Restituisce i percentili della latenza sulla finestra corrente.
+
+        Returns:
+            Dizionario con p50, p90, p99 e massimo in millisecondi
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        return {
+            "p50_ms": percentile(samples, 50) * 1000,
+            "p90_ms": percentile(samples, 90) * 1000,
+            "p99_ms": percentile(samples, 99) * 1000,
+            "max_ms": (samples[-1] if samples else 0.0) * 1000
+        }
+
+    def get_blocks(self, since: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Restituisce i blocchi del loop catturati dal thread di guardia.
+
+        Args:
+            since: Restituisce solo i blocchi successivi a questo timestamp
+
+        Returns:
+            Lista dei blocchi, dal più vecchio al più recente
+        """
+        with self._lock:
+            return [dict(block) for block in self._blocks if block["timestamp"] > since]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Restituisce percentili, massimo assoluto e blocchi recenti."""
+        stats = self.get_percentiles()
+        with self._lock:
+            stats["samples"] = len(self._samples)
+        stats.update({
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "block_threshold_ms": self.block_threshold * 1000,
+            "max_lag_ms": self.max_lag * 1000,
+            "blocked_count": self.block_count,
+            "recent_blocks": self.get_blocks()[-5:]
+        })
+        return stats
@@ -0,0 +1,716 @@
+#!/usr/bin/env python3
+"""
+M4Bot - Registro Unificato delle Metriche
+
+Questo modulo implementa un registro in-process per tutte le metriche del bot
+(chat, comandi, database, API e monitoraggio di sistema), esposte da un unico
+endpoint in formato testo Prometheus.
+
+Caratteristiche:
+- Contatori, gauge e istogrammi a bucket fissi senza lock sul percorso caldo:
+  ogni thread aggiorna una propria cella, le celle vengono sommate solo in lettura
+- Timer utilizzabili come context manager o decoratori (sincroni e asincroni)
+- Limite di cardinalità delle etichette: le serie oltre il limite confluiscono
+  in una serie "__overflow__" invece di far crescere la memoria senza controllo
+- Esposizione in formato Prometheus con stringhe delle etichette precalcolate
+"""
+
+import re
+import hmac
+import math
+import time
+import bisect
+import asyncio
+import logging
+import functools
+import threading
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Any, Optional, Tuple, Callable, Sequence, Union, Mapping
+
+logger = logging.getLogger('m4bot.stability.metrics')
+
+# Bucket predefiniti degli istogrammi di durata (secondi)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Numero massimo predefinito di serie (combinazioni di etichette) per metrica
+DEFAULT_MAX_SERIES = 500
+
+# Valore delle etichette della serie che raccoglie le combinazioni oltre il limite
+OVERFLOW_LABEL = "__overflow__"
+
+# Content type dell'esposizione in formato testo
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Intestazioni aggiunte dai reverse proxy: se presenti, remote_addr è l'indirizzo
+# del proxy (locale con nginx) e non quello del client
+PROXY_HEADERS = ("X-Forwarded-For", "X-Real-IP", "Forwarded")
+
+_NAME_PATTERN = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*$')
+_INVALID_CHARS = re.compile(r'[^a-zA-Z0-9_:]')
+
+_get_ident = threading.get_ident
+_perf_counter = time.perf_counter
+_bisect_left = bisect.bisect_left
+
+
+def metric_name(name: str) -> str:
+    """
+    Converte un nome di metrica (es. "system.cpu.usage_percent") in un nome Prometheus valido.
+
+    Args:
+        name: Nome originale
+
+    Returns:
+        Il nome con i caratteri non ammessi sostituiti da underscore
+    """
+    name = _INVALID_CHARS.sub('_', name)
+    if name[:1].isdigit():
+        name = '_' + name
+    return name
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_string(labelnames: Sequence[str], values: Sequence[str]) -> str:
+    if not labelnames:
+        return ""
+    pairs = ",".join(f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if value != value:
+        return "NaN"
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Timer:
+    """Misura una durata con perf_counter; context manager o decoratore."""
+
+    __slots__ = ("_observe", "_start")
+
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = _perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._observe(_perf_counter() - self._start)
+        return False
+
+    def __call__(self, func: Callable) -> Callable:
+        observe = self._observe
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = _perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    observe(_perf_counter() - start)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = _perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                observe(_perf_counter() - start)
+        return wrapper
+
+
+class _ShardedValue:
+    """Celle per thread: ogni thread scrive solo nella propria, la lettura le somma."""
+
+    __slots__ = ("_cells", "label_values", "label_string")
+
+    def __init__(self, label_values: Tuple[str, ...], label_string: str):
+        self._cells: Dict[int, List[float]] = {}
+        self.label_values = label_values
+        self.label_string = label_string
+
+    def _new_cell(self) -> List[float]:
+        return self._cells.setdefault(_get_ident(), [0.0])
+
+    def _sum(self) -> float:
+        return sum(cell[0] for cell in list(self._cells.values()))
+
+
+class CounterChild(_ShardedValue):
+    """Serie di un contatore (valore che può solo crescere)."""
+
+    __slots__ = ("_base",)
+
+    def __init__(self, label_values: Tuple[str, ...], label_string: str):
+        super().__init__(label_values, label_string)
+        self._base = 0.0
+
+    def inc(self, amount: float = 1.0):
+        """
+        Incrementa il contatore.
+
+        Args:
+            amount: Incremento (non negativo)
+        """
+        if amount < 0:
+            raise ValueError("I contatori possono solo incrementare")
+        cell = self._cells.get(_get_ident()) or self._new_cell()
+        cell[0] += amount
+
+    def set_total(self, value: float):
+        """
+        Allinea il contatore a un totale misurato altrove (es. byte di rete da psutil).
+
+        Args:
+            value: Totale corrente
+        """
+        self._base = value - self._sum()
+
+    def get(self) -> float:
+        """Restituisce il valore corrente."""
+        return self._base + self._sum()
+
+
+class GaugeChild(_ShardedValue):
+    """Serie di un gauge (valore che può salire e scendere)."""
+
+    __slots__ = ("_value", "_offset", "_function")
+
+    def __init__(self, label_values: Tuple[str, ...], label_string: str):
+        super().__init__(label_values, label_string)
+        self._value = 0.0
+        self._offset = 0.0
+        self._function = None
+
+    def set(self, value: float):
+        """Imposta il valore; con inc/dec concorrenti da altri thread prevale l'ultimo."""
+        self._offset = self._sum()
+        self._value = value
+
+    def inc(self, amount: float = 1.0):
+        """Incrementa il valore."""
+        cell = self._cells.get(_get_ident()) or self._new_cell()
+        cell[0] += amount
+
+    def dec(self, amount: float = 1.0):
+        """Decrementa il valore."""
+        cell = self._cells.get(_get_ident()) or self._new_cell()
+        cell[0] -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        """
+        Calcola il valore al momento della lettura (es. lunghezza di una coda).
+
+        Args:
+            function: Funzione senza argomenti che restituisce il valore
+        """
+        self._function = function
+
+    def track_inprogress(self) -> "_InProgress":
+        """Context manager che incrementa il gauge all'ingresso e lo decrementa all'uscita."""
+        return _InProgress(self)
+
+    def get(self) -> float:
+        """Restituisce il valore corrente."""
+        if self._function is not None:
+            try:
+                return float(self._function())
+            except Exception as e:
+                logger.debug(f"Errore nel calcolo del gauge: {e}")
+                return math.nan
+        return self._value + self._sum() - self._offset
+
+
+class _InProgress:
+    __slots__ = ("_gauge",)
+
+    def __init__(self, gauge: GaugeChild):
+        self._gauge = gauge
+
+    def __enter__(self):
+        self._gauge.inc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._gauge.dec()
+        return False
+
+
+class HistogramChild(_ShardedValue):
+    """Serie di un istogramma a bucket fissi."""
+
+    __slots__ = ("_upper", "_size")
+
+    def __init__(self, label_values: Tuple[str, ...], label_string: str, upper: Tuple[float, ...]):
+        super().__init__(label_values, label_string)
+        self._upper = upper
+        # Un contatore per bucket, uno per +Inf e la somma dei valori in coda
+        self._size = len(upper) + 2
+
+    def _new_cell(self) -> List[float]:
+        return self._cells.setdefault(_get_ident(), [0] * (self._size - 1) + [0.0])
+
+    def observe(self, value: float):
+        """
+        Registra un'osservazione.
+
+        Args:
+            value: Valore osservato (per le durate, in secondi)
+        """
+        cell = self._cells.get(_get_ident()) or self._new_cell()
+        cell[_bisect_left(self._upper, value)] += 1
+        cell[-1] += value
+
+    def time(self) -> _Timer:
+        """Timer che registra la durata in secondi (context manager o decoratore)."""
+        return _Timer(self.observe)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """
+        Restituisce i conteggi per bucket (non cumulativi, +Inf incluso) e la somma.
+
+        Returns:
+            Tupla (conteggi, somma)
+        """
+        totals = [0] * (self._size - 1)
+        total_sum = 0.0
+        for cell in list(self._cells.values()):
+            for i in range(self._size - 1):
+                totals[i] += cell[i]
+            total_sum += cell[-1]
+        return totals, total_sum
+
+    def get(self) -> Dict[str, float]:
+        """Restituisce conteggio e somma delle osservazioni."""
+        counts, total = self.snapshot()
+        return {"count": sum(counts), "sum": total}
+
+
+class _MetricFamily(ABC):
+    """Metrica con nome, descrizione ed etichette; contiene una serie per combinazione di etichette."""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], max_series: int):
+        self.name = name
+        self.documentation = documentation.replace('\\', '\\\\').replace('\n', '\\n')
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self._children: Dict[Tuple[str, ...], Any] = {}
+        self._lock = threading.Lock()
+        self._overflow_logged = False
+        self._default = None if self.labelnames else self._create_child(())
+
+    @abstractmethod
+    def _new_child(self, values: Tuple[str, ...], label_string: str):
+        """Crea la serie per una combinazione di valori delle etichette."""
+
+    def _create_child(self, values: Tuple[str, ...]):
+        child = self._new_child(values, _label_string(self.labelnames, values))
+        self._children[values] = child
+        return child
+
+    def labels(self, *values, **kwvalues):
+        """
+        Restituisce la serie per una combinazione di etichette, creandola se necessario.
+
+        Conviene conservare il risultato quando le etichette sono note in anticipo:
+        l'aggiornamento della serie non richiede altre ricerche.
+
+        Args:
+            *values: Valori delle etichette in ordine
+            **kwvalues: Valori delle etichette per nome
+
+        Returns:
+            La serie corrispondente (o quella di overflow oltre il limite di cardinalità)
+        """
+        if kwvalues:
+            try:
+                values = tuple(str(kwvalues[name]) for name in self.labelnames)
+            except KeyError as e:
+                raise ValueError(f"Etichetta mancante per {self.name}: {e}")
+        else:
+            # Percorso rapido: valori già stringa e serie esistente
+            child = self._children.get(values)
+            if child is not None:
+                return child
+            values = tuple(str(value) for value in values)
+
+        child = self._children.get(values)
+        if child is not None:
+            return child
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} richiede le etichette {self.labelnames}")
+
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                if len(self._children) >= self.max_series:
+                    values = (OVERFLOW_LABEL,) * len(self.labelnames)
+                    if not self._overflow_logged:
+                        self._overflow_logged = True
+                        logger.warning(f"Limite di {self.max_series} serie raggiunto per {self.name}: "
+                                       f"le nuove combinazioni di etichette confluiscono in {OVERFLOW_LABEL}")
+                    child = self._children.get(values) or self._create_child(values)
+                else:
+                    child = self._create_child(values)
+        return child
+
+    def _unlabeled(self):
+        if self._default is None:
+            raise ValueError(f"{self.name} ha etichette: usare labels()")
+        return self._default
+
+    def children(self) -> List[Any]:
+        """Restituisce le serie della metrica."""
+        return list(self._children.values())
+
+    def clear(self):
+        """Rimuove tutte le serie con etichette."""
+        if self.labelnames:
+            with self._lock:
+                self._children.clear()
+
+    def render(self, output: List[str]):
+        """Aggiunge le righe in formato Prometheus della metrica."""
+        output.append(f"# HELP {self.name} {self.documentation}")
+        output.append(f"# TYPE {self.name} {self.kind}")
+        for child in self.children():
+            output.append(f"{self.name}{child.label_string} {_format_value(child.get())}")
+
+
+class Counter(_MetricFamily):
+    """Contatore monotono."""
+
+    kind = "counter"
+
+    def _new_child(self, values, label_string):
+        return CounterChild(values, label_string)
+
+    def inc(self, amount: float = 1.0):
+        """Incrementa la serie senza etichette."""
+        self._unlabeled().inc(amount)
+
+    def set_total(self, value: float):
+        """Allinea la serie senza etichette a un totale misurato altrove."""
+        self._unlabeled().set_total(value)
+
+    def get(self) -> float:
+        """Restituisce il valore della serie senza etichette."""
+        return self._unlabeled().get()
+
+
+class Gauge(_MetricFamily):
+    """Valore che può salire e scendere."""
+
+    kind = "gauge"
+
+    def _new_child(self, values, label_string):
+        return GaugeChild(values, label_string)
+
+    def set(self, value: float):
+        """Imposta la serie senza etichette."""
+        self._unlabeled().set(value)
+
+    def inc(self, amount: float = 1.0):
+        """Incrementa la serie senza etichette."""
+        self._unlabeled().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        """Decrementa la serie senza etichette."""
+        self._unlabeled().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        """Calcola la serie senza etichette al momento della lettura."""
+        self._unlabeled().set_function(function)
+
+    def track_inprogress(self) -> _InProgress:
+        """Conta le operazioni in corso sulla serie senza etichette."""
+        return self._unlabeled().track_inprogress()
+
+    def get(self) -> float:
+        """Restituisce il valore della serie senza etichette."""
+        return self._unlabeled().get()
+
+
+class Histogram(_MetricFamily):
+    """Istogramma a bucket fissi (limiti superiori inclusivi, come in Prometheus)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], max_series: int,
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        upper = sorted(float(b) for b in buckets if b != math.inf)
+        if not upper:
+            raise ValueError(f"{name}: almeno un bucket finito è richiesto")
+        if "le" in labelnames:
+            raise ValueError(f"{name}: l'etichetta 'le' è riservata")
+        self.buckets = tuple(upper)
+        self._bucket_labels = [_format_value(b) for b in self.buckets] + ["+Inf"]
+        super().__init__(name, documentation, labelnames, max_series)
+
+    def _new_child(self, values, label_string):
+        return HistogramChild(values, label_string, self.buckets)
+
+    def observe(self, value: float):
+        """Registra un'osservazione nella serie senza etichette."""
+        self._unlabeled().observe(value)
+
+    def time(self) -> _Timer:
+        """Timer sulla serie senza etichette (context manager o decoratore)."""
+        return self._unlabeled().time()
+
+    def render(self, output: List[str]):
+        output.append(f"# HELP {self.name} {self.documentation}")
+        output.append(f"# TYPE {self.name} histogram")
+        name = self.name
+        bucket_labels = self._bucket_labels
+        for child in self.children():
+            counts, total = child.snapshot()
+            labels = child.label_string
+            prefix = f"{name}_bucket{{{labels[1:-1]}," if labels else f"{name}_bucket{{"
+            cumulative = 0
+            for bound, count in zip(bucket_labels, counts):
+                cumulative += count
+                output.append(f'{prefix}le="{bound}"}} {cumulative}')
+            output.append(f"{name}_sum{labels} {_format_value(total)}")
+            output.append(f"{name}_count{labels} {cumulative}")
+
+
+class MetricsRegistry:
+    """Registro delle metriche di un processo."""
+
+    def __init__(self, max_series: int = DEFAULT_MAX_SERIES):
+        """
+        Args:
+            max_series: Numero massimo predefinito di serie per metrica
+        """
+        self.max_series = max_series
+        self._metrics: Dict[str, _MetricFamily] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: Sequence[str],
+                  max_series: Optional[int], **options) -> Any:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    if not _NAME_PATTERN.match(name):
+                        raise ValueError(f"Nome di metrica non valido: {name}")
+                    metric = cls(name, documentation, labelnames, max_series or self.max_series, **options)
+                    self._metrics[name] = metric
+                    return metric
+
+        if type(metric) is not cls or metric.labelnames != tuple(labelnames):
+            raise ValueError(f"Metrica {name} già registrata come {metric.kind} con etichette {metric.labelnames}")
+        return metric
+
+    def counter(self, name: str, documentation: str = "", labelnames: Sequence[str] = (),
+                max_series: Optional[int] = None) -> Counter:
+        """
+        Registra un contatore, o restituisce quello già registrato con lo stesso nome.
+
+        Args:
+            name: Nome Prometheus della metrica
+            documentation: Descrizione
+            labelnames: Nomi delle etichette
+            max_series: Limite di serie (predefinito quello del registro)
+
+        Returns:
+            Il contatore
+        """
+        return self._register(Counter, name, documentation, labelnames, max_series)
+
+    def gauge(self, name: str, documentation: str = "", labelnames: Sequence[str] = (),
+              max_series: Optional[int] = None) -> Gauge:
+        """
+        Registra un gauge, o restituisce quello già registrato con lo stesso nome.
+
+        Args:
+            name: Nome Prometheus della metrica
+            documentation: Descrizione
+            labelnames: Nomi delle etichette
+            max_series: Limite di serie (predefinito quello del registro)
+
+        Returns:
+            Il gauge
+        """
+        return self._register(Gauge, name, documentation, labelnames, max_series)
+
+    def histogram(self, name: str, documentation: str = "", labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS, max_series: Optional[int] = None) -> Histogram:
+        """
+        Registra un istogramma, o restituisce quello già registrato con lo stesso nome.
+
+        Args:
+            name: Nome Prometheus della metrica
+            documentation: Descrizione
+            labelnames: Nomi delle etichette
+            buckets: Limiti superiori dei bucket (+Inf viene aggiunto automaticamente)
+            max_series: Limite di serie (predefinito quello del registro)
+
+        Returns:
+            L'istogramma
+        """
+        return self._register(Histogram, name, documentation, labelnames, max_series, buckets=buckets)
+
+    def set_value(self, name: str, value: Union[float, Dict[str, float]], kind: str = "gauge",
+                  documentation: str = "", labels: Optional[Dict[str, str]] = None):
+        """
+        Riporta nel registro il valore assoluto di una metrica raccolta periodicamente.
+
+        I contatori vengono allineati al totale, i dizionari (es. sum/count/min/max)
+        diventano un gauge per chiave con suffisso.
+
+        Args:
+            name: Nome della metrica (anche in forma puntata, es. "system.cpu.usage_percent")
+            value: Valore numerico o dizionario di valori
+            kind: Tipo della metrica ("counter", "gauge", "histogram", "summary")
+            documentation: Descrizione
+            labels: Etichette costanti della metrica
+        """
+        labels = labels or {}
+        labelnames = tuple(labels)
+        base = metric_name(name)
+
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, (int, float)):
+                    gauge = self.gauge(f"{base}_{metric_name(str(key))}", documentation, labelnames)
+                    gauge.labels(**labels).set(item)
+        elif isinstance(value, (int, float)):
+            if kind == "counter":
+                self.counter(base, documentation, labelnames).labels(**labels).set_total(value)
+            else:
+                self.gauge(base, documentation, labelnames).labels(**labels).set(value)
+
+    def get(self, name: str) -> Optional[_MetricFamily]:
+        """Restituisce una metrica registrata."""
+        return self._metrics.get(name)
+
+    def unregister(self, name: str):
+        """Rimuove una metrica dal registro."""
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self) -> str:
+        """
+        Formatta tutte le metriche in formato testo Prometheus.
+
+        Returns:
+            Il documento di esposizione
+        """
+        output: List[str] = []
+        for metric in list(self._metrics.values()):
+            metric.render(output)
+        output.append("")
+        return "\n".join(output)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Restituisce un'istantanea delle metriche (usata dalle API JSON)."""
+        result = {}
+        for name, metric in list(self._metrics.items()):
+            result[name] = {
+                "type": metric.kind,
+                "description": metric.documentation,
+                "series": [
+                    {"labels": dict(zip(metric.labelnames, child.label_values)), "value": child.get()}
+                    for child in metric.children()
+                ]
+            }
+        return result
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Richiesta metriche da {self.address_string()}: {format % args}")
+
+
+def start_http_server(port: int, host: str = "0.0.0.0",
+                      registry: Optional[MetricsRegistry] = None) -> ThreadingHTTPServer:
+    """
+    Avvia l'endpoint di esposizione /metrics in un thread in background.
+
+    Args:
+        port: Porta di ascolto
+        host: Indirizzo di ascolto
+        registry: Registro da esporre (predefinito quello globale)
+
+    Returns:
+        Il server avviato (chiamare shutdown() per fermarlo)
+    """
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry or get_registry()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    logger.info(f"Endpoint delle metriche avviato su {host}:{port}/metrics")
+    return server
+
+
+def internal_access_allowed(remote_addr: Optional[str], headers: Mapping[str, str],
+                            allowed_ips: Sequence[str], token: str = "") -> bool:
+    """
+    Verifica l'accesso a un endpoint interno (metriche, profiler) servito dalle app Quart.
+
+    Con un token configurato la richiesta deve presentarlo come "Authorization:
+    Bearer <token>". Senza token è ammessa solo una connessione diretta da un
+    indirizzo autorizzato: le richieste inoltrate da un reverse proxy vengono
+    rifiutate, perché dietro nginx remote_addr è sempre quello locale del proxy.
+
+    Args:
+        remote_addr: Indirizzo del peer della connessione
+        headers: Intestazioni della richiesta
+        allowed_ips: Indirizzi autorizzati senza token
+        token: Token condiviso (vuoto = accesso per indirizzo)
+
+    Returns:
+        True se la richiesta è autorizzata
+    """
+    if token:
+        return hmac.compare_digest(headers.get("Authorization", "").encode(), f"Bearer {token}".encode())
+    if any(header in headers for header in PROXY_HEADERS):
+        return False
+    return remote_addr in allowed_ips
+
+
+# Registro globale del processo
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_registry() -> MetricsRegistry:
+    """Restituisce l'istanza singleton del registro delle metriche."""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+    return _registry
@@ -28,6 +28,8 @@ import aiohttp
 import numpy as np
 from prometheus_client import Counter, Gauge, Histogram, start_http_server
 
+from stability.monitoring.probe_scheduler import ProbeScheduler, ProbeResult
+
 # Configurazione logging
 logger = logging.getLogger('m4bot.stability.monitoring')
 
@@ -172,11 +174,20 @@ class MetricCollector:
                 is_up=False,
                 last_check=time.time()
             )
+        
+        # Verifiche dei servizi in parallelo, con timeout e intervalli per servizio
+        self.probes = ProbeScheduler(
+            config['services'],
+            default_interval=config.get('monitoring_interval', 30),
+            on_result=self._on_probe_result
+        )
     
     async def start(self):
         """Inizializza e avvia il collector."""
         # Inizializza sessione HTTP
         self.http_session = aiohttp.ClientSession()
+        self.probes.http_session = self.http_session
+        self.probes.start()
         
         if self.config.get('enable_prometheus', False):
             try:
@@ -188,6 +199,7 @@ class MetricCollector:
     
     async def stop(self):
         """Arresta il collector."""
+        await self.probes.stop()
         if self.http_session:
             await self.http_session.close()
     
@@ -261,157 +273,38 @@ class MetricCollector:
             return {}
     
     async def check_services(self) -> Dict[str, ServiceStatus]:
-        """Controlla lo stato dei servizi configurati."""
-        results = {}
-        for service in self.config['services']:
-            service_name = service['name']
-            service_type = service['type']
-            status = self.services_status.get(
-                service_name, 
-                ServiceStatus(
-                    name=service_name,
-                    type=service_type,
-                    is_up=False,
-                    last_check=time.time()
-                )
-            )
-            
-            # Aggiorna il timestamp
-            status.last_check = time.time()
-            
-            try:
-                if service_type == 'http':
-                    await self._check_http_service(service, status)
-                elif service_type == 'postgres':
-                    await self._check_postgres_service(service, status)
-                elif service_type == 'port':
-                    await self._check_port_service(service, status)
-                else:
-                    logger.warning(f"Tipo di servizio non supportato: {service_type}")
-                    status.is_up = False
-                    status.error_message = f"Tipo di servizio non supportato: {service_type}"
-            except Exception as e:
-                logger.error(f"Errore nel controllo del servizio {service_name}: {e}")
-                status.is_up = False
-                status.error_message = str(e)
-                status.consecutive_failures += 1
-            
-            # Aggiorna history
-            status.status_history.append(status.is_up)
-            if len(status.status_history) > 1000:  # Limita la lunghezza
-                status.status_history = status.status_history[-1000:]
-            
-            # Aggiorna gauge Prometheus
-            SERVICE_UP_GAUGE.labels(service=service_name).set(1 if status.is_up else 0)
-            
-            # Memorizza risultato
-            results[service_name] = status
-            self.services_status[service_name] = status
-        
-        return results
-    
-    async def _check_http_service(self, service: Dict[str, Any], status: ServiceStatus):
-        """Controlla un servizio HTTP."""
-        if not self.http_session:
-            raise RuntimeError("Sessione HTTP non inizializzata")
-        
-        url = service['url']
-        method = service.get('method', 'GET')
-        expected_status = service.get('expected_status', 200)
-        timeout = service.get('timeout', 5)
+        """
+        Restituisce lo stato corrente dei servizi configurati.
         
-        start_time = time.time()
-        try:
-            if method == 'GET':
-                async with self.http_session.get(url, timeout=timeout) as response:
-                    status.is_up = response.status == expected_status
-                    status.latency = (time.time() - start_time) * 1000  # ms
-                    
-                    if not status.is_up:
-                        status.error_message = f"Stato HTTP non valido: {response.status}"
-                        status.consecutive_failures += 1
-                    else:
-                        status.error_message = ""
-                        status.consecutive_failures = 0
-            else:
-                raise ValueError(f"Metodo HTTP non supportato: {method}")
-            
-            # Aggiorna istogramma latenza
-            REQUEST_LATENCY.labels(endpoint=url).observe(status.latency / 1000)  # secondi
-        except asyncio.TimeoutError:
-            status.is_up = False
-            status.error_message = f"Timeout dopo {timeout} secondi"
-            status.latency = timeout * 1000
-            status.consecutive_failures += 1
-        except Exception as e:
-            status.is_up = False
-            status.error_message = str(e)
-            status.latency = (time.time() - start_time) * 1000
-            status.consecutive_failures += 1
-    
-    async def _check_postgres_service(self, service: Dict[str, Any], status: ServiceStatus):
-        """Controlla un servizio PostgreSQL."""
-        import asyncpg
-        
-        host = service.get('host', 'localhost')
-        port = service.get('port', 5432)
-        user = service.get('user', 'postgres')
-        password = service.get('password', '')
-        database = service.get('database', 'postgres')
-        timeout = service.get('timeout', 5)
-        
-        start_time = time.time()
-        conn = None
-        try:
-            conn = await asyncpg.connect(
-                host=host,
-                port=port,
-                user=user,
-                password=password,
-                database=database,
-                timeout=timeout
-            )
-            
-            # Esegui una query semplice per verificare il funzionamento
-            await conn.fetchval('SELECT 1')
-            
-            status.is_up = True
-            status.latency = (time.time() - start_time) * 1000
-            status.error_message = ""
-            status.consecutive_failures = 0
-        except Exception as e:
-            status.is_up = False
-            status.error_message = str(e)
-            status.latency = (time.time() - start_time) * 1000
-            status.consecutive_failures += 1
-        finally:
-            if conn:
-                await conn.close()
+        Con il collector avviato le verifiche girano in background nello scheduler;
+        altrimenti vengono eseguite qui, in parallelo, quelle scadute.
+        """
+        if not self.probes.running:
+            await self.probes.run_due()
+        return dict(self.services_status)
     
-    async def _check_port_service(self, service: Dict[str, Any], status: ServiceStatus):
-        """Controlla se una porta TCP è aperta."""
-        host = service.get('host', 'localhost')
-        port = service.get('port', 80)
-        timeout = service.get('timeout', 2)
-        
-        start_time = time.time()
-        try:
-            reader, writer = await asyncio.wait_for(
-                asyncio.open_connection(host, port),
-                timeout=timeout
-            )
-            writer.close()
-            await writer.wait_closed()
-            
-            status.is_up = True
-            status.latency = (time.time() - start_time) * 1000
-            status.error_message = ""
-            status.consecutive_failures = 0
-        except (asyncio.TimeoutError, ConnectionRefusedError, socket.gaierror) as e:
-            status.is_up = False
-            status.error_message = str(e)
-            status.latency = (time.time() - start_time) * 1000
-            status.consecutive_failures += 1
+    async def _on_probe_result(self, result: ProbeResult):
+        """Aggiorna lo stato del servizio con l'esito di una verifica."""
+        status = self.services_status.get(result.name)
+        if status is None:
+            status = ServiceStatus(name=result.name, type=result.type, is_up=False, last_check=result.timestamp)
+            self.services_status[result.name] = status
+        
+        status.last_check = result.timestamp
+        status.is_up = result.ok
+        status.latency = result.latency_ms
+        status.error_message = result.error
+        status.consecutive_failures = 0 if result.ok else status.consecutive_failures + 1
+        
+        # Aggiorna history
+        status.status_history.append(status.is_up)
+        if len(status.status_history) > 1000:  # Limita la lunghezza
+            status.status_history = status.status_history[-1000:]
+        
+        # Aggiorna le metriche Prometheus
+        SERVICE_UP_GAUGE.labels(service=result.name).set(1 if status.is_up else 0)
+        if 'status' in result.detail:
+            REQUEST_LATENCY.labels(endpoint=self.probes.probes[result.name].config['url']).observe(result.latency_ms / 1000)
     
     def _update_metric_history(self, name: str, value: float):
         """Aggiorna la storia delle metriche per calcoli adattivi."""
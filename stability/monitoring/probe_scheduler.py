@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+M4Bot - Scheduler delle Verifiche dei Servizi
+
+Questo modulo esegue le verifiche di disponibilità dei servizi (HTTP, porta TCP,
+PostgreSQL, systemd, processi) in parallelo, ognuna con il proprio timeout e il
+proprio intervallo, così una verifica bloccata non ritarda le altre.
+
+Caratteristiche:
+- Ogni verifica viene avviata quando è scaduto il suo intervallo e mai due volte
+  in contemporanea
+- Le verifiche dei processi condividono un'unica istantanea di process_iter per ciclo,
+  letta in un thread per non bloccare il loop
+- Storico delle latenze per verifica e istogramma nel registro unificato delle metriche
+"""
+
+import time
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, List, Any, Optional, Callable, Union, Awaitable
+
+import psutil
+
+from stability.monitoring.metrics_registry import get_registry
+
+logger = logging.getLogger('m4bot.stability.probes')
+
+# Tipi di verifica supportati
+PROBE_TYPES = ("http", "port", "postgres", "systemd", "process")
+
+# Timeout predefiniti per tipo, al posto di default_timeout: aprire una
+# connessione TCP locale è immediato, oltre 2 secondi la porta non risponde
+TYPE_TIMEOUTS = {"port": 2.0}
+
+# Durata delle verifiche nel registro unificato
+PROBE_DURATION = get_registry().histogram(
+    "m4bot_probe_duration_seconds", "Durata delle verifiche dei servizi", ("service", "type"))
+PROBE_UP = get_registry().gauge(
+    "m4bot_probe_up", "Esito dell'ultima verifica del servizio (1=disponibile, 0=non disponibile)", ("service",))
+
+
+@dataclass
+class ProbeResult:
+    """Esito di una singola verifica."""
+    name: str
+    type: str
+    ok: bool
+    latency_ms: float
+    timestamp: float
+    error: str = ""
+    detail: Dict[str, Any] = field(default_factory=dict)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte l'esito in dizionario."""
+        return {
+            "name": self.name,
+            "type": self.type,
+            "ok": self.ok,
+            "latency_ms": self.latency_ms,
+            "timestamp": self.timestamp,
+            "error": self.error
+        }
+
+
+@dataclass
+class Probe:
+    """Verifica registrata nello scheduler."""
+    name: str
+    type: str
+    config: Dict[str, Any]
+    interval: float
+    timeout: float
+    next_run: float = 0.0
+    task: Optional[asyncio.Task] = None
+    last_result: Optional[ProbeResult] = None
+    history: deque = field(default_factory=lambda: deque(maxlen=500))
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+
+def _process_names() -> set:
+    """Istantanea dei nomi dei processi in esecuzione."""
+    names = set()
+    for proc in psutil.process_iter(['name']):
+        name = proc.info.get('name')
+        if name:
+            names.add(name)
+    return names
+
+
+class ProbeScheduler:
+    """Esegue le verifiche dei servizi in parallelo con timeout e intervalli per verifica."""
+
+    def __init__(self, services: Union[Dict[str, Dict[str, Any]], List[Dict[str, Any]]],
+                 default_interval: float = 60, default_timeout: float = 5,
+                 history_size: int = 500, tick: float = 1.0,
+                 on_result: Optional[Callable[[ProbeResult], Awaitable[None]]] = None):
+        """
+        Args:
+            services: Servizi da verificare, come dizionario nome -> configurazione
+                      o lista di configurazioni con chiave 'name'
+            default_interval: Intervallo predefinito tra due verifiche (secondi)
+            default_timeout: Timeout predefinito di ogni verifica (secondi)
+            history_size: Numero di esiti conservati per verifica
+            tick: Frequenza con cui il loop in background cerca verifiche scadute (secondi)
+            on_result: Coroutine chiamata con ogni esito
+        """
+        self.default_interval = default_interval
+        self.default_timeout = default_timeout
+        self.history_size = history_size
+        self.tick = tick
+        self.on_result = on_result
+        self.http_session = None
+        self._own_session = False
+        self._loop_task: Optional[asyncio.Task] = None
+        self.probes: Dict[str, Probe] = {}
+
+        items = services.items() if isinstance(services, dict) else ((s.get('name'), s) for s in services)
+        for name, config in items:
+            self.add_probe(name, config)
+
+    def add_probe(self, name: str, config: Dict[str, Any]) -> Optional[Probe]:
+        """
+        Registra una verifica.
+
+        Args:
+            name: Nome del servizio
+            config: Configurazione (type, interval, timeout e parametri del tipo)
+
+        Returns:
+            La verifica registrata; se il tipo non è supportato il servizio viene
+            comunque verificato e segnalato come non disponibile per configurazione errata
+        """
+        probe_type = config.get('type', 'systemd')
+        if probe_type not in PROBE_TYPES:
+            logger.warning(f"Tipo di servizio non supportato per {name}: {probe_type}")
+
+        probe = Probe(
+            name=name,
+            type=probe_type,
+            config=config,
+            interval=float(config.get('interval', self.default_interval)),
+            timeout=float(config.get('timeout', TYPE_TIMEOUTS.get(probe_type, self.default_timeout))),
+            history=deque(maxlen=self.history_size)
+        )
+        self.probes[name] = probe
+        return probe
+
+    @property
+    def running(self) -> bool:
+        """Indica se il loop in background è attivo."""
+        return self._loop_task is not None and not self._loop_task.done()
+
+    def start(self):
+        """Avvia il loop in background; deve essere chiamato con un loop in esecuzione."""
+        if self._loop_task is None or self._loop_task.done():
+            self._loop_task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Ferma il loop e le verifiche in corso e chiude la sessione HTTP propria."""
+        tasks = [self._loop_task] if self._loop_task else []
+        tasks.extend(probe.task for probe in self.probes.values() if probe.running)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop_task = None
+
+        if self._own_session and self.http_session:
+            await self.http_session.close()
+            self.http_session = None
+            self._own_session = False
+
+    async def _loop(self):
+        while True:
+            try:
+                self._launch(self._due(time.time()))
+            except Exception as e:
+                logger.error(f"Errore nello scheduler delle verifiche: {e}")
+            await asyncio.sleep(self.tick)
+
+    def _due(self, now: float, force: bool = False) -> List[Probe]:
+        return [probe for probe in self.probes.values()
+                if not probe.running and (force or probe.next_run <= now)]
+
+    def _launch(self, probes: List[Probe]) -> List[asyncio.Task]:
+        """Avvia le verifiche indicate; quelle dei processi condividono un'unica istantanea."""
+        if not probes:
+            return []
+
+        snapshot = None
+        if any(probe.type == 'process' for probe in probes):
+            snapshot = asyncio.ensure_future(asyncio.to_thread(_process_names))
+
+        now = time.time()
+        tasks = []
+        for probe in probes:
+            probe.next_run = now + probe.interval
+            probe.task = asyncio.create_task(self._run_probe(probe, snapshot))
+            tasks.append(probe.task)
+        return tasks
+
+    async def run_due(self, force: bool = False) -> Dict[str, ProbeResult]:
+        """
+        Esegue in parallelo le verifiche scadute e ne attende gli esiti.
+
+        Args:
+            force: Se True esegue tutte le verifiche non già in corso, scadute o meno
+
+        Returns:
+            Dizionario nome servizio -> esito delle verifiche eseguite
+        """
+        tasks = self._launch(self._due(time.time(), force))
+        results = await asyncio.gather(*tasks)
+        return {result.name: result for result in results}
+
+    async def _run_probe(self, probe: Probe, snapshot: Optional[asyncio.Future]) -> ProbeResult:
+        start = time.perf_counter()
+        ok = False
+        error = ""
+        detail: Dict[str, Any] = {}
+        try:
+            ok, error, detail = await asyncio.wait_for(self._check(probe, snapshot), timeout=probe.timeout)
+        except asyncio.TimeoutError:
+            error = f"Timeout dopo {probe.timeout:g} secondi"
+        except Exception as e:
+            error = str(e) or e.__class__.__name__
+
+        elapsed = time.perf_counter() - start
+        result = ProbeResult(probe.name, probe.type, ok, elapsed * 1000, time.time(), error, detail)
+        probe.last_result = result
+        probe.history.append((result.timestamp, result.latency_ms, ok))
+        PROBE_DURATION.labels(probe.name, probe.type).observe(elapsed)
+        PROBE_UP.labels(probe.name).set(1 if ok else 0)
+
+        if self.on_result:
+            try:
+                await self.on_result(result)
+            except Exception as e:
+                logger.error(f"Errore nella gestione dell'esito della verifica {probe.name}: {e}")
+        return result
+
+    async def _check(self, probe: Probe, snapshot: Optional[asyncio.Future]):
+        config = probe.config
+        if probe.type == 'http':
+            return await self._check_http(config, probe.timeout)
+        if probe.type == 'port':
+            return await self._check_port(config)
+        if probe.type == 'postgres':
+            return await self._check_postgres(config, probe.timeout)
+        if probe.type == 'systemd':
+            return await self._check_systemd(config.get('unit', probe.name))
+        if probe.type == 'process':
+            process_name = config.get('process_name', probe.name)
+            running = process_name in await asyncio.shield(snapshot)
+            return running, "" if running else f"Processo {process_name} non in esecuzione", {}
+        return False, f"Tipo di servizio non supportato: {probe.type}", {"misconfigured": True}
+
+    async def _check_http(self, config: Dict[str, Any], timeout: float):
+        import aiohttp
+
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession()
+            self._own_session = True
+
+        url = config['url']
+        method = config.get('method', 'GET')
+        expected_status = config.get('expected_status', 200)
+        async with self.http_session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            ok = response.status == expected_status
+            error = "" if ok else f"Stato HTTP non valido: {response.status}"
+            return ok, error, {"status": response.status}
+
+    async def _check_port(self, config: Dict[str, Any]):
+        reader, writer = await asyncio.open_connection(config.get('host', 'localhost'), config.get('port', 80))
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+        return True, "", {}
+
+    async def _check_postgres(self, config: Dict[str, Any], timeout: float):
+        import asyncpg
+
+        conn = await asyncpg.connect(
+            host=config.get('host', 'localhost'),
+            port=config.get('port', 5432),
+            user=config.get('user', 'postgres'),
+            password=config.get('password', ''),
+            database=config.get('database', 'postgres'),
+            timeout=timeout
+        )
+        try:
+            await conn.fetchval('SELECT 1')
+        finally:
+            await conn.close()
+        return True, "", {}
+
+    async def _check_systemd(self, unit: str):
+        process = await asyncio.create_subprocess_exec(
+            "systemctl", "is-active", unit,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            stdout, _ = await process.communicate()
+        except asyncio.CancelledError:
+            # Timeout o arresto: non lasciare processi systemctl appesi
+            if process.returncode is None:
+                process.kill()
+            raise
+        state = stdout.decode().strip()
+        ok = process.returncode == 0 and state == "active"
+        return ok, "" if ok else f"Stato systemd: {state or 'sconosciuto'}", {"state": state}
+
+    def get_latency_history(self, name: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Restituisce lo storico degli esiti di una verifica.
+
+        Args:
+            name: Nome del servizio
+            limit: Numero massimo di esiti più recenti
+
+        Returns:
+            Lista di dizionari con timestamp, latency_ms e ok
+        """
+        probe = self.probes.get(name)
+        if probe is None:
+            return []
+        history = list(probe.history)
+        if limit:
+            history = history[-limit:]
+        return [{"timestamp": ts, "latency_ms": latency, "ok": ok} for ts, latency, ok in history]
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Restituisce per ogni verifica l'ultimo esito e le statistiche di latenza.
+
+        Returns:
+            Dizionario nome servizio -> statistiche (latenze in millisecondi)
+        """
+        stats = {}
+        for name, probe in self.probes.items():
+            latencies = sorted(latency for _, latency, _ in probe.history)
+            successes = sum(1 for _, _, ok in probe.history if ok)
+            count = len(latencies)
+            stats[name] = {
+                "type": probe.type,
+                "interval": probe.interval,
+                "timeout": probe.timeout,
+                "running": probe.running,
+                "last_result": probe.last_result.to_dict() if probe.last_result else None,
+                "samples": count,
+                "availability": successes / count if count else None,
+                "avg_ms": sum(latencies) / count if count else None,
+                "p50_ms": latencies[count // 2] if count else None,
+                "p95_ms": latencies[min(count - 1, int(count * 0.95))] if count else None,
+                "max_ms": latencies[-1] if count else None
+            }
+        return stats
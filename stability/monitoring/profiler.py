@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+M4Bot - Profiler a Campionamento
+
+Questo modulo implementa un profiler a basso costo, pensato per restare attivo in
+produzione nei processi del bot e dell'interfaccia web.
+
+Caratteristiche:
+- Campionamento periodico dello stack del thread del loop da un thread separato,
+  con esportazione in formato "folded" (flamegraph.pl, speedscope)
+- Rilevamento dei callback lenti del loop asyncio con nome del task e coroutine
+- Tempo passato sul loop per coroutine (somma dei passi eseguiti dai task)
+- Nessun costo sul percorso caldo quando il profiler è fermo
+"""
+
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+from collections import Counter, deque
+from typing import Dict, List, Any, Optional
+
+from stability.monitoring.metrics_registry import get_registry
+
+logger = logging.getLogger('m4bot.stability.profiler')
+
+# Intervallo di campionamento predefinito (secondi)
+DEFAULT_INTERVAL = 0.02
+
+# Durata oltre la quale un callback del loop è considerato lento (secondi, come asyncio)
+DEFAULT_SLOW_CALLBACK = 0.1
+
+# Limiti della memoria usata dal profiler
+MAX_STACKS = 5000
+MAX_COROUTINES = 1000
+MAX_DEPTH = 64
+
+# Stack e coroutine oltre i limiti confluiscono in queste voci
+OTHER_STACKS = "[altri stack]"
+OTHER_COROUTINES = "[altre coroutine]"
+
+SLOW_CALLBACKS = get_registry().counter(
+    "m4bot_asyncio_slow_callbacks_total", "Callback del loop asyncio più lenti della soglia del profiler")
+
+_perf_counter = time.perf_counter
+_labels: Dict[Any, str] = {}
+
+
+def frame_label(code) -> str:
+    """Etichetta di una funzione nello stack: nome qualificato e file."""
+    label = _labels.get(code)
+    if label is None:
+        path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)
+        label = f"{getattr(code, 'co_qualname', code.co_name)} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+        _labels[code] = label
+    return label
+
+
+def frame_stack(frame, max_depth: int = MAX_DEPTH) -> List[str]:
+    """
+    Restituisce lo stack di un frame dalla radice alla foglia.
+
+    Args:
+        frame: Frame più interno
+        max_depth: Numero massimo di frame (i più interni)
+
+    Returns:
+        Lista delle etichette delle funzioni
+    """
+    stack = []
+    while frame is not None and len(stack) < max_depth:
+        stack.append(frame_label(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+# Hook dei callback del loop: installato una sola volta per processo
+_original_handle_run = asyncio.events.Handle._run
+_active_profiler: Optional["SamplingProfiler"] = None
+
+
+def _profiled_handle_run(handle):
+    profiler = _active_profiler
+    if profiler is None or handle._loop is not profiler.loop:
+        return _original_handle_run(handle)
+    start = _perf_counter()
+    try:
+        return _original_handle_run(handle)
+    finally:
+        profiler._record_callback(handle, _perf_counter() - start)
+
+
+class SamplingProfiler:
+    """Profiler a campionamento dello stack e dei callback di un loop asyncio."""
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, slow_callback: float = DEFAULT_SLOW_CALLBACK,
+                 max_stacks: int = MAX_STACKS, slow_history: int = 200):
+        """
+        Args:
+            interval: Intervallo di campionamento dello stack (secondi)
+            slow_callback: Soglia dei callback lenti (secondi)
+            max_stacks: Numero massimo di stack distinti conservati
+            slow_history: Numero di callback lenti recenti conservati
+        """
+        self.interval = interval
+        self.slow_callback = slow_callback
+        self.max_stacks = max_stacks
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.thread_id: Optional[int] = None
+        self.started_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._coroutines: Dict[str, List[float]] = {}  # nome -> [passi, tempo totale, tempo massimo]
+        self._slow = deque(maxlen=slow_history)
+        self.samples = 0
+        self.idle_samples = 0
+        self.slow_count = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """
+        Avvia il profiler sul loop indicato.
+
+        Args:
+            loop: Loop da profilare; se None il loop in esecuzione (la chiamata
+                  deve allora avvenire nel thread del loop)
+        """
+        global _active_profiler
+        if self.running:
+            return
+        if _active_profiler is not None and _active_profiler is not self:
+            raise RuntimeError("Un altro profiler è già attivo in questo processo")
+
+        self.loop = loop or asyncio.get_running_loop()
+        self.thread_id = getattr(self.loop, "_thread_id", None) or threading.get_ident()
+        self.started_at = time.time()
+        self._stop_event.clear()
+
+        _active_profiler = self
+        asyncio.events.Handle._run = _profiled_handle_run
+        self._thread = threading.Thread(target=self._sample_loop, name="m4bot-profiler", daemon=True)
+        self._thread.start()
+        logger.info(f"Profiler avviato (campionamento ogni {self.interval * 1000:g} ms)")
+
+    def stop(self):
+        """Ferma il campionamento e rimuove l'hook dei callback; i dati raccolti restano disponibili."""
+        global _active_profiler
+        if _active_profiler is self:
+            asyncio.events.Handle._run = _original_handle_run
+            _active_profiler = None
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+        logger.info("Profiler fermato")
+
+    def reset(self):
+        """Azzera i dati raccolti."""
+        with self._lock:
+            self._stacks.clear()
+            self._coroutines.clear()
+            self._slow.clear()
+            self.samples = 0
+            self.idle_samples = 0
+            self.slow_count = 0
+            self.started_at = time.time() if self.running else None
+
+    def _sample_loop(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"Errore nel campionamento dello stack: {e}")
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        # Il loop in attesa di eventi si trova nella select del modulo selectors
+        idle = frame.f_code.co_filename.endswith("selectors.py")
+        key = ";".join(frame_stack(frame))
+        del frame
+
+        with self._lock:
+            self.samples += 1
+            if idle:
+                self.idle_samples += 1
+            if key not in self._stacks and len(self._stacks) >= self.max_stacks:
+                key = OTHER_STACKS
+            self._stacks[key] += 1
+
+    def _record_callback(self, handle, elapsed: float):
+        """Aggiorna il tempo per coroutine e registra i callback lenti."""
+        callback = handle._callback
+        task = getattr(callback, "__self__", None)
+        if isinstance(task, asyncio.Task):
+            coro = task.get_coro()
+            name = getattr(coro, "__qualname__", None) or repr(coro)
+        else:
+            task = None
+            name = getattr(callback, "__qualname__", None) or type(callback).__name__
+
+        stats = self._coroutines.get(name)
+        if stats is None:
+            if len(self._coroutines) >= MAX_COROUTINES:
+                name = OTHER_COROUTINES
+                stats = self._coroutines.get(name)
+            if stats is None:
+                stats = self._coroutines[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        if elapsed > stats[2]:
+            stats[2] = elapsed
+
+        if elapsed >= self.slow_callback:
+            self.slow_count += 1
+            SLOW_CALLBACKS.inc()
+            entry = {
+                "timestamp": time.time(),
+                "duration_ms": elapsed * 1000,
+                "task": task.get_name() if task else None,
+                "callback": name
+            }
+            # Punto in cui la coroutine si è sospesa dopo il passo lento
+            frame = getattr(task.get_coro(), "cr_frame", None) if task else None
+            if frame is not None:
+                entry["resumed_at"] = f"{frame.f_code.co_filename}:{frame.f_lineno}"
+            self._slow.append(entry)
+
+    def export_folded(self) -> str:
+        """
+        Esporta gli stack campionati in formato "folded" (una riga per stack con il conteggio).
+
+        Returns:
+            Testo utilizzabile con flamegraph.pl o importabile in speedscope
+        """
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks)
+
+    def get_stats(self, top: int = 30) -> Dict[str, Any]:
+        """
+        Restituisce un riepilogo dei dati raccolti.
+
+        Args:
+            top: Numero di voci nelle classifiche di funzioni e coroutine
+
+        Returns:
+            Dizionario con campioni, funzioni più presenti in cima allo stack,
+            tempo sul loop per coroutine e callback lenti recenti
+        """
+        with self._lock:
+            stacks = list(self._stacks.items())
+            samples = self.samples
+            idle = self.idle_samples
+            slow = list(self._slow)
+
+        leaves = Counter()
+        for stack, count in stacks:
+            leaves[stack.rsplit(";", 1)[-1]] += count
+
+        coroutines = sorted(
+            ((name, stats[0], stats[1], stats[2]) for name, stats in list(self._coroutines.items())),
+            key=lambda item: item[2], reverse=True
+        )[:top]
+
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "started_at": self.started_at,
+            "samples": samples,
+            "idle_percent": idle / samples * 100 if samples else None,
+            "stacks": len(stacks),
+            "top_functions": [
+                {"function": function, "samples": count, "percent": count / samples * 100}
+                for function, count in leaves.most_common(top)
+            ],
+            "coroutines": [
+                {"name": name, "steps": steps, "total_ms": total * 1000,
+                 "avg_ms": total / steps * 1000 if steps else 0.0, "max_ms": maximum * 1000}
+                for name, steps, total, maximum in coroutines
+            ],
+            "slow_callbacks": {
+                "threshold_ms": self.slow_callback * 1000,
+                "count": self.slow_count,
+                "recent": slow[-50:]
+            }
+        }
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> SamplingProfiler:
+    """Restituisce il profiler del processo (creato alla prima richiesta, non avviato)."""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler(
+            interval=float(os.environ.get("M4BOT_PROFILER_INTERVAL", DEFAULT_INTERVAL)),
+            slow_callback=float(os.environ.get("M4BOT_PROFILER_SLOW_MS", DEFAULT_SLOW_CALLBACK * 1000)) / 1000
+        )
+    return _profiler
+
+
+def profiler_enabled() -> bool:
+    """Indica se il profiler va avviato all'avvio del processo (variabile M4BOT_PROFILER)."""
+    return os.environ.get("M4BOT_PROFILER", "").lower() in ("1", "true", "yes", "on")
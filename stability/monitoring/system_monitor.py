@@ -26,6 +26,9 @@ from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
 
+from stability.monitoring.timeseries_store import TimeSeriesStore, flatten_metric_values, import_json_exports
+from stability.monitoring.metrics_registry import get_registry, start_http_server
+
 # Configurazione logging
 logging.basicConfig(
     level=logging.INFO,
@@ -96,6 +99,23 @@ class SystemMonitor:
         self.data_dir = Path(self.config.get('data_dir', './monitoring_data'))
         self.data_dir.mkdir(exist_ok=True, parents=True)
         
+        # Archivio dello storico delle metriche, separato da quello di IntegratedMonitor
+        # (data_dir/timeseries) perché ogni archivio ammette un solo scrittore
+        self.history = TimeSeriesStore(
+            self.config.get('history_dir') or self.data_dir / 'system_timeseries',
+            segment_seconds=self.config.get('history_segment_seconds', 3600),
+            raw_retention_hours=self.config.get('history_raw_hours', 48),
+            retention_days=self.config.get('history_days', 7),
+            rollup_seconds=self.config.get('history_rollup_seconds', 300)
+        )
+        
+        # Importa eventuali esportazioni JSON prodotte dalle versioni precedenti
+        import_json_exports(self.history, self.data_dir)
+        
+        # Registro unificato del processo, esposto su /metrics se abilitato
+        self.registry = get_registry()
+        self.metrics_server = None
+        
         # Intervalli di raccolta
         self.system_metrics_interval = self.config.get('system_metrics_interval', 60)
         self.app_metrics_interval = self.config.get('app_metrics_interval', 30)
@@ -116,6 +136,9 @@ class SystemMonitor:
             'enable_export': True,
             'export_interval': 300,
             'history_days': 7,
+            'history_raw_hours': 48,
+            'history_segment_seconds': 3600,
+            'history_rollup_seconds': 300,
             'thresholds': {
                 'cpu_warning': 75,
                 'cpu_critical': 90,
@@ -171,6 +194,7 @@ class SystemMonitor:
         )
         
         self.metrics[name] = metric
+        self._mirror_metric(metric)
         logger.debug(f"Metrica registrata: {name}")
         return metric
     
@@ -186,7 +210,35 @@ class SystemMonitor:
             logger.warning(f"Tentativo di aggiornare metrica non registrata: {name}")
             return
         
-        self.metrics[name].update(value)
+        metric = self.metrics[name]
+        metric.update(value)
+        self._mirror_metric(metric)
+    
+    def _mirror_metric(self, metric: Metric):
+        """Riporta il valore della metrica nel registro unificato."""
+        try:
+            self.registry.set_value(metric.name, metric.value, metric.type.value,
+                                    metric.description, metric.labels)
+        except ValueError as e:
+            logger.warning(f"Impossibile esporre la metrica {metric.name}: {e}")
+    
+    def _start_metrics_server(self):
+        """Avvia l'endpoint /metrics del registro se abilitato nella configurazione."""
+        if not self.config.get('enable_prometheus', False) or self.metrics_server:
+            return
+        
+        port = self.config.get('prometheus_port', 9090)
+        try:
+            self.metrics_server = start_http_server(port, registry=self.registry)
+        except OSError as e:
+            logger.error(f"Impossibile avviare l'endpoint delle metriche sulla porta {port}: {e}")
+    
+    def _stop_metrics_server(self):
+        """Ferma l'endpoint /metrics."""
+        if self.metrics_server:
+            self.metrics_server.shutdown()
+            self.metrics_server.server_close()
+            self.metrics_server = None
     
     def get_metric(self, name: str) -> Optional[Metric]:
         """Restituisce una metrica per nome."""
@@ -208,6 +260,7 @@ class SystemMonitor:
         
         # Inizializziamo le metriche di sistema
         self._init_system_metrics()
+        self._start_metrics_server()
         
         # Avvia il task di raccolta
         self.collection_task = asyncio.create_task(self._collection_loop())
@@ -227,6 +280,9 @@ class SystemMonitor:
             except asyncio.CancelledError:
                 pass
             self.collection_task = None
+        
+        self._stop_metrics_server()
+        self.history.close()
     
     def _init_system_metrics(self):
         """Inizializza le metriche di sistema predefinite."""
@@ -444,40 +500,34 @@ class SystemMonitor:
             logger.warning(f"Disk usage high: {disk_value}%")
     
     def _export_metrics(self):
-        """Esporta le metriche su file."""
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        export_file = self.data_dir / f"metrics_{timestamp}.json"
-        
+        """Registra i valori correnti delle metriche nell'archivio dello storico."""
         try:
-            data = {
-                "timestamp": time.time(),
-                "metrics": {name: metric.to_dict() for name, metric in self.metrics.items()}
-            }
+            points = flatten_metric_values({name: metric.value for name, metric in self.metrics.items()})
+            self.history.append_many(points)
+            logger.debug(f"Registrati {len(points)} punti nello storico delle metriche")
             
-            with open(export_file, 'w') as f:
-                json.dump(data, f, indent=2)
-                
-            logger.info(f"Metriche esportate in {export_file}")
-            
-            # Elimina file vecchi
-            self._cleanup_old_exports()
+            # Sigillatura dei segmenti, rollup e retention
+            self.history.maintain()
             
         except Exception as e:
             logger.error(f"Errore nell'esportazione delle metriche: {e}")
     
-    def _cleanup_old_exports(self):
-        """Elimina i file di esportazione più vecchi del periodo configurato."""
-        try:
-            history_days = self.config.get('history_days', 7)
-            cutoff_time = time.time() - (history_days * 86400)
+    def query_history(self, name: str, start: Optional[float] = None, end: Optional[float] = None,
+                      step: Optional[float] = None, aggregate: str = "avg") -> List[Tuple[float, float]]:
+        """
+        Restituisce lo storico di una metrica in un intervallo di tempo.
+        
+        Args:
+            name: Nome della serie (es. system.cpu.usage_percent)
+            start: Inizio dell'intervallo in secondi (default: un'ora fa)
+            end: Fine dell'intervallo in secondi (default: ora corrente)
+            step: Intervallo di aggregazione opzionale in secondi
+            aggregate: Aggregato da usare: avg, min o max
             
-            for file in self.data_dir.glob("metrics_*.json"):
-                if file.stat().st_mtime < cutoff_time:
-                    file.unlink()
-                    logger.debug(f"File eliminato: {file}")
-                    
-        except Exception as e:
-            logger.error(f"Errore nella pulizia dei file vecchi: {e}")
+        Returns:
+            Lista di tuple (timestamp, valore)
+        """
+        return self.history.query(name, start, end, step, aggregate)
     
     def get_all_metrics(self) -> Dict[str, Dict[str, Any]]:
         """Restituisce tutte le metriche come dizionario."""
@@ -497,35 +547,8 @@ class SystemMonitor:
         }
     
     def format_prometheus(self) -> str:
-        """Formatta le metriche in formato Prometheus."""
-        output = []
-        
-        for name, metric in self.metrics.items():
-            # Converti nome in formato Prometheus (punti in underscore)
-            prom_name = name.replace('.', '_')
-            
-            # Aggiungi commento con descrizione
-            output.append(f"# HELP {prom_name} {metric.description}")
-            output.append(f"# TYPE {prom_name} {metric.type.value}")
-            
-            # Formatta il valore
-            if isinstance(metric.value, (int, float)):
-                # Formatta le labels
-                labels_str = ""
-                if metric.labels:
-                    labels = []
-                    for k, v in metric.labels.items():
-                        labels.append(f'{k}="{v}"')
-                    labels_str = f'{{{",".join(labels)}}}'
-                
-                output.append(f"{prom_name}{labels_str} {metric.value}")
-            
-            elif isinstance(metric.value, dict) and metric.type in (MetricType.HISTOGRAM, MetricType.SUMMARY):
-                # Per istogrammi e sommari, formato speciale
-                for k, v in metric.value.items():
-                    output.append(f"{prom_name}_{k} {v}")
-        
-        return "\n".join(output)
+        """Formatta le metriche del processo (registro unificato) in formato Prometheus."""
+        return self.registry.render()
 
 # Singola istanza del sistema di monitoraggio
 _system_monitor = None
@@ -0,0 +1,867 @@
+#!/usr/bin/env python3
+"""
+M4Bot - Archivio Serie Temporali
+
+Questo modulo implementa un archivio embedded, append-only, per lo storico delle
+metriche di monitoraggio, in sostituzione dei file JSON con timestamp.
+
+Struttura della directory:
+- LOCK: lock esclusivo del processo che scrive (uno solo per directory)
+- series.json: tabella nome metrica -> id numerico
+- head_<inizio>.log: segmento attivo, record binari (id, timestamp ms, valore) in append
+- seg_<inizio>.tsdb: segmenti sigillati, una colonna compressa per metrica
+  (timestamp delta-of-delta e valori XOR in stile Gorilla, allineati al byte)
+- rollup_<inizio>.tsdb: segmenti ridotti a media/min/max per intervallo di rollup,
+  che sostituiscono i segmenti grezzi oltre il periodo di conservazione dei dati grezzi
+
+I nomi dei file contengono l'inizio della finestra temporale, quindi la selezione
+dei segmenti e la pulizia per retention non richiedono stat né parsing dei file.
+"""
+
+import os
+import json
+import time
+import struct
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows: il lock tra processi non è disponibile
+    fcntl = None
+
+logger = logging.getLogger('m4bot.stability.timeseries')
+
+# Intestazione dei segmenti sigillati
+SEGMENT_MAGIC = b"M4TS\x01"
+
+# Record del segmento attivo: id metrica, timestamp in ms, valore
+HEAD_RECORD = struct.Struct('<Iqd')
+
+# Aggregati conservati nei rollup
+ROLLUP_AGGREGATES = ("avg", "min", "max")
+
+# Colonne decodificate tenute in memoria
+COLUMN_CACHE_SIZE = 256
+
+# File su cui il processo che scrive tiene il lock esclusivo
+LOCK_FILE = "LOCK"
+
+_FLOAT = struct.Struct('<d')
+_UINT64 = struct.Struct('<Q')
+
+
+def _write_varint(buffer: bytearray, value: int):
+    """Scrive un intero non negativo in formato varint."""
+    while value >= 0x80:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    """Legge un intero varint restituendo (valore, nuova posizione)."""
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def encode_column(timestamps: List[int], values: List[float]) -> bytes:
+    """
+    Comprime una colonna di punti.
+
+    I timestamp (ms) sono codificati come delta-of-delta zigzag varint; ogni valore è
+    codificato come XOR con il precedente: un byte 0 se invariato, altrimenti un byte
+    con zeri iniziali e byte significativi seguito dai soli byte significativi.
+
+    Args:
+        timestamps: Timestamp in millisecondi, in ordine crescente
+        values: Valori corrispondenti
+
+    Returns:
+        La colonna compressa
+    """
+    buffer = bytearray()
+    _write_varint(buffer, len(timestamps))
+
+    previous = 0
+    previous_delta = 0
+    for timestamp in timestamps:
+        delta = timestamp - previous
+        dod = delta - previous_delta
+        _write_varint(buffer, (dod << 1) if dod >= 0 else ((-dod) << 1) - 1)
+        previous = timestamp
+        previous_delta = delta
+
+    previous_bits = 0
+    for value in values:
+        bits = _UINT64.unpack(_FLOAT.pack(value))[0]
+        xor = bits ^ previous_bits
+        previous_bits = bits
+        if xor == 0:
+            buffer.append(0)
+            continue
+        leading = (64 - xor.bit_length()) // 8
+        trailing = ((xor & -xor).bit_length() - 1) // 8
+        size = 8 - leading - trailing
+        buffer.append((leading << 4) | size)
+        buffer += (xor >> (trailing * 8)).to_bytes(size, 'little')
+
+    return bytes(buffer)
+
+
+def decode_column(data: bytes) -> Tuple[List[int], List[float]]:
+    """
+    Decomprime una colonna prodotta da encode_column.
+
+    Args:
+        data: La colonna compressa
+
+    Returns:
+        Tupla (timestamp in ms, valori)
+    """
+    count, pos = _read_varint(data, 0)
+
+    timestamps = []
+    previous = 0
+    previous_delta = 0
+    for _ in range(count):
+        encoded, pos = _read_varint(data, pos)
+        dod = (encoded >> 1) if not encoded & 1 else -((encoded + 1) >> 1)
+        previous_delta += dod
+        previous += previous_delta
+        timestamps.append(previous)
+
+    values = []
+    bits = 0
+    for _ in range(count):
+        header = data[pos]
+        pos += 1
+        if header:
+            leading = header >> 4
+            size = header & 0x0F
+            trailing = 8 - leading - size
+            bits ^= int.from_bytes(data[pos:pos + size], 'little') << (trailing * 8)
+            pos += size
+        values.append(_FLOAT.unpack(_UINT64.pack(bits))[0])
+
+    return timestamps, values
+
+
+def flatten_metric_values(metrics: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Converte i valori delle metriche in punti numerici.
+
+    I valori dizionario (istogrammi, sommari) diventano una serie per chiave,
+    ad esempio app.response_time.ms.sum.
+
+    Args:
+        metrics: Valori per nome di metrica
+
+    Returns:
+        Dizionario nome serie -> valore numerico
+    """
+    points = {}
+    for name, value in metrics.items():
+        if isinstance(value, bool):
+            points[name] = float(value)
+        elif isinstance(value, (int, float)):
+            points[name] = float(value)
+        elif isinstance(value, dict):
+            for key, item in value.items():
+                if isinstance(item, (int, float)) and not isinstance(item, bool):
+                    points[f"{name}.{key}"] = float(item)
+    return points
+
+
+class TimeSeriesStore:
+    """Archivio append-only di serie temporali partizionato per finestre di tempo."""
+
+    def __init__(self, directory: Union[str, Path], segment_seconds: int = 3600,
+                 raw_retention_hours: float = 48, retention_days: float = 30,
+                 rollup_seconds: int = 300, readonly: bool = False):
+        """
+        Inizializza l'archivio.
+
+        Args:
+            directory: Directory dei dati
+            segment_seconds: Durata di ciascun segmento
+            raw_retention_hours: Ore per cui conservare i punti grezzi
+            retention_days: Giorni per cui conservare i rollup
+            rollup_seconds: Risoluzione dei rollup
+            readonly: Apre l'archivio in sola lettura (es. dal processo web)
+
+        Se la directory è già aperta in scrittura (anche da questo processo), l'archivio
+        viene aperto in sola lettura: due scrittori corromperebbero il segmento attivo.
+        """
+        self.directory = Path(directory)
+        self.segment_seconds = int(segment_seconds)
+        self.raw_retention = raw_retention_hours * 3600
+        self.retention = retention_days * 86400
+        self.rollup_seconds = int(rollup_seconds)
+        self.readonly = readonly
+
+        self.series: Dict[str, int] = {}
+        self.segments: List[int] = []  # Inizio dei segmenti grezzi sigillati
+        self.rollups: List[int] = []  # Inizio dei segmenti di rollup
+
+        # Segmento attivo
+        self.head_start: Optional[int] = None
+        self.head_points: Dict[str, Tuple[List[int], List[float]]] = {}
+        self.head_file = None
+        self.head_offset = 0
+        self._lock_file = None
+
+        self._series_mtime = 0.0
+        self._lock = threading.RLock()
+        self._headers: Dict[Path, Dict[str, Any]] = {}
+        self._columns: "OrderedDict[Tuple[Path, str], Tuple[List[int], List[float]]]" = OrderedDict()
+
+        if not readonly:
+            self.directory.mkdir(exist_ok=True, parents=True)
+            if not self._acquire_writer_lock():
+                logger.error(f"Archivio {self.directory} già aperto in scrittura da un altro scrittore: "
+                             f"aperto in sola lettura")
+                self.readonly = True
+        self._load()
+
+    def _acquire_writer_lock(self) -> bool:
+        """
+        Prende il lock esclusivo riservato all'unico scrittore della directory.
+
+        Returns:
+            True se il lock è stato ottenuto (o non è supportato dal sistema)
+        """
+        if fcntl is None:
+            return True
+        lock_file = open(self.directory / LOCK_FILE, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _load(self):
+        """Carica tabella delle serie, elenco dei segmenti ed eventuale segmento attivo."""
+        self._load_meta()
+        self._load_series()
+        self.segments, self.rollups, heads = self._scan()
+
+        # Normalmente c'è un solo segmento attivo; quelli precedenti derivano da
+        # un'interruzione durante la sigillatura e vengono sigillati subito
+        for start in heads:
+            if self.head_start is not None and not self.readonly:
+                self.seal()
+            self.head_start = start
+            self.head_points = {}
+            self.head_offset = 0
+            self._read_head()
+
+    def _scan(self) -> Tuple[List[int], List[int], List[int]]:
+        """Elenca gli inizi di segmenti grezzi, rollup e segmenti attivi presenti su disco."""
+        segments, rollups, heads = [], [], []
+        if not self.directory.exists():
+            return segments, rollups, heads
+
+        for entry in os.scandir(self.directory):
+            name = entry.name
+            try:
+                if name.startswith("seg_") and name.endswith(".tsdb"):
+                    segments.append(int(name[4:-5]))
+                elif name.startswith("rollup_") and name.endswith(".tsdb"):
+                    rollups.append(int(name[7:-5]))
+                elif name.startswith("head_") and name.endswith(".log"):
+                    heads.append(int(name[5:-4]))
+            except ValueError:
+                logger.warning(f"File inatteso nell'archivio serie temporali: {name}")
+        return sorted(segments), sorted(rollups), sorted(heads)
+
+    def _load_meta(self):
+        """
+        Legge la durata dei segmenti con cui è stato creato l'archivio, che prevale
+        sul parametro passato per non disallineare i segmenti già scritti.
+        """
+        path = self.directory / "meta.json"
+        try:
+            with open(path, 'r') as f:
+                segment_seconds = int(json.load(f)["segment_seconds"])
+        except FileNotFoundError:
+            if not self.readonly:
+                with open(path, 'w') as f:
+                    json.dump({"segment_seconds": self.segment_seconds}, f)
+            return
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Errore nella lettura dei metadati dell'archivio: {e}")
+            return
+
+        if segment_seconds != self.segment_seconds:
+            if not self.readonly:
+                logger.warning(f"Durata dei segmenti dell'archivio esistente: {segment_seconds}s "
+                               f"(ignorato il valore configurato di {self.segment_seconds}s)")
+            self.segment_seconds = segment_seconds
+
+    def _load_series(self):
+        path = self.directory / "series.json"
+        try:
+            mtime = path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._series_mtime:
+            return
+        try:
+            with open(path, 'r') as f:
+                self.series = json.load(f)
+            self._series_mtime = mtime
+        except (OSError, ValueError) as e:
+            logger.error(f"Errore nel caricamento della tabella delle serie: {e}")
+
+    def _save_series(self):
+        path = self.directory / "series.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self.series, f)
+        os.replace(tmp_path, path)
+        self._series_mtime = path.stat().st_mtime
+
+    def _head_path(self, start: int) -> Path:
+        return self.directory / f"head_{start}.log"
+
+    def _segment_path(self, start: int) -> Path:
+        return self.directory / f"seg_{start}.tsdb"
+
+    def _rollup_path(self, start: int) -> Path:
+        return self.directory / f"rollup_{start}.tsdb"
+
+    def _read_head(self):
+        """Legge i record del segmento attivo a partire dall'ultimo offset letto."""
+        path = self._head_path(self.head_start)
+        try:
+            with open(path, 'rb') as f:
+                f.seek(self.head_offset)
+                data = f.read()
+        except FileNotFoundError:
+            return
+
+        complete = len(data) - len(data) % HEAD_RECORD.size
+        if complete:
+            names = {series_id: name for name, series_id in self.series.items()}
+            if any(series_id not in names for series_id, _, _ in HEAD_RECORD.iter_unpack(data[:complete])):
+                self._load_series()
+                names = {series_id: name for name, series_id in self.series.items()}
+            for series_id, timestamp, value in HEAD_RECORD.iter_unpack(data[:complete]):
+                name = names.get(series_id)
+                if name is None:
+                    continue
+                column = self.head_points.setdefault(name, ([], []))
+                column[0].append(timestamp)
+                column[1].append(value)
+        self.head_offset += complete
+
+        # Un record troncato può restare solo dopo un'interruzione: il writer lo scarta
+        if complete != len(data) and not self.readonly:
+            logger.warning(f"Record incompleto scartato da {path}")
+            with open(path, 'r+b') as f:
+                f.truncate(self.head_offset)
+
+    def _segment_start(self, timestamp: float) -> int:
+        return int(timestamp // self.segment_seconds) * self.segment_seconds
+
+    def _series_id(self, name: str) -> int:
+        series_id = self.series.get(name)
+        if series_id is None:
+            series_id = len(self.series)
+            self.series[name] = series_id
+            self._save_series()
+        return series_id
+
+    def append(self, name: str, value: float, timestamp: Optional[float] = None) -> bool:
+        """
+        Aggiunge un punto a una serie.
+
+        Args:
+            name: Nome della serie
+            value: Valore
+            timestamp: Timestamp in secondi (default: ora corrente)
+
+        Returns:
+            True se il punto è stato scritto
+        """
+        return self.append_many({name: value}, timestamp)
+
+    def append_many(self, values: Dict[str, float], timestamp: Optional[float] = None) -> bool:
+        """
+        Aggiunge un punto per ciascuna serie con lo stesso timestamp.
+
+        Args:
+            values: Valori per nome di serie
+            timestamp: Timestamp in secondi (default: ora corrente)
+
+        Returns:
+            True se i punti sono stati scritti
+        """
+        if self.readonly:
+            logger.error("Archivio serie temporali aperto in sola lettura")
+            return False
+        if not values:
+            return True
+        if timestamp is None:
+            timestamp = time.time()
+
+        start = self._segment_start(timestamp)
+        if self.head_start is not None and start > self.head_start:
+            self.seal()
+        elif self.head_start is not None and start < self.head_start:
+            # Punti in ritardo rispetto al segmento attivo: vanno nel segmento sigillato
+            return self.backfill([(timestamp, values)])
+        if self.head_start is None:
+            self.head_start = start
+            self.head_points = {}
+            self.head_offset = 0
+
+        timestamp_ms = int(timestamp * 1000)
+        records = bytearray()
+        for name, value in values.items():
+            value = float(value)
+            records += HEAD_RECORD.pack(self._series_id(name), timestamp_ms, value)
+            column = self.head_points.setdefault(name, ([], []))
+            column[0].append(timestamp_ms)
+            column[1].append(value)
+
+        if self.head_file is None:
+            self.head_file = open(self._head_path(self.head_start), 'ab')
+        self.head_file.write(records)
+        self.head_file.flush()
+        self.head_offset += len(records)
+        return True
+
+    def backfill(self, points: Iterable[Tuple[float, Dict[str, float]]]) -> bool:
+        """
+        Inserisce punti storici, anche precedenti al segmento attivo.
+
+        Args:
+            points: Sequenza di (timestamp, valori per nome di serie)
+
+        Returns:
+            True se i punti sono stati scritti
+        """
+        if self.readonly:
+            logger.error("Archivio serie temporali aperto in sola lettura")
+            return False
+
+        by_segment: Dict[int, Dict[str, Tuple[List[int], List[float]]]] = {}
+        head_points = []
+        for timestamp, values in points:
+            start = self._segment_start(timestamp)
+            if self.head_start is not None and start >= self.head_start:
+                head_points.append((timestamp, values))
+                continue
+            columns = by_segment.setdefault(start, {})
+            for name, value in values.items():
+                self._series_id(name)
+                column = columns.setdefault(name, ([], []))
+                column[0].append(int(timestamp * 1000))
+                column[1].append(float(value))
+
+        for start, columns in by_segment.items():
+            path = self._segment_path(start)
+            if start in self.segments:
+                for name in self._read_header(path)["columns"]:
+                    existing = self._read_column(path, name)
+                    column = columns.setdefault(name, ([], []))
+                    column[0].extend(existing[0])
+                    column[1].extend(existing[1])
+            self._write_segment(path, start, columns)
+            if start not in self.segments:
+                bisect.insort(self.segments, start)
+
+        for timestamp, values in sorted(head_points, key=lambda point: point[0]):
+            self.append_many(values, timestamp)
+        return True
+
+    def _write_segment(self, path: Path, start: int, columns: Dict[str, Tuple[List[int], List[float]]]):
+        """Scrive atomicamente un segmento sigillato."""
+        header = {"start": start, "columns": {}}
+        blobs = []
+        offset = 0
+        for name, (timestamps, values) in columns.items():
+            if not timestamps:
+                continue
+            # I punti sono quasi sempre già ordinati; l'ordinamento è stabile ed economico
+            if any(timestamps[i] > timestamps[i + 1] for i in range(len(timestamps) - 1)):
+                order = sorted(range(len(timestamps)), key=timestamps.__getitem__)
+                timestamps = [timestamps[i] for i in order]
+                values = [values[i] for i in order]
+            blob = encode_column(timestamps, values)
+            header["columns"][name] = [offset, len(blob), len(timestamps), timestamps[0], timestamps[-1]]
+            blobs.append(blob)
+            offset += len(blob)
+
+        encoded_header = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(SEGMENT_MAGIC)
+            f.write(struct.pack('<I', len(encoded_header)))
+            f.write(encoded_header)
+            for blob in blobs:
+                f.write(blob)
+        os.replace(tmp_path, path)
+        self._forget(path)
+
+    def seal(self):
+        """Sigilla il segmento attivo scrivendolo in forma compressa."""
+        if self.readonly or self.head_start is None:
+            return
+
+        if self.head_file:
+            self.head_file.close()
+            self.head_file = None
+
+        if self.head_points:
+            path = self._segment_path(self.head_start)
+            columns = self.head_points
+            if self.head_start in self.segments:
+                # Un segmento con lo stesso inizio esiste già (backfill): unisce i punti
+                for name in self._read_header(path)["columns"]:
+                    existing = self._read_column(path, name)
+                    column = columns.setdefault(name, ([], []))
+                    column[0][:0] = existing[0]
+                    column[1][:0] = existing[1]
+            self._write_segment(path, self.head_start, columns)
+            if self.head_start not in self.segments:
+                bisect.insort(self.segments, self.head_start)
+
+        try:
+            self._head_path(self.head_start).unlink()
+        except FileNotFoundError:
+            pass
+
+        logger.debug(f"Segmento {self.head_start} sigillato")
+        self.head_start = None
+        self.head_points = {}
+        self.head_offset = 0
+
+    def maintain(self, now: Optional[float] = None) -> Dict[str, int]:
+        """
+        Sigilla il segmento scaduto, riduce in rollup i segmenti grezzi vecchi ed
+        elimina i rollup oltre la retention.
+
+        Args:
+            now: Istante di riferimento (default: ora corrente)
+
+        Returns:
+            Conteggio dei segmenti sigillati, ridotti ed eliminati
+        """
+        stats = {"sealed": 0, "rolled_up": 0, "deleted": 0}
+        if self.readonly:
+            return stats
+        if now is None:
+            now = time.time()
+
+        if self.head_start is not None and self._segment_start(now) > self.head_start:
+            self.seal()
+            stats["sealed"] += 1
+
+        raw_cutoff = now - self.raw_retention
+        while self.segments and self.segments[0] + self.segment_seconds <= raw_cutoff:
+            start = self.segments.pop(0)
+            try:
+                self._rollup_segment(start)
+                stats["rolled_up"] += 1
+            except Exception as e:
+                logger.error(f"Errore nel rollup del segmento {start}: {e}")
+                bisect.insort(self.segments, start)
+                break
+
+        cutoff = now - self.retention
+        while self.rollups and self.rollups[0] + self.segment_seconds <= cutoff:
+            start = self.rollups.pop(0)
+            path = self._rollup_path(start)
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            self._forget(path)
+            stats["deleted"] += 1
+
+        return stats
+
+    def _rollup_segment(self, start: int):
+        """Sostituisce un segmento grezzo con i suoi aggregati per intervallo di rollup."""
+        path = self._segment_path(start)
+        resolution = self.rollup_seconds * 1000
+        columns = {}
+
+        for name in self._read_header(path)["columns"]:
+            timestamps, values = self._read_column(path, name)
+            buckets: "OrderedDict[int, List[float]]" = OrderedDict()
+            for timestamp, value in zip(timestamps, values):
+                bucket = timestamp - timestamp % resolution
+                aggregate = buckets.get(bucket)
+                if aggregate is None:
+                    buckets[bucket] = [value, 1, value, value]
+                else:
+                    aggregate[0] += value
+                    aggregate[1] += 1
+                    if value < aggregate[2]:
+                        aggregate[2] = value
+                    if value > aggregate[3]:
+                        aggregate[3] = value
+
+            bucket_times = list(buckets)
+            columns[f"{name}|avg"] = (bucket_times, [total / count for total, count, _, _ in buckets.values()])
+            columns[f"{name}|min"] = (bucket_times, [low for _, _, low, _ in buckets.values()])
+            columns[f"{name}|max"] = (bucket_times, [high for _, _, _, high in buckets.values()])
+
+        self._write_segment(self._rollup_path(start), start, columns)
+        bisect.insort(self.rollups, start)
+        path.unlink()
+        self._forget(path)
+
+    def close(self):
+        """Chiude il file del segmento attivo e rilascia il lock di scrittura."""
+        if self.head_file:
+            self.head_file.close()
+            self.head_file = None
+        if self._lock_file:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _forget(self, path: Path):
+        """Rimuove dalla cache intestazione e colonne di un segmento riscritto o eliminato."""
+        self._headers.pop(path, None)
+        for key in [key for key in self._columns if key[0] == path]:
+            del self._columns[key]
+
+    def _read_header(self, path: Path) -> Dict[str, Any]:
+        header = self._headers.get(path)
+        if header is None:
+            with open(path, 'rb') as f:
+                if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+                    raise ValueError(f"Segmento non valido: {path}")
+                length = struct.unpack('<I', f.read(4))[0]
+                header = json.loads(f.read(length))
+            header["data_offset"] = len(SEGMENT_MAGIC) + 4 + length
+            self._headers[path] = header
+        return header
+
+    def _read_column(self, path: Path, name: str) -> Tuple[List[int], List[float]]:
+        key = (path, name)
+        column = self._columns.get(key)
+        if column is not None:
+            self._columns.move_to_end(key)
+            return column
+
+        header = self._read_header(path)
+        entry = header["columns"].get(name)
+        if entry is None:
+            return [], []
+        offset, length = entry[0], entry[1]
+        with open(path, 'rb') as f:
+            f.seek(header["data_offset"] + offset)
+            column = decode_column(f.read(length))
+
+        self._columns[key] = column
+        if len(self._columns) > COLUMN_CACHE_SIZE:
+            self._columns.popitem(last=False)
+        return column
+
+    def refresh(self):
+        """
+        Aggiorna la vista di un archivio in sola lettura con i dati scritti da un
+        altro processo. Nel processo che scrive non ha effetto.
+        """
+        if not self.readonly:
+            return
+
+        self._load_series()
+        segments, rollups, heads = self._scan()
+
+        # Si invalida la cache dei segmenti rimossi o riscritti (sigillatura, backfill)
+        for start in set(self.segments) - set(segments):
+            self._forget(self._segment_path(start))
+        for start in set(self.rollups) - set(rollups):
+            self._forget(self._rollup_path(start))
+        if self.head_start is not None and self.head_start in segments:
+            self._forget(self._segment_path(self.head_start))
+        self.segments = segments
+        self.rollups = rollups
+
+        head_start = max(heads) if heads else None
+        if head_start != self.head_start:
+            self.head_start = head_start
+            self.head_points = {}
+            self.head_offset = 0
+        if self.head_start is not None:
+            self._read_head()
+
+    def list_metrics(self) -> List[str]:
+        """Restituisce i nomi delle serie presenti nell'archivio."""
+        with self._lock:
+            self.refresh()
+            return sorted(self.series)
+
+    def query(self, name: str, start: Optional[float] = None, end: Optional[float] = None,
+              step: Optional[float] = None, aggregate: str = "avg") -> List[Tuple[float, float]]:
+        """
+        Restituisce i punti di una serie in un intervallo di tempo.
+
+        I periodi più vecchi della conservazione dei dati grezzi sono serviti dai rollup.
+
+        Args:
+            name: Nome della serie
+            start: Inizio dell'intervallo in secondi (default: un'ora fa)
+            end: Fine dell'intervallo in secondi (default: ora corrente)
+            step: Se indicato, aggrega i punti in intervalli di step secondi
+            aggregate: Aggregato usato per rollup e step: avg, min o max
+
+        Returns:
+            Lista di tuple (timestamp in secondi, valore)
+        """
+        if aggregate not in ROLLUP_AGGREGATES:
+            raise ValueError(f"Aggregato non supportato: {aggregate}")
+
+        with self._lock:
+            self.refresh()
+            return self._query(name, start, end, step, aggregate)
+
+    def _query(self, name: str, start: Optional[float], end: Optional[float],
+               step: Optional[float], aggregate: str) -> List[Tuple[float, float]]:
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - 3600
+        start_ms = int(start * 1000)
+        end_ms = int(end * 1000)
+        first_segment = self._segment_start(start)
+
+        timestamps: List[int] = []
+        values: List[float] = []
+
+        def collect(column: Tuple[List[int], List[float]]):
+            column_times, column_values = column
+            low = bisect.bisect_left(column_times, start_ms)
+            high = bisect.bisect_right(column_times, end_ms)
+            timestamps.extend(column_times[low:high])
+            values.extend(column_values[low:high])
+
+        raw_segments = set(self.segments)
+        for segment in self.rollups[bisect.bisect_left(self.rollups, first_segment):]:
+            if segment > end:
+                break
+            if segment not in raw_segments:
+                collect(self._read_column(self._rollup_path(segment), f"{name}|{aggregate}"))
+
+        for segment in self.segments[bisect.bisect_left(self.segments, first_segment):]:
+            if segment > end:
+                break
+            collect(self._read_column(self._segment_path(segment), name))
+
+        if self.head_start is not None and self.head_start <= end and name in self.head_points:
+            collect(self.head_points[name])
+
+        points = [(timestamp / 1000, value) for timestamp, value in zip(timestamps, values)]
+        if step:
+            points = self._downsample(points, step, aggregate)
+        return points
+
+    def query_many(self, names: Iterable[str], start: Optional[float] = None, end: Optional[float] = None,
+                   step: Optional[float] = None, aggregate: str = "avg") -> Dict[str, List[Tuple[float, float]]]:
+        """
+        Restituisce i punti di più serie nello stesso intervallo.
+
+        Args:
+            names: Nomi delle serie
+            start: Inizio dell'intervallo in secondi
+            end: Fine dell'intervallo in secondi
+            step: Intervallo di aggregazione opzionale in secondi
+            aggregate: Aggregato usato per rollup e step
+
+        Returns:
+            Dizionario nome serie -> lista di tuple (timestamp, valore)
+        """
+        if end is None:
+            end = time.time()
+        if start is None:
+            start = end - 3600
+        return {name: self.query(name, start, end, step, aggregate) for name in names}
+
+    @staticmethod
+    def _downsample(points: List[Tuple[float, float]], step: float,
+                    aggregate: str) -> List[Tuple[float, float]]:
+        """Aggrega i punti in intervalli allineati di step secondi."""
+        result = []
+        bucket = None
+        bucket_values: List[float] = []
+
+        def flush():
+            if aggregate == "min":
+                result.append((bucket, min(bucket_values)))
+            elif aggregate == "max":
+                result.append((bucket, max(bucket_values)))
+            else:
+                result.append((bucket, sum(bucket_values) / len(bucket_values)))
+
+        for timestamp, value in points:
+            current = timestamp - timestamp % step
+            if current != bucket:
+                if bucket_values:
+                    flush()
+                bucket = current
+                bucket_values = []
+            bucket_values.append(value)
+        if bucket_values:
+            flush()
+        return result
+
+
+def import_json_exports(store: TimeSeriesStore, directory: Union[str, Path]) -> int:
+    """
+    Importa nell'archivio i vecchi file metrics_<timestamp>.json.
+
+    I file importati non vengono eliminati: sono rinominati in
+    metrics_<timestamp>.json.imported, così restano disponibili e non vengono
+    importati di nuovo all'avvio successivo.
+
+    Args:
+        store: Archivio di destinazione
+        directory: Directory contenente le esportazioni JSON
+
+    Returns:
+        Numero di file importati
+    """
+    points = []
+    imported = []
+    for path in sorted(Path(directory).glob("metrics_*.json")):
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            values = flatten_metric_values({
+                name: metric.get("value") for name, metric in data.get("metrics", {}).items()
+            })
+            points.append((data.get("timestamp", path.stat().st_mtime), values))
+            imported.append(path)
+        except Exception as e:
+            logger.error(f"Errore nell'importazione di {path}: {e}")
+
+    if not imported:
+        return 0
+
+    if not store.backfill(points):
+        logger.error("Importazione delle esportazioni JSON non riuscita: i file restano invariati")
+        return 0
+    for path in imported:
+        path.rename(path.with_name(path.name + ".imported"))
+    logger.info(f"Importate {len(imported)} esportazioni JSON nell'archivio serie temporali")
+    return len(imported)
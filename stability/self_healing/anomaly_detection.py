@@ -15,14 +15,14 @@ Funzionalità:
 
 import os
 import json
+import math
 import time
 import logging
 import asyncio
 import numpy as np
+from collections import deque
 from typing import Dict, List, Any, Optional, Tuple, Union
 from datetime import datetime, timedelta
-from collections import deque
-from dataclasses import dataclass, field
 
 # Configurazione logging
 logging.basicConfig(
@@ -31,44 +31,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger('m4bot.stability.anomaly_detection')
 
-@dataclass
-class MetricSeries:
-    """Serie temporale di una metrica con statistiche."""
-    name: str
-    values: deque = field(default_factory=lambda: deque(maxlen=1000))
-    timestamps: deque = field(default_factory=lambda: deque(maxlen=1000))
-    mean: float = 0.0
-    std_dev: float = 0.0
-    min_value: float = float('inf')
-    max_value: float = float('-inf')
-    last_update: float = field(default_factory=time.time)
+# Decadimento massimo accumulabile in un blocco vettoriale prima di rischiare overflow
+_MAX_DECAY_EXPONENT = 150.0
+
+# Numero massimo di anomalie e di gruppi di anomalie conservati in memoria
+MAX_ANOMALY_HISTORY = 1000
+
+
+def _decay_path(start: float, decay: float, inputs: np.ndarray) -> np.ndarray:
+    """
+    Risolve in forma vettoriale la ricorrenza s_i = decay * s_(i-1) + inputs_i.
     
-    def add_value(self, value: float, timestamp: Optional[float] = None):
-        """Aggiunge un valore alla serie e aggiorna le statistiche."""
-        if timestamp is None:
-            timestamp = time.time()
-        
-        self.values.append(value)
-        self.timestamps.append(timestamp)
-        self.last_update = timestamp
-        
-        # Aggiorna min e max
-        self.min_value = min(self.min_value, value)
-        self.max_value = max(self.max_value, value)
+    Il calcolo procede a blocchi per evitare che le potenze di decay vadano in overflow.
+    
+    Args:
+        start: Valore iniziale s_(-1)
+        decay: Fattore di decadimento in (0, 1)
+        inputs: Ingressi della ricorrenza
         
-        # Aggiorna statistiche solo se abbiamo abbastanza dati
-        if len(self.values) > 1:
-            self._update_statistics()
+    Returns:
+        Array con tutti gli stati s_i
+    """
+    result = np.empty(len(inputs), dtype=np.float64)
+    block = max(1, min(256, int(_MAX_DECAY_EXPONENT / max(-np.log10(decay), 1e-12))))
+    powers = decay ** np.arange(block, dtype=np.float64)
+    
+    for offset in range(0, len(inputs), block):
+        chunk = inputs[offset:offset + block]
+        size = len(chunk)
+        scaled = np.cumsum(chunk / powers[:size])
+        result[offset:offset + size] = powers[:size] * (decay * start + scaled)
+        start = result[offset + size - 1]
+    
+    return result
+
+
+class _SeriesAnalysis:
+    """
+    Analisi comuni alle serie di metriche.
     
-    def _update_statistics(self):
-        """Aggiorna le statistiche della serie."""
-        values_array = np.array(self.values)
-        self.mean = np.mean(values_array)
-        self.std_dev = np.std(values_array)
+    Richiede gli attributi count, mean, std_dev e last_value e il metodo _recent().
+    """
     
     def is_anomaly(self, value: float, z_threshold: float = 3.0) -> bool:
         """Determina se un valore è anomalo usando lo Z-score."""
-        if len(self.values) < 10:  # Serve un minimo di dati per un rilevamento affidabile
+        if self.count < 10:  # Serve un minimo di dati per un rilevamento affidabile
             return False
             
         z_score = abs(value - self.mean) / max(self.std_dev, 0.0001)  # Evita divisione per zero
@@ -76,33 +83,414 @@ class MetricSeries:
     
     def recent_trend(self, window: int = 10) -> float:
         """Calcola il trend recente (positivo = crescente, negativo = decrescente)."""
-        if len(self.values) < window:
+        if self.count < window or window < 2:
             return 0.0
+        
+        # Pendenza della retta dei minimi quadrati, per campione
+        _, y = self._recent(window)
+        x = np.arange(window, dtype=np.float64)
+        x -= x.mean()
+        return float(np.dot(x, y - y.mean()) / np.dot(x, x))
+    
+    def linear_fit(self, window: int = 30) -> Optional[Tuple[float, float, float, np.ndarray]]:
+        """
+        Stima una retta ai minimi quadrati sugli ultimi campioni in funzione del tempo.
+        
+        Args:
+            window: Numero di campioni recenti da considerare
             
-        recent_values = list(self.values)[-window:]
-        if len(recent_values) < 2:
-            return 0.0
+        Returns:
+            Tupla (pendenza al secondo, valore stimato all'ultimo timestamp,
+            deviazione standard dei residui, ascisse centrate) o None se i dati non bastano
+        """
+        if self.count < 3:
+            return None
+        
+        t, y = self._recent(window)
+        x = t - t.mean()
+        sxx = float(np.dot(x, x))
+        if sxx == 0.0:
+            return None
+        
+        slope = float(np.dot(x, y - y.mean()) / sxx)
+        intercept = float(y.mean())
+        residuals = y - (intercept + slope * x)
+        residual_std = float(np.sqrt(np.dot(residuals, residuals) / (len(y) - 2)))
+        return slope, intercept + slope * x[-1], residual_std, x
+    
+    def forecast(self, time_ahead: float, window: int = 30) -> Tuple[float, float]:
+        """
+        Prevede il valore della metrica tra time_ahead secondi.
+        
+        Args:
+            time_ahead: Secondi nel futuro per la previsione
+            window: Numero di campioni recenti da considerare
             
-        # Calcola pendenza della linea di regressione
-        x = np.arange(len(recent_values))
-        y = np.array(recent_values)
+        Returns:
+            Tupla (valore_previsto, semiampiezza dell'intervallo di previsione al 95%)
+        """
+        fit = self.linear_fit(window)
+        if fit is None:
+            return (self.last_value or 0.0, self.std_dev * 1.96)
+        
+        slope, last_fitted, residual_std, x = fit
+        x0 = x[-1] + time_ahead
+        predicted_value = last_fitted + slope * time_ahead
+        
+        # Errore standard della previsione di un nuovo punto
+        spread = np.sqrt(1 + 1 / len(x) + x0 * x0 / float(np.dot(x, x)))
+        return (float(predicted_value), 1.96 * residual_std * float(spread))
+
+
+class MetricMatrix:
+    """
+    Archivio colonnare di tutte le serie di metriche.
+    
+    Ogni metrica occupa una riga di un buffer 2D NumPy (metriche × finestra) con
+    un proprio puntatore circolare; statistiche della finestra (Welford), EWMA e
+    baseline stagionali sono tenute in array paralleli, così un tick di raccolta
+    aggiorna e valuta tutte le metriche in un'unica passata vettoriale.
+    """
+    
+    def __init__(self, capacity: int = 1000, ewma_alpha: float = 0.1,
+                 season_period: int = 86400, season_slots: int = 24,
+                 season_alpha: float = 0.2, initial_rows: int = 32):
+        """
+        Inizializza l'archivio.
+        
+        Args:
+            capacity: Campioni conservati per ogni metrica
+            ewma_alpha: Fattore di smoothing della media esponenziale
+            season_period: Durata del ciclo stagionale in secondi
+            season_slots: Numero di fasce in cui è diviso il ciclo
+            season_alpha: Fattore di smoothing delle baseline stagionali
+            initial_rows: Righe preallocate
+        """
+        self.capacity = capacity
+        self.ewma_alpha = ewma_alpha
+        self.season_period = season_period
+        self.season_slots = season_slots
+        self.season_alpha = season_alpha
+        
+        self.rows: Dict[str, int] = {}
+        self.names: List[str] = []
+        self._allocate(initial_rows)
+    
+    def _allocate(self, rows: int):
+        """Alloca (o ingrandisce) gli array per contenere almeno rows righe."""
+        layout = {
+            "values": ((self.capacity,), 0.0, np.float64),
+            "timestamps": ((self.capacity,), 0.0, np.float64),
+            "heads": ((), 0, np.int64),
+            "counts": ((), 0, np.int64),
+            "mean": ((), 0.0, np.float64),
+            "m2": ((), 0.0, np.float64),
+            "std_dev": ((), 0.0, np.float64),
+            "ewma": ((), 0.0, np.float64),
+            "ewma_var": ((), 0.0, np.float64),
+            "min_value": ((), float('inf'), np.float64),
+            "max_value": ((), float('-inf'), np.float64),
+            "last_update": ((), 0.0, np.float64),
+            "updates_since_resync": ((), 0, np.int64),
+            "season_mean": ((self.season_slots,), 0.0, np.float64),
+            "season_var": ((self.season_slots,), 0.0, np.float64),
+            "season_count": ((self.season_slots,), 0, np.int64),
+        }
+        for attr, (shape, fill, dtype) in layout.items():
+            array = np.full((rows,) + shape, fill, dtype=dtype)
+            current = getattr(self, attr, None)
+            if current is not None:
+                array[:len(current)] = current
+            setattr(self, attr, array)
+    
+    def register(self, name: str) -> int:
+        """
+        Registra una metrica e restituisce l'indice della sua riga.
+        
+        Args:
+            name: Nome della metrica
+            
+        Returns:
+            Indice di riga
+        """
+        row = self.rows.get(name)
+        if row is None:
+            row = len(self.names)
+            if row == len(self.values):
+                self._allocate(row * 2)
+            self.rows[name] = row
+            self.names.append(name)
+        return row
+    
+    def season_slot(self, timestamp: float) -> int:
+        """Restituisce la fascia stagionale di un timestamp."""
+        return int((timestamp % self.season_period) * self.season_slots // self.season_period)
+    
+    def score(self, rows: np.ndarray, values: np.ndarray, timestamp: float) -> Dict[str, np.ndarray]:
+        """
+        Valuta un tick di valori rispetto allo stato attuale delle righe.
+        
+        Args:
+            rows: Indici di riga (senza duplicati)
+            values: Valori corrispondenti
+            timestamp: Timestamp del tick
+            
+        Returns:
+            Dizionario con z-score della finestra, deviazione dalla EWMA,
+            z-score stagionale (NaN se la baseline non è pronta), conteggi,
+            media e deviazione standard della finestra
+        """
+        slot = self.season_slot(timestamp)
+        z_window = np.abs(values - self.mean[rows]) / np.maximum(self.std_dev[rows], 0.0001)
+        z_ewma = np.abs(values - self.ewma[rows]) / np.maximum(np.sqrt(self.ewma_var[rows]), 0.0001)
+        season_ready = self.season_count[rows, slot] >= 3
+        z_season = np.where(
+            season_ready,
+            np.abs(values - self.season_mean[rows, slot]) / np.maximum(np.sqrt(self.season_var[rows, slot]), 0.0001),
+            np.nan
+        )
+        return {
+            "z_window": z_window,
+            "z_ewma": z_ewma,
+            "z_season": z_season,
+            "counts": self.counts[rows],
+            "mean": self.mean[rows],
+            "std_dev": self.std_dev[rows]
+        }
+    
+    def append(self, rows: np.ndarray, values: np.ndarray, timestamp: float):
+        """
+        Aggiunge un valore a ciascuna delle righe indicate in un'unica passata.
+        
+        Args:
+            rows: Indici di riga (senza duplicati)
+            values: Valori corrispondenti
+            timestamp: Timestamp del tick
+        """
+        heads = self.heads[rows]
+        counts = self.counts[rows]
+        mean = self.mean[rows]
+        m2 = self.m2[rows]
+        old = self.values[rows, heads]
+        
+        # Welford: sostituzione del valore più vecchio a finestra piena, aggiunta altrimenti
+        full = counts == self.capacity
+        new_counts = np.where(full, counts, counts + 1)
+        new_mean = mean + np.where(full, values - old, values - mean) / new_counts
+        m2 += np.where(full,
+                       (values - old) * (values - new_mean + old - mean),
+                       (values - mean) * (values - new_mean))
+        
+        # EWMA: la prima osservazione inizializza lo stato
+        first = counts == 0
+        ewma = self.ewma[rows]
+        diff = values - ewma
+        self.ewma[rows] = np.where(first, values, ewma + self.ewma_alpha * diff)
+        self.ewma_var[rows] = np.where(
+            first, 0.0,
+            (1 - self.ewma_alpha) * (self.ewma_var[rows] + self.ewma_alpha * diff * diff)
+        )
+        
+        # Baseline stagionale (EWMA per fascia)
+        slot = self.season_slot(timestamp)
+        season_mean = self.season_mean[rows, slot]
+        season_first = self.season_count[rows, slot] == 0
+        season_diff = values - season_mean
+        self.season_mean[rows, slot] = np.where(season_first, values, season_mean + self.season_alpha * season_diff)
+        self.season_var[rows, slot] = np.where(
+            season_first, 0.0,
+            (1 - self.season_alpha) * (self.season_var[rows, slot] + self.season_alpha * season_diff * season_diff)
+        )
+        self.season_count[rows, slot] += 1
+        
+        self.values[rows, heads] = values
+        self.timestamps[rows, heads] = timestamp
+        self.heads[rows] = (heads + 1) % self.capacity
+        self.counts[rows] = new_counts
+        self.mean[rows] = new_mean
+        self.m2[rows] = m2
+        self.min_value[rows] = np.minimum(self.min_value[rows], values)
+        self.max_value[rows] = np.maximum(self.max_value[rows], values)
+        self.last_update[rows] = timestamp
+        self.std_dev[rows] = np.sqrt(np.maximum(m2, 0.0) / new_counts)
+        
+        # Ricalcolo esatto periodico per limitare la deriva numerica
+        self.updates_since_resync[rows] += 1
+        stale = rows[self.updates_since_resync[rows] >= self.capacity]
+        if len(stale):
+            self._resync(stale)
+    
+    def extend_row(self, row: int, values: np.ndarray, timestamps: np.ndarray):
+        """
+        Aggiunge un blocco di valori a una singola riga.
+        
+        Args:
+            row: Indice di riga
+            values: Valori in ordine cronologico
+            timestamps: Timestamp corrispondenti
+        """
+        size = len(values)
+        if size == 0:
+            return
+        
+        # EWMA in forma vettoriale
+        ewma_values = values
+        if self.counts[row] == 0:
+            self.ewma[row] = values[0]
+            self.ewma_var[row] = 0.0
+            ewma_values = values[1:]
+        if len(ewma_values):
+            decay = 1 - self.ewma_alpha
+            path = _decay_path(self.ewma[row], decay, self.ewma_alpha * ewma_values)
+            diff = ewma_values - np.concatenate(([self.ewma[row]], path[:-1]))
+            var_path = _decay_path(self.ewma_var[row], decay, decay * self.ewma_alpha * diff * diff)
+            self.ewma[row] = path[-1]
+            self.ewma_var[row] = var_path[-1]
+        
+        # Baseline stagionali, campione per campione (blocchi rari: importazioni)
+        for value, timestamp in zip(values.tolist(), timestamps.tolist()):
+            slot = self.season_slot(timestamp)
+            if self.season_count[row, slot] == 0:
+                self.season_mean[row, slot] = value
+            else:
+                season_diff = value - self.season_mean[row, slot]
+                self.season_mean[row, slot] += self.season_alpha * season_diff
+                self.season_var[row, slot] = (1 - self.season_alpha) * (
+                    self.season_var[row, slot] + self.season_alpha * season_diff * season_diff)
+            self.season_count[row, slot] += 1
+        
+        # Minimo e massimo su tutto il blocco, anche sui valori che non entrano nella finestra
+        self.min_value[row] = min(self.min_value[row], values.min())
+        self.max_value[row] = max(self.max_value[row], values.max())
+        
+        if size > self.capacity:
+            values = values[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+            size = self.capacity
+        positions = (self.heads[row] + np.arange(size)) % self.capacity
+        self.values[row, positions] = values
+        self.timestamps[row, positions] = timestamps
+        self.heads[row] = (self.heads[row] + size) % self.capacity
+        self.counts[row] = min(self.counts[row] + size, self.capacity)
+        self.last_update[row] = timestamps[-1]
+        self._resync(np.array([row]))
+    
+    def _resync(self, rows: np.ndarray):
+        """Ricalcola esattamente media e varianza della finestra per le righe indicate."""
+        for row in rows.tolist():
+            window = self.values[row, :self.counts[row]]
+            self.mean[row] = window.mean()
+            self.m2[row] = np.sum((window - self.mean[row]) ** 2)
+            self.std_dev[row] = np.sqrt(self.m2[row] / self.counts[row])
+        self.updates_since_resync[rows] = 0
+    
+    def recent(self, rows: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Restituisce gli ultimi window campioni delle righe indicate.
         
-        # Stima della pendenza (può essere migliorata con regressione lineare)
-        return (y[-1] - y[0]) / max(len(y) - 1, 1)
+        Args:
+            rows: Indici di riga
+            window: Numero di campioni
+            
+        Returns:
+            Tupla (timestamp, valori) di forma (righe, window) in ordine cronologico
+        """
+        indices = (self.heads[rows][:, None] - window + np.arange(window)) % self.capacity
+        return (np.take_along_axis(self.timestamps[rows], indices, axis=1),
+                np.take_along_axis(self.values[rows], indices, axis=1))
+
+
+class MetricRow(_SeriesAnalysis):
+    """Vista su una singola riga di MetricMatrix, con le analisi di _SeriesAnalysis."""
+    
+    def __init__(self, matrix: MetricMatrix, name: str):
+        self.matrix = matrix
+        self.name = name
+        self.row = matrix.register(name)
+    
+    @property
+    def count(self) -> int:
+        return int(self.matrix.counts[self.row])
+    
+    @property
+    def mean(self) -> float:
+        return float(self.matrix.mean[self.row])
+    
+    @property
+    def std_dev(self) -> float:
+        return float(self.matrix.std_dev[self.row])
+    
+    @property
+    def ewma(self) -> float:
+        return float(self.matrix.ewma[self.row])
+    
+    @property
+    def ewma_std(self) -> float:
+        return math.sqrt(max(float(self.matrix.ewma_var[self.row]), 0.0))
+    
+    @property
+    def min_value(self) -> float:
+        return float(self.matrix.min_value[self.row])
+    
+    @property
+    def max_value(self) -> float:
+        return float(self.matrix.max_value[self.row])
+    
+    @property
+    def last_update(self) -> float:
+        return float(self.matrix.last_update[self.row])
+    
+    @property
+    def last_value(self) -> Optional[float]:
+        if self.count == 0:
+            return None
+        return float(self.matrix.values[self.row, self.matrix.heads[self.row] - 1])
+    
+    @property
+    def values(self) -> np.ndarray:
+        """Copia dei valori della finestra in ordine cronologico."""
+        return self._recent(self.count)[1]
+    
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Copia dei timestamp della finestra in ordine cronologico."""
+        return self._recent(self.count)[0]
+    
+    def _recent(self, window: int) -> Tuple[np.ndarray, np.ndarray]:
+        window = min(window, self.count)
+        timestamps, values = self.matrix.recent(np.array([self.row]), window)
+        return timestamps[0], values[0]
+    
+    def add_value(self, value: float, timestamp: Optional[float] = None):
+        """Aggiunge un valore alla riga."""
+        self.matrix.append(np.array([self.row]), np.array([float(value)]),
+                           time.time() if timestamp is None else timestamp)
+    
+    def add_values(self, values, timestamps=None):
+        """Aggiunge un blocco di valori alla riga."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if timestamps is None:
+            timestamps = np.full(len(values), time.time())
+        else:
+            timestamps = np.asarray(timestamps, dtype=np.float64).ravel()
+        self.matrix.extend_row(self.row, values, timestamps)
     
     def to_dict(self) -> Dict[str, Any]:
         """Converte la serie in un dizionario."""
         return {
             "name": self.name,
-            "count": len(self.values),
+            "count": self.count,
             "mean": self.mean,
             "std_dev": self.std_dev,
+            "ewma": self.ewma,
+            "ewma_std": self.ewma_std,
             "min": self.min_value,
             "max": self.max_value,
-            "last_value": list(self.values)[-1] if self.values else None,
+            "last_value": self.last_value,
             "last_update": self.last_update
         }
 
+
 class AnomalyDetector:
     """Sistema di rilevamento anomalie per M4Bot."""
     
@@ -113,8 +501,11 @@ class AnomalyDetector:
         Args:
             history_size: Dimensione dell'archivio storico per metrica
         """
-        self.metrics: Dict[str, MetricSeries] = {}
-        self.anomalies: List[Dict[str, Any]] = []
+        self.matrix = MetricMatrix(capacity=history_size)
+        self.metrics: Dict[str, MetricRow] = {}
+        self.anomalies = deque(maxlen=MAX_ANOMALY_HISTORY)
+        self.anomaly_groups = deque(maxlen=MAX_ANOMALY_HISTORY)
+        self.group_count = 0
         self.history_size = history_size
         self.running = False
         self.collection_task = None
@@ -122,13 +513,17 @@ class AnomalyDetector:
         # Configurazioni
         self.anomaly_threshold = 3.0  # Z-score per considerare un valore anomalo
         self.collection_interval = 60  # secondi tra collezioni di metriche
+        self.trend_window = 30  # campioni usati per trend e previsioni
+        self.min_samples = 10  # campioni minimi prima di valutare una metrica
+        self.correlation_threshold = 0.8  # correlazione minima per raggruppare anomalie
+        self.correlation_window = 30  # campioni usati per la correlazione
         
         logger.info("Sistema di rilevamento anomalie inizializzato")
     
-    def register_metric(self, name: str) -> MetricSeries:
+    def register_metric(self, name: str) -> MetricRow:
         """Registra una nuova metrica da monitorare."""
         if name not in self.metrics:
-            self.metrics[name] = MetricSeries(name=name)
+            self.metrics[name] = MetricRow(self.matrix, name)
             logger.info(f"Metrica registrata: {name}")
         return self.metrics[name]
     
@@ -146,6 +541,148 @@ class AnomalyDetector:
         # Aggiunge il valore
         metric.add_value(value, timestamp)
     
+    def add_metric_values(self, name: str, values, timestamps=None):
+        """
+        Aggiunge un blocco di valori storici a una metrica senza verificare anomalie.
+        
+        Args:
+            name: Nome della metrica
+            values: Valori in ordine cronologico
+            timestamps: Timestamp corrispondenti (opzionale)
+        """
+        if name not in self.metrics:
+            self.register_metric(name)
+        self.metrics[name].add_values(values, timestamps)
+    
+    def process_tick(self, sample: Dict[str, float],
+                     timestamp: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Valuta e registra in un'unica passata vettoriale i valori di un tick di raccolta.
+        
+        Un valore è anomalo quando il suo z-score sulla finestra supera la soglia e,
+        se la baseline stagionale della fascia oraria è disponibile, è anomalo anche
+        rispetto a quella. Le anomalie dello stesso tick correlate tra loro sono
+        raggruppate in un unico evento.
+        
+        Args:
+            sample: Valori del tick per nome di metrica
+            timestamp: Timestamp del tick (default: ora corrente)
+            
+        Returns:
+            Lista dei gruppi di anomalie rilevati
+        """
+        if not sample:
+            return []
+        if timestamp is None:
+            timestamp = time.time()
+        
+        rows = np.fromiter((self.register_metric(name).row for name in sample), dtype=np.int64, count=len(sample))
+        values = np.fromiter(sample.values(), dtype=np.float64, count=len(sample))
+        
+        # Valutazione e correlazione sulla finestra precedente al tick, come per add_metric_value
+        scores = self.matrix.score(rows, values, timestamp)
+        z_season = scores["z_season"]
+        flagged = ((scores["counts"] >= self.min_samples)
+                   & (scores["z_window"] > self.anomaly_threshold)
+                   & (np.isnan(z_season) | (z_season > self.anomaly_threshold)))
+        
+        groups = []
+        if flagged.any():
+            groups = self._group_anomalies(rows[flagged], values[flagged],
+                                           {key: score[flagged] for key, score in scores.items()}, timestamp)
+        
+        self.matrix.append(rows, values, timestamp)
+        return groups
+    
+    def _group_anomalies(self, rows: np.ndarray, values: np.ndarray,
+                         scores: Dict[str, np.ndarray], timestamp: float) -> List[Dict[str, Any]]:
+        """
+        Raggruppa le anomalie di un tick per famiglia di metrica e correlazione recente.
+        
+        Args:
+            rows: Righe delle metriche anomale
+            values: Valori anomali
+            scores: Punteggi restituiti da MetricMatrix.score, filtrati sulle anomalie
+            timestamp: Timestamp del tick
+            
+        Returns:
+            Lista dei gruppi creati
+        """
+        size = len(rows)
+        names = [self.matrix.names[row] for row in rows.tolist()]
+        parent = list(range(size))
+        
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        def union(i: int, j: int):
+            parent[find(i)] = find(j)
+        
+        # Stessa famiglia (es. system.cpu.*)
+        families: Dict[str, int] = {}
+        for i, name in enumerate(names):
+            family = ".".join(name.split(".")[:2])
+            if family in families:
+                union(i, families[family])
+            else:
+                families[family] = i
+        
+        # Andamento recente correlato
+        window = min(self.correlation_window, int(self.matrix.counts[rows].min()))
+        if size > 1 and window > 2:
+            _, recent = self.matrix.recent(rows, window)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                correlation = np.nan_to_num(np.corrcoef(recent))
+            for i, j in np.argwhere(np.triu(np.abs(correlation) >= self.correlation_threshold, 1)).tolist():
+                union(i, j)
+        
+        members: Dict[int, List[int]] = {}
+        for i in range(size):
+            members.setdefault(find(i), []).append(i)
+        
+        groups = []
+        for indices in members.values():
+            root = max(indices, key=lambda i: scores["z_window"][i])
+            self.group_count += 1
+            group = {
+                "id": f"{int(timestamp * 1000)}-{self.group_count}",
+                "timestamp": timestamp,
+                "root_metric": names[root],
+                "metrics": [names[i] for i in indices],
+                "max_z_score": float(scores["z_window"][root])
+            }
+            
+            for i in indices:
+                z_season = float(scores["z_season"][i])
+                self.anomalies.append({
+                    "metric": names[i],
+                    "value": float(values[i]),
+                    "timestamp": timestamp,
+                    "mean": float(scores["mean"][i]),
+                    "std_dev": float(scores["std_dev"][i]),
+                    "z_score": float(scores["z_window"][i]),
+                    "ewma_deviation": float(scores["z_ewma"][i]),
+                    "seasonal_z_score": None if math.isnan(z_season) else z_season,
+                    "group_id": group["id"]
+                })
+            
+            self.anomaly_groups.append(group)
+            groups.append(group)
+            
+            related = len(indices) - 1
+            if related:
+                logger.warning(f"Anomalia rilevata: {names[root]} = {float(values[root])} "
+                               f"(z-score: {group['max_z_score']:.2f}) con {related} metriche correlate: "
+                               f"{', '.join(group['metrics'])}")
+            else:
+                logger.warning(f"Anomalia rilevata: {names[root]} = {float(values[root])} "
+                               f"(z-score: {group['max_z_score']:.2f})")
+        
+        return groups
+    
     def _record_anomaly(self, metric_name: str, value: float, timestamp: float):
         """Registra un'anomalia rilevata."""
         metric = self.metrics[metric_name]
@@ -203,35 +740,40 @@ class AnomalyDetector:
         
         while self.running:
             try:
+                sample: Dict[str, float] = {}
+                
                 # Raccolta CPU
                 cpu_percent = psutil.cpu_percent(interval=1)
-                self.add_metric_value("system.cpu.percent", cpu_percent)
+                sample["system.cpu.percent"] = cpu_percent
                 
                 # Per-core CPU
                 per_cpu = psutil.cpu_percent(interval=None, percpu=True)
                 for i, cpu in enumerate(per_cpu):
-                    self.add_metric_value(f"system.cpu.core.{i}.percent", cpu)
+                    sample[f"system.cpu.core.{i}.percent"] = cpu
                 
                 # Memoria
                 memory = psutil.virtual_memory()
-                self.add_metric_value("system.memory.percent", memory.percent)
-                self.add_metric_value("system.memory.available_mb", memory.available / (1024 * 1024))
+                sample["system.memory.percent"] = memory.percent
+                sample["system.memory.available_mb"] = memory.available / (1024 * 1024)
                 
                 # Disco
                 disk = psutil.disk_usage('/')
-                self.add_metric_value("system.disk.percent", disk.percent)
-                self.add_metric_value("system.disk.free_gb", disk.free / (1024 * 1024 * 1024))
+                sample["system.disk.percent"] = disk.percent
+                sample["system.disk.free_gb"] = disk.free / (1024 * 1024 * 1024)
                 
                 # Rete (somma di tutti gli adattatori)
                 net_io = psutil.net_io_counters()
-                self.add_metric_value("system.network.bytes_sent", net_io.bytes_sent)
-                self.add_metric_value("system.network.bytes_recv", net_io.bytes_recv)
+                sample["system.network.bytes_sent"] = net_io.bytes_sent
+                sample["system.network.bytes_recv"] = net_io.bytes_recv
                 
                 # Load average
                 load = psutil.getloadavg()
-                self.add_metric_value("system.load.1min", load[0])
-                self.add_metric_value("system.load.5min", load[1])
-                self.add_metric_value("system.load.15min", load[2])
+                sample["system.load.1min"] = load[0]
+                sample["system.load.5min"] = load[1]
+                sample["system.load.15min"] = load[2]
+                
+                # Valutazione vettoriale di tutte le metriche del tick
+                self.process_tick(sample)
                 
                 # Attendi per il prossimo ciclo
                 await asyncio.sleep(self.collection_interval)
@@ -257,6 +799,10 @@ class AnomalyDetector:
         """Restituisce le anomalie più recenti."""
         return sorted(self.anomalies, key=lambda x: x['timestamp'], reverse=True)[:limit]
     
+    def get_recent_anomaly_groups(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Restituisce i gruppi di anomalie correlate più recenti."""
+        return sorted(self.anomaly_groups, key=lambda x: x['timestamp'], reverse=True)[:limit]
+    
     def get_anomalies_by_metric(self, metric_name: str, limit: int = 50) -> List[Dict[str, Any]]:
         """Restituisce le anomalie per una metrica specifica."""
         metric_anomalies = [a for a in self.anomalies if a['metric'] == metric_name]
@@ -274,24 +820,12 @@ class AnomalyDetector:
         Returns:
             Tupla (valore_previsto, intervallo_confidenza)
         """
-        if metric_name not in self.metrics or len(self.metrics[metric_name].values) < 10:
+        if metric_name not in self.metrics or self.metrics[metric_name].count < 10:
             return (0.0, 0.0)
         
-        metric = self.metrics[metric_name]
-        
-        # Implementazione semplice: trend lineare
-        # In un'implementazione reale, si utilizzerebbe un modello più sofisticato
-        trend = metric.recent_trend(window=min(30, len(metric.values)))
-        last_value = list(metric.values)[-1]
-        
-        # Calcola previsione: ultimo valore + trend * tempo
-        time_units = time_ahead / self.collection_interval
-        predicted_value = last_value + (trend * time_units)
-        
-        # Intervallo di confidenza semplice (basato sulla deviazione standard)
-        confidence = metric.std_dev * 1.96  # 95% di confidenza
-        
-        return (predicted_value, confidence)
+        # Regressione lineare ai minimi quadrati sugli ultimi campioni, con
+        # intervallo di previsione al 95% basato sui residui
+        return self.metrics[metric_name].forecast(time_ahead, window=self.trend_window)
     
     def should_trigger_alert(self, metric_name: str) -> bool:
         """
@@ -303,16 +837,16 @@ class AnomalyDetector:
             return False
             
         metric = self.metrics[metric_name]
-        if len(metric.values) < 10:
+        if metric.count < 10:
             return False
             
         # Controlla se l'ultimo valore è anomalo
-        last_value = list(metric.values)[-1]
+        last_value = metric.last_value
         if metric.is_anomaly(last_value, self.anomaly_threshold):
             return True
             
         # Controlla se il trend è preoccupante
-        trend = metric.recent_trend(window=min(30, len(metric.values)))
+        trend = metric.recent_trend(window=min(self.trend_window, metric.count))
         
         # Logica specifica per metriche diverse
         if metric_name == "system.cpu.percent" and last_value > 80 and trend > 0:
@@ -331,6 +865,7 @@ class AnomalyDetector:
         data = {
             "metrics": self.get_metrics(),
             "anomalies": self.get_recent_anomalies(),
+            "anomaly_groups": self.get_recent_anomaly_groups(),
             "timestamp": time.time()
         }
         
@@ -23,7 +23,7 @@ import uuid
 import platform
 
 import aiohttp
-from quart import Quart, render_template, request, redirect, url_for, session, jsonify, flash, websocket
+from quart import Quart, render_template, request, redirect, url_for, session, jsonify, flash, websocket, g
 from quart_cors import cors
 import asyncpg
 import bcrypt
@@ -40,6 +40,9 @@ APP_VERSION = "3.1.0"
 # Aggiungi la directory principale al path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from stability.monitoring.metrics_registry import get_registry, internal_access_allowed, CONTENT_TYPE
+from stability.monitoring.profiler import get_profiler, profiler_enabled
+
 # Carica le variabili d'ambiente dal file .env
 env_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env")
 load_dotenv(env_path)
@@ -115,6 +118,26 @@ REDIS_URL = f"redis://{':' + REDIS_PASSWORD + '@' if REDIS_PASSWORD else ''}{RED
 REFRESH_TOKEN_EXPIRY = int(os.getenv('REFRESH_TOKEN_EXPIRY', '604800'))  # 7 giorni in secondi
 ACCESS_TOKEN_EXPIRY = int(os.getenv('ACCESS_TOKEN_EXPIRY', '3600'))  # 1 ora in secondi
 
+# Indirizzi autorizzati a leggere l'endpoint /metrics con una connessione diretta
+# (le richieste inoltrate da nginx vengono rifiutate)
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Token Bearer per /metrics: se impostato è richiesto a ogni richiesta, da qualunque indirizzo
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# API del bot, che espone il proprio profiler solo al pannello web: con
+# PROFILER_TOKEN (lo stesso configurato nel bot) le richieste lo inviano come token Bearer
+BOT_API_URL = os.getenv('M4BOT_API_URL', 'http://127.0.0.1:5000')
+PROFILER_TOKEN = os.getenv('PROFILER_TOKEN', '')
+PROFILER_HEADERS = {"Authorization": f"Bearer {PROFILER_TOKEN}"} if PROFILER_TOKEN else None
+PROFILER_ACTIONS = ("start", "stop", "reset")
+
+# Metriche delle richieste HTTP nel registro unificato
+metrics_registry = get_registry()
+HTTP_REQUEST_DURATION = metrics_registry.histogram(
+    "m4bot_http_request_duration_seconds", "Durata delle richieste HTTP del pannello web",
+    ("method", "endpoint", "status"))
+
 # Assicurati che le directory necessarie esistano
 log_dir = os.path.dirname(LOG_FILE)
 if log_dir and not os.path.exists(log_dir):
@@ -297,6 +320,8 @@ async def setup_db_pool():
                 min_size=2,            # Minimo numero di connessioni nel pool
                 max_size=10            # Massimo numero di connessioni nel pool
             )
+            # I blueprint accedono al pool tramite current_app
+            app.db_pool = db_pool
             logger.info("Connessione al database PostgreSQL stabilita")
             return
         except asyncpg.exceptions.PostgresError as e:
@@ -371,7 +396,7 @@ async def redis_cache(key, callback, expire=300):
     
     return result
 
-async def api_request(url, method='GET', data=None, timeout=10, retries=3):
+async def api_request(url, method='GET', data=None, timeout=10, retries=3, headers=None):
     """Helper per richieste API con retry automatico"""
     if not bot_client:
         return None
@@ -379,7 +404,7 @@ async def api_request(url, method='GET', data=None, timeout=10, retries=3):
     for attempt in range(retries):
         try:
             if method.upper() == 'GET':
-                async with bot_client.get(url, timeout=timeout) as response:
+                async with bot_client.get(url, timeout=timeout, headers=headers) as response:
                     if response.status < 200 or response.status >= 300:
                         logger.warning(f"API request error: {response.status} on {url}, attempt {attempt+1}/{retries}")
                         if attempt < retries - 1:
@@ -388,7 +413,7 @@ async def api_request(url, method='GET', data=None, timeout=10, retries=3):
                         return None
                     return await response.json()
             elif method.upper() == 'POST':
-                async with bot_client.post(url, json=data, timeout=timeout) as response:
+                async with bot_client.post(url, json=data, timeout=timeout, headers=headers) as response:
                     if response.status < 200 or response.status >= 300:
                         logger.warning(f"API request error: {response.status} on {url}, attempt {attempt+1}/{retries}")
                         if attempt < retries - 1:
@@ -559,6 +584,96 @@ async def inject_common_data():
         'cookie_policy_version': COOKIE_POLICY_VERSION
     }
 
+@app.before_request
+async def start_request_timer():
+    """Registra l'inizio della richiesta per la metrica di durata."""
+    g.request_start = time.perf_counter()
+
+@app.after_request
+async def record_request_duration(response):
+    """Registra la durata della richiesta, etichettata con la regola di routing (cardinalità limitata)."""
+    start = g.get('request_start')
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "__unmatched__"
+        HTTP_REQUEST_DURATION.labels(request.method, endpoint, response.status_code).observe(
+            time.perf_counter() - start)
+    return response
+
+@app.route('/metrics')
+async def metrics_endpoint():
+    """Endpoint di esposizione delle metriche in formato Prometheus."""
+    if not internal_access_allowed(request.remote_addr, request.headers, METRICS_ALLOWED_IPS, METRICS_TOKEN):
+        return "Forbidden", 403
+    return metrics_registry.render(), 200, {"Content-Type": CONTENT_TYPE}
+
+# Profiler a campionamento del pannello web, attivo dall'avvio se richiesto (M4BOT_PROFILER=1).
+# Con più worker (gunicorn -w N) ogni processo ha il proprio profiler: per questo si
+# attiva solo all'avvio, e le letture riportano il PID del worker che ha risposto
+@app.before_serving
+async def start_profiler():
+    if profiler_enabled():
+        get_profiler().start()
+
+@app.after_serving
+async def stop_profiler():
+    get_profiler().stop()
+
+@app.route('/admin/api/system/profiler')
+@admin_required
+async def system_profiler():
+    """Riepilogo del profiler del worker web che risponde o, con ?process=bot, del bot."""
+    top = request.args.get('top', 30, type=int)
+    if request.args.get('process', 'web') == 'bot':
+        data = await api_request(f"{BOT_API_URL}/api/system/profiler?top={top}", retries=1,
+                                 headers=PROFILER_HEADERS)
+        if data is None:
+            return jsonify({"error": "Profiler del bot non raggiungibile"}), 502
+        return jsonify(data)
+    stats = await asyncio.to_thread(get_profiler().get_stats, top)
+    stats["pid"] = os.getpid()
+    return jsonify(stats)
+
+@app.route('/admin/api/system/profiler/flamegraph')
+@admin_required
+async def system_profiler_flamegraph():
+    """Scarica gli stack campionati in formato folded (flamegraph.pl, speedscope)."""
+    process = request.args.get('process', 'web')
+    if process == 'bot':
+        data = await api_request(f"{BOT_API_URL}/api/system/profiler/flamegraph", retries=1,
+                                 headers=PROFILER_HEADERS)
+        if data is None:
+            return jsonify({"error": "Profiler del bot non raggiungibile"}), 502
+        folded = data.get("folded", "")
+    else:
+        folded = await asyncio.to_thread(get_profiler().export_folded)
+        process = f"web_{os.getpid()}"
+    
+    filename = f"m4bot_{process}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.folded"
+    return folded, 200, {
+        "Content-Type": "text/plain; charset=utf-8",
+        "Content-Disposition": f"attachment; filename={filename}"
+    }
+
+@app.route('/admin/api/system/profiler/<action>', methods=['POST'])
+@admin_required
+async def system_profiler_control(action):
+    """Avvia, ferma o azzera il profiler del bot."""
+    if action not in PROFILER_ACTIONS:
+        return jsonify({"success": False, "message": f"Azione non valida: {action}"}), 400
+    
+    # Un comando raggiungerebbe un solo worker web: il loro profiler si attiva con M4BOT_PROFILER
+    if request.args.get('process', 'bot') != 'bot':
+        return jsonify({
+            "success": False,
+            "message": "Il profiler del pannello web si attiva all'avvio con M4BOT_PROFILER=1"
+        }), 400
+    
+    data = await api_request(f"{BOT_API_URL}/api/system/profiler/{action}", method='POST', retries=1,
+                             headers=PROFILER_HEADERS)
+    if data is None:
+        return jsonify({"success": False, "message": "Profiler del bot non raggiungibile"}), 502
+    return jsonify(data)
+
 @app.after_request
 async def add_language_switcher(response):
     """Aggiunge un cookie sicuro per il language switcher"""
@@ -583,10 +698,12 @@ async def register_blueprints():
     from web.routes.dashboard import dashboard_blueprint
     from web.routes.timer import timer
     from web.routes.gdpr import init_gdpr_bp
+    from web.routes.system_monitoring import system_bp
     
     # Registra i blueprint
     app.register_blueprint(dashboard_blueprint)
     app.register_blueprint(timer)
+    app.register_blueprint(system_bp)
     
     # Inizializza blueprint che richiedono configurazione avanzata
     init_admin_bp(app)
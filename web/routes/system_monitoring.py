@@ -11,13 +11,39 @@ import time
 import json
 import datetime
 import asyncio
-from quart import Blueprint, jsonify, render_template, request, current_app
-from web.auth.decorators import admin_required
-from modules.stability_security import get_service_status
+from functools import wraps
+from quart import Blueprint, jsonify, render_template, request, current_app, session, redirect, url_for
+from stability.monitoring.timeseries_store import TimeSeriesStore, ROLLUP_AGGREGATES
 
 # Inizializzazione del blueprint
 system_bp = Blueprint('system', __name__, url_prefix='/admin')
 
+# Archivio dello storico delle metriche (scritto dal monitor, letto qui in sola lettura)
+_history_store = None
+
+# Middleware per verificare i permessi di amministratore (stesso controllo di web/app.py)
+def admin_required(f):
+    @wraps(f)
+    async def decorated_function(*args, **kwargs):
+        if 'user_id' not in session:
+            return redirect(url_for('login', next=request.url))
+        
+        db_pool = getattr(current_app, 'db_pool', None)
+        if not db_pool:
+            return await render_template('error.html', message="Database non disponibile"), 500
+        
+        async with db_pool.acquire() as conn:
+            user = await conn.fetchrow(
+                'SELECT is_admin FROM users WHERE id = $1',
+                session['user_id']
+            )
+            
+            if not user or not user['is_admin']:
+                return redirect(url_for('dashboard'))
+        
+        return await f(*args, **kwargs)
+    return decorated_function
+
 # Funzioni di utilità
 def get_size(bytes, suffix="B"):
     """
@@ -252,52 +278,49 @@ def get_services_info():
     Recupera informazioni sui servizi M4Bot
     """
     try:
-        # Verifica se il modulo di gestione servizi è disponibile
-        services = get_service_status() if 'get_service_status' in globals() else []
-        if not services:
-            # Dati di esempio per lo sviluppo
-            services = [
-                {
-                    "id": "m4bot-core",
-                    "name": "M4Bot Core",
-                    "status": "running",
-                    "pid": 12345,
-                    "cpu": 1.2,
-                    "memory": 3.5
-                },
-                {
-                    "id": "m4bot-web",
-                    "name": "M4Bot Web Server",
-                    "status": "running",
-                    "pid": 12346,
-                    "cpu": 0.8,
-                    "memory": 2.1
-                },
-                {
-                    "id": "m4bot-telegram",
-                    "name": "M4Bot Telegram",
-                    "status": "running",
-                    "pid": 12347,
-                    "cpu": 0.5,
-                    "memory": 1.7
-                },
-                {
-                    "id": "m4bot-discord",
-                    "name": "M4Bot Discord",
-                    "status": "stopped",
-                    "pid": None,
-                    "cpu": None,
-                    "memory": None
-                },
-                {
-                    "id": "m4bot-database",
-                    "name": "M4Bot Database",
-                    "status": "running",
-                    "pid": 12348,
-                    "cpu": 1.5,
-                    "memory": 4.2
-                }
-            ]
+        # Nessun gestore dei servizi disponibile: dati di esempio per lo sviluppo
+        services = [
+            {
+                "id": "m4bot-core",
+                "name": "M4Bot Core",
+                "status": "running",
+                "pid": 12345,
+                "cpu": 1.2,
+                "memory": 3.5
+            },
+            {
+                "id": "m4bot-web",
+                "name": "M4Bot Web Server",
+                "status": "running",
+                "pid": 12346,
+                "cpu": 0.8,
+                "memory": 2.1
+            },
+            {
+                "id": "m4bot-telegram",
+                "name": "M4Bot Telegram",
+                "status": "running",
+                "pid": 12347,
+                "cpu": 0.5,
+                "memory": 1.7
+            },
+            {
+                "id": "m4bot-discord",
+                "name": "M4Bot Discord",
+                "status": "stopped",
+                "pid": None,
+                "cpu": None,
+                "memory": None
+            },
+            {
+                "id": "m4bot-database",
+                "name": "M4Bot Database",
+                "status": "running",
+                "pid": 12348,
+                "cpu": 1.5,
+                "memory": 4.2
+            }
+        ]
             
         return services
     except Exception as e:
@@ -397,6 +420,18 @@ def get_net_speed():
         current_app.logger.error(f"Errore nel calcolo della velocità di rete: {str(e)}")
         return 0.0, 0.0
 
+def get_history_store():
+    """
+    Restituisce l'archivio dello storico delle metriche in sola lettura
+    """
+    global _history_store
+    if _history_store is None:
+        _history_store = TimeSeriesStore(
+            current_app.config.get('MONITORING_HISTORY_DIR', './monitoring_data/timeseries'),
+            readonly=True
+        )
+    return _history_store
+
 # Routes
 @system_bp.route('/monitoring')
 @admin_required
@@ -446,6 +481,60 @@ async def system_stats():
             "error": "Si è verificato un errore nel recupero dei dati di sistema"
         }), 500
 
+@system_bp.route('/api/system/history')
+@admin_required
+async def system_history():
+    """
+    API per lo storico delle metriche in un intervallo di tempo
+    
+    Parametri: metric (ripetibile o separato da virgole), start ed end (epoch in secondi,
+    default ultima ora), step (secondi, opzionale), aggregate (avg, min, max)
+    """
+    try:
+        names = [name for value in request.args.getlist('metric') for name in value.split(',') if name]
+        if not names:
+            return jsonify({"error": "Specificare almeno una metrica"}), 400
+        
+        aggregate = request.args.get('aggregate', 'avg')
+        if aggregate not in ROLLUP_AGGREGATES:
+            return jsonify({"error": f"Aggregato non valido: {aggregate}"}), 400
+        
+        end = request.args.get('end', type=float) or time.time()
+        start = request.args.get('start', type=float) or end - 3600
+        step = request.args.get('step', type=float)
+        
+        # La lettura dei segmenti avviene fuori dal loop degli eventi
+        series = await asyncio.to_thread(get_history_store().query_many, names, start, end, step, aggregate)
+        
+        return jsonify({
+            "start": start,
+            "end": end,
+            "step": step,
+            "aggregate": aggregate,
+            "series": {name: [[timestamp, value] for timestamp, value in points]
+                       for name, points in series.items()}
+        })
+    except Exception as e:
+        current_app.logger.error(f"Errore nell'API system_history: {str(e)}")
+        return jsonify({
+            "error": "Si è verificato un errore nel recupero dello storico delle metriche"
+        }), 500
+
+@system_bp.route('/api/system/history/metrics')
+@admin_required
+async def system_history_metrics():
+    """
+    API per l'elenco delle metriche disponibili nello storico
+    """
+    try:
+        metrics = await asyncio.to_thread(get_history_store().list_metrics)
+        return jsonify({"metrics": metrics})
+    except Exception as e:
+        current_app.logger.error(f"Errore nell'API system_history_metrics: {str(e)}")
+        return jsonify({
+            "error": "Si è verificato un errore nel recupero delle metriche"
+        }), 500
+
 @system_bp.route('/api/service/restart/<service_id>', methods=['POST'])
 @admin_required
 async def restart_service(service_id):
@@ -476,4 +565,4 @@ def init_app(app):
     """
     Inizializza le rotte nell'app
     """
-    app.register_blueprint(system_bp) 
\ No newline at end of file
+    app.register_blueprint(system_bp)
@@ -9,14 +9,16 @@ import os
 import sys
 import time
 import json
+import math
+import heapq
 import random
 import asyncio
 import argparse
-import statistics
+import multiprocessing
 import aiohttp
 import logging
 from datetime import datetime
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, List, Any, Tuple, Optional, Iterable
 from dataclasses import dataclass, asdict, field
 import matplotlib.pyplot as plt
 import numpy as np
@@ -54,6 +56,11 @@ class LoadTestConfig:
     websocket_duration: int = 30  # Durata connessione WebSocket (in secondi)
     test_name: str = ""  # Nome del test
     output_dir: str = "results"  # Directory per i risultati
+    arrival_rate: float = 0.0  # Richieste al secondo a frequenza fissa (modello aperto); 0 = utenti virtuali
+    arrival_distribution: str = "constant"  # Distribuzione degli arrivi nel modello aperto: constant o poisson
+    max_in_flight: int = 10000  # Richieste contemporanee massime nel modello aperto
+    series_bucket_seconds: float = 1.0  # Ampiezza dei bucket della serie temporale (in secondi)
+    max_samples: int = 1000  # Richieste conservate integralmente come campione
 
 @dataclass
 class RequestResult:
@@ -69,15 +76,356 @@ class RequestResult:
     request_data: Dict[str, Any] = field(default_factory=dict)
     response_data: Optional[Dict[str, Any]] = None
 
+# Valore massimo registrabile negli istogrammi (1 ora, in microsecondi)
+HISTOGRAM_MAX_US = 3600 * 1000 * 1000
+
+# Cifre significative degli istogrammi (errore relativo massimo 10^-cifre)
+HISTOGRAM_DIGITS = 2
+
+# Percentili riportati nella distribuzione delle latenze
+REPORT_PERCENTILES = (50, 75, 90, 95, 99, 99.9, 99.99, 100)
+
+class LatencyHistogram:
+    """
+    Istogramma HDR (log-lineare) dei tempi di risposta a memoria costante.
+
+    I valori vengono registrati in microsecondi con un errore relativo inferiore a
+    10^-significant_digits; istogrammi con la stessa configurazione si fondono
+    sommando i conteggi, quindi i risultati di più processi si possono unire.
+    """
+
+    def __init__(self, significant_digits: int = HISTOGRAM_DIGITS, max_value_us: int = HISTOGRAM_MAX_US):
+        self.significant_digits = significant_digits
+        self.max_value_us = max_value_us
+        sub_bucket_count = 1 << math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._half_count = sub_bucket_count // 2
+        self._half_magnitude = self._half_count.bit_length() - 1
+        self.counts = np.zeros(self._index(max_value_us) + 1, dtype=np.int64)
+        self.total = 0
+        self.sum_us = 0
+        self.min_us = 0
+        self.max_us = 0
+
+    def _index(self, value: int) -> int:
+        bucket = value.bit_length() - self._half_magnitude - 1
+        if bucket < 0:
+            bucket = 0
+        return (bucket + 1) * self._half_count + (value >> bucket) - self._half_count
+
+    def _highest_equivalent(self, index: int) -> int:
+        bucket = index // self._half_count - 1
+        if bucket < 0:
+            return index
+        return ((index % self._half_count + self._half_count) << bucket) + (1 << bucket) - 1
+
+    def record(self, value_ms: float, count: int = 1):
+        """
+        Registra un tempo di risposta.
+
+        Args:
+            value_ms: Tempo in millisecondi (limitato a max_value_us)
+            count: Numero di occorrenze
+        """
+        value = min(max(int(value_ms * 1000), 0), self.max_value_us)
+        self.counts[self._index(value)] += count
+        if self.total == 0 or value < self.min_us:
+            self.min_us = value
+        if value > self.max_us:
+            self.max_us = value
+        self.total += count
+        self.sum_us += value * count
+
+    def merge(self, other: "LatencyHistogram"):
+        """Aggiunge i conteggi di un altro istogramma con la stessa configurazione."""
+        if (other.significant_digits, other.max_value_us) != (self.significant_digits, self.max_value_us):
+            raise ValueError("Impossibile unire istogrammi con configurazioni diverse")
+        if other.total == 0:
+            return
+        self.counts += other.counts
+        self.min_us = other.min_us if self.total == 0 else min(self.min_us, other.min_us)
+        self.max_us = max(self.max_us, other.max_us)
+        self.total += other.total
+        self.sum_us += other.sum_us
+
+    def percentiles(self, percentiles: Iterable[float]) -> Dict[float, float]:
+        """
+        Calcola più percentili con una sola somma cumulativa.
+
+        Args:
+            percentiles: Percentili richiesti (0-100)
+
+        Returns:
+            Dizionario percentile -> tempo in millisecondi
+        """
+        percentiles = list(percentiles)
+        if self.total == 0:
+            return {p: 0.0 for p in percentiles}
+        cumulative = np.cumsum(self.counts)
+        result = {}
+        for p in percentiles:
+            target = max(1, math.ceil(p / 100 * self.total))
+            index = int(np.searchsorted(cumulative, target))
+            value = min(self._highest_equivalent(index), self.max_us)
+            result[p] = max(value, self.min_us) / 1000
+        return result
+
+    def percentile(self, p: float) -> float:
+        """Restituisce il percentile p (0-100) in millisecondi."""
+        return self.percentiles([p])[p]
+
+    @property
+    def mean(self) -> float:
+        """Tempo medio in millisecondi."""
+        return self.sum_us / self.total / 1000 if self.total else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializza l'istogramma in forma sparsa."""
+        nonzero = np.nonzero(self.counts)[0]
+        return {
+            "significant_digits": self.significant_digits,
+            "max_value_us": self.max_value_us,
+            "total": self.total,
+            "sum_us": self.sum_us,
+            "min_us": self.min_us,
+            "max_us": self.max_us,
+            "counts": {str(int(i)): int(self.counts[i]) for i in nonzero}
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        """Ricostruisce un istogramma serializzato con to_dict()."""
+        histogram = cls(data.get("significant_digits", HISTOGRAM_DIGITS), data.get("max_value_us", HISTOGRAM_MAX_US))
+        for index, count in data.get("counts", {}).items():
+            histogram.counts[int(index)] = count
+        histogram.total = data.get("total", 0)
+        histogram.sum_us = data.get("sum_us", 0)
+        histogram.min_us = data.get("min_us", 0)
+        histogram.max_us = data.get("max_us", 0)
+        return histogram
+
+@dataclass
+class EndpointStats:
+    """Statistiche aggregate di un endpoint."""
+    endpoint: str
+    count: int = 0
+    success: int = 0
+    errors: int = 0
+    status_codes: Dict[int, int] = field(default_factory=dict)
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)  # Dall'istante previsto di invio
+    service_time: LatencyHistogram = field(default_factory=LatencyHistogram)  # Dall'invio effettivo
+
+    def record(self, result: "RequestResult", service_time: Optional[float] = None):
+        """
+        Aggiunge una richiesta alle statistiche.
+
+        Anche le richieste fallite, scadute o rifiutate entrano negli istogrammi con
+        il tempo trascorso fino al fallimento: escluderle nasconderebbe proprio le
+        attese più lunghe.
+        """
+        self.count += 1
+        self.status_codes[result.status_code] = self.status_codes.get(result.status_code, 0) + 1
+        if 200 <= result.status_code < 400:
+            self.success += 1
+        else:
+            self.errors += 1
+
+        self.latency.record(result.response_time)
+        self.service_time.record(result.response_time if service_time is None else service_time)
+
+    def merge(self, other: "EndpointStats"):
+        """Aggiunge le statistiche di un altro processo di carico."""
+        self.count += other.count
+        self.success += other.success
+        self.errors += other.errors
+        for status, count in other.status_codes.items():
+            self.status_codes[status] = self.status_codes.get(status, 0) + count
+        self.latency.merge(other.latency)
+        self.service_time.merge(other.service_time)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "endpoint": self.endpoint,
+            "count": self.count,
+            "success": self.success,
+            "errors": self.errors,
+            "status_codes": {str(k): v for k, v in self.status_codes.items()},
+            "latency": self.latency.to_dict(),
+            "service_time": self.service_time.to_dict()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "EndpointStats":
+        return cls(
+            endpoint=data["endpoint"],
+            count=data["count"],
+            success=data["success"],
+            errors=data["errors"],
+            status_codes={int(k): v for k, v in data["status_codes"].items()},
+            latency=LatencyHistogram.from_dict(data["latency"]),
+            service_time=LatencyHistogram.from_dict(data["service_time"])
+        )
+
+def _series_point(t: float, bucket_seconds: float, requests: int, errors: int,
+                  histogram: LatencyHistogram, include_histogram: bool) -> Dict[str, Any]:
+    """Riassume un bucket della serie temporale."""
+    p = histogram.percentiles((50, 95, 99))
+    point = {
+        "t": t,
+        "requests": requests,
+        "errors": errors,
+        "rps": requests / bucket_seconds,
+        "p50_ms": p[50],
+        "p95_ms": p[95],
+        "p99_ms": p[99],
+        "max_ms": histogram.max_us / 1000
+    }
+    if include_histogram:
+        point["histogram"] = histogram.to_dict()
+    return point
+
+class SeriesRecorder:
+    """
+    Serie temporale di throughput e latenze a bucket fissi.
+
+    Ogni bucket viene riassunto e scritto su file JSONL appena si chiude (con un
+    bucket di tolleranza per le richieste che terminano in ritardo), così la serie
+    è disponibile durante il test e la memoria non cresce con il numero di richieste.
+    """
+
+    def __init__(self, start_time: float, bucket_seconds: float = 1.0, path: Optional[str] = None,
+                 include_histograms: bool = False):
+        """
+        Args:
+            start_time: Istante di riferimento dei bucket (epoch)
+            bucket_seconds: Ampiezza dei bucket in secondi
+            path: File JSONL su cui scrivere i bucket chiusi (opzionale)
+            include_histograms: Se True ogni riga contiene l'istogramma del bucket,
+                                necessario per unire le serie di più processi
+        """
+        self.start_time = start_time
+        self.bucket_seconds = bucket_seconds
+        self.path = path
+        self.include_histograms = include_histograms
+        self.points: List[Dict[str, Any]] = []
+        self._open: Dict[int, List[Any]] = {}
+        self._file = open(path, 'a', encoding='utf-8') if path else None
+
+    def record(self, timestamp: float, latency_ms: Optional[float], failed: bool):
+        """Aggiunge una richiesta terminata all'istante indicato."""
+        index = int((timestamp - self.start_time) // self.bucket_seconds)
+        bucket = self._open.get(index)
+        if bucket is None:
+            bucket = self._open[index] = [0, 0, LatencyHistogram()]
+        bucket[0] += 1
+        if failed:
+            bucket[1] += 1
+        if latency_ms is not None:
+            bucket[2].record(latency_ms)
+
+    def flush(self, now: Optional[float] = None):
+        """
+        Chiude e scrive i bucket completati.
+
+        Args:
+            now: Istante corrente; se None chiude tutti i bucket aperti
+        """
+        if now is None:
+            ready = sorted(self._open)
+        else:
+            current = int((now - self.start_time) // self.bucket_seconds)
+            ready = sorted(index for index in self._open if index < current - 1)
+
+        for index in ready:
+            requests, errors, histogram = self._open.pop(index)
+            point = _series_point(index * self.bucket_seconds, self.bucket_seconds, requests, errors,
+                                  histogram, self.include_histograms)
+            if self._file:
+                self._file.write(json.dumps(point) + "\n")
+            point.pop("histogram", None)
+            self.points.append(point)
+
+        if ready and self._file:
+            self._file.flush()
+
+    def close(self):
+        """Chiude tutti i bucket e il file."""
+        self.flush()
+        if self._file:
+            self._file.close()
+            self._file = None
+
+def merge_series_files(paths: List[str], output_path: Optional[str] = None,
+                       bucket_seconds: float = 1.0) -> List[Dict[str, Any]]:
+    """
+    Unisce le serie temporali di più processi di carico (scritte con include_histograms).
+
+    I file sono ordinati per bucket, quindi vengono letti in parallelo con un merge
+    ordinato e ogni bucket viene unito e scritto appena completo.
+
+    Args:
+        paths: File JSONL dei singoli processi
+        output_path: File JSONL della serie unita (opzionale)
+        bucket_seconds: Ampiezza dei bucket in secondi
+
+    Returns:
+        Lista dei punti della serie unita (senza istogrammi)
+    """
+    def read(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    points = []
+    output = open(output_path, 'w', encoding='utf-8') if output_path else None
+
+    def emit(t, requests, errors, histogram):
+        point = _series_point(t, bucket_seconds, requests, errors, histogram, False)
+        points.append(point)
+        if output:
+            output.write(json.dumps(point) + "\n")
+
+    try:
+        current_t = None
+        requests = errors = 0
+        histogram = None
+        for point in heapq.merge(*(read(path) for path in paths), key=lambda p: p["t"]):
+            if point["t"] != current_t:
+                if current_t is not None:
+                    emit(current_t, requests, errors, histogram)
+                current_t = point["t"]
+                requests = errors = 0
+                histogram = LatencyHistogram()
+            requests += point["requests"]
+            errors += point["errors"]
+            if "histogram" in point:
+                histogram.merge(LatencyHistogram.from_dict(point["histogram"]))
+        if current_t is not None:
+            emit(current_t, requests, errors, histogram)
+    finally:
+        if output:
+            output.close()
+
+    return points
+
 @dataclass
 class TestResults:
-    """Risultati di un test di carico completo."""
+    """
+    Risultati di un test di carico completo.
+
+    Le richieste non vengono conservate: ogni risultato aggiorna gli istogrammi per
+    endpoint e la serie temporale, e solo le prime max_samples restano come campione.
+    """
     config: LoadTestConfig
-    requests: List[RequestResult] = field(default_factory=list)
+    requests: List[RequestResult] = field(default_factory=list)  # Campione delle prime richieste
     start_time: float = field(default_factory=time.time)
     end_time: Optional[float] = None
     errors: List[str] = field(default_factory=list)
-    
+    endpoints: Dict[str, EndpointStats] = field(default_factory=dict)
+    series: Optional[SeriesRecorder] = None
+    series_points: List[Dict[str, Any]] = field(default_factory=list)
+    error_count: int = 0
+
     # Statistiche aggregate
     total_requests: int = 0
     successful_requests: int = 0
@@ -88,36 +436,97 @@ class TestResults:
     median_response_time: float = 0
     p95_response_time: float = 0  # 95° percentile
     p99_response_time: float = 0  # 99° percentile
+    p999_response_time: float = 0  # 99.9° percentile
     requests_per_second: float = 0
-    
+
+    def record(self, result: RequestResult, service_time: Optional[float] = None):
+        """
+        Registra il risultato di una richiesta.
+
+        Args:
+            result: Risultato della richiesta
+            service_time: Tempo dall'invio effettivo in ms, se diverso da response_time
+        """
+        stats = self.endpoints.get(result.endpoint)
+        if stats is None:
+            stats = self.endpoints[result.endpoint] = EndpointStats(result.endpoint)
+        stats.record(result, service_time)
+
+        self.total_requests += 1
+        if len(self.requests) < self.config.max_samples:
+            self.requests.append(result)
+
+        if self.series:
+            failed = not (200 <= result.status_code < 400)
+            self.series.record(time.time(), result.response_time, failed)
+
+    def add_error(self, message: str):
+        """Registra un errore (ne vengono conservati al massimo max_samples)."""
+        self.error_count += 1
+        if len(self.errors) < self.config.max_samples:
+            self.errors.append(message)
+
+    def histogram(self) -> LatencyHistogram:
+        """Istogramma complessivo dei tempi di risposta di tutti gli endpoint."""
+        histogram = LatencyHistogram()
+        for stats in self.endpoints.values():
+            histogram.merge(stats.latency)
+        return histogram
+
+    def status_codes(self) -> Dict[int, int]:
+        """Conteggio complessivo delle richieste per codice di stato."""
+        codes: Dict[int, int] = {}
+        for stats in self.endpoints.values():
+            for status, count in stats.status_codes.items():
+                codes[status] = codes.get(status, 0) + count
+        return codes
+
     def calculate_statistics(self):
-        """Calcola statistiche aggregate dai risultati."""
-        if not self.requests:
+        """Calcola statistiche aggregate dagli istogrammi."""
+        if self.series:
+            self.series.close()
+            self.series_points = self.series.points
+
+        self.total_requests = sum(stats.count for stats in self.endpoints.values())
+        if not self.total_requests:
             return
-        
-        self.total_requests = len(self.requests)
-        self.successful_requests = sum(1 for r in self.requests if 200 <= r.status_code < 400)
+
+        self.successful_requests = sum(stats.success for stats in self.endpoints.values())
         self.failed_requests = self.total_requests - self.successful_requests
-        
+
         # Calcola statistiche sui tempi di risposta
-        response_times = [r.response_time for r in self.requests if r.error is None]
-        if response_times:
-            self.min_response_time = min(response_times)
-            self.max_response_time = max(response_times)
-            self.avg_response_time = sum(response_times) / len(response_times)
-            self.median_response_time = statistics.median(response_times)
-            
-            # Calcola percentili
-            response_times.sort()
-            self.p95_response_time = response_times[int(len(response_times) * 0.95)]
-            self.p99_response_time = response_times[int(len(response_times) * 0.99)]
-        
+        histogram = self.histogram()
+        if histogram.total:
+            p = histogram.percentiles((50, 95, 99, 99.9))
+            self.min_response_time = histogram.min_us / 1000
+            self.max_response_time = histogram.max_us / 1000
+            self.avg_response_time = histogram.mean
+            self.median_response_time = p[50]
+            self.p95_response_time = p[95]
+            self.p99_response_time = p[99]
+            self.p999_response_time = p[99.9]
+
         # Calcola richieste al secondo
         if self.end_time and self.start_time:
             test_duration = self.end_time - self.start_time
             if test_duration > 0:
                 self.requests_per_second = self.total_requests / test_duration
-    
+
+    def merge(self, other: "TestResults"):
+        """Aggiunge i risultati di un altro processo di carico."""
+        for endpoint, stats in other.endpoints.items():
+            if endpoint in self.endpoints:
+                self.endpoints[endpoint].merge(stats)
+            else:
+                self.endpoints[endpoint] = stats
+
+        self.start_time = min(self.start_time, other.start_time)
+        if other.end_time:
+            self.end_time = max(self.end_time or 0, other.end_time)
+        self.error_count += other.error_count
+        self.errors.extend(other.errors[:max(0, self.config.max_samples - len(self.errors))])
+        self.requests.extend(other.requests[:max(0, self.config.max_samples - len(self.requests))])
+
     def save_to_file(self, filename: str = None):
         """Salva i risultati del test su file."""
         if filename is None:
@@ -125,132 +534,215 @@ class TestResults:
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             test_name = self.config.test_name or "load_test"
             filename = f"{test_name}_{timestamp}.json"
-        
+
         # Assicurati che la directory esista
         os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
-        
+
         # Converti in dizionario seriale
         results_dict = {
             "config": asdict(self.config),
             "summary": {
                 "start_time": datetime.fromtimestamp(self.start_time).isoformat(),
                 "end_time": datetime.fromtimestamp(self.end_time).isoformat() if self.end_time else None,
+                "start_timestamp": self.start_time,
+                "end_timestamp": self.end_time,
                 "total_requests": self.total_requests,
                 "successful_requests": self.successful_requests,
                 "failed_requests": self.failed_requests,
-                "min_response_time": self.min_response_time,
+                "min_response_time": self.min_response_time if self.min_response_time != float('inf') else None,
                 "max_response_time": self.max_response_time,
                 "avg_response_time": self.avg_response_time,
                 "median_response_time": self.median_response_time,
                 "p95_response_time": self.p95_response_time,
                 "p99_response_time": self.p99_response_time,
-                "requests_per_second": self.requests_per_second
+                "p999_response_time": self.p999_response_time,
+                "requests_per_second": self.requests_per_second,
+                "error_count": self.error_count
             },
+            "endpoints": {endpoint: stats.to_dict() for endpoint, stats in self.endpoints.items()},
             "errors": self.errors,
-            "requests": [asdict(r) for r in self.requests[:1000]]  # Limita per dimensioni file
+            "requests": [asdict(r) for r in self.requests]
         }
-        
+
         with open(filename, 'w') as f:
             json.dump(results_dict, f, indent=2)
-        
+
         logger.info(f"Risultati salvati su {filename}")
         return filename
 
+    @classmethod
+    def load_from_file(cls, filename: str) -> "TestResults":
+        """Carica i risultati salvati con save_to_file() (istogrammi inclusi)."""
+        with open(filename, 'r') as f:
+            data = json.load(f)
+
+        summary = data["summary"]
+        results = cls(
+            config=LoadTestConfig(**data["config"]),
+            start_time=summary["start_timestamp"],
+            end_time=summary.get("end_timestamp"),
+            errors=data.get("errors", []),
+            error_count=summary.get("error_count", len(data.get("errors", []))),
+            endpoints={endpoint: EndpointStats.from_dict(stats) for endpoint, stats in data.get("endpoints", {}).items()},
+            requests=[RequestResult(**r) for r in data.get("requests", [])]
+        )
+        results.calculate_statistics()
+        return results
+
+def merge_result_files(filenames: List[str]) -> TestResults:
+    """
+    Unisce i risultati di più processi o macchine di carico.
+
+    Args:
+        filenames: File JSON prodotti da save_to_file()
+
+    Returns:
+        TestResults con gli istogrammi uniti e le statistiche ricalcolate
+    """
+    merged = None
+    for filename in filenames:
+        results = TestResults.load_from_file(filename)
+        if merged is None:
+            merged = results
+        else:
+            merged.merge(results)
+
+    if merged is None:
+        raise ValueError("Nessun file di risultati da unire")
+    merged.calculate_statistics()
+    return merged
+
 class LoadTester:
     """Esegue test di carico utilizzando aiohttp."""
-    
-    def __init__(self, config: LoadTestConfig):
+
+    def __init__(self, config: LoadTestConfig, start_at: Optional[float] = None,
+                 series_path: Optional[str] = None, series_histograms: bool = False):
+        """
+        Args:
+            config: Configurazione del test
+            start_at: Istante (epoch) di avvio, usato per allineare più processi di carico
+            series_path: File JSONL su cui scrivere la serie temporale durante il test
+            series_histograms: Se True la serie include gli istogrammi per bucket (unibili)
+        """
         self.config = config
         self.results = TestResults(config=config)
         self.session = None
         self.request_id_counter = 0
         self.active_users = 0
+        self.in_flight = 0
         self.stop_event = asyncio.Event()
-    
+        self.start_at = start_at
+        self.series_path = series_path
+        self.series_histograms = series_histograms
+
     async def start_test(self) -> TestResults:
         """Avvia il test di carico."""
-        logger.info(f"Avvio test di carico: {self.config.users} utenti, "
-                   f"{self.config.requests_per_user} richieste per utente")
-        
-        self.results.start_time = time.time()
-        
+        if self.config.arrival_rate > 0:
+            logger.info(f"Avvio test di carico a modello aperto: {self.config.arrival_rate:g} richieste/sec "
+                       f"({self.config.arrival_distribution})")
+        else:
+            logger.info(f"Avvio test di carico: {self.config.users} utenti, "
+                       f"{self.config.requests_per_user} richieste per utente")
+
+        # Attendi l'istante di avvio comune agli altri processi di carico
+        if self.start_at:
+            await asyncio.sleep(max(0.0, self.start_at - time.time()))
+
+        self.results.start_time = self.start_at or time.time()
+        self.results.series = SeriesRecorder(
+            self.results.start_time,
+            self.config.series_bucket_seconds,
+            self.series_path,
+            include_histograms=self.series_histograms
+        )
+
         # Crea connettore per sessione aiohttp
         connector = aiohttp.TCPConnector(
-            limit=self.config.users * 2,  # Limite connessioni
+            limit=max(self.config.users, self.config.max_in_flight if self.config.arrival_rate > 0 else 0) * 2,
             ssl=self.config.verify_ssl,
             ttl_dns_cache=300  # Cache DNS
         )
-        
+
         # Timeout per le richieste
         timeout = aiohttp.ClientTimeout(total=self.config.request_timeout)
-        
+
         # Crea sessione HTTP
         async with aiohttp.ClientSession(
             connector=connector,
             timeout=timeout,
             headers=self.config.headers
         ) as self.session:
-            # Crea task per ogni utente
-            user_tasks = []
-            for user_id in range(self.config.users):
-                # Calcola ritardo per il ramp-up graduale
-                if self.config.ramp_up_time > 0:
-                    delay = (user_id / self.config.users) * self.config.ramp_up_time
-                else:
-                    delay = 0
-                
-                # Crea e avvia task
-                task = asyncio.create_task(
-                    self.user_task(user_id, delay)
-                )
-                user_tasks.append(task)
-            
+            # Crea task per ogni utente, o il generatore di arrivi nel modello aperto
+            load_tasks = []
+            if self.config.arrival_rate > 0:
+                load_tasks.append(asyncio.create_task(self.open_model_task()))
+            else:
+                for user_id in range(self.config.users):
+                    # Calcola ritardo per il ramp-up graduale
+                    if self.config.ramp_up_time > 0:
+                        delay = (user_id / self.config.users) * self.config.ramp_up_time
+                    else:
+                        delay = 0
+
+                    # Crea e avvia task
+                    task = asyncio.create_task(
+                        self.user_task(user_id, delay)
+                    )
+                    load_tasks.append(task)
+
             # Monitor del test
             monitor_task = asyncio.create_task(self.monitor_test())
-            
+
             # Imposta timeout per durata totale del test
             end_timer = asyncio.create_task(self.end_timer())
-            
-            # Attendi il completamento di tutti i task
-            await asyncio.gather(end_timer, monitor_task, *user_tasks, return_exceptions=True)
-        
+
+            # Attendi il completamento del carico, poi ferma timer e monitor
+            await asyncio.gather(*load_tasks, return_exceptions=True)
+            self.stop_event.set()
+            end_timer.cancel()
+            await asyncio.gather(end_timer, monitor_task, return_exceptions=True)
+
         # Completa i risultati
         self.results.end_time = time.time()
         self.results.calculate_statistics()
-        
+
         logger.info(f"Test completato in {self.results.end_time - self.results.start_time:.2f} secondi")
         logger.info(f"Richieste totali: {self.results.total_requests}")
         logger.info(f"Richieste riuscite: {self.results.successful_requests}")
         logger.info(f"Richieste fallite: {self.results.failed_requests}")
         logger.info(f"Tempo medio di risposta: {self.results.avg_response_time:.2f} ms")
+        logger.info(f"Percentili p50/p99/p99.9: {self.results.median_response_time:.2f} / "
+                   f"{self.results.p99_response_time:.2f} / {self.results.p999_response_time:.2f} ms")
         logger.info(f"Richieste al secondo: {self.results.requests_per_second:.2f}")
-        
+
         return self.results
-    
+
     async def end_timer(self):
         """Timer per terminare il test dopo la durata configurata."""
         await asyncio.sleep(self.config.test_duration)
         logger.info(f"Durata test ({self.config.test_duration}s) raggiunta, arresto in corso...")
         self.stop_event.set()
-    
+
     async def monitor_test(self):
-        """Task di monitoraggio che fornisce aggiornamenti periodici sullo stato del test."""
-        start_time = time.time()
+        """Task di monitoraggio: chiude i bucket della serie e fornisce aggiornamenti periodici."""
         last_count = 0
-        
+        last_log = time.time()
+
         while not self.stop_event.is_set():
-            await asyncio.sleep(5.0)  # Aggiorna ogni 5 secondi
-            
-            current_count = len(self.results.requests)
-            elapsed = time.time() - start_time
-            new_requests = current_count - last_count
-            
-            if elapsed > 0:
-                rate = new_requests / 5.0  # Richieste negli ultimi 5 secondi
-                logger.info(f"Stato: {current_count} richieste, {self.active_users} utenti attivi, "
-                           f"{rate:.2f} richieste/sec (ultimi 5s)")
-            
+            await asyncio.sleep(min(1.0, self.config.series_bucket_seconds))
+            now = time.time()
+            self.results.series.flush(now)
+
+            if now - last_log < 5.0:  # Aggiorna il log ogni 5 secondi
+                continue
+
+            current_count = self.results.total_requests
+            rate = (current_count - last_count) / (now - last_log)
+            logger.info(f"Stato: {current_count} richieste, {self.active_users} utenti attivi, "
+                       f"{self.in_flight} in volo, {rate:.2f} richieste/sec (ultimi 5s)")
+
             last_count = current_count
+            last_log = now
     
     async def user_task(self, user_id: int, start_delay: float):
         """Simula un singolo utente che esegue richieste."""
@@ -292,7 +784,7 @@ class LoadTester:
             
         except Exception as e:
             logger.error(f"Errore nel task utente {user_id}: {str(e)}")
-            self.results.errors.append(f"User {user_id}: {str(e)}")
+            self.results.add_error(f"User {user_id}: {str(e)}")
         finally:
             # Decrementa contatore utenti attivi
             self.active_users -= 1
@@ -311,8 +803,8 @@ class LoadTester:
         
         login_url = f"{self.config.base_url}{self.config.login_endpoint}"
         
+        start_time = time.time()
         try:
-            start_time = time.time()
             async with self.session.post(login_url, data=credentials) as response:
                 response_time = (time.time() - start_time) * 1000  # in millisecondi
                 
@@ -334,7 +826,7 @@ class LoadTester:
                     result.error = f"Login fallito: HTTP {response.status}"
                     logger.warning(f"Login fallito per utente {user_id}: HTTP {response.status}")
                 
-                self.results.requests.append(result)
+                self.results.record(result)
                 
                 # Estrai cookies per le richieste successive
                 cookies = {}
@@ -351,43 +843,109 @@ class LoadTester:
                 endpoint=self.config.login_endpoint,
                 method="POST",
                 status_code=0,
-                response_time=0,
+                response_time=(time.time() - start_time) * 1000,
                 error=str(e),
                 user_id=user_id,
                 request_id=self.request_id_counter
             )
-            self.results.requests.append(result)
+            self.results.record(result)
             return {}
     
-    async def make_request(self, endpoint: str, user_id: int, req_num: int, 
-                          cookies: Dict[str, str] = None) -> RequestResult:
-        """Esegue una singola richiesta HTTP."""
+    async def open_model_task(self):
+        """
+        Genera richieste a frequenza di arrivo fissa (modello aperto).
+
+        Gli arrivi non aspettano le risposte: se il server rallenta le richieste si
+        accumulano invece di essere rimandate. Il tempo di risposta viene misurato
+        dall'istante di arrivo previsto, correggendo la coordinated omission.
+        """
+        rate = self.config.arrival_rate
+        poisson = self.config.arrival_distribution == "poisson"
+        cookies = await self.perform_login(0) if self.config.login_required else None
+
+        tasks = set()
+        next_arrival = time.perf_counter()
+        req_num = 0
+
+        while not self.stop_event.is_set():
+            delay = next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                if self.stop_event.is_set():
+                    break
+
+            endpoint = random.choice(self.config.target_endpoints)
+            if self.in_flight >= self.config.max_in_flight:
+                # Il generatore non rallenta: l'arrivo viene contato come fallito,
+                # con il ritardo accumulato dall'istante previsto di invio
+                self.request_id_counter += 1
+                self.results.record(RequestResult(
+                    endpoint=endpoint,
+                    method="GET",
+                    status_code=0,
+                    response_time=(time.perf_counter() - next_arrival) * 1000,
+                    error="Limite di richieste in volo raggiunto",
+                    request_id=self.request_id_counter
+                ))
+            else:
+                task = asyncio.create_task(self.make_request(
+                    endpoint, req_num % max(1, self.config.users), req_num,
+                    cookies=cookies, intended_start=next_arrival
+                ))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            req_num += 1
+            next_arrival += random.expovariate(rate) if poisson else 1.0 / rate
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def make_request(self, endpoint: str, user_id: int, req_num: int,
+                          cookies: Dict[str, str] = None,
+                          intended_start: Optional[float] = None) -> RequestResult:
+        """
+        Esegue una singola richiesta HTTP.
+
+        Args:
+            endpoint: Endpoint da richiedere
+            user_id: ID dell'utente virtuale
+            req_num: Numero progressivo della richiesta
+            cookies: Cookie di sessione
+            intended_start: Istante previsto di invio (perf_counter) nel modello aperto;
+                            il tempo di risposta viene misurato da questo istante
+        """
         url = f"{self.config.base_url}{endpoint}"
         method = "GET"  # Per semplicità usiamo solo GET, ma può essere esteso
-        
+
+        self.in_flight += 1
+        start_time = time.perf_counter()
         try:
-            start_time = time.time()
-            
             # Aggiunge cookies se presenti
             request_kwargs = {}
             if cookies:
                 request_kwargs['cookies'] = cookies
-            
+
             async with self.session.request(method, url, **request_kwargs) as response:
-                response_time = (time.time() - start_time) * 1000  # in millisecondi
-                
+                end_time = time.perf_counter()
+                service_time = (end_time - start_time) * 1000  # in millisecondi
+                response_time = (end_time - intended_start) * 1000 if intended_start else service_time
+
                 # Incrementa contatore ID richieste
                 self.request_id_counter += 1
-                
-                # Prova a leggere la risposta come JSON
+
+                # Prova a leggere la risposta come JSON (solo per il campione conservato)
                 response_data = None
-                try:
-                    if response.content_type == 'application/json':
-                        response_data = await response.json()
-                except Exception:
-                    # Ignora errori nel parsing JSON
-                    pass
-                
+                if len(self.results.requests) < self.config.max_samples:
+                    try:
+                        if response.content_type == 'application/json':
+                            response_data = await response.json()
+                    except Exception:
+                        # Ignora errori nel parsing JSON
+                        pass
+                else:
+                    await response.read()
+
                 # Crea oggetto risultato
                 result = RequestResult(
                     endpoint=endpoint,
@@ -398,37 +956,40 @@ class LoadTester:
                     request_id=self.request_id_counter,
                     response_data=response_data
                 )
-                
+
                 # Registra errori
                 if response.status >= 400:
                     result.error = f"HTTP Error {response.status}"
-                
+
                 # Aggiungi ai risultati
-                self.results.requests.append(result)
+                self.results.record(result, service_time)
                 return result
-                
+
         except Exception as e:
-            # Gestisci timeout e altri errori
+            # Gestisci timeout e altri errori: il tempo conta fino al fallimento
+            end_time = time.perf_counter()
+            service_time = (end_time - start_time) * 1000
             self.request_id_counter += 1
             result = RequestResult(
                 endpoint=endpoint,
                 method=method,
                 status_code=0,
-                response_time=0,
+                response_time=(end_time - intended_start) * 1000 if intended_start else service_time,
                 error=str(e),
                 user_id=user_id,
                 request_id=self.request_id_counter
             )
-            self.results.requests.append(result)
+            self.results.record(result, service_time)
             return result
+        finally:
+            self.in_flight -= 1
     
     async def test_websocket(self, user_id: int, cookies: Dict[str, str] = None):
         """Testa la connessione WebSocket."""
         ws_url = f"{self.config.base_url.replace('http', 'ws')}{self.config.websocket_endpoint}"
         
+        start_time = time.time()
         try:
-            start_time = time.time()
-            
             # Prepara headers con cookie se necessario
             headers = {}
             if cookies:
@@ -482,7 +1043,7 @@ class LoadTester:
                     user_id=user_id,
                     request_id=self.request_id_counter
                 )
-                self.results.requests.append(result)
+                self.results.record(result)
                 
         except Exception as e:
             logger.error(f"Errore WebSocket per utente {user_id}: {str(e)}")
@@ -493,12 +1054,12 @@ class LoadTester:
                 endpoint=self.config.websocket_endpoint,
                 method="WS",
                 status_code=0,
-                response_time=0,
+                response_time=(time.time() - start_time) * 1000,
                 error=str(e),
                 user_id=user_id,
                 request_id=self.request_id_counter
             )
-            self.results.requests.append(result)
+            self.results.record(result)
     
     async def ws_receive_loop(self, ws, user_id: int):
         """Loop per ricevere messaggi WebSocket."""
@@ -528,47 +1089,40 @@ def generate_report(results: TestResults, output_file: str = None):
     # Crea grafici usando matplotlib
     fig, axs = plt.subplots(2, 2, figsize=(12, 10))
     
-    # 1. Grafico dei tempi di risposta nel tempo
-    times = [r.timestamp - results.start_time for r in results.requests]
-    response_times = [r.response_time for r in results.requests]
-    success = [200 <= r.status_code < 400 for r in results.requests]
-    
-    axs[0, 0].scatter(times, response_times, c=['green' if s else 'red' for s in success], alpha=0.5)
+    # 1. Percentili dei tempi di risposta nel tempo (dalla serie a bucket)
+    series = results.series_points
+    times = [p["t"] for p in series]
+    if series:
+        axs[0, 0].plot(times, [p["p50_ms"] for p in series], 'g-', label='p50')
+        axs[0, 0].plot(times, [p["p95_ms"] for p in series], 'b-', label='p95')
+        axs[0, 0].plot(times, [p["p99_ms"] for p in series], 'r-', label='p99')
+        axs[0, 0].legend()
     axs[0, 0].set_title('Tempi di Risposta')
     axs[0, 0].set_xlabel('Tempo (secondi)')
     axs[0, 0].set_ylabel('Tempo di Risposta (ms)')
     
-    # 2. Istogramma dei tempi di risposta
-    axs[0, 1].hist(response_times, bins=30, alpha=0.7, color='blue')
-    axs[0, 1].set_title('Distribuzione Tempi di Risposta')
-    axs[0, 1].set_xlabel('Tempo di Risposta (ms)')
-    axs[0, 1].set_ylabel('Frequenza')
+    # 2. Distribuzione per percentile (istogramma HDR complessivo)
+    histogram = results.histogram()
+    percentiles = histogram.percentiles(REPORT_PERCENTILES)
+    labels = [f"p{p:g}" for p in REPORT_PERCENTILES]
+    axs[0, 1].plot(labels, [percentiles[p] for p in REPORT_PERCENTILES], 'bo-')
+    if histogram.total:
+        axs[0, 1].set_yscale('log')
+    axs[0, 1].set_title('Distribuzione Tempi di Risposta per Percentile')
+    axs[0, 1].set_xlabel('Percentile')
+    axs[0, 1].set_ylabel('Tempo di Risposta (ms)')
     
     # 3. Richieste al secondo nel tempo
-    if times:
-        max_time = max(times) + 1
-        time_buckets = np.arange(0, max_time, 1.0)
-        requests_per_second = []
-        
-        for i in range(len(time_buckets) - 1):
-            start_time = time_buckets[i]
-            end_time = time_buckets[i+1]
-            
-            count = sum(1 for t in times if start_time <= t < end_time)
-            requests_per_second.append(count)
-        
-        axs[1, 0].plot(time_buckets[:-1], requests_per_second, 'b-')
-        axs[1, 0].set_title('Richieste al Secondo')
-        axs[1, 0].set_xlabel('Tempo (secondi)')
-        axs[1, 0].set_ylabel('Richieste/Secondo')
+    if series:
+        axs[1, 0].plot(times, [p["rps"] for p in series], 'b-', label='richieste/s')
+        axs[1, 0].plot(times, [p["errors"] / results.config.series_bucket_seconds for p in series], 'r-', label='errori/s')
+        axs[1, 0].legend()
+    axs[1, 0].set_title('Richieste al Secondo')
+    axs[1, 0].set_xlabel('Tempo (secondi)')
+    axs[1, 0].set_ylabel('Richieste/Secondo')
     
     # 4. Percentuale di richieste per codice di stato
-    status_codes = {}
-    for r in results.requests:
-        if r.status_code in status_codes:
-            status_codes[r.status_code] += 1
-        else:
-            status_codes[r.status_code] = 1
+    status_codes = results.status_codes()
     
     labels = list(status_codes.keys())
     sizes = list(status_codes.values())
@@ -672,6 +1226,10 @@ def generate_report(results: TestResults, output_file: str = None):
                         <th>99° Percentile</th>
                         <td>{results.p99_response_time:.2f} ms</td>
                     </tr>
+                    <tr>
+                        <th>99.9° Percentile</th>
+                        <td>{results.p999_response_time:.2f} ms</td>
+                    </tr>
                 </table>
             </div>
             
@@ -689,42 +1247,26 @@ def generate_report(results: TestResults, output_file: str = None):
                         <th>Successi</th>
                         <th>Errori</th>
                         <th>Tempo Medio (ms)</th>
+                        <th>p95 (ms)</th>
+                        <th>p99 (ms)</th>
                         <th>Tempo Max (ms)</th>
                     </tr>
     """
     
-    # Calcola statistiche per endpoint
-    endpoints = {}
-    for r in results.requests:
-        if r.endpoint not in endpoints:
-            endpoints[r.endpoint] = {
-                'count': 0,
-                'success': 0,
-                'error': 0,
-                'times': []
-            }
-        
-        endpoints[r.endpoint]['count'] += 1
-        if 200 <= r.status_code < 400:
-            endpoints[r.endpoint]['success'] += 1
-        else:
-            endpoints[r.endpoint]['error'] += 1
-        
-        if r.error is None:
-            endpoints[r.endpoint]['times'].append(r.response_time)
-    
-    for endpoint, data in sorted(endpoints.items()):
-        avg_time = sum(data['times']) / max(1, len(data['times']))
-        max_time = max(data['times']) if data['times'] else 0
+    # Statistiche per endpoint dagli istogrammi
+    for endpoint, data in sorted(results.endpoints.items()):
+        p = data.latency.percentiles((95, 99))
         
         html += f"""
                     <tr>
                         <td>{endpoint}</td>
-                        <td>{data['count']}</td>
-                        <td class="success">{data['success']}</td>
-                        <td class="error">{data['error']}</td>
-                        <td>{avg_time:.2f}</td>
-                        <td>{max_time:.2f}</td>
+                        <td>{data.count}</td>
+                        <td class="success">{data.success}</td>
+                        <td class="error">{data.errors}</td>
+                        <td>{data.latency.mean:.2f}</td>
+                        <td>{p[95]:.2f}</td>
+                        <td>{p[99]:.2f}</td>
+                        <td>{data.latency.max_us / 1000:.2f}</td>
                     </tr>
         """
     
@@ -757,8 +1299,9 @@ def generate_report(results: TestResults, output_file: str = None):
                 </table>
         """
         
-        if len(results.errors) > 100:
-            html += f"<p>Mostrati 100 errori su {len(results.errors)} totali.</p>"
+        shown = min(100, len(results.errors))
+        if results.error_count > shown:
+            html += f"<p>Mostrati {shown} errori su {results.error_count} totali.</p>"
     else:
         html += "<p>Nessun errore rilevato.</p>"
     
@@ -779,38 +1322,120 @@ def generate_report(results: TestResults, output_file: str = None):
 async def run_load_test(config: LoadTestConfig) -> Tuple[TestResults, str, str]:
     """
     Esegue un test di carico completo e genera i report.
-    
+
     Args:
         config: Configurazione del test
-        
+
     Returns:
         Tuple[TestResults, str, str]: (risultati, percorso file json, percorso report html)
     """
     # Crea output_dir se non esiste
     os.makedirs(config.output_dir, exist_ok=True)
-    
-    # Esegui il test
-    tester = LoadTester(config)
-    results = await tester.start_test()
-    
+
     # Genera timestamp per i file di output
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     test_name = config.test_name or "load_test"
-    
+    base_path = os.path.join(config.output_dir, f"{test_name}_{timestamp}")
+
+    # Esegui il test, scrivendo la serie temporale man mano
+    tester = LoadTester(config, series_path=f"{base_path}_series.jsonl")
+    results = await tester.start_test()
+
     # Salva i risultati
-    results_file = os.path.join(config.output_dir, f"{test_name}_{timestamp}.json")
+    results_file = f"{base_path}.json"
     results.save_to_file(results_file)
-    
+
     # Genera report
-    report_file = os.path.join(config.output_dir, f"{test_name}_{timestamp}_report.html")
+    report_file = f"{base_path}_report.html"
     generate_report(results, report_file)
-    
+
+    return results, results_file, report_file
+
+def _split(total: int, parts: int, index: int) -> int:
+    """Quota di total assegnata alla parte index."""
+    return total // parts + (1 if index < total % parts else 0)
+
+def _load_process(config_dict: Dict[str, Any], start_at: float, results_file: str, series_file: str):
+    """Processo di carico: esegue la propria quota del test e salva risultati e serie."""
+    async def run():
+        tester = LoadTester(LoadTestConfig(**config_dict), start_at=start_at,
+                            series_path=series_file, series_histograms=True)
+        results = await tester.start_test()
+        results.save_to_file(results_file)
+
+    asyncio.run(run())
+
+def run_multiprocess_load_test(config: LoadTestConfig, processes: int) -> Tuple[TestResults, str, str]:
+    """
+    Esegue il test di carico su più processi e unisce i risultati.
+
+    Utenti virtuali e frequenza di arrivo vengono divisi tra i processi, che partono
+    nello stesso istante; istogrammi e serie temporali vengono poi uniti.
+
+    Args:
+        config: Configurazione complessiva del test
+        processes: Numero di processi di carico
+
+    Returns:
+        Tuple[TestResults, str, str]: (risultati uniti, percorso file json, percorso report html)
+    """
+    os.makedirs(config.output_dir, exist_ok=True)
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    test_name = config.test_name or "load_test"
+    base_path = os.path.join(config.output_dir, f"{test_name}_{timestamp}")
+
+    # Avvio comune, così i bucket delle serie sono allineati tra i processi
+    start_at = time.time() + 2.0
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    part_files = []
+    series_files = []
+
+    for index in range(processes):
+        part_config = asdict(config)
+        part_config["users"] = max(1, _split(config.users, processes, index))
+        part_config["arrival_rate"] = config.arrival_rate / processes
+        part_config["max_in_flight"] = max(1, _split(config.max_in_flight, processes, index))
+        part_config["test_name"] = f"{test_name}_p{index}"
+
+        part_files.append(f"{base_path}_p{index}.json")
+        series_files.append(f"{base_path}_p{index}_series.jsonl")
+        worker = context.Process(
+            target=_load_process,
+            args=(part_config, start_at, part_files[-1], series_files[-1]),
+            name=f"load-test-{index}"
+        )
+        worker.start()
+        workers.append(worker)
+
+    logger.info(f"Avviati {processes} processi di carico")
+    for worker in workers:
+        worker.join()
+        if worker.exitcode != 0:
+            logger.error(f"Processo {worker.name} terminato con codice {worker.exitcode}")
+
+    completed = [(part, series) for part, series in zip(part_files, series_files) if os.path.exists(part)]
+    results = merge_result_files([part for part, _ in completed])
+    results.config = config
+    results.series_points = merge_series_files(
+        [series for _, series in completed if os.path.exists(series)],
+        f"{base_path}_series.jsonl",
+        config.series_bucket_seconds
+    )
+
+    results_file = f"{base_path}.json"
+    results.save_to_file(results_file)
+
+    report_file = f"{base_path}_report.html"
+    generate_report(results, report_file)
+
     return results, results_file, report_file
 
 def main():
     """Funzione principale per esecuzione da linea di comando."""
     parser = argparse.ArgumentParser(description='Esegui test di carico su M4Bot')
-    parser.add_argument('--url', required=True, help='URL base dell\'applicazione')
+    parser.add_argument('--url', help='URL base dell\'applicazione')
     parser.add_argument('--users', type=int, default=100, help='Numero di utenti virtuali')
     parser.add_argument('--requests', type=int, default=10, help='Richieste per utente')
     parser.add_argument('--duration', type=int, default=60, help='Durata del test in secondi')
@@ -823,9 +1448,30 @@ def main():
     parser.add_argument('--ws-endpoint', default='/ws', help='Endpoint WebSocket')
     parser.add_argument('--output', default='results', help='Directory output')
     parser.add_argument('--name', default='', help='Nome del test')
-    
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='Richieste al secondo a frequenza fissa (modello aperto, corregge la coordinated omission)')
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant',
+                        help='Distribuzione degli arrivi nel modello aperto')
+    parser.add_argument('--max-in-flight', type=int, default=10000, help='Richieste contemporanee massime nel modello aperto')
+    parser.add_argument('--bucket', type=float, default=1.0, help='Ampiezza dei bucket della serie temporale in secondi')
+    parser.add_argument('--processes', type=int, default=1, help='Numero di processi di carico')
+    parser.add_argument('--merge', nargs='+', metavar='FILE',
+                        help='Unisce file di risultati esistenti (es. da più macchine) e genera il report')
+
     args = parser.parse_args()
-    
+
+    if args.merge:
+        results = merge_result_files(args.merge)
+        output_dir = args.output
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        base_path = os.path.join(output_dir, f"{args.name or 'load_test'}_merged_{timestamp}")
+        results.save_to_file(f"{base_path}.json")
+        generate_report(results, f"{base_path}_report.html")
+        return
+
+    if not args.url:
+        parser.error("--url è obbligatorio")
+
     # Configura il test
     config = LoadTestConfig(
         base_url=args.url,
@@ -842,11 +1488,18 @@ def main():
         use_websocket=args.websocket,
         websocket_endpoint=args.ws_endpoint,
         output_dir=args.output,
-        test_name=args.name
+        test_name=args.name,
+        arrival_rate=args.rate,
+        arrival_distribution=args.arrival,
+        max_in_flight=args.max_in_flight,
+        series_bucket_seconds=args.bucket
     )
-    
+
     # Esegui il test
-    asyncio.run(run_load_test(config))
+    if args.processes > 1:
+        run_multiprocess_load_test(config, args.processes)
+    else:
+        asyncio.run(run_load_test(config))
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file